@@ -2,15 +2,28 @@ import os
 import random
 import smtplib
 import uuid
+import csv
+import tempfile
+import numpy as np
 import pandas as pd
 from werkzeug.utils import secure_filename
 from email.mime.text import MIMEText
-from flask import Flask, render_template_string, request, redirect, session, url_for, jsonify, current_app, send_file
-from supabase import create_client, Client
+from flask import Flask, render_template, request, redirect, session, url_for, jsonify, current_app, send_file, g, has_request_context, Response, stream_with_context
+from supabase_client import create_backend, instrument_backend
+from otp_delivery import create_otp_queue
 from dotenv import load_dotenv
 from datetime import datetime, date, timedelta
 import json
+import re
 import io
+import html
+import threading
+import time
+import contextvars
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from jinja2 import ChoiceLoader, DictLoader, FileSystemBytecodeCache
 
 # === Load environment variables ===
 load_dotenv()
@@ -20,9 +33,35 @@ app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "supersecretkey")
 
 # === Supabase setup ===
+# SIA_BACKEND=memory/sqlite memakai backend lokal (lihat supabase_client.py)
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Pool koneksi HTTP per proses seukuran jumlah thread yang bisa memanggil backend
+# bersamaan: thread request gunicorn, worker fetch paralel dan prefetch halaman
+GUNICORN_THREADS = int(os.getenv("GUNICORN_THREADS", "1"))
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "6"))
+READ_PREFETCH_WORKERS = int(os.getenv("READ_PREFETCH_WORKERS", "4"))
+supabase = create_backend(SUPABASE_URL, SUPABASE_KEY,
+                          pool_size=GUNICORN_THREADS + FETCH_WORKERS + READ_PREFETCH_WORKERS)
+
+# === Instrumentasi backend ===
+# Setiap execute() dicatat per request (tabel, operasi, baris, latency);
+# ringkasannya dikirim di header X-Backend-Calls dan /admin/backend_calls.
+# Matikan dengan BACKEND_INSTRUMENTATION=0. Ukuran payload (byte) mahal dihitung
+# (json.dumps tiap respons), jadi hanya diukur bila BACKEND_PAYLOAD_BYTES=1.
+BACKEND_INSTRUMENTATION = os.getenv("BACKEND_INSTRUMENTATION", "1") != "0"
+BACKEND_PAYLOAD_BYTES = os.getenv("BACKEND_PAYLOAD_BYTES", "0") == "1"
+BACKEND_STATS_LOCK = threading.Lock()
+BACKEND_ROUTE_STATS = {}
+BACKEND_RECENT_REQUESTS = deque(maxlen=50)
+
+def record_backend_call(call):
+    """Simpan satu panggilan backend ke daftar milik request aktif"""
+    if has_request_context():
+        g.setdefault("backend_calls", []).append(call)
+
+if BACKEND_INSTRUMENTATION:
+    supabase = instrument_backend(supabase, record_backend_call, measure_bytes=BACKEND_PAYLOAD_BYTES)
 
 # === Email setup ===
 # === Email setup ===
@@ -30,6 +69,14 @@ EMAIL_SENDER = os.getenv("EMAIL_SENDER")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 EMAIL_LOGO_URL = os.getenv("EMAIL_LOGO_URL", "").strip()
 
+# === Periode laporan ===
+# Bulan awal tahun fiskal (1 = Januari)
+FISCAL_YEAR_START_MONTH = int(os.getenv("FISCAL_YEAR_START_MONTH", "1"))
+
+# === Engine perhitungan ledger ===
+# python (default): perhitungan per akun dengan dict; pandas: kolumnar (hasil sama)
+LEDGER_ENGINE = os.getenv("LEDGER_ENGINE", "python").strip().lower()
+
 # === Harga jual ikan patin ===
 HARGA_JUAL = {
     '8cm': 1000,
@@ -60,57 +107,20 @@ def send_otp(email, otp):
     except:
         pass
     
-    # 2. Coba SendGrid jika ada API Key valid
-    EMAIL_SENDER = os.getenv("EMAIL_SENDER", "noreply@airyn.com")
-    API_KEY = os.getenv("EMAIL_PASSWORD")
-    
-    if API_KEY and API_KEY.startswith("SG."):
-        print("🔄 Mencoba SendGrid...")
-        try:
-            import requests
-            
-            response = requests.post(
-                "https://api.sendgrid.com/v3/mail/send",
-                headers={
-                    "Authorization": f"Bearer {API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "personalizations": [{"to": [{"email": email}]}],
-                    "from": {"email": EMAIL_SENDER, "name": "Airyn"},
-                    "subject": "Kode OTP Airyn",
-                    "content": [{
-                        "type": "text/plain",
-                        "value": f"Kode OTP Anda: {otp}\n\nKode berlaku 5 menit."
-                    }]
-                },
-                timeout=10
-            )
-            
-            if response.status_code == 202:
-                print("✅ SendGrid: Email terkirim")
-                return True
-            else:
-                print(f"❌ SendGrid Error {response.status_code}")
-                
-        except Exception as e:
-            print(f"❌ SendGrid Exception: {e}")
-    
-    # 3. FALLBACK: Console mode (selalu bekerja)
-    print("📟 Menggunakan console mode fallback")
-    print(f"👤 User {email} bisa login dengan OTP: {otp}")
+    # 2. Kirim email lewat antrian background (SMTP/SendGrid, retry, fallback console)
+    #    supaya request tidak menunggu mail server
+    OTP_QUEUE.enqueue(email, "Kode OTP Airyn", otp_email_html(otp), otp)
     
-    # 4. Tambahkan ke session untuk auto-verify (optional)
+    # 3. Tambahkan ke session untuk auto-verify (optional)
     if 'temp_user' in session:
         session['temp_user']['otp_displayed'] = otp
     
     print(f"{'='*60}")
     return True  # SELALU return True agar user bisa lanjut
 
-def send_otp_sendgrid(email, otp, api_key):
-    """Send OTP using SendGrid API"""
-    import requests
-    
+# === Helper: isi email OTP (HTML) ===
+def otp_email_html(otp):
+    """HTML email OTP (dipakai antrian pengiriman dan send_otp_sendgrid)"""
     EMAIL_LOGO_URL = os.getenv("EMAIL_LOGO_URL", "").strip()
     
     logo_html = (
@@ -176,6 +186,13 @@ def send_otp_sendgrid(email, otp, api_key):
     </body>
     </html>
     """
+    return html_content
+
+def send_otp_sendgrid(email, otp, api_key):
+    """Send OTP using SendGrid API"""
+    import requests
+    
+    html_content = otp_email_html(otp)
 
     try:
         url = "https://api.sendgrid.com/v3/mail/send"
@@ -305,6 +322,9 @@ def send_otp_console(email, otp):
     print(f"📧 [CONSOLE] Email verification would be sent in production")
     return True
 
+# === Antrian pengiriman OTP (lihat otp_delivery.py) ===
+OTP_QUEUE = create_otp_queue(fallback=send_otp_console)
+
 # === Helper: Setup akun default sesuai struktur baru ===
 def setup_default_accounts():
     default_accounts = [
@@ -368,6 +388,7 @@ def setup_default_accounts():
                     "created_at": datetime.now().isoformat()
                 }
                 supabase.table("accounts").insert(account_data).execute()
+                invalidate_account_catalogue()
                 print(f"✅ Akun {kode} - {nama} berhasil ditambahkan")
                 
     except Exception as e:
@@ -504,7 +525,11 @@ def setup_database_tables():
         "sales", 
         "jurnal_penyesuaian",
         "buku_pembantu_piutang",
-        "jurnal_penutup"
+        "jurnal_penutup",
+        "saldo_akun",
+        "piutang_saldo",
+        "document_sequences",
+        "idempotency_keys"
     ]
     
     for table in tables_to_check:
@@ -539,44 +564,16 @@ def save_journal_entries(tanggal, jenis_transaksi, entries, table_name="jurnal_u
             print(f"✅ DEBUG Jurnal balance: Debit {total_debit} = Kredit {total_kredit}")
         
         # Generate nomor jurnal
-        nomor_jurnal = f"J{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        nomor_jurnal = next_document_number("J")
         
         print(f"🔧 DEBUG Journal number: {nomor_jurnal}")
         
-        # Simpan detail jurnal ke Supabase
-        for i, entry in enumerate(entries):
-            jurnal_data = {
-                "tanggal": tanggal,
-                "nomor_jurnal": nomor_jurnal,
-                "jenis_transaksi": jenis_transaksi,
-                "kode_akun": entry['kode_akun'],
-                "deskripsi": entry['deskripsi'],
-                "debit": float(entry['debit']),  # Pastikan float
-                "kredit": float(entry['kredit']),  # Pastikan float
-                "referensi": f"Pembelian-{jenis_transaksi}",
-                "created_at": datetime.now().isoformat()
-            }
-            
-            print(f"🔧 DEBUG Saving entry {i+1}: {jurnal_data}")
-            
-            try:
-                # Gunakan Supabase client langsung
-                if table_name == "jurnal_umum":
-                    result = supabase.table("jurnal_umum").insert(jurnal_data).execute()
-                else:
-                    result = supabase.table(table_name).insert(jurnal_data).execute()
-                
-                # Cek hasil insert
-                if hasattr(result, 'data') and result.data:
-                    print(f"✅ DEBUG Entry {i+1} saved successfully")
-                else:
-                    error_msg = getattr(result, 'error', 'Unknown error')
-                    print(f"❌ DEBUG Failed to save entry {i+1}: {error_msg}")
-                    return False
-                    
-            except Exception as e:
-                print(f"❌ DEBUG Database error saving entry {i+1}: {e}")
-                return False
+        # Susun semua baris jurnal lalu simpan dalam satu bulk insert
+        # (satu request PostgREST = satu statement, jadi semua baris masuk atau tidak sama sekali)
+        jurnal_rows = build_journal_rows(tanggal, jenis_transaksi, entries, nomor_jurnal, datetime.now().isoformat())
+        
+        if not insert_journal_rows(table_name, jurnal_rows):
+            return False
         
         print(f"✅ DEBUG Jurnal {jenis_transaksi} berhasil disimpan: {len(entries)} entries")
         return True
@@ -587,37 +584,784 @@ def save_journal_entries(tanggal, jenis_transaksi, entries, table_name="jurnal_u
         traceback.print_exc()
         return False
 
+def build_journal_rows(tanggal, jenis_transaksi, entries, nomor_jurnal, created_at):
+    """Baris tabel jurnal untuk satu transaksi (belum disimpan)"""
+    return [{
+        "tanggal": tanggal,
+        "nomor_jurnal": nomor_jurnal,
+        "jenis_transaksi": jenis_transaksi,
+        "kode_akun": entry['kode_akun'],
+        "deskripsi": entry['deskripsi'],
+        "debit": float(entry['debit']),  # Pastikan float
+        "kredit": float(entry['kredit']),  # Pastikan float
+        "referensi": f"Pembelian-{jenis_transaksi}",
+        "created_at": created_at
+    } for entry in entries]
+
+# === Helper: RPC belum dipasang ===
+# Fallback ke jalur non-RPC hanya aman bila fungsinya memang tidak ada di server.
+# Error lain (timeout, 5xx, constraint) bisa terjadi setelah transaksi ter-commit,
+# jadi mengulang lewat jalur lain berisiko menulis dua kali.
+def rpc_missing(error):
+    """True bila error berarti fungsi RPC belum dipasang (PGRST202 / 404), bukan gangguan sementara"""
+    code = str(getattr(error, "code", "") or "")
+    return code in ("PGRST202", "42883", "404") or "PGRST202" in str(error) or "Could not find the function" in str(error)
+
+def table_missing(error):
+    """True bila error berarti tabel belum dibuat (PGRST205 / 42P01 / 404), bukan gangguan sementara"""
+    code = str(getattr(error, "code", "") or "")
+    return code in ("PGRST205", "42P01", "404") or "PGRST205" in str(error) or "Could not find the table" in str(error)
+
+# === Helper: Penomoran dokumen ===
+# Nomor dokumen per jenis per hari: J-20250301-0001, SO-20250301-0002, ...
+# next_document_number() (supabase_schema.sql) menaikkan counter dengan satu upsert
+# yang mengunci baris (jenis, hari), jadi dua posting di detik yang sama tidak bisa
+# mendapat nomor yang sama.
+def allocate_document_numbers(doc_type, count=1):
+    """Alokasikan `count` nomor dokumen berurutan untuk jenis dokumen (J, JP, SO, PO, ADJ)"""
+    hari = datetime.now().strftime('%Y%m%d')
+    try:
+        result = supabase.rpc("next_document_number", {
+            "p_doc_type": doc_type,
+            "p_hari": f"{hari[:4]}-{hari[4:6]}-{hari[6:]}",
+            "p_count": count,
+        }).execute()
+        last_number = int(result.data)
+    except Exception as e:
+        if not rpc_missing(e):
+            # Gangguan backend: posting dihentikan, bukan diberi nomor di luar urutan
+            print(f"❌ next_document_number gagal ({e})")
+            raise
+        # RPC belum dipasang: nomor acak, tetap unik tapi tidak berurutan
+        print(f"⚠ next_document_number tidak tersedia ({e}), pakai nomor acak")
+        return [f"{doc_type}-{hari}-{uuid.uuid4().hex[:8].upper()}" for _ in range(count)]
+    
+    return [f"{doc_type}-{hari}-{number:04d}" for number in range(last_number - count + 1, last_number + 1)]
+
+def next_document_number(doc_type):
+    """Satu nomor dokumen baru, mis. next_document_number("SO") -> 'SO-20250301-0007'"""
+    return allocate_document_numbers(doc_type)[0]
+
+# === Helper: Bulk insert baris jurnal ===
+class PostingStatusUnknown(Exception):
+    """post_journal error tanpa kepastian: jurnal bisa saja sudah ter-commit di server.
+
+    Penulisan sebelumnya (mis. stok) tidak boleh dibatalkan dan posting tidak boleh
+    diulang begitu saja; pengguna perlu mengecek data dulu."""
+
+def insert_journal_rows(table_name, jurnal_rows):
+    """Insert semua baris satu jurnal (jurnal_umum / jurnal_penyesuaian / jurnal_penutup) dalam satu round trip.
+
+    Error post_journal selain "fungsi tidak ada" diteruskan ke pemanggil (tidak di-insert ulang)."""
+    if not jurnal_rows:
+        return []
+    
+    # post_journal() menyimpan baris jurnal dan meng-update saldo_akun dalam satu transaksi
+    try:
+        result = supabase.rpc("post_journal", {"p_table": table_name, "p_rows": jurnal_rows}).execute()
+    except Exception as rpc_error:
+        if not rpc_missing(rpc_error):
+            # Bisa saja sudah ter-commit di server (mis. timeout): jangan insert ulang lewat jalur lain
+            print(f"❌ DEBUG post_journal gagal ({rpc_error}), jurnal {table_name} tidak di-insert ulang")
+            raise
+        print(f"⚠ post_journal tidak tersedia ({rpc_error}), fallback ke bulk insert biasa")
+        print(f"⚠ saldo_akun untuk {table_name} perlu di-rebuild (/admin/rebuild_saldo_akun)")
+        try:
+            result = supabase.table(table_name).insert(jurnal_rows).execute()
+        except Exception as e:
+            print(f"❌ DEBUG Database error saving {table_name}: {e}")
+            return []
+    bump_ledger_version(table_name)
+    
+    # Cek hasil insert
+    if hasattr(result, 'data') and result.data and len(result.data) == len(jurnal_rows):
+        print(f"✅ DEBUG {len(jurnal_rows)} baris tersimpan ke {table_name}")
+        return result.data
+    
+    error_msg = getattr(result, 'error', 'Unknown error')
+    print(f"❌ DEBUG Gagal menyimpan jurnal ke {table_name}: {error_msg}")
+    return []
+
+# === Helper: Cache laporan berversi ===
+# Setiap jalur tulis menaikkan versi domain (nama tabel) yang diubahnya lewat
+# bump_ledger_version(). Laporan di-cache dengan kunci (fungsi, argumen, versi domain
+# yang dibaca), jadi tampilan ulang tanpa transaksi baru cukup lookup dict, dan
+# penulisan hanya membatalkan laporan yang bergantung pada domain tersebut.
+# Versi dibagi antar worker lewat tabel ledger_versions (supabase_schema.sql);
+# bila tabel belum ada, versi disimpan per proses.
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "256"))
+REPORT_CACHE = OrderedDict()
+REPORT_CACHE_LOCK = threading.Lock()
+LOCAL_LEDGER_VERSIONS = {}
+
+def get_ledger_versions():
+    """Versi tiap domain ledger: domain -> versi (sekali per request).
+
+    None bila tabel ada tapi gagal dibaca: versi tidak diketahui, laporan dihitung tanpa cache."""
+    if has_request_context() and 'ledger_versions' in g:
+        return g.ledger_versions
+    
+    try:
+        versions_res = supabase.table("ledger_versions").select("domain, version").execute()
+        versions = {row['domain']: row['version'] for row in (versions_res.data or [])}
+    except Exception as e:
+        if not table_missing(e):
+            # Versi per proses tidak tahu posting worker lain: jangan pakai cache sama sekali
+            print(f"⚠ ledger_versions gagal dibaca ({e}), laporan dihitung tanpa cache")
+            return None
+        print(f"⚠ ledger_versions belum dibuat ({e}), pakai versi per proses")
+        with REPORT_CACHE_LOCK:
+            versions = dict(LOCAL_LEDGER_VERSIONS)
+    
+    if has_request_context():
+        g.ledger_versions = versions
+    return versions
+
+# Bila versi bersama gagal dinaikkan, domainnya dicatat di PENDING_LEDGER_BUMPS:
+# laporan yang bergantung padanya tidak memakai cache (kunci versinya sudah basi)
+# sampai bump berikutnya berhasil mengirim ulang domain tersebut.
+LEDGER_BUMP_RETRIES = int(os.getenv("LEDGER_BUMP_RETRIES", "3"))
+PENDING_LEDGER_BUMPS = set()
+
+def push_ledger_versions(domains):
+    """Naikkan versi bersama di ledger_versions (dengan retry); return False bila tetap gagal"""
+    for attempt in range(LEDGER_BUMP_RETRIES):
+        try:
+            supabase.rpc("bump_ledger_version", {"p_domains": sorted(domains)}).execute()
+            return True
+        except Exception as e:
+            if rpc_missing(e):
+                # Belum dipasang: versi hanya per proses (lihat get_ledger_versions)
+                return True
+            print(f"⚠ bump_ledger_version gagal ({e}), percobaan {attempt + 1}/{LEDGER_BUMP_RETRIES}")
+            if attempt < LEDGER_BUMP_RETRIES - 1:
+                time.sleep(0.1 * 2 ** attempt)
+    return False
+
+def bump_ledger_version(*domains):
+    """Naikkan versi domain setelah ditulis; laporan yang bergantung padanya dibuang dari cache"""
+    with REPORT_CACHE_LOCK:
+        for domain in domains:
+            LOCAL_LEDGER_VERSIONS[domain] = LOCAL_LEDGER_VERSIONS.get(domain, 0) + 1
+        stale_keys = [key for key, (deps, _) in REPORT_CACHE.items() if deps.intersection(domains)]
+        for key in stale_keys:
+            del REPORT_CACHE[key]
+        # Domain yang sebelumnya gagal ikut dikirim ulang
+        pending = PENDING_LEDGER_BUMPS | set(domains)
+        PENDING_LEDGER_BUMPS.clear()
+    
+    if not push_ledger_versions(pending):
+        print(f"❌ bump_ledger_version gagal untuk {sorted(pending)}, cache laporan terkait dimatikan sampai berhasil")
+        with REPORT_CACHE_LOCK:
+            PENDING_LEDGER_BUMPS.update(pending)
+            stale_keys = [key for key, (deps, _) in REPORT_CACHE.items() if deps.intersection(pending)]
+            for key in stale_keys:
+                del REPORT_CACHE[key]
+    
+    if has_request_context():
+        g.pop('ledger_versions', None)
+        g.ledger_written = True
+
+def cached_report(*domains):
+    """Decorator: cache hasil laporan sampai salah satu domain berubah.
+
+    Hasil yang di-cache dipakai bersama antar request, jangan diubah oleh pemanggil."""
+    deps = frozenset(domains)
+    
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with REPORT_CACHE_LOCK:
+                bypass = not deps.isdisjoint(PENDING_LEDGER_BUMPS)
+            if bypass:
+                # Versi bersama domain ini belum naik: kunci cache tidak bisa dipercaya
+                return func(*args, **kwargs)
+            
+            versions = get_ledger_versions()
+            if versions is None:
+                return func(*args, **kwargs)
+            key = (func.__name__, args, tuple(sorted(kwargs.items())),
+                   tuple(versions.get(domain, 0) for domain in domains))
+            
+            with REPORT_CACHE_LOCK:
+                entry = REPORT_CACHE.get(key)
+                if entry is not None:
+                    REPORT_CACHE.move_to_end(key)
+                    return entry[1]
+            
+            result = func(*args, **kwargs)
+            # Hasil kosong (juga hasil error) tidak di-cache
+            if result:
+                with REPORT_CACHE_LOCK:
+                    REPORT_CACHE[key] = (deps, result)
+                    while len(REPORT_CACHE) > REPORT_CACHE_SIZE:
+                        REPORT_CACHE.popitem(last=False)
+            return result
+        return wrapper
+    return decorator
+
+LEDGER_DOMAINS = ("jurnal_umum", "jurnal_penyesuaian", "accounts")
+
+# === Helper: Idempotency key untuk route posting ===
+# Form posting membawa hidden input idempotency_key (dibuat saat halaman dirender), klien
+# JSON boleh mengirim header Idempotency-Key. Request pertama meng-klaim key lewat
+# claim_idempotency_key(); retry / double-click dengan key yang sama menunggu request
+# pertama selesai lalu menerima respons yang sama, tanpa memposting ulang.
+# Respons disimpan bila sukses (redirect / JSON success) atau bila view sudah menulis
+# ke database (bump_ledger_version menandai g.ledger_written), termasuk hasil batch
+# sebagian dan error setelah sebagian data tersimpan. Key hanya dilepas bila tidak ada
+# yang ditulis, supaya form yang diperbaiki bisa dikirim ulang.
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "15"))
+# Klaim 'processing' yang lebih tua dari ini dianggap ditinggal (worker mati / timeout);
+# harus lebih lama dari request posting terlama (timeout gunicorn)
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "120"))
+# Key per proses (bila RPC belum dipasang) dibatasi jumlah dan umurnya
+IDEMPOTENCY_LOCAL_MAX = int(os.getenv("IDEMPOTENCY_LOCAL_MAX", "1024"))
+IDEMPOTENCY_LOCAL_TTL = float(os.getenv("IDEMPOTENCY_LOCAL_TTL", "3600"))
+LOCAL_IDEMPOTENCY_KEYS = OrderedDict()
+IDEMPOTENCY_LOCK = threading.Lock()
+
+def new_idempotency_key():
+    """Key baru untuk satu form posting"""
+    return uuid.uuid4().hex
+
+def get_idempotency_key():
+    """Key dari header Idempotency-Key, field form atau body JSON (None bila tidak ada)"""
+    key = request.headers.get(IDEMPOTENCY_HEADER) or request.form.get("idempotency_key")
+    if not key and request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            key = data.get("idempotency_key")
+    key = str(key or "").strip()
+    return key[:128] or None
+
+def claim_idempotency_key(route, key):
+    """Klaim key: {"claimed": True} atau {"claimed": False, "status": ..., "response": ...}
+
+    Error selain "fungsi tidak ada" diteruskan: key per proses tidak melindungi dari
+    retry yang jatuh ke worker lain."""
+    try:
+        result = supabase.rpc("claim_idempotency_key", {
+            "p_route": route,
+            "p_key": key,
+            "p_lease_seconds": IDEMPOTENCY_LEASE_SECONDS,
+        }).execute()
+        return result.data
+    except Exception as e:
+        if not rpc_missing(e):
+            print(f"❌ claim_idempotency_key gagal ({e})")
+            raise
+        print(f"⚠ claim_idempotency_key tidak tersedia ({e}), pakai key per proses")
+    
+    now = time.monotonic()
+    with IDEMPOTENCY_LOCK:
+        prune_local_idempotency_keys(now)
+        existing = LOCAL_IDEMPOTENCY_KEYS.get((route, key))
+        if existing is None or (existing["status"] == "processing"
+                                and now - existing["at"] > IDEMPOTENCY_LEASE_SECONDS):
+            store_local_idempotency_key(route, key, "processing", None, now)
+            return {"claimed": True, "local": True}
+        return {"claimed": False, "status": existing["status"], "response": existing["response"], "local": True}
+
+def store_local_idempotency_key(route, key, status, response, now):
+    """Simpan key per proses sebagai entri terbaru (panggil di bawah IDEMPOTENCY_LOCK)"""
+    LOCAL_IDEMPOTENCY_KEYS.pop((route, key), None)
+    LOCAL_IDEMPOTENCY_KEYS[(route, key)] = {"status": status, "response": response, "at": now}
+
+def prune_local_idempotency_keys(now):
+    """Buang key per proses yang kedaluwarsa atau melebihi batas, mulai dari yang terlama"""
+    while LOCAL_IDEMPOTENCY_KEYS:
+        oldest = next(iter(LOCAL_IDEMPOTENCY_KEYS.values()))
+        if len(LOCAL_IDEMPOTENCY_KEYS) <= IDEMPOTENCY_LOCAL_MAX and now - oldest["at"] < IDEMPOTENCY_LOCAL_TTL:
+            break
+        LOCAL_IDEMPOTENCY_KEYS.popitem(last=False)
+
+def finish_idempotency_key(route, key, claim, stored_response):
+    """Simpan respons untuk key (stored_response None = lepas key supaya bisa dicoba lagi)"""
+    if claim.get("local"):
+        with IDEMPOTENCY_LOCK:
+            if stored_response is None:
+                LOCAL_IDEMPOTENCY_KEYS.pop((route, key), None)
+            else:
+                store_local_idempotency_key(route, key, "completed", stored_response, time.monotonic())
+        return
+    
+    try:
+        query = supabase.table("idempotency_keys")
+        if stored_response is None:
+            query = query.delete()
+        else:
+            query = query.update({"status": "completed", "response": stored_response})
+        query.eq("route", route).eq("key", key).execute()
+    except Exception as e:
+        print(f"⚠ Gagal menyimpan idempotency key {route} {key}: {e}")
+
+def wait_idempotent_response(route, key, wait=True):
+    """Tunggu request pertama dengan key yang sama selesai; return klaim terakhir.
+
+    Interval cek naik bertahap (0.2 s sampai 2 s) supaya thread yang menunggu tidak
+    membanjiri RPC; wait=False langsung mengembalikan klaim pertama."""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    delay = 0.2
+    while True:
+        claim = claim_idempotency_key(route, key)
+        if claim.get("claimed") or claim.get("status") == "completed" or not wait:
+            return claim
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return claim
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 2.0)
+
+def stored_posting_response(response, wrote=False):
+    """Respons yang layak di-replay: redirect, JSON success, atau respons apa pun bila view
+    sudah menulis ke database (mis. batch sebagian berhasil); selain itu None"""
+    succeeded = (300 <= response.status_code < 400
+                 or (response.is_json and (response.get_json(silent=True) or {}).get("success")))
+    if not (wrote or succeeded):
+        return None
+    return {"status": response.status_code, "mimetype": response.mimetype,
+            "body": response.get_data(as_text=True), "location": response.headers.get("Location")}
+
+def posting_response(stored):
+    """Response Flask dari respons posting yang disimpan"""
+    response = Response(stored["body"], status=stored["status"], mimetype=stored["mimetype"])
+    if stored.get("location"):
+        response.headers["Location"] = stored["location"]
+    return response
+
+def interrupted_posting_response():
+    """Respons yang disimpan bila view error setelah sebagian data tersimpan"""
+    message = "Transaksi terhenti setelah sebagian data tersimpan, cek data sebelum mengulang"
+    if request.is_json:
+        return {"status": 500, "mimetype": "application/json",
+                "body": json.dumps({"success": False, "message": message}), "location": None}
+    return {"status": 500, "mimetype": "text/html",
+            "body": f"<script>alert('{message}'); window.history.back();</script>", "location": None}
+
+def idempotent(view):
+    """Decorator route posting: retry dengan idempotency key yang sama tidak dieksekusi ulang"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = get_idempotency_key()
+        if not key or "user" not in session:
+            return view(*args, **kwargs)
+        
+        route = request.path
+        try:
+            # Klien JSON bisa mengulang sendiri: langsung 409, thread tidak ditahan
+            claim = wait_idempotent_response(route, key, wait=not request.is_json)
+        except Exception:
+            # Key tidak bisa diklaim: jangan posting tanpa perlindungan retry
+            message = "Transaksi belum bisa diproses, coba lagi sebentar lagi"
+            if request.is_json:
+                return jsonify({"success": False, "message": message}), 503
+            return f"<script>alert('{message}'); window.history.back();</script>", 503
+        if not claim.get("claimed"):
+            stored = claim.get("response")
+            if claim.get("status") == "completed" and stored:
+                print(f"🔁 Replay respons {route} untuk idempotency key {key}")
+                response = posting_response(stored)
+                response.headers["Idempotent-Replayed"] = "true"
+                return response
+            message = "Transaksi yang sama masih diproses, coba lagi sebentar lagi"
+            if request.is_json:
+                return jsonify({"success": False, "message": message}), 409
+            return f"<script>alert('{message}'); window.history.back();</script>", 409
+        
+        g.ledger_written = False
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            # Key dilepas hanya bila belum ada yang ditulis; jika sudah, retry tidak boleh memposting ulang
+            finish_idempotency_key(route, key, claim,
+                                   interrupted_posting_response() if g.ledger_written else None)
+            raise
+        finish_idempotency_key(route, key, claim, stored_posting_response(response, g.ledger_written))
+        return response
+    return wrapper
+
+# === Helper: Baca tabel per halaman ===
+# Satu .select().execute() tanpa batas dipotong diam-diam di max-rows server
+# (default Supabase 1000 baris). Semua pembacaan laporan lewat iter_query_rows:
+# halaman keyset berurutan, halaman berikutnya diambil di thread prefetch selagi
+# halaman sekarang diproses. READ_PAGE_SIZE tidak boleh melebihi max-rows server.
+READ_PAGE_SIZE = int(os.getenv("READ_PAGE_SIZE", "1000"))
+
+def keyset_literal(value):
+    """Nilai kunci untuk filter or_: angka apa adanya, selain itu dikutip"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def keyset_after(keys, row):
+    """Filter or_ untuk baris sesudah row pada urutan naik keys,
+    mis. (tanggal, id) -> tanggal.gt.X,and(tanggal.eq.X,id.gt.Y)"""
+    conditions = []
+    for i, key in enumerate(keys):
+        equal = [f"{prev}.eq.{keyset_literal(row[prev])}" for prev in keys[:i]]
+        greater = f"{key}.gt.{keyset_literal(row[key])}"
+        conditions.append(f"and({','.join(equal + [greater])})" if equal else greater)
+    return ",".join(conditions)
+
+def fetch_query_page(make_query, keys, after, page_size):
+    """Satu halaman query urut keys, mulai sesudah baris after (None = halaman pertama)"""
+    query = make_query()
+    for key in keys:
+        query = query.order(key)
+    if after is not None:
+        query = query.or_(keyset_after(keys, after))
+    return query.limit(page_size).execute().data or []
+
+def iter_query_rows(make_query, keys=("id",), page_size=READ_PAGE_SIZE):
+    """Yield semua baris query per halaman keyset (urut naik keys) dengan memori terbatas.
+
+    make_query() harus mengembalikan query builder baru (select + filter, tanpa order)
+    setiap dipanggil; kolom keys harus ikut di-select dan bersama-sama unik."""
+    page = fetch_query_page(make_query, keys, None, page_size)
+    while page:
+        pending = None
+        if len(page) >= page_size:
+            # Prefetch di konteks yang sama (g / instrumentasi request tetap tercatat)
+            context = contextvars.copy_context()
+            pending = READ_PREFETCH_POOL.submit(context.run, fetch_query_page,
+                                                make_query, keys, page[-1], page_size)
+        yield from page
+        page = pending.result() if pending else []
+
+def read_query_rows(make_query, keys=("id",), page_size=READ_PAGE_SIZE):
+    """Semua baris query sebagai list (lihat iter_query_rows)"""
+    return list(iter_query_rows(make_query, keys, page_size))
+
+# === Helper: Fetch paralel ===
+# Pembacaan yang saling bebas (input satu laporan: total per sumber jurnal, saldo awal,
+# baris jurnal, ...) dijalankan bersamaan di pool terbatas, jadi latency mendekati
+# query paling lambat, bukan jumlah semuanya.
+IN_FETCH_POOL = contextvars.ContextVar("in_fetch_pool", default=False)
+
+def create_thread_pools():
+    """Pool prefetch halaman dan fetch paralel; dibuat ulang di proses hasil fork
+    (gunicorn --preload) karena thread pool induk tidak ikut ter-fork"""
+    global READ_PREFETCH_POOL, FETCH_POOL
+    READ_PREFETCH_POOL = ThreadPoolExecutor(max_workers=READ_PREFETCH_WORKERS, thread_name_prefix="sia-prefetch")
+    FETCH_POOL = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="sia-fetch")
+
+create_thread_pools()
+os.register_at_fork(after_in_child=create_thread_pools)
+
+def run_in_fetch_pool(call):
+    IN_FETCH_POOL.set(True)
+    return call()
+
+def fetch_concurrently(*calls):
+    """Jalankan beberapa callable tanpa argumen bersamaan; hasil berurutan seperti calls.
+
+    Callable pertama jalan di thread pemanggil. Fan-out bersarang (dari dalam worker)
+    dijalankan berurutan agar pool tidak menunggu dirinya sendiri."""
+    if len(calls) < 2 or IN_FETCH_POOL.get():
+        return [call() for call in calls]
+    # Konteks disalin agar g / instrumentasi request tetap terlihat dari worker
+    futures = [FETCH_POOL.submit(contextvars.copy_context().run, run_in_fetch_pool, call)
+               for call in calls[1:]]
+    first = calls[0]()
+    return [first] + [future.result() for future in futures]
+
+# === Helper: Kolom select per kebutuhan ===
+# Tiap pembacaan hanya meminta kolom yang benar-benar dipakai: payload JSON, waktu parse
+# dan memori dict per baris jadi lebih kecil di ledger besar. Kolom kunci keyset
+# (iter_query_rows) harus ikut di set yang dipakai.
+ACCOUNT_COLUMNS = "kode_akun, nama_akun, kategori, tipe_akun, saldo_awal"
+JURNAL_DISPLAY_COLUMNS = "id, tanggal, nomor_jurnal, jenis_transaksi, kode_akun, debit, kredit"
+JURNAL_BUKU_BESAR_COLUMNS = "id, tanggal, kode_akun, debit, kredit, jenis_transaksi, referensi"
+JURNAL_EXPORT_COLUMNS = "id, tanggal, nomor_jurnal, jenis_transaksi, kode_akun, deskripsi, debit, kredit, referensi"
+PIUTANG_COLUMNS = "id, customer, tanggal, keterangan, debit, kredit, saldo"
+INVENTORY_COLUMNS = "item_code, item_name, item_size, current_stock, total_sold, purchase_price, selling_price"
+SALES_ITEMS_COLUMNS = "id, tanggal, items"
+
+# === Helper: Periode laporan ===
+def next_month_start(tanggal):
+    """Tanggal 1 bulan berikutnya"""
+    return date(tanggal.year + tanggal.month // 12, tanggal.month % 12 + 1, 1)
+
+def get_default_period(today=None):
+    """Periode fiskal berjalan: (tanggal awal, tanggal akhir)"""
+    today = today or date.today()
+    tahun = today.year if today.month >= FISCAL_YEAR_START_MONTH else today.year - 1
+    start_date = date(tahun, FISCAL_YEAR_START_MONTH, 1)
+    end_date = date(tahun + 1, FISCAL_YEAR_START_MONTH, 1) - timedelta(days=1)
+    return start_date, end_date
+
+def get_report_period():
+    """Periode laporan dari query string ?start=YYYY-MM-DD&end=YYYY-MM-DD (default: periode fiskal berjalan)"""
+    start_date, end_date = get_default_period()
+    if not has_request_context():
+        return start_date, end_date
+
+    try:
+        if request.args.get('start'):
+            start_date = date.fromisoformat(request.args['start'])
+        if request.args.get('end'):
+            end_date = date.fromisoformat(request.args['end'])
+    except ValueError:
+        print(f"⚠ Periode tidak valid: {request.args.get('start')} - {request.args.get('end')}, pakai periode default")
+        return get_default_period()
+
+    if start_date > end_date:
+        start_date, end_date = end_date, start_date
+    return start_date, end_date
+
+def format_periode(start_date, end_date):
+    """Teks periode untuk judul laporan"""
+    return f"{start_date.strftime('%d %B %Y')} - {end_date.strftime('%d %B %Y')}"
+
+# === Helper: Saldo akun (materialized, dari tabel saldo_akun) ===
+JOURNAL_TABLES = ["jurnal_umum", "jurnal_penyesuaian", "jurnal_penutup"]
+
+def get_saldo_akun(sumber, start_date=None, end_date=None):
+    """Total debit/kredit per akun untuk satu tabel jurnal: kode_akun -> {'debit', 'kredit'}
+
+    Opsional dibatasi tanggal start_date s/d end_date. Dijumlahkan di server lewat RPC
+    saldo_per_akun (O(akun) baris). Fallback: bulan yang tercakup penuh dibaca dari
+    saldo_akun; hanya sisa hari di bulan pinggir yang diambil dari baris jurnal."""
+    try:
+        saldo_res = supabase.rpc("saldo_per_akun", {
+            "p_sumber": sumber,
+            "p_start": start_date.isoformat() if start_date else None,
+            "p_end": end_date.isoformat() if end_date else None,
+        }).execute()
+        return {
+            row['kode_akun']: {'debit': float(row['debit'] or 0), 'kredit': float(row['kredit'] or 0)}
+            for row in (saldo_res.data or [])
+        }
+    except Exception as rpc_error:
+        if not rpc_missing(rpc_error):
+            # Timeout / error SQL: jangan diganti jalur baca yang jauh lebih berat
+            print(f"❌ saldo_per_akun gagal ({rpc_error})")
+            raise
+        print(f"⚠ saldo_per_akun tidak tersedia ({rpc_error}), fallback ke saldo_akun + baris jurnal")
+    
+    # Jendela bulan penuh [bulan_awal, bulan_akhir) dalam periode
+    bulan_awal = None if start_date is None else (start_date if start_date.day == 1 else next_month_start(start_date))
+    bulan_akhir = None if end_date is None else (end_date + timedelta(days=1)).replace(day=1)
+    
+    rows = []
+    try:
+        if bulan_awal and bulan_akhir and bulan_awal >= bulan_akhir:
+            # Periode di dalam satu bulan: tidak ada bulan penuh
+            fringe_ranges = [(start_date, end_date)]
+        else:
+            def saldo_query():
+                query = supabase.table("saldo_akun")\
+                    .select("kode_akun, periode, total_debit, total_kredit")\
+                    .eq("sumber", sumber)
+                if bulan_awal:
+                    query = query.gte("periode", bulan_awal.strftime("%Y-%m"))
+                if bulan_akhir:
+                    query = query.lt("periode", bulan_akhir.strftime("%Y-%m"))
+                return query
+            rows = [
+                {'kode_akun': row['kode_akun'], 'debit': row['total_debit'], 'kredit': row['total_kredit']}
+                for row in iter_query_rows(saldo_query, keys=("kode_akun", "periode"))
+            ]
+            
+            fringe_ranges = []
+            if start_date and start_date < bulan_awal:
+                fringe_ranges.append((start_date, bulan_awal - timedelta(days=1)))
+            if end_date and bulan_akhir <= end_date:
+                fringe_ranges.append((bulan_akhir, end_date))
+    except Exception as e:
+        # Tabel saldo_akun belum dibuat: hitung langsung dari baris jurnal
+        print(f"⚠ saldo_akun tidak bisa dibaca ({e}), hitung ulang dari {sumber}")
+        rows = []
+        fringe_ranges = [(start_date, end_date)]
+    
+    totals = {}
+    def tambah(row):
+        total = totals.setdefault(row['kode_akun'], {'debit': 0, 'kredit': 0})
+        total['debit'] += float(row['debit'] or 0)
+        total['kredit'] += float(row['kredit'] or 0)
+    
+    for row in rows:
+        tambah(row)
+    for range_start, range_end in fringe_ranges:
+        def fringe_query(range_start=range_start, range_end=range_end):
+            query = supabase.table(sumber).select("id, kode_akun, debit, kredit")
+            if range_start:
+                query = query.gte("tanggal", range_start.isoformat())
+            if range_end:
+                query = query.lte("tanggal", range_end.isoformat())
+            return query
+        for row in iter_query_rows(fringe_query):
+            tambah(row)
+    return totals
+
+def tambah_total_akun(saldo, catalogue, totals):
+    """Tambahkan total debit/kredit per akun ke saldo (arah saldo normal akun); akun di luar katalog diabaikan"""
+    for kode, total in totals.items():
+        if kode not in catalogue:
+            continue
+        if catalogue[kode]['tipe_akun'] == 'debit':
+            saldo[kode] += total['debit'] - total['kredit']
+        else:  # kredit
+            saldo[kode] += total['kredit'] - total['debit']
+    return saldo
+
+def get_saldo_akhir_akun(sumber_list, end_date=None):
+    """Saldo per akun (arah saldo normal) per end_date = saldo_awal + mutasi dari tabel jurnal yang diminta"""
+    catalogue = get_account_catalogue()
+    saldo = {kode: akun['saldo_awal'] for kode, akun in catalogue.items()}
+
+    for totals in fetch_concurrently(*[partial(get_saldo_akun, sumber, end_date=end_date) for sumber in sumber_list]):
+        tambah_total_akun(saldo, catalogue, totals)
+
+    return saldo
+
+def get_saldo_awal_periode(sumber_list, start_date):
+    """Saldo pembukaan per akun untuk periode yang mulai di start_date (carry-forward dari saldo_akun)"""
+    if start_date is None:
+        return {kode: akun['saldo_awal'] for kode, akun in get_account_catalogue().items()}
+    return get_saldo_akhir_akun(sumber_list, start_date - timedelta(days=1))
+
+def get_mutasi_periode(sumber_list, start_date, end_date):
+    """Mutasi per akun (arah saldo normal) selama periode, tanpa saldo awal"""
+    catalogue = get_account_catalogue()
+    mutasi = {kode: 0 for kode in catalogue}
+
+    for totals in fetch_concurrently(*[partial(get_saldo_akun, sumber, start_date, end_date) for sumber in sumber_list]):
+        tambah_total_akun(mutasi, catalogue, totals)
+
+    return mutasi
+
+def rebuild_saldo_akun(sumber=None):
+    """Hitung ulang saldo_akun dari baris jurnal (setelah baris jurnal dihapus)"""
+    for table_name in ([sumber] if sumber else JOURNAL_TABLES):
+        try:
+            supabase.rpc("rebuild_saldo_akun", {"p_sumber": table_name}).execute()
+            bump_ledger_version(table_name)
+            print(f"✅ saldo_akun {table_name} berhasil di-rebuild")
+        except Exception as e:
+            print(f"⚠ Gagal rebuild saldo_akun {table_name}: {e}")
+
+# === Ledger snapshot ===
+# Semua laporan per end_date (neraca saldo, NSSP, neraca lajur, laba rugi, neraca,
+# perubahan modal, jurnal penutup, neraca saldo setelah penutupan) dihitung dari satu
+# LedgerSnapshot. Input dibaca sekali (lazy) dan tiap laporan hitung_*(snapshot) dihitung
+# sekali per snapshot lewat snapshot.get(), jadi laporan yang saling memanggil tidak
+# fetch atau menghitung ulang. Snapshot di-cache per versi ledger (get_ledger_snapshot)
+# dan dipakai bersama antar request: isinya jangan diubah oleh pemanggil.
+class LedgerSnapshot:
+    """Data ledger per end_date: katalog akun, total jurnal per akun, jurnal penutup dan hasil turunan"""
+
+    def __init__(self, end_date=None):
+        self.end_date = end_date
+        self.catalogue = get_account_catalogue()
+        self.results = {}
+        self.lock = threading.RLock()
+
+    def get(self, func):
+        """Hasil func(snapshot), dihitung sekali per snapshot (hasil yang raise tidak disimpan)"""
+        with self.lock:
+            if func not in self.results:
+                self.results[func] = func(self)
+            return self.results[func]
+
+    def prefetch(self, *inputs):
+        """Baca beberapa input (baca_*) yang belum ada secara paralel, lalu kembalikan snapshot"""
+        with self.lock:
+            missing = [func for func in inputs if func not in self.results]
+        # Dibaca di luar lock agar worker tidak saling menunggu
+        results = fetch_concurrently(*[partial(func, self) for func in missing])
+        with self.lock:
+            for func, result in zip(missing, results):
+                self.results.setdefault(func, result)
+        return self
+
+    @property
+    def saldo_umum(self):
+        """Total debit/kredit jurnal umum per akun s/d end_date (dari saldo_akun)"""
+        return self.get(baca_saldo_umum)
+
+    @property
+    def penyesuaian(self):
+        """Total debit/kredit jurnal penyesuaian per akun s/d end_date (dari saldo_akun)"""
+        return self.get(baca_penyesuaian)
+
+    @property
+    def jurnal_penutup(self):
+        """Total debit/kredit jurnal_penutup tersimpan per akun s/d end_date"""
+        return self.get(baca_jurnal_penutup)
+
+    @property
+    def pembelian_persediaan(self):
+        """Total debit pembelian per akun persediaan (1-1200 / 1-1300) s/d end_date"""
+        return self.get(baca_pembelian_persediaan)
+
+def baca_saldo_umum(snapshot):
+    return get_saldo_akun("jurnal_umum", end_date=snapshot.end_date)
+
+def baca_penyesuaian(snapshot):
+    return get_saldo_akun("jurnal_penyesuaian", end_date=snapshot.end_date)
+
+def baca_jurnal_penutup(snapshot):
+    # Cukup total per akun (dipakai hitung_neraca_saldo_setelah_penutupan)
+    try:
+        totals = get_saldo_akun("jurnal_penutup", end_date=snapshot.end_date)
+    except Exception:
+        # Jika tabel belum ada, anggap kosong agar tidak error
+        return []
+    return [{'kode_akun': kode, **total} for kode, total in totals.items()]
+
+def baca_pembelian_persediaan(snapshot):
+    # Difilter di server: hanya baris persediaan dari transaksi pembelian
+    def make_query():
+        query = supabase.table("jurnal_umum").select("id, kode_akun, debit")\
+            .in_("kode_akun", ['1-1200', '1-1300'])\
+            .like("jenis_transaksi", "%Pembelian%")
+        if snapshot.end_date:
+            query = query.lte("tanggal", snapshot.end_date.isoformat())
+        return query
+    pembelian = {'1-1200': 0, '1-1300': 0}
+    for row in iter_query_rows(make_query):
+        pembelian[row['kode_akun']] += row['debit']
+    return pembelian
+
+# Input snapshot per kelompok laporan, dibaca paralel lewat snapshot.prefetch()
+SNAPSHOT_INPUT_NSSP = (baca_saldo_umum, baca_penyesuaian)
+SNAPSHOT_INPUT_PENUTUPAN = SNAPSHOT_INPUT_NSSP + (baca_jurnal_penutup, baca_pembelian_persediaan)
+
+def hitung_saldo_akhir_umum(snapshot):
+    """Saldo akhir jurnal umum per akun (arah saldo normal) = saldo_awal + mutasi"""
+    saldo = {kode: akun['saldo_awal'] for kode, akun in snapshot.catalogue.items()}
+    return tambah_total_akun(saldo, snapshot.catalogue, snapshot.saldo_umum)
+
+@cached_report(*LEDGER_DOMAINS, "jurnal_penutup")
+def get_ledger_snapshot(end_date=None):
+    """Snapshot ledger per end_date, dipakai ulang sampai salah satu domain ledger berubah"""
+    return LedgerSnapshot(end_date)
+
 # === Helper: Record ke Buku Pembantu Piutang ===
 def record_buku_pembantu_piutang(customer, tanggal, keterangan, debit, kredit):
     """Record transaksi ke buku pembantu piutang untuk customer tertentu"""
     try:
-        # Cek apakah customer sudah ada
-        existing_res = supabase.table("buku_pembantu_piutang").select("*")\
-            .eq("customer", customer)\
-            .order("tanggal")\
-            .execute()
-        
-        # Hitung saldo terakhir
-        saldo_akhir = 0
-        if existing_res.data:
-            last_entry = existing_res.data[-1]
-            saldo_akhir = last_entry['saldo']
-        
-        # Hitung saldo baru
-        saldo_baru = saldo_akhir + debit - kredit
-        
-        # Record transaksi baru
-        piutang_data = {
-            "customer": customer,
-            "tanggal": tanggal,
-            "keterangan": keterangan,
-            "debit": debit,
-            "kredit": kredit,
-            "saldo": saldo_baru,
-            "created_at": datetime.now().isoformat()
-        }
-        
-        result = supabase.table("buku_pembantu_piutang").insert(piutang_data).execute()
+        # post_piutang() menaikkan saldo customer di piutang_saldo dan menyimpan baris buku
+        # pembantu dalam satu transaksi: biaya posting tetap, tidak bergantung panjang history
+        try:
+            result = supabase.rpc("post_piutang", {
+                "p_customer": customer,
+                "p_tanggal": tanggal,
+                "p_keterangan": keterangan,
+                "p_debit": debit,
+                "p_kredit": kredit,
+            }).execute()
+        except Exception as rpc_error:
+            if not rpc_missing(rpc_error):
+                # Bisa saja sudah ter-commit di server: jangan diposting ulang lewat insert biasa
+                print(f"❌ post_piutang gagal ({rpc_error}), baris {customer} tidak di-insert ulang")
+                return False
+            print(f"⚠ post_piutang tidak tersedia ({rpc_error}), fallback ke insert biasa")
+            result = record_buku_pembantu_piutang_fallback(customer, tanggal, keterangan, debit, kredit)
+        bump_ledger_version("buku_pembantu_piutang")
         
         if result.data:
             print(f"✅ Buku Pembantu Piutang updated: {customer} - {keterangan}")
@@ -630,23 +1374,53 @@ def record_buku_pembantu_piutang(customer, tanggal, keterangan, debit, kredit):
         print(f"Error recording buku pembantu piutang: {e}")
         return False
 
+def record_buku_pembantu_piutang_fallback(customer, tanggal, keterangan, debit, kredit):
+    """Versi non-RPC: baca satu baris terakhir customer (lewat index), lalu insert.
+
+    Tidak atomik; piutang_saldo tidak ikut di-update sehingga perlu di-rebuild setelah RPC dipasang."""
+    last_res = supabase.table("buku_pembantu_piutang").select("saldo")\
+        .eq("customer", customer)\
+        .order("tanggal", desc=True)\
+        .order("created_at", desc=True)\
+        .limit(1)\
+        .execute()
+    saldo_akhir = last_res.data[0]['saldo'] if last_res.data else 0
+    
+    return supabase.table("buku_pembantu_piutang").insert({
+        "customer": customer,
+        "tanggal": tanggal,
+        "keterangan": keterangan,
+        "debit": debit,
+        "kredit": kredit,
+        "saldo": saldo_akhir + debit - kredit,
+        "created_at": datetime.now().isoformat()
+    }).execute()
+
+def rebuild_piutang_saldo():
+    """Hitung ulang piutang_saldo dari seluruh baris buku pembantu piutang"""
+    try:
+        supabase.rpc("rebuild_piutang_saldo", {}).execute()
+        print("✅ piutang_saldo berhasil di-rebuild")
+    except Exception as e:
+        print(f"⚠ Gagal rebuild piutang_saldo: {e}")
+
 # === Helper: Get Buku Pembantu Piutang Data ===
-def get_buku_pembantu_piutang_data():
-    """Ambil data buku pembantu piutang dikelompokkan per customer"""
+@cached_report("buku_pembantu_piutang")
+def get_buku_pembantu_piutang_data(start_date=None, end_date=None):
+    """Ambil data buku pembantu piutang dikelompokkan per customer (opsional per periode)"""
     try:
-        # Ambil semua data buku pembantu piutang
-        piutang_res = supabase.table("buku_pembantu_piutang")\
-            .select("*")\
-            .order("customer")\
-            .order("tanggal")\
-            .execute()
-        
-        if not piutang_res.data:
-            return {}
+        # Ambil data buku pembantu piutang (kolom saldo sudah berjalan per customer)
+        def make_query():
+            query = supabase.table("buku_pembantu_piutang").select(PIUTANG_COLUMNS)
+            if start_date:
+                query = query.gte("tanggal", start_date.isoformat())
+            if end_date:
+                query = query.lte("tanggal", end_date.isoformat())
+            return query
         
         # Kelompokkan per customer
         buku_piutang = {}
-        for entry in piutang_res.data:
+        for entry in iter_query_rows(make_query, keys=("customer", "tanggal", "id")):
             customer = entry['customer']
             if customer not in buku_piutang:
                 buku_piutang[customer] = []
@@ -658,38 +1432,95 @@ def get_buku_pembantu_piutang_data():
         print(f"Error getting buku pembantu piutang data: {e}")
         return {}
 
+# === Helper: Rekap penjualan per ukuran ===
+@cached_report("sales")
+def get_penjualan_per_ukuran(start_date=None, end_date=None):
+    """Total penjualan per hari per ukuran ikan: [{tanggal, jenis_ikan, quantity, subtotal, jumlah_transaksi}]
+
+    Dijumlahkan di server lewat RPC penjualan_per_ukuran; fallback menjumlahkan item tabel sales."""
+    try:
+        rekap_res = supabase.rpc("penjualan_per_ukuran", {
+            "p_start": start_date.isoformat() if start_date else None,
+            "p_end": end_date.isoformat() if end_date else None,
+        }).execute()
+        return [{
+            'tanggal': str(row['tanggal'])[:10],
+            'jenis_ikan': row['jenis_ikan'],
+            'quantity': int(row['quantity'] or 0),
+            'subtotal': float(row['subtotal'] or 0),
+            'jumlah_transaksi': int(row['jumlah_transaksi'] or 0),
+        } for row in (rekap_res.data or [])]
+    except Exception as rpc_error:
+        if not rpc_missing(rpc_error):
+            print(f"Error getting rekap penjualan: {rpc_error}")
+            return []
+        print(f"⚠ penjualan_per_ukuran tidak tersedia ({rpc_error}), fallback ke tabel sales")
+    
+    def make_query():
+        query = supabase.table("sales").select(SALES_ITEMS_COLUMNS)
+        if start_date:
+            query = query.gte("tanggal", start_date.isoformat())
+        if end_date:
+            query = query.lte("tanggal", end_date.isoformat())
+        return query
+    
+    try:
+        rekap = {}
+        for sale in iter_query_rows(make_query, keys=("tanggal", "id")):
+            items = sale['items']
+            items = json.loads(items) if isinstance(items, str) else (items or [])
+            for item in items:
+                key = (str(sale['tanggal'])[:10], item.get('jenis_ikan'))
+                baris = rekap.setdefault(key, {'tanggal': key[0], 'jenis_ikan': key[1], 'quantity': 0,
+                                               'subtotal': 0, 'sales': set()})
+                baris['quantity'] += int(item.get('quantity') or 0)
+                baris['subtotal'] += float(item.get('subtotal') or 0)
+                baris['sales'].add(sale['id'])
+        hasil = []
+        for key in sorted(rekap, key=lambda key: (key[0], str(key[1]))):
+            baris = rekap[key]
+            baris['jumlah_transaksi'] = len(baris.pop('sales'))
+            hasil.append(baris)
+        return hasil
+    except Exception as e:
+        print(f"Error getting rekap penjualan: {e}")
+        return []
+
 # === Helper: Get Laporan Perubahan Modal ===
-def get_laporan_perubahan_modal():
+def hitung_perubahan_modal(snapshot):
+    """Laporan perubahan modal dari NSSP dan laba rugi snapshot"""
+    # Ambil data neraca saldo setelah penyesuaian
+    neraca_setelah_penyesuaian = snapshot.get(hitung_neraca_saldo_setelah_penyesuaian)
+    
+    # Ambil data laba rugi
+    laba_rugi_data = snapshot.get(hitung_laba_rugi)
+    
+    # Cari akun Modal dan Prive
+    modal_awal = 0
+    prive = 0
+    
+    for item in neraca_setelah_penyesuaian:
+        if item['kode_akun'] == '3-1000':  # Modal Usaha
+            modal_awal = item['debit'] if item['debit'] > 0 else item['kredit']
+        elif item['kode_akun'] == '3-1200':  # Prive
+            prive = item['debit'] if item['debit'] > 0 else item['kredit']
+    
+    laba_bersih = laba_rugi_data['laba_bersih']
+    perubahan_modal = laba_bersih - prive
+    modal_akhir = modal_awal + perubahan_modal
+    
+    return {
+        'modal_awal': modal_awal,
+        'laba_bersih': laba_bersih,
+        'prive': prive,
+        'perubahan_modal': perubahan_modal,
+        'modal_akhir': modal_akhir
+    }
+
+def get_laporan_perubahan_modal(end_date=None):
     """Ambil data untuk laporan perubahan modal"""
     try:
-        # Ambil data neraca saldo setelah penyesuaian
-        neraca_setelah_penyesuaian = get_neraca_saldo_setelah_penyesuaian()
-        
-        # Ambil data laba rugi
-        laba_rugi_data = get_laba_rugi_data()
-        
-        # Cari akun Modal dan Prive
-        modal_awal = 0
-        prive = 0
-        
-        for item in neraca_setelah_penyesuaian:
-            if item['kode_akun'] == '3-1000':  # Modal Usaha
-                modal_awal = item['debit'] if item['debit'] > 0 else item['kredit']
-            elif item['kode_akun'] == '3-1200':  # Prive
-                prive = item['debit'] if item['debit'] > 0 else item['kredit']
-        
-        laba_bersih = laba_rugi_data['laba_bersih']
-        perubahan_modal = laba_bersih - prive
-        modal_akhir = modal_awal + perubahan_modal
-        
-        return {
-            'modal_awal': modal_awal,
-            'laba_bersih': laba_bersih,
-            'prive': prive,
-            'perubahan_modal': perubahan_modal,
-            'modal_akhir': modal_akhir
-        }
-        
+        return get_ledger_snapshot(end_date).prefetch(*SNAPSHOT_INPUT_NSSP).get(hitung_perubahan_modal)
     except Exception as e:
         print(f"Error getting laporan perubahan modal: {e}")
         return {
@@ -701,342 +1532,337 @@ def get_laporan_perubahan_modal():
         }
 
 # === Helper: Get jurnal penutup ===
-def get_jurnal_penutup_data():
-    """Generate jurnal penutup berdasarkan struktur yang benar"""
-    try:
-        # Ambil data laba rugi dan neraca
-        laba_rugi_data = get_laba_rugi_data()
-        neraca_setelah_penyesuaian = get_neraca_saldo_setelah_penyesuaian()
-        
-        jurnal_penutup = []
-        
-        # ==================== 1. TUTUP AKUN PENDAPATAN ====================
-        print("🔧 1. Menutup akun pendapatan...")
-        
-        # Cari saldo akun pendapatan
-        pendapatan_8cm = 0
-        pendapatan_10cm = 0
-        beban_angkut_penjualan = 0
-        
-        for item in neraca_setelah_penyesuaian:
-            if item['kode_akun'] == '4-1000':  # Pendapatan 8cm
-                pendapatan_8cm = item['kredit'] if item['kredit'] > 0 else 0
-            elif item['kode_akun'] == '4-1100':  # Pendapatan 10cm
-                pendapatan_10cm = item['kredit'] if item['kredit'] > 0 else 0
-            elif item['kode_akun'] == '5-1200':  # Beban Angkut Penjualan
-                beban_angkut_penjualan = item['debit'] if item['debit'] > 0 else 0
-        
-        # Jurnal penutup pendapatan
-        if pendapatan_8cm > 0:
-            jurnal_penutup.append({
-                'kode_akun': '4-1000',
-                'nama_akun': 'Penjualan Ikan Patin 8 cm',
-                'debit': pendapatan_8cm,
-                'kredit': 0,
-                'keterangan': 'Penutupan pendapatan 8cm'
-            })
+def hitung_jurnal_penutup(snapshot):
+    """Generate jurnal penutup berdasarkan struktur yang benar (saldo per end_date snapshot)"""
+    # Ambil data laba rugi dan neraca
+    laba_rugi_data = snapshot.get(hitung_laba_rugi)
+    neraca_setelah_penyesuaian = snapshot.get(hitung_neraca_saldo_setelah_penyesuaian)
+    
+    jurnal_penutup = []
+    
+    # ==================== 1. TUTUP AKUN PENDAPATAN ====================
+    print("🔧 1. Menutup akun pendapatan...")
+    
+    # Cari saldo akun pendapatan
+    pendapatan_8cm = 0
+    pendapatan_10cm = 0
+    beban_angkut_penjualan = 0
+    
+    for item in neraca_setelah_penyesuaian:
+        if item['kode_akun'] == '4-1000':  # Pendapatan 8cm
+            pendapatan_8cm = item['kredit'] if item['kredit'] > 0 else 0
+        elif item['kode_akun'] == '4-1100':  # Pendapatan 10cm
+            pendapatan_10cm = item['kredit'] if item['kredit'] > 0 else 0
+        elif item['kode_akun'] == '5-1200':  # Beban Angkut Penjualan
+            beban_angkut_penjualan = item['debit'] if item['debit'] > 0 else 0
+    
+    # Jurnal penutup pendapatan
+    if pendapatan_8cm > 0:
+        jurnal_penutup.append({
+            'kode_akun': '4-1000',
+            'nama_akun': 'Penjualan Ikan Patin 8 cm',
+            'debit': pendapatan_8cm,
+            'kredit': 0,
+            'keterangan': 'Penutupan pendapatan 8cm'
+        })
+    
+    if pendapatan_10cm > 0:
+        jurnal_penutup.append({
+            'kode_akun': '4-1100',
+            'nama_akun': 'Penjualan Ikan Patin 10 cm',
+            'debit': pendapatan_10cm,
+            'kredit': 0,
+            'keterangan': 'Penutupan pendapatan 10cm'
+        })
+    
+    # Kredit ke Ikhtisar Laba Rugi untuk total pendapatan
+    total_pendapatan = pendapatan_8cm + pendapatan_10cm
+    if total_pendapatan > 0:
+        jurnal_penutup.append({
+            'kode_akun': '3-1100',
+            'nama_akun': 'Ikhtisar Laba Rugi',
+            'debit': 0,
+            'kredit': total_pendapatan,
+            'keterangan': 'Penutupan total pendapatan'
+        })
+    
+    # ==================== 2. TUTUP AKUN HPP ====================
+    print("🔧 2. Menutup akun HPP...")
+    
+    # Cari saldo akun HPP
+    beban_angkut_pembelian = 0
+    
+    for item in neraca_setelah_penyesuaian:
+        if item['kode_akun'] == '5-1000':  # HPP
+            # Untuk HPP, kita perlu detail komponennya
+            pass
+        elif item['kode_akun'] == '5-1300':  # Beban Angkut Pembelian
+            beban_angkut_pembelian = item['debit'] if item['debit'] > 0 else 0
+    
+    # Pembelian dari jurnal umum (total per akun persediaan, dibaca sekali per snapshot)
+    pembelian_8cm = snapshot.pembelian_persediaan['1-1200']  # Pembelian 8cm
+    pembelian_10cm = snapshot.pembelian_persediaan['1-1300']  # Pembelian 10cm
+    
+    total_hpp = pembelian_8cm + pembelian_10cm + beban_angkut_pembelian
+    
+    # Jurnal penutup HPP
+    if total_hpp > 0:
+        # Debit Ikhtisar Laba Rugi
+        jurnal_penutup.append({
+            'kode_akun': '3-1100',
+            'nama_akun': 'Ikhtisar Laba Rugi',
+            'debit': total_hpp,
+            'kredit': 0,
+            'keterangan': 'Penutupan HPP'
+        })
         
-        if pendapatan_10cm > 0:
+        # Kredit komponen HPP
+        if pembelian_8cm > 0:
             jurnal_penutup.append({
-                'kode_akun': '4-1100',
-                'nama_akun': 'Penjualan Ikan Patin 10 cm',
-                'debit': pendapatan_10cm,
-                'kredit': 0,
-                'keterangan': 'Penutupan pendapatan 10cm'
+                'kode_akun': '1-1200',
+                'nama_akun': 'Persediaan Ikan Patin 8 cm',
+                'debit': 0,
+                'kredit': pembelian_8cm,
+                'keterangan': 'Penutupan pembelian 8cm'
             })
         
-        # Kredit ke Ikhtisar Laba Rugi untuk total pendapatan
-        total_pendapatan = pendapatan_8cm + pendapatan_10cm
-        if total_pendapatan > 0:
+        if pembelian_10cm > 0:
             jurnal_penutup.append({
-                'kode_akun': '3-1100',
-                'nama_akun': 'Ikhtisar Laba Rugi',
+                'kode_akun': '1-1300',
+                'nama_akun': 'Persediaan Ikan Patin 10 cm',
                 'debit': 0,
-                'kredit': total_pendapatan,
-                'keterangan': 'Penutupan total pendapatan'
+                'kredit': pembelian_10cm,
+                'keterangan': 'Penutupan pembelian 10cm'
             })
         
-        # ==================== 2. TUTUP AKUN HPP ====================
-        print("🔧 2. Menutup akun HPP...")
-        
-        # Cari saldo akun HPP
-        pembelian_8cm = 0
-        pembelian_10cm = 0
-        beban_angkut_pembelian = 0
-        
-        for item in neraca_setelah_penyesuaian:
-            if item['kode_akun'] == '5-1000':  # HPP
-                # Untuk HPP, kita perlu detail komponennya
-                pass
-            elif item['kode_akun'] == '5-1300':  # Beban Angkut Pembelian
-                beban_angkut_pembelian = item['debit'] if item['debit'] > 0 else 0
-        
-        # Cari pembelian dari jurnal umum
-        jurnal_res = supabase.table("jurnal_umum").select("*").execute()
-        if jurnal_res.data:
-            for jurnal in jurnal_res.data:
-                if 'Pembelian' in jurnal['jenis_transaksi']:
-                    if jurnal['kode_akun'] == '1-1200':  # Pembelian 8cm
-                        pembelian_8cm += jurnal['debit']
-                    elif jurnal['kode_akun'] == '1-1300':  # Pembelian 10cm
-                        pembelian_10cm += jurnal['debit']
-        
-        total_hpp = pembelian_8cm + pembelian_10cm + beban_angkut_pembelian
-        
-        # Jurnal penutup HPP
-        if total_hpp > 0:
-            # Debit Ikhtisar Laba Rugi
+        if beban_angkut_pembelian > 0:
             jurnal_penutup.append({
-                'kode_akun': '3-1100',
-                'nama_akun': 'Ikhtisar Laba Rugi',
-                'debit': total_hpp,
-                'kredit': 0,
-                'keterangan': 'Penutupan HPP'
+                'kode_akun': '5-1300',
+                'nama_akun': 'Beban Angkut Pembelian',
+                'debit': 0,
+                'kredit': beban_angkut_pembelian,
+                'keterangan': 'Penutupan beban angkut pembelian'
             })
-            
-            # Kredit komponen HPP
-            if pembelian_8cm > 0:
-                jurnal_penutup.append({
-                    'kode_akun': '1-1200',
-                    'nama_akun': 'Persediaan Ikan Patin 8 cm',
-                    'debit': 0,
-                    'kredit': pembelian_8cm,
-                    'keterangan': 'Penutupan pembelian 8cm'
-                })
-            
-            if pembelian_10cm > 0:
-                jurnal_penutup.append({
-                    'kode_akun': '1-1300',
-                    'nama_akun': 'Persediaan Ikan Patin 10 cm',
-                    'debit': 0,
-                    'kredit': pembelian_10cm,
-                    'keterangan': 'Penutupan pembelian 10cm'
-                })
-            
-            if beban_angkut_pembelian > 0:
-                jurnal_penutup.append({
-                    'kode_akun': '5-1300',
-                    'nama_akun': 'Beban Angkut Pembelian',
-                    'debit': 0,
-                    'kredit': beban_angkut_pembelian,
-                    'keterangan': 'Penutupan beban angkut pembelian'
-                })
+    
+    # ==================== 3. TUTUP AKUN BEBAN ====================
+    print("🔧 3. Menutup akun beban...")
+    
+    # Cari saldo akun beban
+    beban_listrik = 0
+    beban_penyusutan_kendaraan = 0
+    beban_penyusutan_peralatan = 0
+    beban_penyusutan_bangunan = 0
+    
+    for item in neraca_setelah_penyesuaian:
+        if item['kode_akun'] == '5-1100':  # Beban Listrik dan Air
+            beban_listrik = item['debit'] if item['debit'] > 0 else 0
+        elif item['kode_akun'] == '6-1000':  # Beban Penyusutan Kendaraan
+            beban_penyusutan_kendaraan = item['debit'] if item['debit'] > 0 else 0
+        elif item['kode_akun'] == '6-1100':  # Beban Penyusutan Peralatan
+            beban_penyusutan_peralatan = item['debit'] if item['debit'] > 0 else 0
+        elif item['kode_akun'] == '6-1200':  # Beban Penyusutan Bangunan
+            beban_penyusutan_bangunan = item['debit'] if item['debit'] > 0 else 0
+    
+    total_beban = beban_listrik + beban_penyusutan_kendaraan + beban_penyusutan_peralatan + beban_penyusutan_bangunan
+    
+    # Jurnal penutup beban
+    if total_beban > 0:
+        # Debit Ikhtisar Laba Rugi
+        jurnal_penutup.append({
+            'kode_akun': '3-1100',
+            'nama_akun': 'Ikhtisar Laba Rugi',
+            'debit': total_beban,
+            'kredit': 0,
+            'keterangan': 'Penutupan total beban'
+        })
         
-        # ==================== 3. TUTUP AKUN BEBAN ====================
-        print("🔧 3. Menutup akun beban...")
-        
-        # Cari saldo akun beban
-        beban_listrik = 0
-        beban_penyusutan_kendaraan = 0
-        beban_penyusutan_peralatan = 0
-        beban_penyusutan_bangunan = 0
-        
-        for item in neraca_setelah_penyesuaian:
-            if item['kode_akun'] == '5-1100':  # Beban Listrik dan Air
-                beban_listrik = item['debit'] if item['debit'] > 0 else 0
-            elif item['kode_akun'] == '6-1000':  # Beban Penyusutan Kendaraan
-                beban_penyusutan_kendaraan = item['debit'] if item['debit'] > 0 else 0
-            elif item['kode_akun'] == '6-1100':  # Beban Penyusutan Peralatan
-                beban_penyusutan_peralatan = item['debit'] if item['debit'] > 0 else 0
-            elif item['kode_akun'] == '6-1200':  # Beban Penyusutan Bangunan
-                beban_penyusutan_bangunan = item['debit'] if item['debit'] > 0 else 0
-        
-        total_beban = beban_listrik + beban_penyusutan_kendaraan + beban_penyusutan_peralatan + beban_penyusutan_bangunan
-        
-        # Jurnal penutup beban
-        if total_beban > 0:
-            # Debit Ikhtisar Laba Rugi
+        # Kredit masing-masing akun beban
+        if beban_listrik > 0:
             jurnal_penutup.append({
-                'kode_akun': '3-1100',
-                'nama_akun': 'Ikhtisar Laba Rugi',
-                'debit': total_beban,
-                'kredit': 0,
-                'keterangan': 'Penutupan total beban'
+                'kode_akun': '5-1100',
+                'nama_akun': 'Beban Listrik dan Air',
+                'debit': 0,
+                'kredit': beban_listrik,
+                'keterangan': 'Penutupan beban listrik'
             })
-            
-            # Kredit masing-masing akun beban
-            if beban_listrik > 0:
-                jurnal_penutup.append({
-                    'kode_akun': '5-1100',
-                    'nama_akun': 'Beban Listrik dan Air',
-                    'debit': 0,
-                    'kredit': beban_listrik,
-                    'keterangan': 'Penutupan beban listrik'
-                })
-            
-            if beban_penyusutan_kendaraan > 0:
-                jurnal_penutup.append({
-                    'kode_akun': '6-1000',
-                    'nama_akun': 'Beban Penyusutan Kendaraan',
-                    'debit': 0,
-                    'kredit': beban_penyusutan_kendaraan,
-                    'keterangan': 'Penutupan beban penyusutan kendaraan'
-                })
-            
-            if beban_penyusutan_peralatan > 0:
-                jurnal_penutup.append({
-                    'kode_akun': '6-1100',
-                    'nama_akun': 'Beban Penyusutan Peralatan',
-                    'debit': 0,
-                    'kredit': beban_penyusutan_peralatan,
-                    'keterangan': 'Penutupan beban penyusutan peralatan'
-                })
-            
-            if beban_penyusutan_bangunan > 0:
-                jurnal_penutup.append({
-                    'kode_akun': '6-1200',
-                    'nama_akun': 'Beban Penyusutan Bangunan',
-                    'debit': 0,
-                    'kredit': beban_penyusutan_bangunan,
-                    'keterangan': 'Penutupan beban penyusutan bangunan'
-                })
-        
-        # ==================== 4. TUTUP LABA KE MODAL ====================
-        print("🔧 4. Menutup laba ke modal...")
         
-        laba_bersih = laba_rugi_data['laba_bersih']
-        
-        if laba_bersih >= 0:  # Laba
-            jurnal_penutup.append({
-                'kode_akun': '3-1100',
-                'nama_akun': 'Ikhtisar Laba Rugi',
-                'debit': laba_bersih,
-                'kredit': 0,
-                'keterangan': 'Penutupan laba bersih'
-            })
+        if beban_penyusutan_kendaraan > 0:
             jurnal_penutup.append({
-                'kode_akun': '3-1000',
-                'nama_akun': 'Modal Usaha',
+                'kode_akun': '6-1000',
+                'nama_akun': 'Beban Penyusutan Kendaraan',
                 'debit': 0,
-                'kredit': laba_bersih,
-                'keterangan': 'Penutupan laba bersih ke modal'
-            })
-        else:  # Rugi
-            jurnal_penutup.append({
-                'kode_akun': '3-1000',
-                'nama_akun': 'Modal Usaha',
-                'debit': abs(laba_bersih),
-                'kredit': 0,
-                'keterangan': 'Penutupan rugi bersih'
+                'kredit': beban_penyusutan_kendaraan,
+                'keterangan': 'Penutupan beban penyusutan kendaraan'
             })
+        
+        if beban_penyusutan_peralatan > 0:
             jurnal_penutup.append({
-                'kode_akun': '3-1100',
-                'nama_akun': 'Ikhtisar Laba Rugi',
+                'kode_akun': '6-1100',
+                'nama_akun': 'Beban Penyusutan Peralatan',
                 'debit': 0,
-                'kredit': abs(laba_bersih),
-                'keterangan': 'Penutupan rugi bersih'
+                'kredit': beban_penyusutan_peralatan,
+                'keterangan': 'Penutupan beban penyusutan peralatan'
             })
         
-        # ==================== 5. TUTUP PRIVE ====================
-        print("🔧 5. Menutup prive...")
-        
-        prive_saldo = 0
-        for item in neraca_setelah_penyesuaian:
-            if item['kode_akun'] == '3-1200':  # Prive
-                prive_saldo = item['debit'] if item['debit'] > 0 else 0
-        
-        if prive_saldo > 0:
+        if beban_penyusutan_bangunan > 0:
             jurnal_penutup.append({
-                'kode_akun': '3-1000',
-                'nama_akun': 'Modal Usaha',
-                'debit': prive_saldo,
-                'kredit': 0,
-                'keterangan': 'Penutupan prive'
-            })
-            jurnal_penutup.append({
-                'kode_akun': '3-1200',
-                'nama_akun': 'Prive',
+                'kode_akun': '6-1200',
+                'nama_akun': 'Beban Penyusutan Bangunan',
                 'debit': 0,
-                'kredit': prive_saldo,
-                'keterangan': 'Penutupan prive'
+                'kredit': beban_penyusutan_bangunan,
+                'keterangan': 'Penutupan beban penyusutan bangunan'
             })
-        
-        print(f"✅ Jurnal penutup berhasil digenerate: {len(jurnal_penutup)} entries")
-        return jurnal_penutup
+    
+    # ==================== 4. TUTUP LABA KE MODAL ====================
+    print("🔧 4. Menutup laba ke modal...")
+    
+    laba_bersih = laba_rugi_data['laba_bersih']
+    
+    if laba_bersih >= 0:  # Laba
+        jurnal_penutup.append({
+            'kode_akun': '3-1100',
+            'nama_akun': 'Ikhtisar Laba Rugi',
+            'debit': laba_bersih,
+            'kredit': 0,
+            'keterangan': 'Penutupan laba bersih'
+        })
+        jurnal_penutup.append({
+            'kode_akun': '3-1000',
+            'nama_akun': 'Modal Usaha',
+            'debit': 0,
+            'kredit': laba_bersih,
+            'keterangan': 'Penutupan laba bersih ke modal'
+        })
+    else:  # Rugi
+        jurnal_penutup.append({
+            'kode_akun': '3-1000',
+            'nama_akun': 'Modal Usaha',
+            'debit': abs(laba_bersih),
+            'kredit': 0,
+            'keterangan': 'Penutupan rugi bersih'
+        })
+        jurnal_penutup.append({
+            'kode_akun': '3-1100',
+            'nama_akun': 'Ikhtisar Laba Rugi',
+            'debit': 0,
+            'kredit': abs(laba_bersih),
+            'keterangan': 'Penutupan rugi bersih'
+        })
+    
+    # ==================== 5. TUTUP PRIVE ====================
+    print("🔧 5. Menutup prive...")
+    
+    prive_saldo = 0
+    for item in neraca_setelah_penyesuaian:
+        if item['kode_akun'] == '3-1200':  # Prive
+            prive_saldo = item['debit'] if item['debit'] > 0 else 0
+    
+    if prive_saldo > 0:
+        jurnal_penutup.append({
+            'kode_akun': '3-1000',
+            'nama_akun': 'Modal Usaha',
+            'debit': prive_saldo,
+            'kredit': 0,
+            'keterangan': 'Penutupan prive'
+        })
+        jurnal_penutup.append({
+            'kode_akun': '3-1200',
+            'nama_akun': 'Prive',
+            'debit': 0,
+            'kredit': prive_saldo,
+            'keterangan': 'Penutupan prive'
+        })
+    
+    print(f"✅ Jurnal penutup berhasil digenerate: {len(jurnal_penutup)} entries")
+    return jurnal_penutup
+
+def get_jurnal_penutup_data(end_date=None):
+    """Generate jurnal penutup berdasarkan struktur yang benar (saldo per end_date)"""
+    try:
+        return get_ledger_snapshot(end_date).prefetch(*SNAPSHOT_INPUT_NSSP, baca_pembelian_persediaan).get(hitung_jurnal_penutup)
         
     except Exception as e:
         print(f"❌ Error generating jurnal penutup: {e}")
         return []
     
 # === Helper: Get neraca saldo setelah penutupan ===
-def get_neraca_saldo_setelah_penutupan():
-    """Ambil data neraca saldo setelah penutupan"""
-    try:
-        # 1. Ambil neraca saldo setelah penyesuaian
-        neraca_setelah_penyesuaian = get_neraca_saldo_setelah_penyesuaian()
+def hitung_neraca_saldo_setelah_penutupan(snapshot):
+    """Neraca saldo setelah penutupan (saldo per end_date snapshot)"""
+    # 1. Ambil neraca saldo setelah penyesuaian
+    neraca_setelah_penyesuaian = snapshot.get(hitung_neraca_saldo_setelah_penyesuaian)
+    
+    # 2. Ambil jurnal penutup dari database (kosong bila tabel belum ada)
+    jurnal_penutup = snapshot.jurnal_penutup
+        
+    # Jika belum ada jurnal penutup di DB, mungkin user ingin melihat preview
+    # Kita bisa ambil dari fungsi generator in-memory jika DB kosong
+    if not jurnal_penutup:
+        print("ℹ️ Mengambil preview jurnal penutup (in-memory) karena DB kosong")
+        jurnal_penutup = snapshot.get(hitung_jurnal_penutup)
+
+    # 3. Kelompokkan jurnal penutup per akun
+    penyesuaian_penutup = {}
+    for entry in jurnal_penutup:
+        kode = entry['kode_akun']
+        if kode not in penyesuaian_penutup:
+            penyesuaian_penutup[kode] = {'debit': 0, 'kredit': 0}
+        penyesuaian_penutup[kode]['debit'] += float(entry.get('debit', 0))
+        penyesuaian_penutup[kode]['kredit'] += float(entry.get('kredit', 0))
+    
+    # 4. Hitung Saldo Akhir (Akun Nominal harus jadi 0)
+    akun_real = []
+    
+    for item in neraca_setelah_penyesuaian:
+        kode = item['kode_akun']
+        nama = item['nama_akun']
+        tipe = item.get('tipe_akun', 'debit')
+        
+        # Saldo awal (dari NSSP)
+        debit_awal = float(item.get('debit', 0))
+        kredit_awal = float(item.get('kredit', 0))
+        
+        # Apply Penutup
+        adj_debit = 0
+        adj_kredit = 0
+        if kode in penyesuaian_penutup:
+            adj = penyesuaian_penutup[kode]
+            adj_debit = adj['debit']
+            adj_kredit = adj['kredit']
+        
+        # Hitung saldo net baru
+        # Logika: Saldo Baru = (Debit Awal + Debit Penutup) - (Kredit Awal + Kredit Penutup)
+        # Karena Jurnal Penutup membalik saldo akun nominal, hasilnya harus 0 untuk akun nominal.
+        
+        total_debit = debit_awal + adj_debit
+        total_kredit = kredit_awal + adj_kredit
         
-        # 2. Ambil jurnal penutup dari database
-        try:
-            jurnal_penutup_res = supabase.table("jurnal_penutup").select("*").execute()
-            jurnal_penutup = jurnal_penutup_res.data if jurnal_penutup_res.data else []
-        except:
-            # Jika tabel belum ada, anggap kosong agar tidak error
-            jurnal_penutup = []
-            
-        # Jika belum ada jurnal penutup di DB, mungkin user ingin melihat preview
-        # Kita bisa ambil dari fungsi generator in-memory jika DB kosong
-        if not jurnal_penutup:
-            print("ℹ️ Mengambil preview jurnal penutup (in-memory) karena DB kosong")
-            jurnal_penutup = get_jurnal_penutup_data()
-
-        # 3. Kelompokkan jurnal penutup per akun
-        penyesuaian_penutup = {}
-        for entry in jurnal_penutup:
-            kode = entry['kode_akun']
-            if kode not in penyesuaian_penutup:
-                penyesuaian_penutup[kode] = {'debit': 0, 'kredit': 0}
-            penyesuaian_penutup[kode]['debit'] += float(entry.get('debit', 0))
-            penyesuaian_penutup[kode]['kredit'] += float(entry.get('kredit', 0))
-        
-        # 4. Hitung Saldo Akhir (Akun Nominal harus jadi 0)
-        akun_real = []
-        
-        for item in neraca_setelah_penyesuaian:
-            kode = item['kode_akun']
-            nama = item['nama_akun']
-            tipe = item.get('tipe_akun', 'debit')
-            
-            # Saldo awal (dari NSSP)
-            debit_awal = float(item.get('debit', 0))
-            kredit_awal = float(item.get('kredit', 0))
-            
-            # Apply Penutup
-            adj_debit = 0
-            adj_kredit = 0
-            if kode in penyesuaian_penutup:
-                adj = penyesuaian_penutup[kode]
-                adj_debit = adj['debit']
-                adj_kredit = adj['kredit']
-            
-            # Hitung saldo net baru
-            # Logika: Saldo Baru = (Debit Awal + Debit Penutup) - (Kredit Awal + Kredit Penutup)
-            # Karena Jurnal Penutup membalik saldo akun nominal, hasilnya harus 0 untuk akun nominal.
-            
-            total_debit = debit_awal + adj_debit
-            total_kredit = kredit_awal + adj_kredit
-            
-            saldo_akhir = 0
-            posisi_saldo = 'debit'
-            
-            if tipe == 'debit':
-                saldo_akhir = total_debit - total_kredit
-                posisi_saldo = 'debit' if saldo_akhir >= 0 else 'kredit'
-            else:
-                saldo_akhir = total_kredit - total_debit
-                posisi_saldo = 'kredit' if saldo_akhir >= 0 else 'debit'
-                
-            saldo_akhir = abs(saldo_akhir)
-            
-            # Hanya masukkan ke list jika saldo tidak 0 (atau sangat kecil)
-            if saldo_akhir > 1: # Toleransi floating point
-                akun_real.append({
-                    'kode_akun': kode,
-                    'nama_akun': nama,
-                    'debit': saldo_akhir if posisi_saldo == 'debit' else 0,
-                    'kredit': saldo_akhir if posisi_saldo == 'kredit' else 0
-                })
-                
-        return akun_real
+        saldo_akhir = 0
+        posisi_saldo = 'debit'
+        
+        if tipe == 'debit':
+            saldo_akhir = total_debit - total_kredit
+            posisi_saldo = 'debit' if saldo_akhir >= 0 else 'kredit'
+        else:
+            saldo_akhir = total_kredit - total_debit
+            posisi_saldo = 'kredit' if saldo_akhir >= 0 else 'debit'
+            
+        saldo_akhir = abs(saldo_akhir)
+        
+        # Hanya masukkan ke list jika saldo tidak 0 (atau sangat kecil)
+        if saldo_akhir > 1: # Toleransi floating point
+            akun_real.append({
+                'kode_akun': kode,
+                'nama_akun': nama,
+                'debit': saldo_akhir if posisi_saldo == 'debit' else 0,
+                'kredit': saldo_akhir if posisi_saldo == 'kredit' else 0
+            })
+            
+    return akun_real
+
+def get_neraca_saldo_setelah_penutupan(end_date=None):
+    """Ambil data neraca saldo setelah penutupan (saldo per end_date)"""
+    try:
+        return get_ledger_snapshot(end_date).prefetch(*SNAPSHOT_INPUT_PENUTUPAN).get(hitung_neraca_saldo_setelah_penutupan)
         
     except Exception as e:
         print(f"❌ Error getting neraca saldo setelah penutupan: {e}")
@@ -1072,49 +1898,12 @@ def update_inventory(item_code, transaction_type, quantity, price, transaction_d
         print(f"Error updating inventory: {e}")
         return False
 
-# === Helper: Record inventory transaction ===
-def record_inventory_transaction(item_code, transaction_type, quantity, price, reference_id, description, transaction_date):
-    """Record transaksi inventory untuk history"""
+# === Helper: Get inventory summary ===
+@cached_report("inventory")
+def get_inventory_summary():
+    """Ambil summary inventory untuk tampilan sederhana"""
     try:
-        item_res = supabase.table("inventory_items").select("id").eq("item_code", item_code).execute()
-        
-        if not item_res.data:
-            print(f"❌ Item {item_code} tidak ditemukan di tabel inventory_items")
-            return
-            
-        item_uuid = item_res.data[0]['id']
-        total_value = quantity * price
-        
-        transaction_data = {
-            "item_id": item_uuid,         
-            "transaction_type": transaction_type,
-            "quantity": quantity,
-            "unit_cost": price,               
-            "total_value": total_value,       
-            "reference_number": reference_id, 
-            "notes": description,  
-            "transaction_date": transaction_date
-        }
-        
-        # Simpan transaksi
-        supabase.table("inventory_transactions").insert(transaction_data).execute()
-        
-        # Update stok
-        update_inventory_stock(item_code, transaction_type, quantity)
-        
-        print(f"✅ Inventory transaction recorded: {item_code} {transaction_type} {quantity}")
-        return True
-        
-    except Exception as e:
-        print(f"Error recording inventory transaction: {e}")
-        return False
-
-# === Helper: Get inventory summary ===
-def get_inventory_summary():
-    """Ambil summary inventory untuk tampilan sederhana"""
-    try:
-        inventory_res = supabase.table("inventory").select("*").order("item_code").execute()
-        return inventory_res.data if inventory_res.data else []
+        return read_query_rows(lambda: supabase.table("inventory").select(INVENTORY_COLUMNS), keys=("item_code",))
     except Exception as e:
         print(f"Error getting inventory summary: {e}")
         return []
@@ -1125,76 +1914,291 @@ def format_journal_for_display(jurnal_data, accounts):
     if not jurnal_data:
         return []
     
-    # Kelompokkan berdasarkan tanggal dan jenis transaksi (transaksi yang sama)
+    # Index nama akun (lookup O(1) per baris)
+    nama_akun_index = {acc['kode_akun']: acc['nama_akun'] for acc in accounts}
+    
+    # Kelompokkan per nomor_jurnal dalam satu lintasan; urutan baris mengikuti query (tanggal, id).
+    # Baris lama tanpa nomor_jurnal tetap dikelompokkan per tanggal + jenis transaksi.
     grouped_jurnal = {}
     for entry in jurnal_data:
-        key = f"{entry['tanggal']}_{entry['jenis_transaksi']}"
-        if key not in grouped_jurnal:
-            grouped_jurnal[key] = []
-        grouped_jurnal[key].append(entry)
+        nomor_jurnal = entry.get('nomor_jurnal')
+        if nomor_jurnal:
+            key = (nomor_jurnal, entry['tanggal'])
+        else:
+            key = (entry['tanggal'], entry['jenis_transaksi'])
+        
+        group = grouped_jurnal.get(key)
+        show_date = group is None
+        if show_date:
+            group = grouped_jurnal[key] = []
+        
+        group.append({
+            'tanggal': entry['tanggal'] if show_date else '',
+            'keterangan': nama_akun_index.get(entry['kode_akun'], entry['kode_akun']),
+            'ref': entry['kode_akun'],
+            'debit': entry['debit'],
+            'kredit': entry['kredit'],
+            'show_date': show_date
+        })
     
     # Format untuk tampilan
     formatted_entries = []
-    
-    for key, entries in grouped_jurnal.items():
-        # Urutkan entries berdasarkan ID atau urutan simpan
-        entries_sorted = sorted(entries, key=lambda x: x.get('id', 0))
-        
-        # Baris pertama dengan tanggal
-        first_entry = entries_sorted[0]
-        nama_akun = next((acc['nama_akun'] for acc in accounts if acc['kode_akun'] == first_entry['kode_akun']), first_entry['kode_akun'])
-        
-        formatted_entries.append({
-            'tanggal': first_entry['tanggal'],
-            'keterangan': nama_akun,
-            'ref': first_entry['kode_akun'],
-            'debit': first_entry['debit'],
-            'kredit': first_entry['kredit'],
-            'show_date': True
-        })
-        
-        # Baris berikutnya tanpa tanggal
-        for entry in entries_sorted[1:]:
-            nama_akun = next((acc['nama_akun'] for acc in accounts if acc['kode_akun'] == entry['kode_akun']), entry['kode_akun'])
-            
-            formatted_entries.append({
-                'tanggal': '',
-                'keterangan': nama_akun,
-                'ref': entry['kode_akun'],
-                'debit': entry['debit'],
-                'kredit': entry['kredit'],
-                'show_date': False
-            })
+    for group in grouped_jurnal.values():
+        formatted_entries.extend(group)
     
     return formatted_entries
 
+# === Helper: Katalog akun (sekali per request) ===
+def get_account_catalogue():
+    """Ambil katalog akun kode_akun -> data akun, cukup satu query per request"""
+    if has_request_context() and 'account_catalogue' in g:
+        return g.account_catalogue
+    
+    accounts = iter_query_rows(lambda: supabase.table("accounts").select(ACCOUNT_COLUMNS), keys=("kode_akun",))
+    catalogue = {acc['kode_akun']: acc for acc in accounts}
+    
+    if has_request_context():
+        g.account_catalogue = catalogue
+    return catalogue
+
+def invalidate_account_catalogue():
+    """Buang katalog akun request ini dan cache laporan yang memakai akun (dipanggil setelah akun berubah)"""
+    if has_request_context():
+        g.pop('account_catalogue', None)
+    bump_ledger_version("accounts")
+
+
+# === Ledger engine: pandas (LEDGER_ENGINE=pandas) ===
+# Versi kolumnar dari buku besar, neraca saldo, NSSP dan neraca lajur. Input sama
+# dengan versi dict (baris jurnal + total dari saldo_akun) dan urutan penjumlahan
+# dipertahankan, jadi hasilnya identik.
+def akun_frame(catalogue):
+    """Katalog akun sebagai DataFrame (urutan sama dengan katalog)"""
+    return pd.DataFrame({
+        'kode_akun': list(catalogue.keys()),
+        'nama_akun': [akun['nama_akun'] for akun in catalogue.values()],
+        'tipe_akun': [akun['tipe_akun'] for akun in catalogue.values()],
+    })
+
+def frame_records(frame):
+    """DataFrame -> list of dict bertipe Python biasa (lebih cepat dari to_dict('records'))"""
+    columns = list(frame.columns)
+    values = [frame[column].tolist() for column in columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+def saldo_normal(tipe_akun, debit, kredit):
+    """debit - kredit untuk akun bersaldo normal debit, kredit - debit untuk akun kredit"""
+    return np.where(tipe_akun == 'debit', debit - kredit, kredit - debit)
+
+def pisah_debit_kredit(tipe_akun, saldo):
+    """Saldo (arah normal) ke kolom debit/kredit; saldo negatif pindah ke sisi lawan"""
+    positif = saldo >= 0
+    debit = np.where(tipe_akun == 'debit', np.where(positif, saldo, 0), np.where(positif, 0, -saldo))
+    kredit = np.where(tipe_akun == 'debit', np.where(positif, 0, -saldo), np.where(positif, saldo, 0))
+    return debit, kredit
+
+def tambah_akun_penyesuaian(frame, penyesuaian_per_akun, nama_akun):
+    """Tambahkan baris (saldo 0) untuk akun yang hanya muncul di jurnal penyesuaian"""
+    ada = set(frame['kode_akun'])
+    extra = [kode for kode in penyesuaian_per_akun if kode not in ada and nama_akun(kode) is not None]
+    if not extra:
+        return frame
+    tambahan = pd.DataFrame({'kode_akun': extra, 'nama_akun': [nama_akun(kode) for kode in extra]})
+    return pd.concat([frame, tambahan], ignore_index=True).fillna({'debit': 0, 'kredit': 0})
+
+def kolom_penyesuaian(frame, penyesuaian_per_akun):
+    """Total debit/kredit penyesuaian sejajar dengan baris frame (0 bila tidak ada)"""
+    penyesuaian = pd.DataFrame.from_dict(penyesuaian_per_akun, orient='index', columns=['debit', 'kredit'])
+    penyesuaian = penyesuaian.reindex(frame['kode_akun']).fillna(0)
+    return penyesuaian['debit'].to_numpy(), penyesuaian['kredit'].to_numpy()
+
+def hitung_buku_besar_pandas(accounts, saldo_awal_periode, jurnal_data):
+    """Buku besar: saldo berjalan per akun dengan cumulative sum per grup kode_akun"""
+    tipe_index = {akun['kode_akun']: akun['tipe_akun'] for akun in accounts}
+    jurnal = pd.DataFrame(jurnal_data, columns=['kode_akun', 'tanggal', 'jenis_transaksi', 'referensi', 'debit', 'kredit'])
+    jurnal = jurnal[jurnal['kode_akun'].isin(list(tipe_index))].reset_index(drop=True)
+    
+    # Saldo awal ditambahkan ke baris pertama tiap akun lalu np.cumsum per akun
+    # (penjumlahan berurutan, tanpa kompensasi Kahan seperti groupby.cumsum), jadi
+    # hasilnya sama persis dengan loop: ((saldo_awal + mutasi_1) + mutasi_2) + ...
+    mutasi = saldo_normal(jurnal['kode_akun'].map(tipe_index).to_numpy(), jurnal['debit'], jurnal['kredit']).astype(np.float64)
+    saldo = np.empty(len(jurnal), dtype=np.float64)
+    posisi_per_akun = jurnal.groupby('kode_akun', sort=False).indices
+    for kode_akun, posisi in posisi_per_akun.items():
+        mutasi_akun = mutasi[posisi]
+        mutasi_akun[0] = saldo_awal_periode[kode_akun] + mutasi_akun[0]
+        saldo[posisi] = np.cumsum(mutasi_akun)
+    
+    referensi = jurnal['referensi']
+    entries = pd.DataFrame({
+        'tanggal': jurnal['tanggal'],
+        'keterangan': jurnal['jenis_transaksi'],
+        'ref': referensi.where(referensi.notna() & (referensi != ''), '-'),
+        'debit': jurnal['debit'],
+        'kredit': jurnal['kredit'],
+        'saldo': saldo,
+    })
+    records = frame_records(entries)
+    entries_per_akun = {
+        kode_akun: [records[i] for i in posisi]
+        for kode_akun, posisi in posisi_per_akun.items()
+    }
+    
+    buku_besar = {}
+    for akun in accounts:
+        kode_akun = akun['kode_akun']
+        saldo_awal = saldo_awal_periode[kode_akun]
+        entries_with_saldo = entries_per_akun.get(kode_akun, [])
+        buku_besar[kode_akun] = {
+            'nama_akun': akun['nama_akun'],
+            'kategori': akun['kategori'],
+            'tipe_akun': akun['tipe_akun'],
+            'saldo_awal': saldo_awal,
+            'entries': entries_with_saldo,
+            'saldo_akhir': entries_with_saldo[-1]['saldo'] if entries_with_saldo else saldo_awal
+        }
+    return buku_besar
+
+def hitung_neraca_saldo_pandas(catalogue, saldo_akhir_akun):
+    """Neraca saldo: saldo positif di sisi normal akun"""
+    frame = akun_frame(catalogue)
+    saldo = frame['kode_akun'].map(saldo_akhir_akun)
+    frame['debit'] = saldo.where((frame['tipe_akun'] == 'debit') & (saldo > 0), 0)
+    frame['kredit'] = saldo.where((frame['tipe_akun'] == 'kredit') & (saldo > 0), 0)
+    return frame_records(frame[['kode_akun', 'nama_akun', 'debit', 'kredit']])
+
+def hitung_nssp_pandas(catalogue, neraca_saldo, penyesuaian_per_akun):
+    """Neraca saldo setelah penyesuaian = neraca saldo + total penyesuaian per akun"""
+    frame = pd.DataFrame(neraca_saldo, columns=['kode_akun', 'nama_akun', 'debit', 'kredit'])
+    frame = tambah_akun_penyesuaian(
+        frame, penyesuaian_per_akun, lambda kode: catalogue[kode]['nama_akun'] if kode in catalogue else None
+    )
+    penyesuaian_debit, penyesuaian_kredit = kolom_penyesuaian(frame, penyesuaian_per_akun)
+    
+    tipe_akun = frame['kode_akun'].map(lambda kode: catalogue.get(kode, {}).get('tipe_akun', 'debit')).to_numpy()
+    saldo = saldo_normal(
+        tipe_akun,
+        frame['debit'].to_numpy() + penyesuaian_debit,
+        frame['kredit'].to_numpy() + penyesuaian_kredit
+    )
+    debit, kredit = pisah_debit_kredit(tipe_akun, saldo)
+    
+    return frame_records(pd.DataFrame({
+        'kode_akun': frame['kode_akun'],
+        'nama_akun': frame['nama_akun'],
+        'debit': debit,
+        'kredit': kredit,
+        'saldo_akhir': saldo,
+        'tipe_akun': tipe_akun
+    }))
+
+def hitung_neraca_lajur_pandas(catalogue, neraca_saldo, penyesuaian_per_akun):
+    """Neraca lajur: NS, penyesuaian, NSSP lalu dipilah ke laba rugi (4-/5-/6-) atau neraca"""
+    frame = pd.DataFrame(neraca_saldo, columns=['kode_akun', 'nama_akun', 'debit', 'kredit'])
+    frame = tambah_akun_penyesuaian(
+        frame, penyesuaian_per_akun, lambda kode: catalogue.get(kode, {}).get('nama_akun', kode)
+    )
+    ns_debit = frame['debit'].to_numpy()
+    ns_kredit = frame['kredit'].to_numpy()
+    penyesuaian_debit, penyesuaian_kredit = kolom_penyesuaian(frame, penyesuaian_per_akun)
+    
+    tipe_akun = frame['kode_akun'].map(lambda kode: catalogue.get(kode, {}).get('tipe_akun', 'debit')).to_numpy()
+    saldo_setelah = np.where(
+        tipe_akun == 'debit',
+        ns_debit - ns_kredit + penyesuaian_debit - penyesuaian_kredit,
+        ns_kredit - ns_debit + penyesuaian_kredit - penyesuaian_debit
+    )
+    nssp_debit, nssp_kredit = pisah_debit_kredit(tipe_akun, saldo_setelah)
+    
+    nominal = frame['kode_akun'].str[:2].isin(['4-', '5-', '6-']).to_numpy()
+    ada_debit = nssp_debit > 0
+    
+    return frame_records(pd.DataFrame({
+        'kode_akun': frame['kode_akun'],
+        'nama_akun': frame['nama_akun'],
+        'neraca_saldo_debit': ns_debit,
+        'neraca_saldo_kredit': ns_kredit,
+        'penyesuaian_debit': penyesuaian_debit,
+        'penyesuaian_kredit': penyesuaian_kredit,
+        'neraca_saldo_setelah_penyesuaian_debit': nssp_debit,
+        'neraca_saldo_setelah_penyesuaian_kredit': nssp_kredit,
+        'laba_rugi_debit': np.where(nominal & ada_debit, nssp_debit, 0),
+        'laba_rugi_kredit': np.where(nominal & ~ada_debit, nssp_kredit, 0),
+        'neraca_debit': np.where(~nominal & ada_debit, nssp_debit, 0),
+        'neraca_kredit': np.where(~nominal & ~ada_debit, nssp_kredit, 0)
+    }))
+
+def hitung_neraca_saldo_laporan_pandas(catalogue, saldo_umum, penyesuaian_per_akun):
+    """Versi kolumnar get_neraca_saldo_laporan(): (neraca saldo, NSSP)"""
+    frame = akun_frame(catalogue)
+    saldo = frame['kode_akun'].map(saldo_umum).to_numpy()
+    saldo_awal = frame['kode_akun'].map(lambda kode: catalogue[kode]['saldo_awal']).to_numpy()
+    tipe_akun = frame['tipe_akun'].to_numpy()
+    
+    aktif = (saldo != 0) | (saldo_awal != 0)
+    neraca_saldo_data = frame_records(pd.DataFrame({
+        'kode_akun': frame['kode_akun'],
+        'nama_akun': frame['nama_akun'],
+        'debit': np.where((tipe_akun == 'debit') & (saldo > 0), saldo, 0),
+        'kredit': np.where((tipe_akun == 'kredit') & (saldo > 0), saldo, 0)
+    })[aktif])
+    
+    penyesuaian_debit, penyesuaian_kredit = kolom_penyesuaian(frame, penyesuaian_per_akun)
+    val = saldo + saldo_normal(tipe_akun, penyesuaian_debit, penyesuaian_kredit)
+    neraca_saldo_setelah_penyesuaian = frame_records(pd.DataFrame({
+        'kode_akun': frame['kode_akun'],
+        'nama_akun': frame['nama_akun'],
+        'debit': np.where((tipe_akun == 'debit') & (val > 0), val, 0),
+        'kredit': np.where((tipe_akun == 'kredit') & (val > 0), val, 0),
+        'saldo_akhir': val,
+        'tipe_akun': tipe_akun
+    }))
+    
+    return neraca_saldo_data, neraca_saldo_setelah_penyesuaian
+
 # === Helper: Ambil data buku besar per akun ===
-def get_buku_besar_data():
-    """Ambil data untuk buku besar - dikelompokkan per akun"""
+@cached_report("jurnal_umum", "accounts")
+def get_buku_besar_data(start_date=None, end_date=None):
+    """Ambil data untuk buku besar - dikelompokkan per akun (opsional per periode)"""
     try:
-        # Ambil semua akun
-        accounts_res = supabase.table("accounts").select("*").order("kode_akun").execute()
-        accounts = accounts_res.data if accounts_res.data else []
-        
-        # Ambil semua jurnal umum
-        jurnal_res = supabase.table("jurnal_umum")\
-            .select("*")\
-            .order("tanggal")\
-            .order("id")\
-            .execute()
-        jurnal_data = jurnal_res.data if jurnal_res.data else []
+        # Ambil semua akun dari katalog
+        accounts = list(get_account_catalogue().values())
+        
+        # Jurnal umum dalam periode
+        def make_query():
+            query = supabase.table("jurnal_umum").select(JURNAL_BUKU_BESAR_COLUMNS)
+            if start_date:
+                query = query.gte("tanggal", start_date.isoformat())
+            if end_date:
+                query = query.lte("tanggal", end_date.isoformat())
+            return query
+        
+        # Baris jurnal dan saldo awal periode (carry-forward saldo_akun, bukan replay
+        # jurnal sebelumnya) dibaca bersamaan
+        jurnal_data, saldo_awal_periode = fetch_concurrently(
+            partial(read_query_rows, make_query, keys=("tanggal", "id")),
+            partial(get_saldo_awal_periode, ["jurnal_umum"], start_date),
+        )
+        
+        if LEDGER_ENGINE == "pandas":
+            return hitung_buku_besar_pandas(accounts, saldo_awal_periode, jurnal_data)
         
         # Kelompokkan jurnal per akun
+        jurnal_per_akun = {}
+        for jurnal in jurnal_data:
+            jurnal_per_akun.setdefault(jurnal['kode_akun'], []).append(jurnal)
+        
         buku_besar = {}
         for akun in accounts:
             kode_akun = akun['kode_akun']
             nama_akun = akun['nama_akun']
             
-            # Filter jurnal untuk akun ini
-            jurnal_akun = [j for j in jurnal_data if j['kode_akun'] == kode_akun]
+            # Jurnal untuk akun ini
+            jurnal_akun = jurnal_per_akun.get(kode_akun, [])
             
             # Hitung saldo berjalan
-            saldo = akun['saldo_awal']
+            saldo_awal = saldo_awal_periode[kode_akun]
+            saldo = saldo_awal
             entries_with_saldo = []
             
             for jurnal in jurnal_akun:
@@ -1206,7 +2210,7 @@ def get_buku_besar_data():
                 entries_with_saldo.append({
                     'tanggal': jurnal['tanggal'],
                     'keterangan': jurnal['jenis_transaksi'],
-                    'ref': jurnal['kode_akun'],
+                    'ref': jurnal.get('referensi') or '-',
                     'debit': jurnal['debit'],
                     'kredit': jurnal['kredit'],
                     'saldo': saldo
@@ -1216,7 +2220,7 @@ def get_buku_besar_data():
                 'nama_akun': nama_akun,
                 'kategori': akun['kategori'],
                 'tipe_akun': akun['tipe_akun'],
-                'saldo_awal': akun['saldo_awal'],
+                'saldo_awal': saldo_awal,
                 'entries': entries_with_saldo,
                 'saldo_akhir': saldo
             }
@@ -1228,130 +2232,140 @@ def get_buku_besar_data():
         return {}
 
 # === Helper: Ambil data neraca saldo ===
-def get_neraca_saldo_data():
-    """Ambil data untuk neraca saldo"""
+def hitung_neraca_saldo(snapshot):
+    """Neraca saldo (sebelum penyesuaian) per end_date snapshot"""
+    # Saldo akhir dibaca dari saldo_akun (O(akun)), bukan replay seluruh jurnal umum
+    catalogue = snapshot.catalogue
+    saldo_akhir_akun = snapshot.get(hitung_saldo_akhir_umum)
+    if LEDGER_ENGINE == "pandas":
+        return hitung_neraca_saldo_pandas(catalogue, saldo_akhir_akun)
+    
+    neraca_saldo = []
+    
+    for kode_akun, akun in catalogue.items():
+        saldo_akhir = saldo_akhir_akun[kode_akun]
+        neraca_saldo.append({
+            'kode_akun': kode_akun,
+            'nama_akun': akun['nama_akun'],
+            'debit': saldo_akhir if akun['tipe_akun'] == 'debit' and saldo_akhir > 0 else 0,
+            'kredit': saldo_akhir if akun['tipe_akun'] == 'kredit' and saldo_akhir > 0 else 0
+        })
+    
+    return neraca_saldo
+
+def get_neraca_saldo_data(end_date=None):
+    """Ambil data untuk neraca saldo (saldo per end_date)"""
     try:
-        buku_besar_data = get_buku_besar_data()
-        neraca_saldo = []
-        
-        for kode_akun, data in buku_besar_data.items():
-            neraca_saldo.append({
-                'kode_akun': kode_akun,
-                'nama_akun': data['nama_akun'],
-                'debit': data['saldo_akhir'] if data['tipe_akun'] == 'debit' and data['saldo_akhir'] > 0 else 0,
-                'kredit': data['saldo_akhir'] if data['tipe_akun'] == 'kredit' and data['saldo_akhir'] > 0 else 0
-            })
-        
-        return neraca_saldo
+        return get_ledger_snapshot(end_date).get(hitung_neraca_saldo)
         
     except Exception as e:
         print(f"Error getting neraca saldo data: {e}")
         return []
 
 # === Helper: Ambil data neraca saldo setelah penyesuaian ===
-def get_neraca_saldo_setelah_penyesuaian():
-    """Ambil data untuk neraca saldo setelah penyesuaian"""
-    try:
-        # 1. Ambil neraca saldo sebelum penyesuaian (dari jurnal umum)
-        neraca_saldo = get_neraca_saldo_data()
-        
-        # 2. Ambil data jurnal penyesuaian langsung
-        jurnal_penyesuaian_res = supabase.table("jurnal_penyesuaian")\
-            .select("*")\
-            .order("tanggal")\
-            .order("id")\
-            .execute()
-        jurnal_penyesuaian = jurnal_penyesuaian_res.data if jurnal_penyesuaian_res.data else []
-        
-        print(f"🔍 DEBUG: NSSP - Neraca saldo entries: {len(neraca_saldo)}")
-        print(f"🔍 DEBUG: NSSP - Jurnal penyesuaian entries: {len(jurnal_penyesuaian)}")
-        
-        # 3. Konversi neraca saldo ke dictionary untuk memudahkan update
-        neraca_dict = {}
-        for item in neraca_saldo:
-            neraca_dict[item['kode_akun']] = {
-                'nama_akun': item['nama_akun'],
-                'debit': item['debit'],
-                'kredit': item['kredit']
-            }
+def hitung_neraca_saldo_setelah_penyesuaian(snapshot):
+    """Neraca saldo setelah penyesuaian (NSSP) per end_date snapshot"""
+    # 1. Ambil neraca saldo sebelum penyesuaian (dari jurnal umum)
+    neraca_saldo = snapshot.get(hitung_neraca_saldo)
+    
+    # 2. Ambil total jurnal penyesuaian per akun dari saldo_akun
+    penyesuaian_per_akun = snapshot.penyesuaian
+    
+    print(f"🔍 DEBUG: NSSP - Neraca saldo entries: {len(neraca_saldo)}")
+    print(f"🔍 DEBUG: NSSP - Akun dengan penyesuaian: {len(penyesuaian_per_akun)}")
+    
+    catalogue = snapshot.catalogue
+    
+    if LEDGER_ENGINE == "pandas":
+        return hitung_nssp_pandas(catalogue, neraca_saldo, penyesuaian_per_akun)
+    
+    # 3. Konversi neraca saldo ke dictionary untuk memudahkan update
+    neraca_dict = {}
+    for item in neraca_saldo:
+        neraca_dict[item['kode_akun']] = {
+            'nama_akun': item['nama_akun'],
+            'debit': item['debit'],
+            'kredit': item['kredit']
+        }
+    
+    # 4. Terapkan penyesuaian
+    for kode_akun, jurnal in penyesuaian_per_akun.items():
+        if kode_akun not in neraca_dict:
+            # Jika akun belum ada di neraca saldo, tambahkan
+            akun = catalogue.get(kode_akun)
+            if akun:
+                neraca_dict[kode_akun] = {
+                    'nama_akun': akun['nama_akun'],
+                    'debit': 0,
+                    'kredit': 0
+                }
+                print(f"🔍 DEBUG: NSSP - Added new account from adjustment: {kode_akun}")
         
-        # 4. Terapkan penyesuaian
-        for jurnal in jurnal_penyesuaian:
-            kode_akun = jurnal['kode_akun']
-            
-            if kode_akun not in neraca_dict:
-                # Jika akun belum ada di neraca saldo, tambahkan
-                accounts_res = supabase.table("accounts").select("*").eq("kode_akun", kode_akun).execute()
-                if accounts_res.data:
-                    akun = accounts_res.data[0]
-                    neraca_dict[kode_akun] = {
-                        'nama_akun': akun['nama_akun'],
-                        'debit': 0,
-                        'kredit': 0
-                    }
-                    print(f"🔍 DEBUG: NSSP - Added new account from adjustment: {kode_akun}")
-            
-            # Update saldo berdasarkan jurnal penyesuaian
-            if kode_akun in neraca_dict:
-                neraca_dict[kode_akun]['debit'] += jurnal['debit']
-                neraca_dict[kode_akun]['kredit'] += jurnal['kredit']
-                print(f"🔍 DEBUG: NSSP - Applied adjustment: {kode_akun} +Debit:{jurnal['debit']} +Kredit:{jurnal['kredit']}")
-        
-        # 5. Konversi kembali ke list dan format
-        neraca_setelah_penyesuaian = []
-        for kode_akun, data in neraca_dict.items():
-            # Ambil info tipe akun untuk menentukan saldo normal
-            accounts_res = supabase.table("accounts").select("tipe_akun").eq("kode_akun", kode_akun).execute()
-            tipe_akun = accounts_res.data[0]['tipe_akun'] if accounts_res.data else 'debit'
-            
-            # Format sesuai tipe akun
-            if tipe_akun == 'debit':
-                # Untuk akun debit: saldo = debit - kredit
-                saldo = data['debit'] - data['kredit']
-                if saldo >= 0:
-                    formatted_item = {
-                        'kode_akun': kode_akun,
-                        'nama_akun': data['nama_akun'],
-                        'debit': saldo,
-                        'kredit': 0,
-                        'saldo_akhir': saldo,
-                        'tipe_akun': tipe_akun
-                    }
-                else:
-                    formatted_item = {
-                        'kode_akun': kode_akun,
-                        'nama_akun': data['nama_akun'],
-                        'debit': 0,
-                        'kredit': abs(saldo),
-                        'saldo_akhir': saldo,
-                        'tipe_akun': tipe_akun
-                    }
-            else:  # kredit
-                # Untuk akun kredit: saldo = kredit - debit
-                saldo = data['kredit'] - data['debit']
-                if saldo >= 0:
-                    formatted_item = {
-                        'kode_akun': kode_akun,
-                        'nama_akun': data['nama_akun'],
-                        'debit': 0,
-                        'kredit': saldo,
-                        'saldo_akhir': saldo,
-                        'tipe_akun': tipe_akun
-                    }
-                else:
-                    formatted_item = {
-                        'kode_akun': kode_akun,
-                        'nama_akun': data['nama_akun'],
-                        'debit': abs(saldo),
-                        'kredit': 0,
-                        'saldo_akhir': saldo,
-                        'tipe_akun': tipe_akun
-                    }
-            
-            neraca_setelah_penyesuaian.append(formatted_item)
+        # Update saldo berdasarkan jurnal penyesuaian
+        if kode_akun in neraca_dict:
+            neraca_dict[kode_akun]['debit'] += jurnal['debit']
+            neraca_dict[kode_akun]['kredit'] += jurnal['kredit']
+            print(f"🔍 DEBUG: NSSP - Applied adjustment: {kode_akun} +Debit:{jurnal['debit']} +Kredit:{jurnal['kredit']}")
+    
+    # 5. Konversi kembali ke list dan format
+    neraca_setelah_penyesuaian = []
+    for kode_akun, data in neraca_dict.items():
+        # Ambil info tipe akun untuk menentukan saldo normal
+        tipe_akun = catalogue.get(kode_akun, {}).get('tipe_akun', 'debit')
+        
+        # Format sesuai tipe akun
+        if tipe_akun == 'debit':
+            # Untuk akun debit: saldo = debit - kredit
+            saldo = data['debit'] - data['kredit']
+            if saldo >= 0:
+                formatted_item = {
+                    'kode_akun': kode_akun,
+                    'nama_akun': data['nama_akun'],
+                    'debit': saldo,
+                    'kredit': 0,
+                    'saldo_akhir': saldo,
+                    'tipe_akun': tipe_akun
+                }
+            else:
+                formatted_item = {
+                    'kode_akun': kode_akun,
+                    'nama_akun': data['nama_akun'],
+                    'debit': 0,
+                    'kredit': abs(saldo),
+                    'saldo_akhir': saldo,
+                    'tipe_akun': tipe_akun
+                }
+        else:  # kredit
+            # Untuk akun kredit: saldo = kredit - debit
+            saldo = data['kredit'] - data['debit']
+            if saldo >= 0:
+                formatted_item = {
+                    'kode_akun': kode_akun,
+                    'nama_akun': data['nama_akun'],
+                    'debit': 0,
+                    'kredit': saldo,
+                    'saldo_akhir': saldo,
+                    'tipe_akun': tipe_akun
+                }
+            else:
+                formatted_item = {
+                    'kode_akun': kode_akun,
+                    'nama_akun': data['nama_akun'],
+                    'debit': abs(saldo),
+                    'kredit': 0,
+                    'saldo_akhir': saldo,
+                    'tipe_akun': tipe_akun
+                }
         
-        print(f"🔍 DEBUG: NSSP - Final entries: {len(neraca_setelah_penyesuaian)}")
-        return neraca_setelah_penyesuaian
+        neraca_setelah_penyesuaian.append(formatted_item)
+    
+    print(f"🔍 DEBUG: NSSP - Final entries: {len(neraca_setelah_penyesuaian)}")
+    return neraca_setelah_penyesuaian
+
+def get_neraca_saldo_setelah_penyesuaian(end_date=None):
+    """Ambil data untuk neraca saldo setelah penyesuaian (saldo per end_date)"""
+    try:
+        return get_ledger_snapshot(end_date).prefetch(*SNAPSHOT_INPUT_NSSP).get(hitung_neraca_saldo_setelah_penyesuaian)
         
     except Exception as e:
         print(f"❌ Error getting neraca saldo setelah penyesuaian: {e}")
@@ -1360,17 +2374,19 @@ def get_neraca_saldo_setelah_penyesuaian():
         return []
 
 # === Helper: Get jurnal penyesuaian ===
-def get_jurnal_penyesuaian():
-    """Ambil data jurnal penyesuaian"""
+@cached_report("jurnal_penyesuaian")
+def get_jurnal_penyesuaian(start_date=None, end_date=None):
+    """Ambil data jurnal penyesuaian (opsional per periode)"""
     try:
         # Ambil data jurnal penyesuaian langsung dari tabel
-        jurnal_penyesuaian_res = supabase.table("jurnal_penyesuaian")\
-            .select("*")\
-            .order("tanggal")\
-            .order("id")\
-            .execute()
-        
-        jurnal_penyesuaian = jurnal_penyesuaian_res.data if jurnal_penyesuaian_res.data else []
+        def make_query():
+            query = supabase.table("jurnal_penyesuaian").select(JURNAL_DISPLAY_COLUMNS)
+            if start_date:
+                query = query.gte("tanggal", start_date.isoformat())
+            if end_date:
+                query = query.lte("tanggal", end_date.isoformat())
+            return query
+        jurnal_penyesuaian = read_query_rows(make_query, keys=("tanggal", "id"))
         print(f"🔍 DEBUG: get_jurnal_penyesuaian() found {len(jurnal_penyesuaian)} entries")
         
         return jurnal_penyesuaian
@@ -1381,34 +2397,59 @@ def get_jurnal_penyesuaian():
 
 # === Helper: Ambil data neraca lajur ===
 # === Helper: Ambil data neraca lajur ===
-def get_neraca_lajur():
-    """Ambil data untuk neraca lajur (worksheet) - VERSI DIPERBAIKI"""
-    try:
-        # Ambil neraca saldo sebelum penyesuaian
-        neraca_saldo = get_neraca_saldo_data()
-        
-        # Ambil data jurnal penyesuaian langsung
-        jurnal_penyesuaian = get_jurnal_penyesuaian()
-        
-        # Ambil neraca saldo setelah penyesuaian
-        neraca_setelah_penyesuaian = get_neraca_saldo_setelah_penyesuaian()
-        
-        print(f"🔍 DEBUG Neraca Lajur:")
-        print(f"🔍 Neraca Saldo entries: {len(neraca_saldo)}")
-        print(f"🔍 Jurnal Penyesuaian entries: {len(jurnal_penyesuaian)}")
-        print(f"🔍 NSSP entries: {len(neraca_setelah_penyesuaian)}")
-        
-        # Buat dictionary untuk memudahkan pencarian
-        neraca_lajur_dict = {}
-        
-        # 1. Proses neraca saldo
-        for item in neraca_saldo:
-            kode_akun = item['kode_akun']
+def hitung_neraca_lajur(snapshot):
+    """Neraca lajur (worksheet) per end_date snapshot - VERSI DIPERBAIKI"""
+    # Ambil neraca saldo sebelum penyesuaian
+    neraca_saldo = snapshot.get(hitung_neraca_saldo)
+    
+    # Ambil total jurnal penyesuaian per akun dari saldo_akun
+    penyesuaian_per_akun = snapshot.penyesuaian
+    
+    if LEDGER_ENGINE == "pandas":
+        return hitung_neraca_lajur_pandas(snapshot.catalogue, neraca_saldo, penyesuaian_per_akun)
+    
+    # Ambil neraca saldo setelah penyesuaian
+    neraca_setelah_penyesuaian = snapshot.get(hitung_neraca_saldo_setelah_penyesuaian)
+    
+    print(f"🔍 DEBUG Neraca Lajur:")
+    print(f"🔍 Neraca Saldo entries: {len(neraca_saldo)}")
+    print(f"🔍 Akun dengan penyesuaian: {len(penyesuaian_per_akun)}")
+    print(f"🔍 NSSP entries: {len(neraca_setelah_penyesuaian)}")
+    
+    catalogue = snapshot.catalogue
+    
+    # Buat dictionary untuk memudahkan pencarian
+    neraca_lajur_dict = {}
+    
+    # 1. Proses neraca saldo
+    for item in neraca_saldo:
+        kode_akun = item['kode_akun']
+        neraca_lajur_dict[kode_akun] = {
+            'kode_akun': kode_akun,
+            'nama_akun': item['nama_akun'],
+            'neraca_saldo_debit': item['debit'],
+            'neraca_saldo_kredit': item['kredit'],
+            'penyesuaian_debit': 0,
+            'penyesuaian_kredit': 0,
+            'neraca_saldo_setelah_penyesuaian_debit': 0,
+            'neraca_saldo_setelah_penyesuaian_kredit': 0,
+            'laba_rugi_debit': 0,
+            'laba_rugi_kredit': 0,
+            'neraca_debit': 0,
+            'neraca_kredit': 0
+        }
+    
+    # 2. Proses jurnal penyesuaian
+    for kode_akun, jurnal in penyesuaian_per_akun.items():
+        if kode_akun not in neraca_lajur_dict:
+            # Jika akun belum ada, tambahkan
+            nama_akun = catalogue.get(kode_akun, {}).get('nama_akun', kode_akun)
+            
             neraca_lajur_dict[kode_akun] = {
                 'kode_akun': kode_akun,
-                'nama_akun': item['nama_akun'],
-                'neraca_saldo_debit': item['debit'],
-                'neraca_saldo_kredit': item['kredit'],
+                'nama_akun': nama_akun,
+                'neraca_saldo_debit': 0,
+                'neraca_saldo_kredit': 0,
                 'penyesuaian_debit': 0,
                 'penyesuaian_kredit': 0,
                 'neraca_saldo_setelah_penyesuaian_debit': 0,
@@ -1419,86 +2460,66 @@ def get_neraca_lajur():
                 'neraca_kredit': 0
             }
         
-        # 2. Proses jurnal penyesuaian
-        for jurnal in jurnal_penyesuaian:
-            kode_akun = jurnal['kode_akun']
-            
-            if kode_akun not in neraca_lajur_dict:
-                # Jika akun belum ada, tambahkan
-                accounts_res = supabase.table("accounts").select("nama_akun").eq("kode_akun", kode_akun).execute()
-                nama_akun = accounts_res.data[0]['nama_akun'] if accounts_res.data else kode_akun
-                
-                neraca_lajur_dict[kode_akun] = {
-                    'kode_akun': kode_akun,
-                    'nama_akun': nama_akun,
-                    'neraca_saldo_debit': 0,
-                    'neraca_saldo_kredit': 0,
-                    'penyesuaian_debit': 0,
-                    'penyesuaian_kredit': 0,
-                    'neraca_saldo_setelah_penyesuaian_debit': 0,
-                    'neraca_saldo_setelah_penyesuaian_kredit': 0,
-                    'laba_rugi_debit': 0,
-                    'laba_rugi_kredit': 0,
-                    'neraca_debit': 0,
-                    'neraca_kredit': 0
-                }
-            
-            # Tambahkan penyesuaian
-            neraca_lajur_dict[kode_akun]['penyesuaian_debit'] += jurnal['debit']
-            neraca_lajur_dict[kode_akun]['penyesuaian_kredit'] += jurnal['kredit']
-        
-        # 3. Hitung neraca saldo setelah penyesuaian
-        for kode_akun, data in neraca_lajur_dict.items():
-            # Hitung saldo setelah penyesuaian
-            neraca_debit = data['neraca_saldo_debit']
-            neraca_kredit = data['neraca_saldo_kredit']
-            penyesuaian_debit = data['penyesuaian_debit']
-            penyesuaian_kredit = data['penyesuaian_kredit']
-            
-            # Ambil tipe akun
-            accounts_res = supabase.table("accounts").select("tipe_akun").eq("kode_akun", kode_akun).execute()
-            tipe_akun = accounts_res.data[0]['tipe_akun'] if accounts_res.data else 'debit'
-            
-            # Hitung berdasarkan tipe akun
-            if tipe_akun == 'debit':
-                # Akun debit: normal balance debit
-                saldo_setelah = neraca_debit - neraca_kredit + penyesuaian_debit - penyesuaian_kredit
-                if saldo_setelah >= 0:
-                    data['neraca_saldo_setelah_penyesuaian_debit'] = saldo_setelah
-                    data['neraca_saldo_setelah_penyesuaian_kredit'] = 0
-                else:
-                    data['neraca_saldo_setelah_penyesuaian_debit'] = 0
-                    data['neraca_saldo_setelah_penyesuaian_kredit'] = abs(saldo_setelah)
+        # Tambahkan penyesuaian
+        neraca_lajur_dict[kode_akun]['penyesuaian_debit'] += jurnal['debit']
+        neraca_lajur_dict[kode_akun]['penyesuaian_kredit'] += jurnal['kredit']
+    
+    # 3. Hitung neraca saldo setelah penyesuaian
+    for kode_akun, data in neraca_lajur_dict.items():
+        # Hitung saldo setelah penyesuaian
+        neraca_debit = data['neraca_saldo_debit']
+        neraca_kredit = data['neraca_saldo_kredit']
+        penyesuaian_debit = data['penyesuaian_debit']
+        penyesuaian_kredit = data['penyesuaian_kredit']
+        
+        # Ambil tipe akun
+        tipe_akun = catalogue.get(kode_akun, {}).get('tipe_akun', 'debit')
+        
+        # Hitung berdasarkan tipe akun
+        if tipe_akun == 'debit':
+            # Akun debit: normal balance debit
+            saldo_setelah = neraca_debit - neraca_kredit + penyesuaian_debit - penyesuaian_kredit
+            if saldo_setelah >= 0:
+                data['neraca_saldo_setelah_penyesuaian_debit'] = saldo_setelah
+                data['neraca_saldo_setelah_penyesuaian_kredit'] = 0
+            else:
+                data['neraca_saldo_setelah_penyesuaian_debit'] = 0
+                data['neraca_saldo_setelah_penyesuaian_kredit'] = abs(saldo_setelah)
+        else:
+            # Akun kredit: normal balance kredit
+            saldo_setelah = neraca_kredit - neraca_debit + penyesuaian_kredit - penyesuaian_debit
+            if saldo_setelah >= 0:
+                data['neraca_saldo_setelah_penyesuaian_debit'] = 0
+                data['neraca_saldo_setelah_penyesuaian_kredit'] = saldo_setelah
             else:
-                # Akun kredit: normal balance kredit
-                saldo_setelah = neraca_kredit - neraca_debit + penyesuaian_kredit - penyesuaian_debit
-                if saldo_setelah >= 0:
-                    data['neraca_saldo_setelah_penyesuaian_debit'] = 0
-                    data['neraca_saldo_setelah_penyesuaian_kredit'] = saldo_setelah
-                else:
-                    data['neraca_saldo_setelah_penyesuaian_debit'] = abs(saldo_setelah)
-                    data['neraca_saldo_setelah_penyesuaian_kredit'] = 0
-            
-            # 4. Klasifikasikan ke laba rugi atau neraca
-            # Akun nominal (laba rugi): 4-xxx (pendapatan), 5-xxx (HPP/beban), 6-xxx (beban penyesuaian)
-            if kode_akun.startswith('4-') or kode_akun.startswith('5-') or kode_akun.startswith('6-'):
-                # Akun laba rugi
-                if data['neraca_saldo_setelah_penyesuaian_debit'] > 0:
-                    data['laba_rugi_debit'] = data['neraca_saldo_setelah_penyesuaian_debit']
-                else:
-                    data['laba_rugi_kredit'] = data['neraca_saldo_setelah_penyesuaian_kredit']
+                data['neraca_saldo_setelah_penyesuaian_debit'] = abs(saldo_setelah)
+                data['neraca_saldo_setelah_penyesuaian_kredit'] = 0
+        
+        # 4. Klasifikasikan ke laba rugi atau neraca
+        # Akun nominal (laba rugi): 4-xxx (pendapatan), 5-xxx (HPP/beban), 6-xxx (beban penyesuaian)
+        if kode_akun.startswith('4-') or kode_akun.startswith('5-') or kode_akun.startswith('6-'):
+            # Akun laba rugi
+            if data['neraca_saldo_setelah_penyesuaian_debit'] > 0:
+                data['laba_rugi_debit'] = data['neraca_saldo_setelah_penyesuaian_debit']
             else:
-                # Akun neraca (aset, kewajiban, modal)
-                if data['neraca_saldo_setelah_penyesuaian_debit'] > 0:
-                    data['neraca_debit'] = data['neraca_saldo_setelah_penyesuaian_debit']
-                else:
-                    data['neraca_kredit'] = data['neraca_saldo_setelah_penyesuaian_kredit']
-        
-        # Konversi ke list
-        neraca_lajur_data = list(neraca_lajur_dict.values())
-        
-        print(f"🔍 Neraca Lajur final entries: {len(neraca_lajur_data)}")
-        return neraca_lajur_data
+                data['laba_rugi_kredit'] = data['neraca_saldo_setelah_penyesuaian_kredit']
+        else:
+            # Akun neraca (aset, kewajiban, modal)
+            if data['neraca_saldo_setelah_penyesuaian_debit'] > 0:
+                data['neraca_debit'] = data['neraca_saldo_setelah_penyesuaian_debit']
+            else:
+                data['neraca_kredit'] = data['neraca_saldo_setelah_penyesuaian_kredit']
+    
+    # Konversi ke list
+    neraca_lajur_data = list(neraca_lajur_dict.values())
+    
+    print(f"🔍 Neraca Lajur final entries: {len(neraca_lajur_data)}")
+    return neraca_lajur_data
+
+def get_neraca_lajur(end_date=None):
+    """Ambil data untuk neraca lajur (worksheet) per end_date - VERSI DIPERBAIKI"""
+    try:
+        return get_ledger_snapshot(end_date).prefetch(*SNAPSHOT_INPUT_NSSP).get(hitung_neraca_lajur)
         
     except Exception as e:
         print(f"❌ Error getting neraca lajur: {e}")
@@ -1509,63 +2530,67 @@ def get_neraca_lajur():
 # === Helper: Ambil data laporan laba rugi ===
 # === PERBAIKAN 1: FUNGSI HPP YANG BENAR ===
 # === PERBAIKAN FUNGSI get_laba_rugi_data() ===
-def get_laba_rugi_data():
+def hitung_laba_rugi(snapshot):
+    """Laporan laba rugi per end_date snapshot (dari NSSP)"""
+    neraca_setelah_penyesuaian = snapshot.get(hitung_neraca_saldo_setelah_penyesuaian)
+    
+    # DEBUG: Tampilkan semua data
+    print("\n🔍 DEBUG LABA RUGI - NSSP DATA:")
+    for item in neraca_setelah_penyesuaian:
+        print(f"  {item['kode_akun']} - {item['nama_akun']}: Debit={item['debit']}, Kredit={item['kredit']}")
+    
+    # Hitung dari NERACA SALDO SETELAH PENYESUAIAN (bukan dari berbagai sumber)
+    total_pendapatan = 0
+    total_hpp = 0
+    total_beban = 0
+    
+    for item in neraca_setelah_penyesuaian:
+        kode = item['kode_akun']
+        
+        # PENDAPATAN (4-xxx) - normal balance Kredit
+        if kode.startswith('4-'):
+            total_pendapatan += item['kredit']
+            print(f"🔍 Pendapatan {kode}: +{item['kredit']}")
+        
+        # HPP (5-1000) - normal balance Debit
+        elif kode == '5-1000':
+            total_hpp += item['debit']
+            print(f"🔍 HPP {kode}: +{item['debit']}")
+        
+        # BEBAN OPERASIONAL (5-1100, 5-1200) - normal balance Debit
+        elif kode in ['5-1100', '5-1200']:
+            total_beban += item['debit']
+            print(f"🔍 Beban {kode}: +{item['debit']}")
+        
+        # BEBAN PENYESUAIAN (6-xxx) - normal balance Debit
+        elif kode.startswith('6-'):
+            total_beban += item['debit']
+            print(f"🔍 Beban Penyesuaian {kode}: +{item['debit']}")
+    
+    # Hitung laba
+    laba_kotor = total_pendapatan - total_hpp
+    laba_bersih = laba_kotor - total_beban
+    
+    print(f"\n📊 LABA RUGI SUMMARY:")
+    print(f"  Total Pendapatan: Rp {total_pendapatan:,.0f}")
+    print(f"  Total HPP: Rp {total_hpp:,.0f}")
+    print(f"  Laba Kotor: Rp {laba_kotor:,.0f}")
+    print(f"  Total Beban: Rp {total_beban:,.0f}")
+    print(f"  Laba Bersih: Rp {laba_bersih:,.0f}")
+    
+    return {
+        'total_pendapatan': total_pendapatan,
+        'total_hpp': total_hpp,
+        'laba_kotor': laba_kotor,
+        'total_beban': total_beban,
+        'laba_bersih': laba_bersih,
+        'detail_hpp': {}  # Kosongkan detail sementara
+    }
+
+def get_laba_rugi_data(end_date=None):
     """Ambil data untuk laporan laba rugi dengan perhitungan yang benar"""
     try:
-        neraca_setelah_penyesuaian = get_neraca_saldo_setelah_penyesuaian()
-        
-        # DEBUG: Tampilkan semua data
-        print("\n🔍 DEBUG LABA RUGI - NSSP DATA:")
-        for item in neraca_setelah_penyesuaian:
-            print(f"  {item['kode_akun']} - {item['nama_akun']}: Debit={item['debit']}, Kredit={item['kredit']}")
-        
-        # Hitung dari NERACA SALDO SETELAH PENYESUAIAN (bukan dari berbagai sumber)
-        total_pendapatan = 0
-        total_hpp = 0
-        total_beban = 0
-        
-        for item in neraca_setelah_penyesuaian:
-            kode = item['kode_akun']
-            
-            # PENDAPATAN (4-xxx) - normal balance Kredit
-            if kode.startswith('4-'):
-                total_pendapatan += item['kredit']
-                print(f"🔍 Pendapatan {kode}: +{item['kredit']}")
-            
-            # HPP (5-1000) - normal balance Debit
-            elif kode == '5-1000':
-                total_hpp += item['debit']
-                print(f"🔍 HPP {kode}: +{item['debit']}")
-            
-            # BEBAN OPERASIONAL (5-1100, 5-1200) - normal balance Debit
-            elif kode in ['5-1100', '5-1200']:
-                total_beban += item['debit']
-                print(f"🔍 Beban {kode}: +{item['debit']}")
-            
-            # BEBAN PENYESUAIAN (6-xxx) - normal balance Debit
-            elif kode.startswith('6-'):
-                total_beban += item['debit']
-                print(f"🔍 Beban Penyesuaian {kode}: +{item['debit']}")
-        
-        # Hitung laba
-        laba_kotor = total_pendapatan - total_hpp
-        laba_bersih = laba_kotor - total_beban
-        
-        print(f"\n📊 LABA RUGI SUMMARY:")
-        print(f"  Total Pendapatan: Rp {total_pendapatan:,.0f}")
-        print(f"  Total HPP: Rp {total_hpp:,.0f}")
-        print(f"  Laba Kotor: Rp {laba_kotor:,.0f}")
-        print(f"  Total Beban: Rp {total_beban:,.0f}")
-        print(f"  Laba Bersih: Rp {laba_bersih:,.0f}")
-        
-        return {
-            'total_pendapatan': total_pendapatan,
-            'total_hpp': total_hpp,
-            'laba_kotor': laba_kotor,
-            'total_beban': total_beban,
-            'laba_bersih': laba_bersih,
-            'detail_hpp': {}  # Kosongkan detail sementara
-        }
+        return get_ledger_snapshot(end_date).prefetch(*SNAPSHOT_INPUT_NSSP).get(hitung_laba_rugi)
         
     except Exception as e:
         print(f"❌ Error in get_laba_rugi_data: {e}")
@@ -1582,60 +2607,64 @@ def get_laba_rugi_data():
     
 # === Helper: Ambil data neraca ===
 # === PERBAIKAN FUNGSI get_neraca_data() ===
-def get_neraca_data():
+def hitung_neraca(snapshot):
+    """Ringkasan neraca per end_date snapshot (dari NSSP + laba bersih)"""
+    neraca_setelah_penyesuaian = snapshot.get(hitung_neraca_saldo_setelah_penyesuaian)
+    
+    total_aset = 0
+    total_liabilitas = 0
+    total_ekuitas = 0
+    
+    print("\n🔍 DEBUG NERACA - PERHITUNGAN:")
+    
+    for item in neraca_setelah_penyesuaian:
+        kode = item['kode_akun']
+        saldo = item['debit'] - item['kredit']  # Net saldo
+        
+        # ASET (1-xxx) - normal balance Debit
+        if kode.startswith('1-'):
+            if not kode.endswith(('2010', '2110', '2210')):  # Bukan akumulasi penyusutan
+                total_aset += max(saldo, 0)
+                print(f"🔍 Aset {kode}: +{max(saldo, 0):,.0f}")
+            else:  # Akumulasi penyusutan (kontra aset) - Kredit
+                total_aset -= max(-saldo, 0)  # Kurangi dari aset
+                print(f"🔍 Akumulasi Penyusutan {kode}: -{max(-saldo, 0):,.0f}")
+        
+        # LIABILITAS (2-xxx) - normal balance Kredit
+        elif kode.startswith('2-'):
+            total_liabilitas += max(-saldo, 0)
+            print(f"🔍 Liabilitas {kode}: +{max(-saldo, 0):,.0f}")
+        
+        # EKUITAS (3-xxx) - normal balance Kredit
+        elif kode.startswith('3-'):
+            if kode == '3-1200':  # Prive (kontra ekuitas) - Debit
+                total_ekuitas -= max(saldo, 0)
+                print(f"🔍 Prive {kode}: -{max(saldo, 0):,.0f}")
+            else:
+                total_ekuitas += max(-saldo, 0)
+                print(f"🔍 Ekuitas {kode}: +{max(-saldo, 0):,.0f}")
+    
+    # Tambahkan laba bersih ke ekuitas
+    laba_rugi_data = snapshot.get(hitung_laba_rugi)
+    total_ekuitas += laba_rugi_data['laba_bersih']
+    
+    print(f"\n📊 NERACA SUMMARY:")
+    print(f"  Total Aset: Rp {total_aset:,.0f}")
+    print(f"  Total Liabilitas: Rp {total_liabilitas:,.0f}")
+    print(f"  Total Ekuitas: Rp {total_ekuitas:,.0f}")
+    print(f"  Liabilitas + Ekuitas: Rp {total_liabilitas + total_ekuitas:,.0f}")
+    print(f"  Balance Check: {'✅ Balance' if abs(total_aset - (total_liabilitas + total_ekuitas)) < 0.01 else '❌ Tidak Balance'}")
+    
+    return {
+        'total_aset': total_aset,
+        'total_liabilitas': total_liabilitas,
+        'total_ekuitas': total_ekuitas
+    }
+
+def get_neraca_data(end_date=None):
     """Ambil data untuk neraca dengan perhitungan yang benar"""
     try:
-        neraca_setelah_penyesuaian = get_neraca_saldo_setelah_penyesuaian()
-        
-        total_aset = 0
-        total_liabilitas = 0
-        total_ekuitas = 0
-        
-        print("\n🔍 DEBUG NERACA - PERHITUNGAN:")
-        
-        for item in neraca_setelah_penyesuaian:
-            kode = item['kode_akun']
-            saldo = item['debit'] - item['kredit']  # Net saldo
-            
-            # ASET (1-xxx) - normal balance Debit
-            if kode.startswith('1-'):
-                if not kode.endswith(('2010', '2110', '2210')):  # Bukan akumulasi penyusutan
-                    total_aset += max(saldo, 0)
-                    print(f"🔍 Aset {kode}: +{max(saldo, 0):,.0f}")
-                else:  # Akumulasi penyusutan (kontra aset) - Kredit
-                    total_aset -= max(-saldo, 0)  # Kurangi dari aset
-                    print(f"🔍 Akumulasi Penyusutan {kode}: -{max(-saldo, 0):,.0f}")
-            
-            # LIABILITAS (2-xxx) - normal balance Kredit
-            elif kode.startswith('2-'):
-                total_liabilitas += max(-saldo, 0)
-                print(f"🔍 Liabilitas {kode}: +{max(-saldo, 0):,.0f}")
-            
-            # EKUITAS (3-xxx) - normal balance Kredit
-            elif kode.startswith('3-'):
-                if kode == '3-1200':  # Prive (kontra ekuitas) - Debit
-                    total_ekuitas -= max(saldo, 0)
-                    print(f"🔍 Prive {kode}: -{max(saldo, 0):,.0f}")
-                else:
-                    total_ekuitas += max(-saldo, 0)
-                    print(f"🔍 Ekuitas {kode}: +{max(-saldo, 0):,.0f}")
-        
-        # Tambahkan laba bersih ke ekuitas
-        laba_rugi_data = get_laba_rugi_data()
-        total_ekuitas += laba_rugi_data['laba_bersih']
-        
-        print(f"\n📊 NERACA SUMMARY:")
-        print(f"  Total Aset: Rp {total_aset:,.0f}")
-        print(f"  Total Liabilitas: Rp {total_liabilitas:,.0f}")
-        print(f"  Total Ekuitas: Rp {total_ekuitas:,.0f}")
-        print(f"  Liabilitas + Ekuitas: Rp {total_liabilitas + total_ekuitas:,.0f}")
-        print(f"  Balance Check: {'✅ Balance' if abs(total_aset - (total_liabilitas + total_ekuitas)) < 0.01 else '❌ Tidak Balance'}")
-        
-        return {
-            'total_aset': total_aset,
-            'total_liabilitas': total_liabilitas,
-            'total_ekuitas': total_ekuitas
-        }
+        return get_ledger_snapshot(end_date).prefetch(*SNAPSHOT_INPUT_NSSP).get(hitung_neraca)
         
     except Exception as e:
         print(f"❌ Error in get_neraca_data: {e}")
@@ -1648,59 +2677,73 @@ def get_neraca_data():
         }
     
 # === Helper: Update inventory stock ===
-def update_inventory_stock(item_code, transaction_type, quantity):
-    """Update stok inventory dengan validasi tipe data yang ketat"""
+def update_inventory_stock(item_code, transaction_type, quantity, max_retries=5):
+    """Update stok inventory tanpa RPC (cadangan apply_stock_movement).
+
+    Memakai compare-and-set: UPDATE hanya berlaku bila current_stock masih sama
+    dengan yang dibaca, jika tidak dibaca ulang dan dicoba lagi. Dengan begitu
+    dua worker tidak saling menimpa stok."""
     try:
-        # Ambil data inventory saat ini
-        inventory_res = supabase.table("inventory").select("*").eq("item_code", item_code).execute()
-        
-        if not inventory_res.data:
-            print(f"❌ Item {item_code} tidak ditemukan di inventory")
-            return False
-        
-        current_data = inventory_res.data[0]
-        # Pastikan dikonversi ke integer
-        current_stock = int(current_data.get('current_stock', 0))
-        total_sold = int(current_data.get('total_sold', 0))
         quantity = int(quantity) # Pastikan quantity adalah integer
-        
-        new_stock = current_stock
-        
-        # Update berdasarkan jenis transaksi
-        if transaction_type == 'PURCHASE':
-            new_stock = current_stock + quantity
-            print(f"🔧 Stock IN: {current_stock} + {quantity} = {new_stock}")
-            
-        elif transaction_type == 'SALE':
-            if current_stock < quantity:
-                print(f"❌ Insufficient stock: {current_stock} < {quantity}")
+
+        for attempt in range(max_retries):
+            # Ambil data inventory saat ini
+            inventory_res = supabase.table("inventory").select("current_stock, total_sold").eq("item_code", item_code).execute()
+
+            if not inventory_res.data:
+                print(f"❌ Item {item_code} tidak ditemukan di inventory")
                 return False
-            
-            # LOGIKA UTAMA: Pengurangan
-            new_stock = current_stock - quantity
-            total_sold += quantity
-            print(f"🔧 Stock OUT: {current_stock} - {quantity} = {new_stock}")
-            
-        elif transaction_type == 'ADJUSTMENT':
-            new_stock = quantity  # Hati-hati, ini me-reset stok ke nilai input
-            print(f"🔧 Stock ADJUST: set to {quantity}")
-        
-        # Update inventory ke database
-        update_data = {
-            "current_stock": new_stock,
-            "total_sold": total_sold,
-            "updated_at": datetime.now().isoformat()
-        }
-        
-        result = supabase.table("inventory").update(update_data).eq("item_code", item_code).execute()
-        
-        if result.data:
-            print(f"✅ Inventory stock updated: {item_code} -> {new_stock}")
-            return True
-        else:
-            print(f"❌ Failed to update inventory stock: {item_code}")
-            return False
-            
+
+            current_data = inventory_res.data[0]
+            # Pastikan dikonversi ke integer
+            current_stock = int(current_data.get('current_stock') or 0)
+            total_sold = int(current_data.get('total_sold') or 0)
+
+            new_stock = current_stock
+
+            # Update berdasarkan jenis transaksi
+            if transaction_type == 'PURCHASE':
+                new_stock = current_stock + quantity
+                print(f"🔧 Stock IN: {current_stock} + {quantity} = {new_stock}")
+
+            elif transaction_type == 'SALE':
+                if current_stock < quantity:
+                    print(f"❌ Insufficient stock: {current_stock} < {quantity}")
+                    return False
+
+                # LOGIKA UTAMA: Pengurangan
+                new_stock = current_stock - quantity
+                total_sold += quantity
+                print(f"🔧 Stock OUT: {current_stock} - {quantity} = {new_stock}")
+
+            elif transaction_type == 'RETURN':
+                # Kebalikan SALE (pembatalan penjualan)
+                new_stock = current_stock + quantity
+                total_sold = max(total_sold - quantity, 0)
+                print(f"🔧 Stock RETURN: {current_stock} + {quantity} = {new_stock}")
+
+            elif transaction_type == 'ADJUSTMENT':
+                new_stock = quantity  # Hati-hati, ini me-reset stok ke nilai input
+                print(f"🔧 Stock ADJUST: set to {quantity}")
+
+            # Update inventory ke database, hanya jika stok belum diubah proses lain
+            update_data = {
+                "current_stock": new_stock,
+                "total_sold": total_sold,
+                "updated_at": datetime.now().isoformat()
+            }
+
+            result = supabase.table("inventory").update(update_data).eq("item_code", item_code).eq("current_stock", current_stock).execute()
+
+            if result.data:
+                print(f"✅ Inventory stock updated: {item_code} -> {new_stock}")
+                return True
+
+            print(f"⚠ Stok {item_code} berubah saat update, coba lagi ({attempt + 1}/{max_retries})")
+
+        print(f"❌ Failed to update inventory stock: {item_code}")
+        return False
+
     except Exception as e:
         print(f"❌ Error updating inventory stock: {e}")
         import traceback
@@ -1709,47 +2752,210 @@ def update_inventory_stock(item_code, transaction_type, quantity):
 
 # === Helper: Record inventory transaction ===
 def record_inventory_transaction(item_code, transaction_type, quantity, price, reference_id, description, transaction_date):
-    """Record transaksi inventory untuk history"""
+    """Catat pergerakan stok: update inventory + insert inventory_transactions secara atomik.
+
+    ADJUSTMENT berarti stok di-set menjadi quantity."""
+    movement = {
+        "p_item_code": item_code,
+        "p_transaction_type": transaction_type,
+        "p_quantity": int(quantity),
+        "p_unit_cost": price,
+        "p_reference": reference_id,
+        "p_notes": description,
+        "p_transaction_date": transaction_date
+    }
+
+    try:
+        result = supabase.rpc("apply_stock_movement", movement).execute()
+    except Exception as e:
+        if not rpc_missing(e):
+            # Status pergerakan tidak diketahui (bisa sudah diterapkan): jangan ulang lewat jalur lain
+            print(f"❌ RPC apply_stock_movement gagal: {item_code} {transaction_type} {quantity} - {e}")
+            return False
+        # RPC belum dipasang (lihat supabase_schema.sql): pakai jalur compare-and-set
+        print(f"⚠ RPC apply_stock_movement tidak tersedia, pakai update biasa: {e}")
+        return record_inventory_transaction_fallback(item_code, transaction_type, quantity, price, reference_id, description, transaction_date)
+
+    outcome = result.data or {}
+    if not outcome.get('success'):
+        print(f"❌ Stock movement ditolak: {item_code} {transaction_type} {quantity} - {outcome.get('message')}")
+        return False
+
+    bump_ledger_version("inventory")
+    print(f"✅ Inventory transaction recorded: {item_code} {transaction_type} {quantity} (stok: {outcome.get('current_stock')})")
+    return True
+
+def record_inventory_transaction_fallback(item_code, transaction_type, quantity, price, reference_id, description, transaction_date):
+    """Versi non-RPC: update stok dulu (compare-and-set), baru catat history"""
     try:
         item_res = supabase.table("inventory_items").select("id").eq("item_code", item_code).execute()
-        
+
         if not item_res.data:
             print(f"❌ Item {item_code} tidak ditemukan di tabel inventory_items")
-            return
-            
+            return False
+
         item_uuid = item_res.data[0]['id']
-        total_value = quantity * price
-        
+        moved = int(quantity)
+
+        if transaction_type == 'ADJUSTMENT':
+            stock_res = supabase.table("inventory").select("current_stock").eq("item_code", item_code).execute()
+            if stock_res.data:
+                moved = abs(moved - int(stock_res.data[0]['current_stock'] or 0))
+
+        # Update stok; history hanya dicatat jika stok benar-benar berubah
+        if not update_inventory_stock(item_code, transaction_type, quantity):
+            return False
+        bump_ledger_version("inventory")
+
         transaction_data = {
-            "item_id": item_uuid,         
+            "item_id": item_uuid,
             "transaction_type": transaction_type,
-            "quantity": quantity,
-            "unit_cost": price,               
-            "total_value": total_value,       
-            "reference_number": reference_id, 
-            "notes": description,  
+            "quantity": moved,
+            "unit_cost": price,
+            "total_value": moved * price,
+            "reference_number": reference_id,
+            "notes": description,
             "transaction_date": transaction_date
         }
-        
+
         # Simpan transaksi
         supabase.table("inventory_transactions").insert(transaction_data).execute()
-        
-        # Update stok
-        update_inventory_stock(item_code, transaction_type, quantity)
-        
+
         print(f"✅ Inventory transaction recorded: {item_code} {transaction_type} {quantity}")
         return True
-        
+
     except Exception as e:
         print(f"Error recording inventory transaction: {e}")
         return False
 
+# === Helper: Posting penjualan ===
+def sale_item_code(item):
+    """Kode inventory untuk satu item penjualan"""
+    return "PATIN-8CM" if item['jenis_ikan'] == '8cm' else "PATIN-10CM"
+
+def sale_revenue_entries(items):
+    """Baris kredit pendapatan per item penjualan"""
+    entries = []
+    for item in items:
+        if item['jenis_ikan'] == '8cm':
+            entries.append({'kode_akun': '4-1000', 'deskripsi': 'Penjualan Ikan Patin 8 cm', 'debit': 0, 'kredit': item['subtotal']})
+        else:  # 10cm
+            entries.append({'kode_akun': '4-1100', 'deskripsi': 'Penjualan Ikan Patin 10 cm', 'debit': 0, 'kredit': item['subtotal']})
+    return entries
+
+def build_sale_postings(tanggal, customer, items, payment_method, shipping_cost=0, dp_amount=0):
+    """Susun jurnal & baris buku pembantu piutang satu penjualan tanpa menulis ke database.
+
+    Return {"journals": [(tanggal, jenis_transaksi, entries)], "piutang": [(customer, tanggal,
+    keterangan, debit, kredit)]}, atau None bila kombinasi pembayaran tidak dikenali."""
+    total_amount = sum(item['subtotal'] for item in items)
+    jenis_transaksi = f"Penjualan - {customer}"
+    
+    # Hitung tanggal besok untuk auto-pelunasan
+    tanggal_obj = datetime.strptime(tanggal, '%Y-%m-%d')
+    tanggal_besok = (tanggal_obj + timedelta(days=1)).strftime('%Y-%m-%d')
+    
+    # 1. KASUS: Langsung lunas tanpa ongkir dan tanpa DP
+    # 2. KASUS: Langsung lunas + ongkir tanpa DP (ongkir sebagai beban terpisah)
+    if payment_method == 'lunas' and dp_amount == 0 and shipping_cost >= 0:
+        entries = [{'kode_akun': '1-1000', 'deskripsi': 'Kas', 'debit': total_amount, 'kredit': 0}]
+        entries += sale_revenue_entries(items)
+        if shipping_cost > 0:
+            entries.append({'kode_akun': '5-1200', 'deskripsi': 'Beban Angkut Penjualan', 'debit': shipping_cost, 'kredit': 0})
+            entries.append({'kode_akun': '1-1000', 'deskripsi': 'Kas', 'debit': 0, 'kredit': shipping_cost})
+        return {"journals": [(tanggal, jenis_transaksi, entries)], "piutang": []}
+    
+    # 3. KASUS: DP tanpa ongkir - AUTO PELUNASAN
+    # 4. KASUS: DP + ongkir - AUTO PELUNASAN (ongkir dibayar tunai hari ini)
+    if payment_method == 'dp' and shipping_cost >= 0:
+        # JURNAL 1: Penerimaan DP (Hari Ini)
+        entries_dp = [
+            {'kode_akun': '1-1000', 'deskripsi': 'Kas - DP', 'debit': dp_amount, 'kredit': 0},
+            {'kode_akun': '2-2000', 'deskripsi': 'Pendapatan Diterima Dimuka', 'debit': 0, 'kredit': dp_amount},
+        ]
+        jenis_dp = f"DP - {customer}"
+        if shipping_cost > 0:
+            entries_dp.append({'kode_akun': '5-1200', 'deskripsi': 'Beban Angkut Penjualan', 'debit': shipping_cost, 'kredit': 0})
+            entries_dp.append({'kode_akun': '1-1000', 'deskripsi': 'Kas - Ongkir', 'debit': 0, 'kredit': shipping_cost})
+            jenis_dp = f"DP + Ongkir - {customer}"
+        
+        # JURNAL 2: Auto Pelunasan (Besok)
+        sisa_piutang = total_amount - dp_amount
+        
+        # 1. Konversi DP menjadi pendapatan
+        entries_pelunasan = [{'kode_akun': '2-2000', 'deskripsi': 'Pendapatan Diterima Dimuka', 'debit': dp_amount, 'kredit': 0}]
+        
+        # 2. Catat piutang untuk sisa pembayaran
+        if sisa_piutang > 0:
+            entries_pelunasan.append({'kode_akun': '1-1100', 'deskripsi': 'Piutang Usaha', 'debit': sisa_piutang, 'kredit': 0})
+        
+        # 3. Catat pendapatan penjualan
+        entries_pelunasan += sale_revenue_entries(items)
+        
+        # 4. Pelunasan piutang (kas masuk)
+        piutang = []
+        if sisa_piutang > 0:
+            entries_pelunasan.append({'kode_akun': '1-1000', 'deskripsi': 'Kas - Pelunasan', 'debit': sisa_piutang, 'kredit': 0})
+            entries_pelunasan.append({'kode_akun': '1-1100', 'deskripsi': 'Piutang Usaha', 'debit': 0, 'kredit': sisa_piutang})
+            # Buku pembantu piutang (hanya untuk transaksi DP): penjualan kredit lalu pelunasannya
+            piutang = [
+                (customer, tanggal, f"Penjualan - {customer}", sisa_piutang, 0),
+                (customer, tanggal_besok, "Pelunasan piutang", 0, sisa_piutang),
+            ]
+        
+        return {
+            "journals": [(tanggal, jenis_dp, entries_dp), (tanggal_besok, f"Pelunasan - {customer}", entries_pelunasan)],
+            "piutang": piutang,
+        }
+    
+    return None
+
+def build_sale_row(tanggal, customer, items, payment_method, shipping_cost=0, dp_amount=0):
+    """Baris tabel sales untuk satu penjualan"""
+    return {
+        "tanggal": tanggal,
+        "customer": customer,
+        "items": json.dumps(items),
+        "total_amount": sum(item['subtotal'] for item in items),
+        "payment_method": payment_method,
+        "shipping_cost": shipping_cost,
+        "dp_amount": dp_amount,
+        "status": "completed",
+        "created_at": datetime.now().isoformat()
+    }
+
+def build_sale_movements(tanggal, customer, items, reference):
+    """Pergerakan stok SALE (parameter apply_stock_movement) untuk item satu penjualan"""
+    # HANYA quantity yang mempengaruhi stok, harga hanya untuk catatan
+    return [{
+        "p_item_code": sale_item_code(item),
+        "p_transaction_type": 'SALE',
+        "p_quantity": item['quantity'],
+        "p_unit_cost": item['selling_price'],
+        "p_reference": reference,
+        "p_notes": f"Penjualan {item['jenis_ikan']} - {customer}",
+        "p_transaction_date": tanggal
+    } for item in items]
+
+def reverse_stock_movements(movements):
+    """Kembalikan pergerakan SALE yang sudah diterapkan (RETURN), mis. bila posting jurnal gagal"""
+    returns = [{**movement, "p_transaction_type": 'RETURN', "p_notes": f"Batal: {movement['p_notes']}"}
+               for movement in movements]
+    if record_inventory_transactions_batch(returns):
+        print(f"↩ Stok dikembalikan: {len(returns)} pergerakan")
+        return True
+    print(f"❌ Stok gagal dikembalikan, cek inventory manual: "
+          + ", ".join(f"{m['p_item_code']} +{m['p_quantity']}" for m in returns))
+    return False
+
 def process_sale_transaction(tanggal, customer, items, payment_method, shipping_cost=0, dp_amount=0):
-    """Proses transaksi penjualan dengan auto-pelunasan DP di tanggal berikutnya - VERSI DIPERBAIKI"""
+    """Proses transaksi penjualan dengan auto-pelunasan DP di tanggal berikutnya.
+
+    Stok dikurangi lebih dulu; jurnal, buku pembantu piutang dan data penjualan hanya
+    diposting bila stok berhasil dikurangi. Bila jurnal gagal disimpan, stok dikembalikan."""
     
     try:
         total_amount = sum(item['subtotal'] for item in items)
-        jenis_transaksi = f"Penjualan - {customer}"
         
         print(f"\n{'='*60}")
         print(f"🔧 Processing sale: {customer}")
@@ -1757,219 +2963,311 @@ def process_sale_transaction(tanggal, customer, items, payment_method, shipping_
         print(f"🔧 Shipping: {shipping_cost}, DP: {dp_amount}")
         print(f"{'='*60}")
 
-        # Hitung tanggal besok untuk auto-pelunasan
-        tanggal_obj = datetime.strptime(tanggal, '%Y-%m-%d')
-        tanggal_besok = (tanggal_obj + timedelta(days=1)).strftime('%Y-%m-%d')
-        
-        entries = []
-        success = False
+        postings = build_sale_postings(tanggal, customer, items, payment_method, shipping_cost, dp_amount)
+        if postings is None:
+            print(f"❌ Kasus tidak dikenali: payment={payment_method}, shipping={shipping_cost}, dp={dp_amount}")
+            return False
+    except Exception as e:
+        print(f"❌ Error processing sale transaction: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
 
-        # 1. KASUS: Langsung lunas tanpa ongkir dan tanpa DP
-        if payment_method == 'lunas' and shipping_cost == 0 and dp_amount == 0:
-            print("🔧 Case 1: Langsung lunas tanpa ongkir & DP")
-            entries.append({'kode_akun': '1-1000', 'deskripsi': 'Kas', 'debit': total_amount, 'kredit': 0})
-            
-            for item in items:
-                if item['jenis_ikan'] == '8cm':
-                    entries.append({'kode_akun': '4-1000', 'deskripsi': 'Penjualan Ikan Patin 8 cm', 'debit': 0, 'kredit': item['subtotal']})
-                else:  # 10cm
-                    entries.append({'kode_akun': '4-1100', 'deskripsi': 'Penjualan Ikan Patin 10 cm', 'debit': 0, 'kredit': item['subtotal']})
-            
-            success = save_journal_entries(tanggal, jenis_transaksi, entries)
+    # 1. Stok dulu (semua item sekaligus): penjualan ditolak bila stok tidak cukup
+    try:
+        movements = build_sale_movements(tanggal, customer, items, next_document_number("SO"))
+    except Exception as e:
+        print(f"❌ Nomor SO tidak bisa dialokasikan: {e}")
+        return False
+    if not record_inventory_transactions_batch(movements):
+        print(f"❌ Stok ditolak, penjualan {customer} tidak diposting")
+        return False
 
-        # 2. KASUS: Langsung lunas + ongkir tanpa DP
-        elif payment_method == 'lunas' and shipping_cost > 0 and dp_amount == 0:
-            print("🔧 Case 2: Langsung lunas + ongkir tanpa DP")
-            entries.append({'kode_akun': '1-1000', 'deskripsi': 'Kas', 'debit': total_amount, 'kredit': 0})
-            
-            for item in items:
-                if item['jenis_ikan'] == '8cm':
-                    entries.append({'kode_akun': '4-1000', 'deskripsi': 'Penjualan Ikan Patin 8 cm', 'debit': 0, 'kredit': item['subtotal']})
-                else:  # 10cm
-                    entries.append({'kode_akun': '4-1100', 'deskripsi': 'Penjualan Ikan Patin 10 cm', 'debit': 0, 'kredit': item['subtotal']})
-            
-            # Ongkir sebagai beban terpisah
-            entries.append({'kode_akun': '5-1200', 'deskripsi': 'Beban Angkut Penjualan', 'debit': shipping_cost, 'kredit': 0})
-            entries.append({'kode_akun': '1-1000', 'deskripsi': 'Kas', 'debit': 0, 'kredit': shipping_cost})
-            
-            success = save_journal_entries(tanggal, jenis_transaksi, entries)
+    # 2. Semua jurnal penjualan (DP + pelunasan) dalam satu post_journal
+    try:
+        nomor_jurnal = iter(allocate_document_numbers("J", len(postings['journals'])))
+        created_at = datetime.now().isoformat()
+        jurnal_rows = []
+        for jurnal_tanggal, jurnal_jenis, entries in postings['journals']:
+            jurnal_rows += build_journal_rows(jurnal_tanggal, jurnal_jenis, entries, next(nomor_jurnal), created_at)
+    except Exception as e:
+        # Belum ada jurnal yang dikirim: aman mengembalikan stok
+        print(f"❌ Error menyusun jurnal penjualan: {e}")
+        jurnal_rows = []
 
-        # 3. KASUS: DP tanpa ongkir - AUTO PELUNASAN
-        elif payment_method == 'dp' and shipping_cost == 0:
-            print("🔧 Case 3: DP tanpa ongkir - Auto pelunasan")
-            # JURNAL 1: Penerimaan DP (Hari Ini)
-            entries_dp = []
-            entries_dp.append({'kode_akun': '1-1000', 'deskripsi': 'Kas - DP', 'debit': dp_amount, 'kredit': 0})
-            entries_dp.append({'kode_akun': '2-2000', 'deskripsi': 'Pendapatan Diterima Dimuka', 'debit': 0, 'kredit': dp_amount})
-            
-            success_dp = save_journal_entries(tanggal, f"DP - {customer}", entries_dp)
-            
-            if success_dp:
-                print(f"✅ Jurnal DP berhasil disimpan")
-                
-                # JURNAL 2: Auto Pelunasan (Besok)
-                entries_pelunasan = []
-                sisa_piutang = total_amount - dp_amount
-                
-                # 1. Konversi DP menjadi pendapatan
-                entries_pelunasan.append({'kode_akun': '2-2000', 'deskripsi': 'Pendapatan Diterima Dimuka', 'debit': dp_amount, 'kredit': 0})
-                
-                # 2. Catat piutang untuk sisa pembayaran
-                if sisa_piutang > 0:
-                    entries_pelunasan.append({'kode_akun': '1-1100', 'deskripsi': 'Piutang Usaha', 'debit': sisa_piutang, 'kredit': 0})
-                
-                # 3. Catat pendapatan penjualan
-                for item in items:
-                    if item['jenis_ikan'] == '8cm':
-                        entries_pelunasan.append({'kode_akun': '4-1000', 'deskripsi': 'Penjualan Ikan Patin 8 cm', 'debit': 0, 'kredit': item['subtotal']})
-                    else:  # 10cm
-                        entries_pelunasan.append({'kode_akun': '4-1100', 'deskripsi': 'Penjualan Ikan Patin 10 cm', 'debit': 0, 'kredit': item['subtotal']})
-                
-                # 4. Pelunasan piutang (kas masuk)
-                if sisa_piutang > 0:
-                    entries_pelunasan.append({'kode_akun': '1-1000', 'deskripsi': 'Kas - Pelunasan', 'debit': sisa_piutang, 'kredit': 0})
-                    entries_pelunasan.append({'kode_akun': '1-1100', 'deskripsi': 'Piutang Usaha', 'debit': 0, 'kredit': sisa_piutang})
-                
-                # Simpan jurnal pelunasan
-                success_pelunasan = save_journal_entries(tanggal_besok, f"Pelunasan - {customer}", entries_pelunasan)
-                
-                # RECORD KE BUKU PEMBANTU PIUTANG (Hanya untuk transaksi DP)
-                if success_pelunasan and sisa_piutang > 0:
-                    # Catat penjualan kredit di buku pembantu piutang
-                    record_buku_pembantu_piutang(customer, tanggal, f"Penjualan - {customer}", sisa_piutang, 0)
-                    # Catat pelunasan di buku pembantu piutang
-                    record_buku_pembantu_piutang(customer, tanggal_besok, f"Pelunasan piutang", 0, sisa_piutang)
-                    print(f"✅ Buku Pembantu Piutang updated for {customer}")
-                
-                if success_pelunasan:
-                    print(f"✅ Jurnal pelunasan otomatis berhasil disimpan untuk tanggal {tanggal_besok}")
-                    success = True
-                else:
-                    print(f"❌ Gagal menyimpan jurnal pelunasan")
-                    success = False
-            else:
-                print(f"❌ Gagal menyimpan jurnal DP")
-                success = False
-
-        # 4. KASUS: DP + ongkir - AUTO PELUNASAN
-        elif payment_method == 'dp' and shipping_cost > 0:
-            print("🔧 Case 4: DP + ongkir - Auto pelunasan")
-            # JURNAL 1: Penerimaan DP + Ongkir (Hari Ini)
-            entries_dp = []
-            entries_dp.append({'kode_akun': '1-1000', 'deskripsi': 'Kas - DP', 'debit': dp_amount, 'kredit': 0})
-            entries_dp.append({'kode_akun': '2-2000', 'deskripsi': 'Pendapatan Diterima Dimuka', 'debit': 0, 'kredit': dp_amount})
-            
-            # Ongkir dibayar tunai
-            entries_dp.append({'kode_akun': '5-1200', 'deskripsi': 'Beban Angkut Penjualan', 'debit': shipping_cost, 'kredit': 0})
-            entries_dp.append({'kode_akun': '1-1000', 'deskripsi': 'Kas - Ongkir', 'debit': 0, 'kredit': shipping_cost})
-            
-            success_dp = save_journal_entries(tanggal, f"DP + Ongkir - {customer}", entries_dp)
-            
-            if success_dp:
-                print(f"✅ Jurnal DP + Ongkir berhasil disimpan")
-                
-                # JURNAL 2: Auto Pelunasan (Besok)
-                entries_pelunasan = []
-                sisa_piutang = total_amount - dp_amount
-                
-                # 1. Konversi DP menjadi pendapatan
-                entries_pelunasan.append({'kode_akun': '2-2000', 'deskripsi': 'Pendapatan Diterima Dimuka', 'debit': dp_amount, 'kredit': 0})
-                
-                # 2. Catat piutang untuk sisa pembayaran
-                if sisa_piutang > 0:
-                    entries_pelunasan.append({'kode_akun': '1-1100', 'deskripsi': 'Piutang Usaha', 'debit': sisa_piutang, 'kredit': 0})
-                
-                # 3. Catat pendapatan penjualan
-                for item in items:
-                    if item['jenis_ikan'] == '8cm':
-                        entries_pelunasan.append({'kode_akun': '4-1000', 'deskripsi': 'Penjualan Ikan Patin 8 cm', 'debit': 0, 'kredit': item['subtotal']})
-                    else:  # 10cm
-                        entries_pelunasan.append({'kode_akun': '4-1100', 'deskripsi': 'Penjualan Ikan Patin 10 cm', 'debit': 0, 'kredit': item['subtotal']})
-                
-                # 4. Pelunasan piutang (kas masuk)
-                if sisa_piutang > 0:
-                    entries_pelunasan.append({'kode_akun': '1-1000', 'deskripsi': 'Kas - Pelunasan', 'debit': sisa_piutang, 'kredit': 0})
-                    entries_pelunasan.append({'kode_akun': '1-1100', 'deskripsi': 'Piutang Usaha', 'debit': 0, 'kredit': sisa_piutang})
-                
-                # Simpan jurnal pelunasan
-                success_pelunasan = save_journal_entries(tanggal_besok, f"Pelunasan - {customer}", entries_pelunasan)
-                
-                # RECORD KE BUKU PEMBANTU PIUTANG (Hanya untuk transaksi DP)
-                if success_pelunasan and sisa_piutang > 0:
-                    # Catat penjualan kredit di buku pembantu piutang
-                    record_buku_pembantu_piutang(customer, tanggal, f"Penjualan - {customer}", sisa_piutang, 0)
-                    # Catat pelunasan di buku pembantu piutang
-                    record_buku_pembantu_piutang(customer, tanggal_besok, f"Pelunasan piutang", 0, sisa_piutang)
-                    print(f"✅ Buku Pembantu Piutang updated for {customer}")
-                
-                if success_pelunasan:
-                    print(f"✅ Jurnal pelunasan otomatis berhasil disimpan untuk tanggal {tanggal_besok}")
-                    success = True
-                else:
-                    print(f"❌ Gagal menyimpan jurnal pelunasan")
-                    success = False
-            else:
-                print(f"❌ Gagal menyimpan jurnal DP + Ongkir")
-                success = False
+    try:
+        journal_saved = bool(jurnal_rows) and bool(insert_journal_rows("jurnal_umum", jurnal_rows))
+    except Exception as e:
+        # Jurnal bisa saja sudah ter-commit: stok dibiarkan, pengguna harus cek dulu
+        print(f"❌ Status jurnal penjualan {customer} tidak diketahui ({e}), stok tidak dikembalikan")
+        raise PostingStatusUnknown(f"Jurnal penjualan {customer}: {e}") from e
+
+    if not journal_saved:
+        print(f"❌ Gagal menyimpan jurnal penjualan {customer}")
+        reverse_stock_movements(movements)
+        print("🔧 Final result: FAILED")
+        return False
+    print(f"✅ Jurnal penjualan {customer} berhasil disimpan: {len(postings['journals'])} jurnal")
 
+    # 3. Buku pembantu & data penjualan (jurnal dan stok sudah tersimpan: gagal = warning)
+    if postings['piutang']:
+        if record_buku_pembantu_piutang_batch(postings['piutang']):
+            print(f"✅ Buku Pembantu Piutang updated for {customer}")
         else:
-            print(f"❌ Kasus tidak dikenali: payment={payment_method}, shipping={shipping_cost}, dp={dp_amount}")
-            success = False
+            print(f"⚠ Buku pembantu piutang {customer} gagal disimpan")
 
-         # Update inventory untuk semua kasus yang berhasil
-        if success:
-            for item in items:
-                item_code = "PATIN-8CM" if item['jenis_ikan'] == '8cm' else "PATIN-10CM"
-                
-                print(f"🔧 Updating inventory for {item_code}: {item['quantity']} units")
-                
-                # Gunakan fungsi record_inventory_transaction yang sudah diperbaiki
-                # HANYA quantity yang mempengaruhi stok, harga hanya untuk catatan
-                inventory_success = record_inventory_transaction(
-                    item_code, 
-                    'SALE',
-                    item['quantity'], 
-                    item['selling_price'],  # Harga hanya untuk catatan, tidak pengaruhi stok
-                    f"SO-{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                    f"Penjualan {item['jenis_ikan']} - {customer}",
-                    tanggal
-                )
-                
-                if inventory_success:
-                    print(f"✅ Inventory updated for {item_code}: -{item['quantity']} units")
-                else:
-                    print(f"⚠ Gagal update inventory untuk {item_code}")
-                    # Jangan return False di sini, karena jurnal sudah berhasil
-                    # Cukup log warning saja
-
-            # Simpan data penjualan
-            sale_data = {
-                "tanggal": tanggal,
-                "customer": customer,
-                "items": json.dumps(items),
-                "total_amount": total_amount,
-                "payment_method": payment_method,
-                "shipping_cost": shipping_cost,
-                "dp_amount": dp_amount,
-                "status": "completed",
-                "created_at": datetime.now().isoformat()
-            }
-            
-            try:
-                supabase.table("sales").insert(sale_data).execute()
-                print(f"✅ Sale data saved: {customer} - Rp {total_amount:,.0f}")
-            except Exception as e:
-                print(f"⚠ Gagal menyimpan data penjualan: {e}")
+    # Simpan data penjualan
+    try:
+        supabase.table("sales").insert(build_sale_row(tanggal, customer, items, payment_method, shipping_cost, dp_amount)).execute()
+        bump_ledger_version("sales")
+        print(f"✅ Sale data saved: {customer} - Rp {total_amount:,.0f}")
+    except Exception as e:
+        print(f"⚠ Gagal menyimpan data penjualan: {e}")
 
-        print(f"🔧 Final result: {'SUCCESS' if success else 'FAILED'}")
-        return success
-            
+    print("🔧 Final result: SUCCESS")
+    return True
+
+# === Helper: Batch penjualan ===
+# Banyak penjualan (mis. saat panen) divalidasi sekaligus di depan, termasuk stok
+# lintas seluruh batch, lalu ditulis dengan bulk write: satu apply_stock_movements
+# lebih dulu, lalu satu post_journal untuk semua jurnal (gagal = stok dikembalikan),
+# satu post_piutang_batch dan satu insert sales.
+SALES_BATCH_MAX = int(os.getenv("SALES_BATCH_MAX", "200"))
+
+def parse_sale_payload(data):
+    """Validasi & normalisasi satu penjualan dari JSON; return (sale, None) atau (None, pesan error)"""
+    if not isinstance(data, dict):
+        return None, "Format penjualan tidak valid"
+    
+    tanggal = data.get('tanggal')
+    try:
+        datetime.strptime(str(tanggal), '%Y-%m-%d')
+    except ValueError:
+        return None, "Tanggal harus berformat YYYY-MM-DD"
+    
+    payment_method = data.get('payment')
+    if payment_method not in ('lunas', 'dp'):
+        return None, "Metode pembayaran harus 'lunas' atau 'dp'"
+    
+    try:
+        shipping_cost = float(data.get('shipping_cost') or 0)
+        dp_amount = float(data.get('dp_amount') or 0)
+    except (TypeError, ValueError):
+        return None, "Ongkir / DP harus berupa angka"
+    if shipping_cost < 0 or dp_amount < 0:
+        return None, "Ongkir / DP tidak boleh negatif"
+    if payment_method == 'lunas' and dp_amount != 0:
+        return None, "Pembayaran lunas tidak boleh memakai DP"
+    
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return None, "Penjualan harus memiliki minimal satu item"
+    
+    parsed_items = []
+    for item in items:
+        if not isinstance(item, dict) or item.get('jenis_ikan') not in ('8cm', '10cm'):
+            return None, "Jenis ikan harus '8cm' atau '10cm'"
+        try:
+            quantity = int(item.get('quantity'))
+            subtotal = float(item.get('subtotal'))
+            selling_price = float(item.get('selling_price') or 0)
+        except (TypeError, ValueError):
+            return None, "Quantity / subtotal item harus berupa angka"
+        if quantity <= 0 or subtotal < 0:
+            return None, "Quantity harus lebih dari 0 dan subtotal tidak boleh negatif"
+        parsed_items.append({**item, 'quantity': quantity, 'subtotal': subtotal, 'selling_price': selling_price})
+    
+    total_amount = sum(item['subtotal'] for item in parsed_items)
+    if dp_amount > total_amount:
+        return None, "DP melebihi total penjualan"
+    
+    return {
+        "id": data.get('id'),
+        "tanggal": tanggal,
+        "customer": data.get('customer') or "Customer",
+        "items": parsed_items,
+        "payment_method": payment_method,
+        "shipping_cost": shipping_cost,
+        "dp_amount": dp_amount,
+    }, None
+
+def get_stock_levels(item_codes):
+    """Stok terkini beberapa item dalam satu query: item_code -> current_stock"""
+    stock_res = supabase.table("inventory").select("item_code, current_stock")\
+        .in_("item_code", list(item_codes))\
+        .execute()
+    return {row['item_code']: int(row['current_stock'] or 0) for row in (stock_res.data or [])}
+
+def record_buku_pembantu_piutang_batch(rows):
+    """Posting banyak baris buku pembantu piutang (customer, tanggal, keterangan, debit, kredit) sekaligus"""
+    if not rows:
+        return True
+    
+    try:
+        supabase.rpc("post_piutang_batch", {"p_rows": [{
+            "p_customer": customer,
+            "p_tanggal": tanggal,
+            "p_keterangan": keterangan,
+            "p_debit": debit,
+            "p_kredit": kredit,
+        } for customer, tanggal, keterangan, debit, kredit in rows]}).execute()
+    except Exception as rpc_error:
+        if not rpc_missing(rpc_error):
+            print(f"❌ post_piutang_batch gagal ({rpc_error}), {len(rows)} baris tidak diposting ulang")
+            return False
+        print(f"⚠ post_piutang_batch tidak tersedia ({rpc_error}), fallback per baris")
+        return all([record_buku_pembantu_piutang(*row) for row in rows])
+    
+    bump_ledger_version("buku_pembantu_piutang")
+    print(f"✅ Buku Pembantu Piutang updated: {len(rows)} baris")
+    return True
+
+def record_inventory_transactions_batch(movements):
+    """Terapkan banyak pergerakan stok sekaligus (semua atau tidak sama sekali bila RPC tersedia)"""
+    if not movements:
+        return True
+    
+    try:
+        result = supabase.rpc("apply_stock_movements", {"p_movements": movements}).execute()
     except Exception as e:
-        print(f"❌ Error processing sale transaction: {e}")
-        import traceback
-        traceback.print_exc()
+        if not rpc_missing(e):
+            # Batch RPC bersifat semua-atau-tidak: jangan diulang per item (bisa sudah diterapkan)
+            print(f"❌ RPC apply_stock_movements gagal, batch stok dibatalkan: {e}")
+            return False
+        print(f"⚠ RPC apply_stock_movements tidak tersedia, pakai pergerakan per item: {e}")
+        applied = []
+        for movement in movements:
+            if not record_inventory_transaction(
+                movement['p_item_code'], movement['p_transaction_type'], movement['p_quantity'],
+                movement['p_unit_cost'], movement['p_reference'], movement['p_notes'], movement['p_transaction_date']
+            ):
+                # Per item tidak atomik: penjualan yang sudah mengurangi stok dibatalkan lagi
+                sold = [applied_movement for applied_movement in applied if applied_movement['p_transaction_type'] == 'SALE']
+                if sold:
+                    reverse_stock_movements(sold)
+                return False
+            applied.append(movement)
+        return True
+    
+    outcome = result.data or {}
+    if not outcome.get('success'):
+        print(f"❌ Stock movement batch ditolak: {outcome.get('message')}")
         return False
     
+    bump_ledger_version("inventory")
+    print(f"✅ {len(movements)} inventory transaction recorded (stok: {outcome.get('current_stock')})")
+    return True
+
+def process_sales_batch(sales_data):
+    """Proses banyak penjualan sekaligus; return list hasil per penjualan sesuai urutan input.
+
+    Penjualan yang tidak valid atau melebihi sisa stok (dihitung berurutan lintas batch) ditolak
+    sendiri-sendiri; sisanya ditulis dengan bulk write."""
+    results = [{"index": index, "id": data.get('id') if isinstance(data, dict) else None,
+                "success": False, "message": ""} for index, data in enumerate(sales_data)]
+    
+    # 1. Validasi format semua penjualan
+    accepted = []
+    for index, data in enumerate(sales_data):
+        sale, error = parse_sale_payload(data)
+        if error:
+            results[index]['message'] = error
+            continue
+        sale['postings'] = build_sale_postings(sale['tanggal'], sale['customer'], sale['items'],
+                                               sale['payment_method'], sale['shipping_cost'], sale['dp_amount'])
+        if sale['postings'] is None:
+            results[index]['message'] = "Kombinasi pembayaran tidak dikenali"
+            continue
+        accepted.append((index, sale))
+    
+    # 2. Cek stok lintas batch: satu query stok, lalu alokasikan berurutan
+    item_codes = {sale_item_code(item) for _, sale in accepted for item in sale['items']}
+    remaining = get_stock_levels(item_codes) if item_codes else {}
+    valid = []
+    for index, sale in accepted:
+        needed = {}
+        for item in sale['items']:
+            item_code = sale_item_code(item)
+            needed[item_code] = needed.get(item_code, 0) + item['quantity']
+        shortage = [f"{code} (butuh {qty}, sisa {remaining.get(code, 0)})"
+                    for code, qty in needed.items() if remaining.get(code, 0) < qty]
+        if shortage:
+            results[index]['message'] = "Stok tidak cukup: " + ", ".join(shortage)
+            continue
+        for code, qty in needed.items():
+            remaining[code] -= qty
+        valid.append((index, sale))
+    
+    if not valid:
+        return results
+    
+    print(f"🔧 Processing sales batch: {len(valid)}/{len(sales_data)} penjualan valid")
+    
+    # 3. Stok dulu, satu apply_stock_movements untuk seluruh batch (semua atau tidak sama sekali)
+    try:
+        nomor_so = iter(allocate_document_numbers("SO", len(valid)))
+    except Exception as e:
+        print(f"❌ Nomor SO tidak bisa dialokasikan: {e}")
+        for index, _ in valid:
+            results[index]['message'] = "Nomor dokumen tidak bisa dialokasikan, coba lagi"
+        return results
+    movements = []
+    for _, sale in valid:
+        movements += build_sale_movements(sale['tanggal'], sale['customer'], sale['items'], next(nomor_so))
+    
+    if not record_inventory_transactions_batch(movements):
+        for index, _ in valid:
+            results[index]['message'] = "Gagal update stok, penjualan tidak diposting"
+        return results
+    
+    # 4. Semua jurnal dalam satu post_journal; nomor jurnal dialokasikan per blok
+    try:
+        nomor_jurnal = iter(allocate_document_numbers("J", sum(len(sale['postings']['journals']) for _, sale in valid)))
+        created_at = datetime.now().isoformat()
+        jurnal_rows = []
+        for _, sale in valid:
+            for jurnal_tanggal, jurnal_jenis, entries in sale['postings']['journals']:
+                jurnal_rows += build_journal_rows(jurnal_tanggal, jurnal_jenis, entries, next(nomor_jurnal), created_at)
+    except Exception as e:
+        # Belum ada jurnal yang dikirim: aman mengembalikan stok
+        print(f"❌ Error menyusun jurnal batch penjualan: {e}")
+        jurnal_rows = []
+    
+    try:
+        journal_saved = bool(jurnal_rows) and bool(insert_journal_rows("jurnal_umum", jurnal_rows))
+    except Exception as e:
+        # Jurnal bisa saja sudah ter-commit: stok dibiarkan, jangan undang retry buta
+        print(f"❌ Status jurnal batch penjualan tidak diketahui ({e}), stok tidak dikembalikan")
+        for index, _ in valid:
+            results[index]['unknown'] = True
+            results[index]['message'] = "Status jurnal tidak diketahui, cek laporan sebelum mengulang"
+        return results
+    
+    if not journal_saved:
+        # Stok sudah dikurangi: kembalikan supaya tidak ada stok keluar tanpa jurnal
+        reverse_stock_movements(movements)
+        for index, _ in valid:
+            results[index]['message'] = "Gagal menyimpan jurnal"
+        return results
+    
+    # 5. Buku pembantu piutang dan data penjualan (stok & jurnal sudah tersimpan: gagal = warning)
+    piutang_rows = [row for _, sale in valid for row in sale['postings']['piutang']]
+    if not record_buku_pembantu_piutang_batch(piutang_rows):
+        print("⚠ Sebagian buku pembantu piutang gagal disimpan")
+    sale_rows = [build_sale_row(sale['tanggal'], sale['customer'], sale['items'], sale['payment_method'],
+                                sale['shipping_cost'], sale['dp_amount']) for _, sale in valid]
+    try:
+        supabase.table("sales").insert(sale_rows).execute()
+        bump_ledger_version("sales")
+        print(f"✅ Sale data saved: {len(sale_rows)} penjualan")
+    except Exception as e:
+        print(f"⚠ Gagal menyimpan data penjualan: {e}")
+    
+    for index, _ in valid:
+        results[index]['success'] = True
+        results[index]['message'] = "Transaksi berhasil diproses"
+    return results
+    
 # === Helper: Setup default inventory ===
 def setup_default_inventory_items():
     """Setup inventory default untuk ikan patin dengan struktur yang benar"""
@@ -2013,6 +3311,7 @@ def setup_default_inventory_items():
                 print(f"🔧 Adding inventory item: {item['item_code']}")
                 try:
                     result = supabase.table("inventory").insert(item).execute()
+                    bump_ledger_version("inventory")
                     if result.data:
                         print(f"✅ Inventory item {item['item_code']} berhasil ditambahkan")
                     else:
@@ -2027,6 +3326,32 @@ def setup_default_inventory_items():
         import traceback
         traceback.print_exc()
 
+# === Template Jinja (dikompilasi sekali saat start) ===
+# Semua template halaman & partial tab disimpan di TEMPLATES lalu di-load lewat
+# DictLoader; hasil kompilasi di-cache di environment (dan bytecode-nya di disk),
+# jadi request tidak lagi mem-parse ulang template besar seperti render_template_string.
+TEMPLATES = {}
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "airyn-jinja"))
+
+app.jinja_env.loader = ChoiceLoader([DictLoader(TEMPLATES), app.jinja_env.loader])
+app.jinja_env.globals["new_idempotency_key"] = new_idempotency_key
+try:
+    os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+except OSError as e:
+    print(f"⚠ Bytecode cache Jinja tidak aktif ({JINJA_CACHE_DIR}): {e}")
+
+@app.template_filter("rupiah")
+def rupiah(value):
+    """Format angka sebagai 'Rp 1,234,567'"""
+    return f"Rp {value:,.0f}"
+
+def precompile_templates():
+    """Kompilasi semua template di TEMPLATES (dipanggil sekali setelah semua terdaftar)"""
+    for name in TEMPLATES:
+        app.jinja_env.get_template(name)
+    print(f"✅ {len(TEMPLATES)} template Jinja dikompilasi")
+
 # === Base template (sidebar + main) ===
 base_template = """
 <!-- Tambahkan di head section base_template -->
@@ -2217,7 +3542,7 @@ base_template = """
     </header>
 
     <section class="content">
-      {{ content|safe }}
+      {% block content %}{{ content|safe }}{% endblock %}
     </section>
   </div>
 </body>
@@ -2630,8 +3955,79 @@ signin_content = base_style + """
 </div>
 """
 
+TEMPLATES["base.html"] = base_template
+TEMPLATES["signup.html"] = signup_content
+TEMPLATES["otp.html"] = otp_content
+TEMPLATES["signin.html"] = signin_content
+
 # === ROUTES ===
 
+def summarize_backend_calls(calls):
+    """Total panggilan, baris, byte dan latency dari daftar panggilan backend"""
+    return {
+        "calls": len(calls),
+        "rows": sum(call["rows"] for call in calls),
+        "bytes": sum(call["bytes"] for call in calls),
+        "ms": sum(call["ms"] for call in calls),
+        "errors": sum(1 for call in calls if call["error"]),
+    }
+
+def record_backend_route_stats(route, method, path, status, calls):
+    """Tambahkan panggilan backend satu request ke statistik per route; return ringkasannya"""
+    summary = summarize_backend_calls(calls)
+    per_table = {}
+    for call in calls:
+        key = f"{call['operation']} {call['table']}"
+        entry = per_table.setdefault(key, {"calls": 0, "rows": 0, "ms": 0.0})
+        entry["calls"] += 1
+        entry["rows"] += call["rows"]
+        entry["ms"] += call["ms"]
+    
+    with BACKEND_STATS_LOCK:
+        stats = BACKEND_ROUTE_STATS.setdefault(route, {
+            "requests": 0, "calls": 0, "rows": 0, "bytes": 0, "ms": 0.0, "errors": 0, "max_calls": 0
+        })
+        stats["requests"] += 1
+        for key in ("calls", "rows", "bytes", "ms", "errors"):
+            stats[key] += summary[key]
+        stats["max_calls"] = max(stats["max_calls"], summary["calls"])
+        BACKEND_RECENT_REQUESTS.append({
+            "time": datetime.now().strftime("%H:%M:%S"),
+            "method": method,
+            "path": path,
+            "status": status,
+            "summary": summary,
+            "per_table": per_table,
+        })
+    return summary
+
+@app.after_request
+def add_backend_call_summary(response):
+    """Header X-Backend-Calls / Server-Timing + statistik per route"""
+    if not BACKEND_INSTRUMENTATION:
+        return response
+    
+    route = request.url_rule.rule if request.url_rule else request.path
+    path = request.full_path.rstrip("?")
+    
+    if response.is_streamed:
+        # Body streaming (mis. export CSV) baru membaca data setelah after_request:
+        # stream_with_context tetap memakai g yang sama, jadi list ini terus terisi
+        # dan statistiknya dicatat saat response ditutup. Header tidak bisa dikirim.
+        calls = g.setdefault("backend_calls", [])
+        method, status = request.method, response.status_code
+        response.call_on_close(lambda: record_backend_route_stats(route, method, path, status, calls))
+        return response
+    
+    calls = g.pop("backend_calls", [])
+    summary = record_backend_route_stats(route, request.method, path, response.status_code, calls)
+    response.headers["X-Backend-Calls"] = (
+        f"calls={summary['calls']}; rows={summary['rows']}; "
+        f"bytes={summary['bytes']}; ms={summary['ms']:.1f}"
+    )
+    response.headers["Server-Timing"] = f'db;dur={summary["ms"]:.1f};desc="{summary["calls"]} calls"'
+    return response
+
 @app.route("/")
 def root():
     return redirect("/signin")
@@ -2640,7 +4036,7 @@ def root():
 def beranda():
     if "user" not in session:
         return redirect("/signin")
-    return render_template_string(base_template, title="Beranda", content=beranda_content)
+    return render_template("base.html", title="Beranda", content=beranda_content)
 
 @app.route("/signup", methods=["GET", "POST"])
 def signup():
@@ -2672,7 +4068,7 @@ def signup():
         
         return redirect("/verify")
 
-    return render_template_string(signup_content)
+    return render_template("signup.html")
 
 @app.route("/verify", methods=["GET", "POST"])
 def verify():
@@ -2710,7 +4106,7 @@ def verify():
             </div>
             '''.format(user_otp, session['temp_user'].get('otp'))
 
-    return render_template_string(otp_content)
+    return render_template("otp.html")
 
 @app.route("/debug_email_detailed")
 def debug_email_detailed():
@@ -2774,6 +4170,12 @@ def otp_logs():
         logs = ["No log file found"]
     
     log_html = "<h2>📋 OTP Logs</h2>"
+    stats = OTP_QUEUE.stats
+    transport = OTP_QUEUE.transport.name if OTP_QUEUE.transport else "console"
+    log_html += (
+        f"<p>Antrian ({transport}): {OTP_QUEUE.jobs.qsize()} menunggu | "
+        f"{stats['sent']} terkirim | {stats['retried']} retry | {stats['fallback']} fallback console</p>"
+    )
     for log in logs[-20:]:  # Show last 20 entries
         log_html += f"<p>{log}</p>"
     
@@ -2956,7 +4358,7 @@ def signin():
         else:
             return "<h3 style='color:white;text-align:center;'>❌ Email atau password salah.</h3>"
 
-    return render_template_string(signin_content)
+    return render_template("signin.html")
 
 # === MANAJEMEN BARANG CONTENT ===
 @app.route("/barang")
@@ -3214,6 +4616,7 @@ def manajemen_barang():
                             <button class="close-modal" onclick="closeModal('tambah-stok-{item['item_code']}')">&times;</button>
                         </div>
                         <form method="POST" action="/tambah_stok_simple">
+                            <input type="hidden" name="idempotency_key" value="{new_idempotency_key()}">
                             <input type="hidden" name="item_code" value="{item['item_code']}">
                             <div class="form-group">
                                 <label class="form-label">Tanggal *</label>
@@ -3321,284 +4724,1229 @@ def manajemen_barang():
     </script>
     """
     
-    return render_template_string(base_template, title="Manajemen Barang", content=barang_content)
+    return render_template("base.html", title="Manajemen Barang", content=barang_content)
+
+# === Helper: Data untuk tab /laporan ===
+def get_neraca_saldo_laporan(end_date=None):
+    """Neraca saldo sebelum & setelah penyesuaian per end_date untuk tab laporan (dari saldo_akun)"""
+    return get_ledger_snapshot(end_date).prefetch(*SNAPSHOT_INPUT_NSSP).get(hitung_neraca_saldo_laporan)
+
+def hitung_neraca_saldo_laporan(snapshot):
+    """(neraca saldo akun aktif, NSSP semua akun) per end_date snapshot untuk tab laporan"""
+    catalogue = snapshot.catalogue
+    neraca_saldo_data = []
+
+    # Buat List Neraca Saldo (Sebelum Penyesuaian) dari saldo_akun, bukan dari replay jurnal
+    saldo_umum = snapshot.get(hitung_saldo_akhir_umum)
+    penyesuaian_per_akun = snapshot.penyesuaian
+    if LEDGER_ENGINE == "pandas":
+        return hitung_neraca_saldo_laporan_pandas(catalogue, saldo_umum, penyesuaian_per_akun)
+    
+    for kode, akun in catalogue.items():
+        saldo_akhir = saldo_umum[kode]
+        if saldo_akhir != 0 or akun['saldo_awal'] != 0:
+            neraca_saldo_data.append({
+                'kode_akun': kode,
+                'nama_akun': akun['nama_akun'],
+                'debit': saldo_akhir if akun['tipe_akun'] == 'debit' and saldo_akhir > 0 else 0,
+                'kredit': saldo_akhir if akun['tipe_akun'] == 'kredit' and saldo_akhir > 0 else 0
+            })
 
-# === LAPORAN KEUANGAN CONTENT ===
-@app.route("/laporan")
-def laporan():
-    if "user" not in session:
-        return redirect("/signin")
+    # C. Hitung Neraca Saldo Setelah Penyesuaian (NSSP)
+    # Kita copy saldo neraca saldo lalu update dengan total penyesuaian per akun
+    saldo_setelah_penyesuaian_dict = {
+        k: {'val': saldo_umum[k], 'tipe': v['tipe_akun'], 'nama': v['nama_akun']} 
+        for k, v in catalogue.items()
+    }
 
-    # Matikan setup otomatis agar loading cepat
-    # setup_default_accounts()
-    # setup_default_inventory_items()
+    # Apply Jurnal Penyesuaian
+    for kode, adj in penyesuaian_per_akun.items():
+        if kode in saldo_setelah_penyesuaian_dict:
+            acc = saldo_setelah_penyesuaian_dict[kode]
+            if acc['tipe'] == 'debit':
+                acc['val'] += (adj['debit'] - adj['kredit'])
+            else:
+                acc['val'] += (adj['kredit'] - adj['debit'])
+
+    # Convert dict ke list untuk template NSSP
+    neraca_saldo_setelah_penyesuaian = []
+    for kode, data in saldo_setelah_penyesuaian_dict.items():
+        neraca_saldo_setelah_penyesuaian.append({
+            'kode_akun': kode,
+            'nama_akun': data['nama'],
+            'debit': data['val'] if data['tipe'] == 'debit' and data['val'] > 0 else 0,
+            'kredit': data['val'] if data['tipe'] == 'kredit' and data['val'] > 0 else 0,
+            # Field tambahan untuk helpers lain jika perlu
+            'saldo_akhir': data['val'],
+            'tipe_akun': data['tipe']
+        })
 
-    # Gunakan application context
-    with app.app_context():
-        try:
-            # === 1. SINGLE FETCH (Ambil semua data dalam 3 request saja) ===
-            # Ambil semua akun
-            accounts_res = supabase.table("accounts").select("*").order("kode_akun").execute()
-            accounts = accounts_res.data if accounts_res.data else []
+    return neraca_saldo_data, neraca_saldo_setelah_penyesuaian
 
-            # Ambil semua jurnal umum
-            jurnal_res = supabase.table("jurnal_umum").select("*").order("tanggal").order("id").execute()
-            jurnal_data = jurnal_res.data if jurnal_res.data else []
 
-            # Ambil semua jurnal penyesuaian
-            penyesuaian_res = supabase.table("jurnal_penyesuaian").select("*").order("tanggal").order("id").execute()
-            jurnal_penyesuaian_data = penyesuaian_res.data if penyesuaian_res.data else []
+@cached_report(*LEDGER_DOMAINS)
+def hitung_laporan_keuangan(start_date=None, end_date=None):
+    """Laba rugi (mutasi periode), neraca dan perubahan modal (saldo per end_date) untuk tab laporan keuangan"""
+    snapshot = get_ledger_snapshot(end_date)
+    catalogue = snapshot.catalogue
+    sumber_laporan = ["jurnal_umum", "jurnal_penyesuaian"]
+    
+    # Pembelian persediaan dalam periode difilter langsung di server
+    def pembelian_query():
+        query = supabase.table("jurnal_umum").select("id, debit").in_("kode_akun", ['1-1200', '1-1300']).like("jenis_transaksi", "%Pembelian%")
+        if start_date:
+            query = query.gte("tanggal", start_date.isoformat())
+        if end_date:
+            query = query.lte("tanggal", end_date.isoformat())
+        return query
+    
+    # Input laporan saling bebas, dibaca bersamaan: saldo per end_date (snapshot),
+    # mutasi periode, saldo awal periode (carry-forward) dan pembelian periode
+    _, mutasi, saldo_awal_periode, pembelian = fetch_concurrently(
+        lambda: snapshot.prefetch(*SNAPSHOT_INPUT_NSSP),
+        partial(get_mutasi_periode, sumber_laporan, start_date, end_date),
+        partial(get_saldo_awal_periode, sumber_laporan, start_date),
+        lambda: sum(j['debit'] for j in iter_query_rows(pembelian_query)),
+    )
+    _, neraca_saldo_setelah_penyesuaian = snapshot.get(hitung_neraca_saldo_laporan)
 
-            # Ambil data pembantu (piutang & sales) untuk arus kas
-            piutang_res = supabase.table("buku_pembantu_piutang").select("*").order("tanggal").execute()
-            buku_piutang_raw = piutang_res.data if piutang_res.data else []
-            
-            sales_res = supabase.table("sales").select("*").execute()
-            sales_data = sales_res.data if sales_res.data else []
+    # D. Hitung Laba Rugi (Disatukan disini agar tidak fetch ulang)
+    # Persediaan awal = saldo persediaan di awal periode (carry-forward)
+    persediaan_awal = sum(saldo_awal_periode[kode] for kode in ['1-1200', '1-1300'] if kode in saldo_awal_periode)
+    
+    # Ambil saldo akhir persediaan dari NSSP
+    persediaan_akhir = 0
+    
+    for item in neraca_saldo_setelah_penyesuaian:
+        if item['kode_akun'] in ['1-1200', '1-1300']:
+            persediaan_akhir += item['debit'] if item['debit'] > 0 else item['kredit']
+    
+    # Akun nominal (Laba Rugi) dihitung dari mutasi selama periode
+    beban_angkut_pembelian = max(mutasi.get('5-1300', 0), 0) # Saldo normal debit
+    total_pendapatan = 0
+    total_beban = 0
+    
+    for kode, nilai in mutasi.items():
+        # Klasifikasi Laba Rugi
+        if kode.startswith('4-'): # Pendapatan
+            total_pendapatan += max(nilai, 0)
+        elif kode.startswith('5-') and kode != '5-1300': # Beban Ops (kecuali angkut pembelian)
+            total_beban += max(nilai, 0)
+        elif kode.startswith('6-'): # Beban Penyesuaian
+            total_beban += max(nilai, 0)
+
+    # Hitung HPP Final
+    # Rumus: (Awal + Pembelian + Angkut) - Akhir
+    hpp = (persediaan_awal + pembelian + beban_angkut_pembelian) - persediaan_akhir
+    laba_kotor = total_pendapatan - hpp
+    laba_bersih = laba_kotor - total_beban
+
+    laba_rugi_data = {
+        'total_pendapatan': total_pendapatan,
+        'total_hpp': hpp,
+        'laba_kotor': laba_kotor,
+        'total_beban': total_beban,
+        'laba_bersih': laba_bersih,
+        'detail_hpp': {
+            'persediaan_awal': persediaan_awal,
+            'pembelian': pembelian,
+            'beban_angkut_pembelian': beban_angkut_pembelian,
+            'persediaan_akhir': persediaan_akhir,
+            # Detail per item disederhanakan 0 jika tidak kritikal untuk tampilan ringkas
+            'persediaan_awal_8cm': 0, 'persediaan_awal_10cm': 0,
+            'pembelian_8cm': 0, 'pembelian_10cm': 0,
+            'persediaan_akhir_8cm': 0, 'persediaan_akhir_10cm': 0
+        }
+    }
+
+    # E. Hitung Neraca (Balance Sheet)
+    total_aset_lancar = 0
+    total_aset_tetap = 0
+    total_liabilitas = 0
+    total_ekuitas = 0 # Ekuitas awal + Laba Bersih - Prive
+
+    prive = 0
+    modal_awal = 0
+
+    for item in neraca_saldo_setelah_penyesuaian:
+        kode = item['kode_akun']
+        # Cari kategori akun dari katalog
+        kategori = catalogue.get(kode, {}).get('kategori', '')
+
+        # Logika Penjumlahan Neraca (Asset, Liabilitas, Equity)
+        if kategori == 'Current Asset':
+            total_aset_lancar += item['debit'] # Aset saldo normal debit
+        elif kategori == 'Fixed Asset':
+            total_aset_tetap += item['debit']
+        elif kategori == 'Contra Asset':
+            total_aset_tetap -= item['kredit'] # Akumulasi penyusutan mengurangi aset
+        elif kategori == 'Liabilities':
+            total_liabilitas += item['kredit']
+        elif kategori == 'Equity':
+            if kode == '3-1000': modal_awal = item['kredit']
+            total_ekuitas += item['kredit']
+        elif kategori == 'Contra Equity' or kode == '3-1200': # PERBAIKAN: Tambahkan 'or'
+            prive = item['debit']
+            total_ekuitas -= item['debit'] # Prive mengurangi modal
+
+    # Prive di laporan perubahan modal = penarikan selama periode (sejalan dengan laba bersih periode)
+    prive = max(mutasi.get('3-1200', 0), 0)
+
+    # Masukkan Laba Bersih ke Ekuitas di Neraca Akhir
+    total_ekuitas_akhir = total_ekuitas + laba_bersih # Total ekuitas di neraca sudah net (Modal Awal - Prive + Laba)
+
+    # Koreksi perhitungan manual untuk variabel terpisah
+    # Total Ekuitas yang ditampilkan di ringkasan biasanya Modal Akhir
+    # Modal Akhir = Modal Awal + Laba - Prive
+    modal_akhir_calc = modal_awal + laba_bersih - prive
+
+    neraca_data = {
+        'total_aset_lancar': total_aset_lancar,
+        'total_aset_tetap': total_aset_tetap,
+        'total_aset': total_aset_lancar + total_aset_tetap,
+        'total_liabilitas': total_liabilitas,
+        'total_ekuitas': modal_akhir_calc 
+    }
+
+    # Laporan Perubahan Modal
+    perubahan_modal_data = {
+        'modal_awal': modal_awal,
+        'laba_bersih': laba_bersih,
+        'prive': prive,
+        'perubahan_modal': laba_bersih - prive,
+        'modal_akhir': modal_awal + (laba_bersih - prive)
+    }
+
+    return {
+        'laba_rugi': laba_rugi_data,
+        'neraca': neraca_data,
+        'perubahan_modal': perubahan_modal_data
+    }
+
+
+# === Template tab laporan (partial, dirender lewat /laporan/tab/<nama>) ===
+# Tabel tab bisa berisi puluhan ribu sel angka, jadi autoescape dimatikan di partial ini
+# (escape per nilai memakan >50% waktu render); teks dari database di-escape eksplisit dengan |e.
+TEMPLATES["laporan/macros.html"] = """
+{% macro card_header(judul, keterangan) %}{% autoescape false %}
+                <div class="card-header">
+                    <h2 class="card-title">{{ judul }}</h2>
+                    <p style="color: #64748b; margin: 0;">{{ keterangan }}</p>
+                </div>
+{% endautoescape %}{% endmacro %}
+
+{% macro empty_state(judul, pesan) %}{% autoescape false %}
+                    <div class="empty-state">
+                        <i class="ri-file-list-3-line"></i>
+                        <h3>{{ judul }}</h3>
+                        <p>{{ pesan }}</p>
+                    </div>
+{% endautoescape %}{% endmacro %}
+
+{% macro jurnal_table(entries) %}{% autoescape false %}
+                    <table class="jurnal-table">
+                        <thead>
+                            <tr>
+                                <th width="100">Tanggal</th>
+                                <th>Keterangan</th>
+                                <th width="120">Ref</th>
+                                <th width="150">Debit</th>
+                                <th width="150">Kredit</th>
+                            </tr>
+                        </thead>
+                        <tbody>
+                        {% for entry in entries %}
+                            <tr>
+                                <td>{{ entry['tanggal'] if entry['show_date'] else '' }}</td>
+                                <td>{{ entry['keterangan']|e }}</td>
+                                <td>{{ entry['ref']|e }}</td>
+                                <td class="debit-amount">{{ entry['debit']|rupiah if entry['debit'] > 0 else '' }}</td>
+                                <td class="kredit-amount">{{ entry['kredit']|rupiah if entry['kredit'] > 0 else '' }}</td>
+                            </tr>
+                        {% endfor %}
+                        </tbody>
+                    </table>
+{% endautoescape %}{% endmacro %}
+
+{% macro neraca_saldo_table(rows, total_debit, total_kredit, judul) %}{% autoescape false %}
+                    <table class="neraca-table">
+                        <thead>
+                            <tr>
+                                <th width="100">Kode Akun</th>
+                                <th>Nama Akun</th>
+                                <th width="200">Debit</th>
+                                <th width="200">Kredit</th>
+                            </tr>
+                        </thead>
+                        <tbody>
+                        {% for item in rows %}
+                            <tr>
+                                <td><strong>{{ item['kode_akun']|e }}</strong></td>
+                                <td>{{ item['nama_akun']|e }}</td>
+                                <td class="debit-amount">{{ item['debit']|rupiah if item['debit'] > 0 else '' }}</td>
+                                <td class="kredit-amount">{{ item['kredit']|rupiah if item['kredit'] > 0 else '' }}</td>
+                            </tr>
+                        {% endfor %}
+                            <tr class="total-row">
+                                <td colspan="2"><strong>TOTAL</strong></td>
+                                <td class="debit-amount"><strong>{{ total_debit|rupiah }}</strong></td>
+                                <td class="kredit-amount"><strong>{{ total_kredit|rupiah }}</strong></td>
+                            </tr>
+                        </tbody>
+                    </table>
+                    {% set selisih = (total_debit - total_kredit)|abs %}
+                    {% if selisih < 0.01 %}
+                    <div style="background: #f0fdf4; padding: 1rem; border-radius: 8px; margin-top: 1rem; border-left: 4px solid #10b981;">
+                        <h4 style="color: #065f46; margin: 0;">✅ {{ judul }} Balance</h4>
+                        <p style="color: #065f46; margin: 0.5rem 0 0 0;">Total Debit ({{ total_debit|rupiah }}) = Total Kredit ({{ total_kredit|rupiah }})</p>
+                    </div>
+                    {% else %}
+                    <div style="background: #fef2f2; padding: 1rem; border-radius: 8px; margin-top: 1rem; border-left: 4px solid #ef4444;">
+                        <h4 style="color: #dc2626; margin: 0;">❌ {{ judul }} Tidak Balance</h4>
+                        <p style="color: #dc2626; margin: 0.5rem 0 0 0;">Total Debit ({{ total_debit|rupiah }}) ≠ Total Kredit ({{ total_kredit|rupiah }})</p>
+                        <p style="color: #dc2626; margin: 0.5rem 0 0 0;">Selisih: {{ selisih|rupiah }}</p>
+                    </div>
+                    {% endif %}
+{% endautoescape %}{% endmacro %}
+"""
+
+TEMPLATES["laporan/tab_daftar_akun.html"] = """{% autoescape false %}
+{% from "laporan/macros.html" import empty_state %}
+            <div class="card">
+                <div class="card-header">
+                    <h2 class="card-title">Chart of Accounts (COA) - Toko Ikan Patin</h2>
+                    <button class="btn-primary" onclick="openModal('tambah-akun')">
+                        <i class="ri-add-line"></i>Tambah Akun
+                    </button>
+                </div>
+
+                <div class="table-container">
+                    <div style="display: grid; grid-template-columns: 100px 1fr 150px 120px 150px 120px; gap: 1rem; padding: 1rem; background: #f8fafc; font-weight: 600; color: #374151; border-bottom: 2px solid #e2e8f0;">
+                        <div>Kode</div>
+                        <div>Nama Akun</div>
+                        <div>Kategori</div>
+                        <div>Tipe</div>
+                        <div>Saldo Awal</div>
+                        <div style="text-align: center;">Aksi</div>
+                    </div>
+                {% for kategori, badge_class, akun_list in kategori_groups %}
+                    <div style="background: #f1f5f9; padding: 0.75rem 1rem; font-weight: 700; color: #374151; border-bottom: 1px solid #e2e8f0;">
+                        {{ kategori|upper }}
+                    </div>
+                    {% for akun in akun_list %}
+                    <div style="display: grid; grid-template-columns: 100px 1fr 150px 120px 150px 120px; gap: 1rem; padding: 1rem; border-bottom: 1px solid #f1f5f9; align-items: center;">
+                        <div><strong>{{ akun['kode_akun']|e }}</strong></div>
+                        <div>{{ akun['nama_akun']|e }}</div>
+                        <div><span class="kategori-badge {{ badge_class }}">{{ akun['kategori']|e }}</span></div>
+                        <div>{{ akun['tipe_akun']|e }}</div>
+                        <div style="color: {{ '#059669' if akun['tipe_akun'] == 'debit' else '#dc2626' }}; font-weight: 600;">
+                            {{ akun['saldo_awal']|rupiah }}
+                        </div>
+                        <div class="action-buttons">
+                            <button class="btn-primary btn-warning btn-sm" onclick="openEditModal('{{ akun['kode_akun']|e }}', '{{ akun['nama_akun']|e }}', '{{ akun['kategori']|e }}', '{{ akun['tipe_akun']|e }}', {{ akun['saldo_awal'] }})">
+                                <i class="ri-edit-line"></i>
+                            </button>
+                            <button class="btn-primary btn-danger btn-sm" onclick="confirmDelete('{{ akun['kode_akun']|e }}', '{{ akun['nama_akun']|e }}')">
+                                <i class="ri-delete-bin-line"></i>
+                            </button>
+                        </div>
+                    </div>
+                    {% endfor %}
+                {% else %}
+                    {{ empty_state("Belum Ada Akun", "Akun default sedang dimuat...") }}
+                {% endfor %}
+                </div>
+            </div>{% endautoescape %}
+"""
+
+# Urutan kategori di daftar akun -> class CSS badge-nya
+KATEGORI_BADGE = {
+    'Current Asset': "current-asset",
+    'Fixed Asset': "fixed-asset",
+    'Contra Asset': "contra-asset",
+    'Liabilities': "liabilities",
+    'Equity': "equity",
+    'Contra Equity': "contra-equity",
+    'Revenue': "revenue",
+    'Cost of Goods Sold': "cogs",
+    'Expense': "expense",
+}
+
+def render_tab_daftar_akun():
+    """Isi tab Daftar Akun pada halaman laporan"""
+    accounts = list(get_account_catalogue().values())
+
+    # Kelompokkan akun berdasarkan kategori; kategori tak dikenal masuk Expense
+    kategori_groups = {kategori: [] for kategori in KATEGORI_BADGE}
+    for akun in accounts:
+        kategori = akun['kategori'] if akun['kategori'] in kategori_groups else 'Expense'
+        kategori_groups[kategori].append(akun)
+
+    return render_template(
+        "laporan/tab_daftar_akun.html",
+        kategori_groups=[(kategori, KATEGORI_BADGE[kategori], akun_list)
+                         for kategori, akun_list in kategori_groups.items() if akun_list],
+    )
+
+
+TEMPLATES["laporan/tab_jurnal_umum.html"] = """{% autoescape false %}
+{% from "laporan/macros.html" import empty_state, jurnal_table %}
+            <div class="card">
+                <div class="card-header">
+                    <h2 class="card-title">Jurnal Umum - Toko Ikan Patin</h2>
+                    <div>
+                        <button class="btn-primary btn-success" onclick="openModal('tambah-jurnal-penjualan-baru')">
+                            <i class="ri-money-dollar-circle-line"></i> Jurnal Penjualan
+                        </button>
+                        <button class="btn-primary btn-warning" onclick="openModal('tambah-jurnal-pembelian')">
+                            <i class="ri-shopping-cart-line"></i> Jurnal Pembelian
+                        </button>
+                        <button class="btn-primary btn-danger" onclick="openModal('tambah-jurnal-biaya')">
+                            <i class="ri-money-dollar-circle-line"></i> Jurnal Biaya
+                        </button>
+                        <button class="btn-primary btn-info" onclick="openModal('tambah-jurnal-manual')">
+                            <i class="ri-upload-line"></i> Jurnal Manual
+                        </button>
+                    </div>
+                </div>
+
+                <div class="jurnal-container">
+                {% if entries %}
+                    {{ jurnal_table(entries) }}
+                {% else %}
+                    {{ empty_state("Belum Ada Transaksi Jurnal", "Mulai dengan menambahkan jurnal penjualan, pembelian, atau biaya operasional") }}
+                {% endif %}
+                </div>
+            </div>{% endautoescape %}
+"""
+
+def render_tab_jurnal_umum():
+    """Isi tab Jurnal Umum pada halaman laporan"""
+    start_date, end_date = get_report_period()
+    accounts = list(get_account_catalogue().values())
+    jurnal_data = read_query_rows(lambda: supabase.table("jurnal_umum").select(JURNAL_DISPLAY_COLUMNS)
+                                  .gte("tanggal", start_date.isoformat())
+                                  .lte("tanggal", end_date.isoformat()),
+                                  keys=("tanggal", "id"))
+    formatted_jurnal = format_journal_for_display(jurnal_data, accounts)
+
+    return render_template("laporan/tab_jurnal_umum.html", entries=formatted_jurnal)
+
+
+TEMPLATES["laporan/tab_buku_besar.html"] = """{% autoescape false %}
+{% from "laporan/macros.html" import card_header, empty_state %}
+            <div class="card">
+                {{ card_header("Buku Besar - Toko Ikan Patin", "Ringkasan transaksi per akun, periode " ~ periode) }}
+
+                <div class="buku-besar-container">
+                {% for kode_akun, data in buku_besar.items() if data['entries'] or data['saldo_awal'] != 0 %}
+                    <div class="akun-card">
+                        <div class="akun-header">
+                            <div class="akun-info">
+                                <h3>{{ kode_akun|e }} - {{ data['nama_akun']|e }}</h3>
+                                <p>{{ data['kategori']|e }} • Tipe: {{ data['tipe_akun']|title|e }}</p>
+                            </div>
+                            <div class="akun-saldo">
+                                <div class="saldo-awal">Saldo Awal: {{ data['saldo_awal']|rupiah }}</div>
+                                <div class="saldo-akhir">Saldo Akhir: {{ data['saldo_akhir']|rupiah }}</div>
+                            </div>
+                        </div>
+
+                        <div class="jurnal-container">
+                            <table class="jurnal-table">
+                                <thead>
+                                    <tr>
+                                        <th width="100">Tanggal</th>
+                                        <th>Keterangan</th>
+                                        <th width="120">Ref</th>
+                                        <th width="150">Debit</th>
+                                        <th width="150">Kredit</th>
+                                        <th width="150">Saldo</th>
+                                    </tr>
+                                </thead>
+                                <tbody>
+                                    <tr>
+                                        <td></td>
+                                        <td><em>Saldo Awal</em></td>
+                                        <td></td>
+                                        <td></td>
+                                        <td></td>
+                                        <td class="saldo-amount">{{ data['saldo_awal']|rupiah }}</td>
+                                    </tr>
+                                {% for entry in data['entries'] %}
+                                    <tr>
+                                        <td>{{ entry['tanggal'] }}</td>
+                                        <td>{{ entry['keterangan']|e }}</td>
+                                        <td>{{ entry['ref']|e }}</td>
+                                        <td class="debit-amount">{{ entry['debit']|rupiah if entry['debit'] > 0 else '' }}</td>
+                                        <td class="kredit-amount">{{ entry['kredit']|rupiah if entry['kredit'] > 0 else '' }}</td>
+                                        <td class="saldo-amount">{{ entry['saldo']|rupiah }}</td>
+                                    </tr>
+                                {% endfor %}
+                                </tbody>
+                            </table>
+                        </div>
+                    </div>
+                {% endfor %}
+                {% if not buku_besar %}
+                    {{ empty_state("Belum Ada Transaksi", "Belum ada transaksi yang tercatat dalam buku besar") }}
+                {% endif %}
+                </div>
+            </div>{% endautoescape %}
+"""
+
+def render_tab_buku_besar():
+    """Isi tab Buku Besar pada halaman laporan"""
+    start_date, end_date = get_report_period()
+    buku_besar_data = get_buku_besar_data(start_date, end_date)
+
+    return render_template(
+        "laporan/tab_buku_besar.html",
+        buku_besar=buku_besar_data,
+        periode=format_periode(start_date, end_date),
+    )
+
+
+TEMPLATES["laporan/tab_buku_pembantu_piutang.html"] = """{% autoescape false %}
+{% from "laporan/macros.html" import card_header, empty_state %}
+            <div class="card">
+                {{ card_header("Buku Pembantu Piutang - Toko Ikan Patin", "Detail piutang per customer (hanya transaksi DP), periode " ~ periode) }}
+
+                <div class="buku-piutang-container">
+                {% for customer, entries in buku_piutang.items() %}
+                    <div class="piutang-customer-card">
+                        <div class="piutang-header">
+                            <div class="piutang-info">
+                                <h3>{{ customer|e }}</h3>
+                                <p>Customer Piutang</p>
+                            </div>
+                            <div class="piutang-saldo">
+                                <div class="saldo-piutang">Saldo Akhir: {{ (entries[-1]['saldo'] if entries else 0)|rupiah }}</div>
+                            </div>
+                        </div>
+
+                        <div class="jurnal-container">
+                            <table class="piutang-table">
+                                <thead>
+                                    <tr>
+                                        <th width="100">Tanggal</th>
+                                        <th>Keterangan</th>
+                                        <th width="150">Debit</th>
+                                        <th width="150">Kredit</th>
+                                        <th width="150">Saldo</th>
+                                    </tr>
+                                </thead>
+                                <tbody>
+                                {% for entry in entries %}
+                                    <tr>
+                                        <td>{{ entry['tanggal'] }}</td>
+                                        <td>{{ entry['keterangan']|e }}</td>
+                                        <td class="debit-amount">{{ entry['debit']|rupiah if entry['debit'] > 0 else '' }}</td>
+                                        <td class="kredit-amount">{{ entry['kredit']|rupiah if entry['kredit'] > 0 else '' }}</td>
+                                        <td class="saldo-amount">{{ entry['saldo']|rupiah }}</td>
+                                    </tr>
+                                {% endfor %}
+                                </tbody>
+                            </table>
+                        </div>
+                    </div>
+                {% else %}
+                    {{ empty_state("Belum Ada Piutang", "Belum ada transaksi DP yang menghasilkan piutang") }}
+                {% endfor %}
+                </div>
+            </div>{% endautoescape %}
+"""
+
+def render_tab_buku_pembantu_piutang():
+    """Isi tab Buku Pembantu Piutang pada halaman laporan"""
+    start_date, end_date = get_report_period()
+    buku_piutang_data = get_buku_pembantu_piutang_data(start_date, end_date)
+
+    return render_template(
+        "laporan/tab_buku_pembantu_piutang.html",
+        buku_piutang=buku_piutang_data,
+        periode=format_periode(start_date, end_date),
+    )
+
+
+TEMPLATES["laporan/tab_rekap_penjualan.html"] = """{% autoescape false %}
+{% from "laporan/macros.html" import card_header, empty_state %}
+            <div class="card">
+                {{ card_header("Rekap Penjualan - Toko Ikan Patin", "Penjualan per hari per ukuran ikan, periode " ~ periode) }}
+
+                <div class="jurnal-container">
+                {% if rows %}
+                    <table class="neraca-table">
+                        <thead>
+                            <tr>
+                                <th width="120">Tanggal</th>
+                                <th>Ukuran</th>
+                                <th width="150">Transaksi</th>
+                                <th width="150">Quantity (ekor)</th>
+                                <th width="200">Total</th>
+                            </tr>
+                        </thead>
+                        <tbody>
+                        {% for item in rows %}
+                            <tr>
+                                <td>{{ item['tanggal'] }}</td>
+                                <td>Ikan Patin {{ item['jenis_ikan']|e }}</td>
+                                <td>{{ item['jumlah_transaksi'] }}</td>
+                                <td>{{ item['quantity'] }}</td>
+                                <td class="kredit-amount">{{ item['subtotal']|rupiah }}</td>
+                            </tr>
+                        {% endfor %}
+                        {% for jenis_ikan, total in total_per_ukuran.items() %}
+                            <tr class="total-row">
+                                <td colspan="3"><strong>TOTAL Ikan Patin {{ jenis_ikan|e }}</strong></td>
+                                <td><strong>{{ total['quantity'] }}</strong></td>
+                                <td class="kredit-amount"><strong>{{ total['subtotal']|rupiah }}</strong></td>
+                            </tr>
+                        {% endfor %}
+                        </tbody>
+                    </table>
+                {% else %}
+                    {{ empty_state("Belum Ada Penjualan", "Belum ada penjualan dalam periode ini") }}
+                {% endif %}
+                </div>
+            </div>{% endautoescape %}
+"""
+
+def render_tab_rekap_penjualan():
+    """Isi tab Rekap Penjualan pada halaman laporan"""
+    start_date, end_date = get_report_period()
+    rows = get_penjualan_per_ukuran(start_date, end_date)
+
+    total_per_ukuran = {}
+    for item in rows:
+        total = total_per_ukuran.setdefault(item['jenis_ikan'], {'quantity': 0, 'subtotal': 0})
+        total['quantity'] += item['quantity']
+        total['subtotal'] += item['subtotal']
+
+    return render_template(
+        "laporan/tab_rekap_penjualan.html",
+        rows=rows,
+        total_per_ukuran=dict(sorted(total_per_ukuran.items(), key=lambda pair: str(pair[0]))),
+        periode=format_periode(start_date, end_date),
+    )
+
+
+# Dipakai bersama oleh tab Neraca Saldo, NSSP, dan Neraca Saldo Setelah Penutupan
+TEMPLATES["laporan/tab_neraca_saldo.html"] = """{% autoescape false %}
+{% from "laporan/macros.html" import card_header, empty_state, neraca_saldo_table %}
+            <div class="card">
+                {{ card_header(judul ~ " - Toko Ikan Patin", keterangan ~ " per " ~ per_tanggal) }}
+
+                <div class="jurnal-container">
+                {% if rows %}
+                    {{ neraca_saldo_table(rows, total_debit, total_kredit, judul) }}
+                {% else %}
+                    {{ empty_state("Belum Ada Data " ~ judul, pesan_kosong) }}
+                {% endif %}
+                </div>
+            </div>{% endautoescape %}
+"""
+
+def render_neraca_saldo_tab(rows, end_date, judul, keterangan, pesan_kosong):
+    """Render tab berbentuk neraca saldo (kode, nama, debit, kredit + status balance)"""
+    return render_template(
+        "laporan/tab_neraca_saldo.html",
+        rows=rows,
+        total_debit=sum(item['debit'] for item in rows),
+        total_kredit=sum(item['kredit'] for item in rows),
+        judul=judul,
+        keterangan=keterangan,
+        per_tanggal=end_date.strftime("%d %B %Y"),
+        pesan_kosong=pesan_kosong,
+    )
+
+def render_tab_neraca_saldo():
+    """Isi tab Neraca Saldo pada halaman laporan"""
+    start_date, end_date = get_report_period()
+    neraca_saldo_data, _ = get_neraca_saldo_laporan(end_date)
+
+    return render_neraca_saldo_tab(
+        neraca_saldo_data, end_date, "Neraca Saldo",
+        "Saldo akhir semua akun sebelum penyesuaian",
+        "Data neraca saldo akan muncul setelah ada transaksi",
+    )
+
+
+TEMPLATES["laporan/tab_jurnal_penyesuaian.html"] = """{% autoescape false %}
+{% from "laporan/macros.html" import empty_state, jurnal_table %}
+            <div class="card">
+                <div class="card-header">
+                    <h2 class="card-title">Jurnal Penyesuaian - Toko Ikan Patin</h2>
+                    <button class="btn-primary btn-warning" onclick="openModal('tambah-jurnal-penyesuaian')">
+                        <i class="ri-add-line"></i> Tambah Jurnal Penyesuaian
+                    </button>
+                </div>
+
+                <div class="jurnal-container">
+                {% if entries %}
+                    {{ jurnal_table(entries) }}
+                {% else %}
+                    {{ empty_state("Belum Ada Jurnal Penyesuaian", "Tambahkan jurnal penyesuaian untuk mencatat transaksi penyesuaian akhir periode") }}
+                {% endif %}
+                </div>
+            </div>{% endautoescape %}
+"""
+
+def render_tab_jurnal_penyesuaian():
+    """Isi tab Jurnal Penyesuaian pada halaman laporan"""
+    start_date, end_date = get_report_period()
+    accounts = list(get_account_catalogue().values())
+    jurnal_penyesuaian_data = get_jurnal_penyesuaian(start_date, end_date)
+    formatted_penyesuaian = format_journal_for_display(jurnal_penyesuaian_data, accounts) if jurnal_penyesuaian_data else []
+
+    return render_template("laporan/tab_jurnal_penyesuaian.html", entries=formatted_penyesuaian)
+
+
+def render_tab_neraca_saldo_penyesuaian():
+    """Isi tab Neraca Saldo Setelah Penyesuaian pada halaman laporan"""
+    start_date, end_date = get_report_period()
+    _, neraca_saldo_setelah_penyesuaian = get_neraca_saldo_laporan(end_date)
+
+    return render_neraca_saldo_tab(
+        neraca_saldo_setelah_penyesuaian, end_date, "Neraca Saldo Setelah Penyesuaian",
+        "Saldo akhir semua akun setelah penyesuaian",
+        "Data akan muncul setelah ada jurnal penyesuaian",
+    )
+
+
+TEMPLATES["laporan/tab_neraca_lajur.html"] = """{% autoescape false %}
+{% from "laporan/macros.html" import card_header, empty_state %}
+            <div class="card">
+                {{ card_header("Neraca Lajur (Worksheet) - Toko Ikan Patin", "Worksheet untuk mempersiapkan laporan keuangan per " ~ per_tanggal) }}
+
+                <div class="jurnal-container">
+                {% if has_data %}
+                    <table class="neraca-lajur-table">
+                        <thead>
+                            <tr>
+                                <th rowspan="2">Kode Akun</th>
+                                <th rowspan="2">Nama Akun</th>
+                                <th colspan="2">Neraca Saldo</th>
+                                <th colspan="2">Penyesuaian</th>
+                                <th colspan="2">Neraca Saldo Setelah Penyesuaian</th>
+                                <th colspan="2">Laba Rugi</th>
+                                <th colspan="2">Neraca</th>
+                            </tr>
+                            <tr>
+                            {% for _ in kolom %}
+                                <th>{{ loop.cycle("Debit", "Kredit") }}</th>
+                            {% endfor %}
+                            </tr>
+                        </thead>
+                        <tbody>
+                        {% for item in rows %}
+                            <tr>
+                                <td class="akun-info">{{ item['kode_akun']|e }}</td>
+                                <td class="akun-info">{{ item['nama_akun']|e }}</td>
+                            {% for k in kolom %}
+                                <td>{{ item[k]|rupiah if item[k] > 0 else '' }}</td>
+                            {% endfor %}
+                            </tr>
+                        {% endfor %}
+                            <tr class="neraca-lajur-section">
+                                <td colspan="2"><strong>TOTAL</strong></td>
+                            {% for total in totals %}
+                                <td><strong>{{ total|rupiah }}</strong></td>
+                            {% endfor %}
+                            </tr>
+                        </tbody>
+                    </table>
+
+                    <div style="margin-top: 2rem;">
+                        <h4>Status Balance Neraca Lajur:</h4>
+                        <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 1rem; margin-top: 1rem;">
+                        {% for name, debit, kredit in status_items %}
+                            {% set balanced = (debit - kredit)|abs < 0.01 %}
+                            {% set color = "#065f46" if balanced else "#dc2626" %}
+                            <div style="background: {{ "#f0fdf4" if balanced else "#fef2f2" }}; padding: 1rem; border-radius: 8px; border-left: 4px solid {{ color }};">
+                                <h5 style="margin: 0; color: {{ color }};">{{ "✅" if balanced else "❌" }} {{ name }}</h5>
+                                <p style="margin: 0.5rem 0 0 0; color: {{ color }};">
+                                    Debit: {{ debit|rupiah }}<br>
+                                    Kredit: {{ kredit|rupiah }}
+                                </p>
+                            </div>
+                        {% endfor %}
+                        </div>
+                    </div>
+                {% else %}
+                    {{ empty_state("Belum Ada Data Neraca Lajur", "Data neraca lajur akan muncul setelah ada transaksi dan penyesuaian") }}
+                {% endif %}
+                </div>
+            </div>{% endautoescape %}
+"""
+
+NERACA_LAJUR_KOLOM = [
+    'neraca_saldo_debit', 'neraca_saldo_kredit', 'penyesuaian_debit', 'penyesuaian_kredit',
+    'neraca_saldo_setelah_penyesuaian_debit', 'neraca_saldo_setelah_penyesuaian_kredit',
+    'laba_rugi_debit', 'laba_rugi_kredit', 'neraca_debit', 'neraca_kredit',
+]
+
+def render_tab_neraca_lajur():
+    """Isi tab Neraca Lajur pada halaman laporan"""
+    start_date, end_date = get_report_period()
+    neraca_lajur_data = get_neraca_lajur(end_date)
+    print(f"🔍 LAPORAN: Neraca Lajur data entries: {len(neraca_lajur_data)}")
+
+    # Total tiap kolom (semua akun), baris tabel hanya akun yang punya saldo/penyesuaian
+    totals = [sum(item[k] for item in neraca_lajur_data) for k in NERACA_LAJUR_KOLOM]
+    rows = [item for item in neraca_lajur_data
+            if item['neraca_saldo_debit'] > 0 or item['neraca_saldo_kredit'] > 0
+            or item['penyesuaian_debit'] > 0 or item['penyesuaian_kredit'] > 0]
+    status_names = ["Neraca Saldo", "Penyesuaian", "Setelah Penyesuaian", "Laba Rugi", "Neraca"]
+
+    return render_template(
+        "laporan/tab_neraca_lajur.html",
+        has_data=bool(neraca_lajur_data),
+        rows=rows,
+        kolom=NERACA_LAJUR_KOLOM,
+        totals=totals,
+        status_items=[(name, totals[2 * i], totals[2 * i + 1]) for i, name in enumerate(status_names)],
+        per_tanggal=end_date.strftime("%d %B %Y"),
+    )
+
+
+TEMPLATES["laporan/tab_laporan_keuangan.html"] = """{% autoescape false %}
+{% from "laporan/macros.html" import card_header %}
+{% set total_pasiva = neraca['total_liabilitas'] + neraca['total_ekuitas'] %}
+{% set balanced = (neraca['total_aset'] - total_pasiva)|abs < 0.01 %}
+{% set color = "#065f46" if balanced else "#dc2626" %}
+            <div class="card">
+                {{ card_header("Laporan Keuangan - Toko Ikan Patin", "Periode: " ~ periode) }}
+
+                <div class="laporan-keuangan-container">
+                    <!-- Laporan Laba Rugi -->
+                    <div class="laporan-section">
+                        <div class="laporan-header">
+                            <h3 style="margin: 0; color: white;">LAPORAN LABA RUGI</h3>
+                            <p style="margin: 0.5rem 0 0 0; color: #e0e7ff;">Periode Berjalan</p>
+                        </div>
+                        <div class="laporan-body">
+                            <div class="laporan-row">
+                                <span>Pendapatan:</span>
+                                <span>{{ laba_rugi['total_pendapatan']|rupiah }}</span>
+                            </div>
+                            <div class="laporan-row">
+                                <span>Harga Pokok Penjualan:</span>
+                                <span>({{ laba_rugi['total_hpp']|rupiah }})</span>
+                            </div>
+                            <div class="laporan-row laporan-total">
+                                <span>Laba Kotor:</span>
+                                <span class="laporan-positive">{{ laba_rugi['laba_kotor']|rupiah }}</span>
+                            </div>
+                            <div class="laporan-row">
+                                <span>Beban Operasional:</span>
+                                <span>({{ laba_rugi['total_beban']|rupiah }})</span>
+                            </div>
+                            <div class="laporan-row laporan-total {{ "laporan-positive" if laba_rugi['laba_bersih'] >= 0 else "laporan-negative" }}">
+                                <span>{{ "LABA BERSIH" if laba_rugi['laba_bersih'] >= 0 else "RUGI BERSIH" }}:</span>
+                                <span>{{ laba_rugi['laba_bersih']|abs|rupiah }}</span>
+                            </div>
+                        </div>
+                    </div>
+
+                    <!-- Neraca -->
+                    <div class="laporan-section">
+                        <div class="laporan-header">
+                            <h3 style="margin: 0; color: white;">NERACA</h3>
+                            <p style="margin: 0.5rem 0 0 0; color: #e0e7ff;">Posisi Keuangan per {{ per_tanggal }}</p>
+                        </div>
+                        <div class="laporan-body">
+                            <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 2rem;">
+                                <!-- Aset -->
+                                <div>
+                                    <h4 style="color: #374151; margin-bottom: 1rem;">ASET</h4>
+                                    <div class="laporan-row">
+                                        <span>Aset Lancar:</span>
+                                        <span>{{ neraca['total_aset_lancar']|rupiah }}</span>
+                                    </div>
+                                    <div class="laporan-row">
+                                        <span>Aset Tetap:</span>
+                                        <span>{{ neraca['total_aset_tetap']|rupiah }}</span>
+                                    </div>
+                                    <div class="laporan-row laporan-total">
+                                        <span>Total Aset:</span>
+                                        <span>{{ neraca['total_aset']|rupiah }}</span>
+                                    </div>
+                                </div>
+
+                                <!-- Liabilitas & Ekuitas -->
+                                <div>
+                                    <h4 style="color: #374151; margin-bottom: 1rem;">LIABILITAS & EKUITAS</h4>
+                                    <div class="laporan-row">
+                                        <span>Liabilitas:</span>
+                                        <span>{{ neraca['total_liabilitas']|rupiah }}</span>
+                                    </div>
+                                    <div class="laporan-row">
+                                        <span>Ekuitas:</span>
+                                        <span>{{ neraca['total_ekuitas']|rupiah }}</span>
+                                    </div>
+                                    <div class="laporan-row laporan-total">
+                                        <span>Total:</span>
+                                        <span>{{ total_pasiva|rupiah }}</span>
+                                    </div>
+                                </div>
+                            </div>
+
+                            <!-- Status Balance -->
+                            <div style="margin-top: 2rem; padding: 1rem; border-radius: 8px; {{ "background: #f0fdf4; border-left: 4px solid #10b981;" if balanced else "background: #fef2f2; border-left: 4px solid #ef4444;" }}">
+                                <h4 style="margin: 0; color: {{ color }};">
+                                    {{ "✅ Neraca Balance" if balanced else "❌ Neraca Tidak Balance" }}
+                                </h4>
+                                <p style="margin: 0.5rem 0 0 0; color: {{ color }};">
+                                    Aset ({{ neraca['total_aset']|rupiah }}) {{ "=" if balanced else "≠" }} Liabilitas + Ekuitas ({{ total_pasiva|rupiah }})
+                                </p>
+                            </div>
+                        </div>
+                    </div>
+                </div>
+            </div>{% endautoescape %}
+"""
+
+def render_tab_laporan_keuangan():
+    """Isi tab Laporan Keuangan pada halaman laporan"""
+    start_date, end_date = get_report_period()
+    ringkasan = hitung_laporan_keuangan(start_date, end_date)
+
+    return render_template(
+        "laporan/tab_laporan_keuangan.html",
+        laba_rugi=ringkasan['laba_rugi'],
+        neraca=ringkasan['neraca'],
+        periode=format_periode(start_date, end_date),
+        per_tanggal=end_date.strftime("%d %B %Y"),
+    )
+
+
+TEMPLATES["laporan/tab_laporan_perubahan_modal.html"] = """{% autoescape false %}
+            <div class="perubahan-modal-section">
+                <div class="perubahan-modal-header">
+                    <h2 style="margin: 0; color: white;">LAPORAN PERUBAHAN MODAL</h2>
+                    <p style="margin: 0.5rem 0 0 0; color: #e0e7ff;">Periode: {{ periode }}</p>
+                </div>
+                <div class="perubahan-modal-body">
+                    <div class="modal-row">
+                        <span>Modal Awal</span>
+                        <span>{{ modal['modal_awal']|rupiah }}</span>
+                    </div>
+                    <div class="modal-row">
+                        <span>Laba Bersih</span>
+                        <span class="laporan-positive">+ {{ modal['laba_bersih']|rupiah }}</span>
+                    </div>
+                    <div class="modal-row">
+                        <span>Prive/Penarikan Pemilik</span>
+                        <span class="laporan-negative">- {{ modal['prive']|rupiah }}</span>
+                    </div>
+                    <div class="modal-row modal-total">
+                        <span>Penambahan Modal</span>
+                        <span>{{ modal['perubahan_modal']|rupiah }}</span>
+                    </div>
+                    <div class="modal-row modal-total" style="border-top: 2px solid #1e40af; font-size: 1.2rem;">
+                        <span><strong>Modal Akhir</strong></span>
+                        <span><strong>{{ modal['modal_akhir']|rupiah }}</strong></span>
+                    </div>
+                </div>
+            </div>
+
+            <div class="card">
+                <div class="card-header">
+                    <h2 class="card-title">Keterangan Laporan Perubahan Modal</h2>
+                </div>
+                <div class="account-info">
+                    <h4>📊 Sumber Data:</h4>
+                    <p>
+                        • <strong>Modal Awal</strong>: Diambil dari Neraca Saldo Setelah Penyesuaian (Akun 3-1000 - Modal Usaha)<br>
+                        • <strong>Laba Bersih</strong>: Diambil dari Laporan Laba Rugi<br>
+                        • <strong>Prive</strong>: Diambil dari transaksi pengambilan pribadi pemilik (Akun 3-1200 - Prive)<br>
+                        • <strong>Modal Akhir</strong>: Modal Awal + Laba Bersih - Prive
+                    </p>
+                </div>
+            </div>{% endautoescape %}
+"""
+
+def render_tab_laporan_perubahan_modal():
+    """Isi tab Laporan Perubahan Modal pada halaman laporan"""
+    start_date, end_date = get_report_period()
+    perubahan_modal_data = hitung_laporan_keuangan(start_date, end_date)['perubahan_modal']
+
+    return render_template(
+        "laporan/tab_laporan_perubahan_modal.html",
+        modal=perubahan_modal_data,
+        periode=format_periode(start_date, end_date),
+    )
+
+
+TEMPLATES["laporan/tab_jurnal_penutup.html"] = """{% autoescape false %}
+{% from "laporan/macros.html" import empty_state %}
+            <div class="card">
+                <div class="card-header">
+                    <h2 class="card-title">Jurnal Penutup - Toko Ikan Patin</h2>
+                    <div>
+                        <button class="btn-primary btn-warning" onclick="generateJurnalPenutup()">
+                            <i class="ri-refresh-line"></i> Generate Jurnal Penutup
+                        </button>
+                        <button class="btn-primary btn-danger" onclick="prosesPenutupanPeriode()">
+                            <i class="ri-shut-down-line"></i> Proses Penutupan Periode
+                        </button>
+                    </div>
+                </div>
+                <div class="jurnal-container">
+                {% if entries %}
+                    <table class="jurnal-table">
+                        <thead>
+                            <tr>
+                                <th width="100">Kode Akun</th>
+                                <th>Nama Akun</th>
+                                <th width="200">Debit</th>
+                                <th width="200">Kredit</th>
+                                <th>Keterangan</th>
+                            </tr>
+                        </thead>
+                        <tbody>
+                        {% for entry in entries %}
+                            <tr>
+                                <td><strong>{{ entry['kode_akun']|e }}</strong></td>
+                                <td>{{ entry['nama_akun']|e }}</td>
+                                <td class="debit-amount">{{ entry['debit']|rupiah if entry['debit'] > 0 else '' }}</td>
+                                <td class="kredit-amount">{{ entry['kredit']|rupiah if entry['kredit'] > 0 else '' }}</td>
+                                <td>{{ entry['keterangan']|e }}</td>
+                            </tr>
+                        {% endfor %}
+                        </tbody>
+                    </table>
+                {% else %}
+                    {{ empty_state("Belum Ada Jurnal Penutup", "Jurnal penutup akan di-generate otomatis berdasarkan data laba rugi") }}
+                {% endif %}
+                </div>
+            </div>{% endautoescape %}
+"""
+
+def render_tab_jurnal_penutup():
+    """Isi tab Jurnal Penutup pada halaman laporan"""
+    start_date, end_date = get_report_period()
+    jurnal_penutup_data = get_jurnal_penutup_data(end_date)
+
+    return render_template("laporan/tab_jurnal_penutup.html", entries=jurnal_penutup_data)
+
+
+def render_tab_neraca_saldo_penutupan():
+    """Isi tab Neraca Saldo Setelah Penutupan pada halaman laporan"""
+    start_date, end_date = get_report_period()
+    neraca_saldo_penutupan = get_neraca_saldo_setelah_penutupan(end_date)
+
+    return render_neraca_saldo_tab(
+        neraca_saldo_penutupan, end_date, "Neraca Saldo Setelah Penutupan",
+        "Saldo akhir akun real setelah penutupan",
+        "Data akan muncul setelah proses penutupan akun nominal",
+    )
 
-            # === 2. IN-MEMORY PROCESSING (Hitung di Python) ===
 
-            # A. Format Jurnal Umum untuk Tampilan
-            formatted_jurnal = format_journal_for_display(jurnal_data, accounts)
+LAPORAN_TABS = {
+    'daftar-akun': render_tab_daftar_akun,
+    'jurnal-umum': render_tab_jurnal_umum,
+    'buku-besar': render_tab_buku_besar,
+    'buku-pembantu-piutang': render_tab_buku_pembantu_piutang,
+    'rekap-penjualan': render_tab_rekap_penjualan,
+    'neraca-saldo': render_tab_neraca_saldo,
+    'jurnal-penyesuaian': render_tab_jurnal_penyesuaian,
+    'neraca-saldo-penyesuaian': render_tab_neraca_saldo_penyesuaian,
+    'neraca-lajur': render_tab_neraca_lajur,
+    'laporan-keuangan': render_tab_laporan_keuangan,
+    'laporan-perubahan-modal': render_tab_laporan_perubahan_modal,
+    'jurnal-penutup': render_tab_jurnal_penutup,
+    'neraca-saldo-penutupan': render_tab_neraca_saldo_penutupan,
+}
 
-            # B. Hitung Buku Besar & Neraca Saldo
-            buku_besar_data = {}
-            neraca_saldo_data = []
-            
-            # Init buku besar dari daftar akun
-            for akun in accounts:
-                kode = akun['kode_akun']
-                buku_besar_data[kode] = {
-                    'nama_akun': akun['nama_akun'],
-                    'kategori': akun['kategori'],
-                    'tipe_akun': akun['tipe_akun'],
-                    'saldo_awal': akun['saldo_awal'],
-                    'entries': [],
-                    'saldo_akhir': akun['saldo_awal']
-                }
 
-            # Proses Jurnal Umum ke Buku Besar
-            for jurnal in jurnal_data:
-                kode = jurnal['kode_akun']
-                if kode in buku_besar_data:
-                    acc = buku_besar_data[kode]
-                    
-                    # Update saldo
-                    if acc['tipe_akun'] == 'debit':
-                        acc['saldo_akhir'] += (jurnal['debit'] - jurnal['kredit'])
-                    else:
-                        acc['saldo_akhir'] += (jurnal['kredit'] - jurnal['debit'])
-                    
-                    # Tambah ke entries history
-                    acc['entries'].append({
-                        'tanggal': jurnal['tanggal'],
-                        'keterangan': jurnal['jenis_transaksi'],
-                        'ref': jurnal['referensi'] or '-',
-                        'debit': jurnal['debit'],
-                        'kredit': jurnal['kredit'],
-                        'saldo': acc['saldo_akhir']
-                    })
+@app.route("/laporan/tab/<tab_name>")
+def laporan_tab(tab_name):
+    """Ambil isi satu tab laporan sebagai fragment HTML (dimuat saat tab dibuka)"""
+    if "user" not in session:
+        return jsonify({"success": False, "message": "Silakan login terlebih dahulu"}), 401
 
-            # Buat List Neraca Saldo (Sebelum Penyesuaian)
-            for kode, data in buku_besar_data.items():
-                if data['saldo_akhir'] != 0 or data['saldo_awal'] != 0:
-                    neraca_saldo_data.append({
-                        'kode_akun': kode,
-                        'nama_akun': data['nama_akun'],
-                        'debit': data['saldo_akhir'] if data['tipe_akun'] == 'debit' and data['saldo_akhir'] > 0 else 0,
-                        'kredit': data['saldo_akhir'] if data['tipe_akun'] == 'kredit' and data['saldo_akhir'] > 0 else 0
-                    })
+    render_tab = LAPORAN_TABS.get(tab_name)
+    if render_tab is None:
+        return jsonify({"success": False, "message": f"Tab {tab_name} tidak dikenal"}), 404
 
-            # C. Hitung Neraca Saldo Setelah Penyesuaian (NSSP)
-            # Kita copy struktur neraca saldo lalu update dengan jurnal penyesuaian
-            saldo_setelah_penyesuaian_dict = {
-                k: {'val': v['saldo_akhir'], 'tipe': v['tipe_akun'], 'nama': v['nama_akun']} 
-                for k, v in buku_besar_data.items()
-            }
+    try:
+        return jsonify({"success": True, "html": render_tab()})
+    except Exception as e:
+        print(f"❌ Error memuat tab {tab_name}: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"success": False, "message": str(e)}), 500
+
+# === Export laporan (CSV / XLSX) ===
+
+def export_rows_jurnal_umum(start_date, end_date):
+    """Baris export jurnal umum dalam periode"""
+    catalogue = get_account_catalogue()
+    yield ['Tanggal', 'Nomor Jurnal', 'Keterangan', 'Kode Akun', 'Nama Akun', 'Deskripsi', 'Debit', 'Kredit', 'Referensi']
+
+    def make_query():
+        return supabase.table("jurnal_umum")\
+            .select(JURNAL_EXPORT_COLUMNS)\
+            .gte("tanggal", start_date.isoformat())\
+            .lte("tanggal", end_date.isoformat())
+
+    for row in iter_query_rows(make_query, keys=("tanggal", "id")):
+        nama_akun = catalogue.get(row['kode_akun'], {}).get('nama_akun', row['kode_akun'])
+        yield [row['tanggal'], row.get('nomor_jurnal') or '', row['jenis_transaksi'], row['kode_akun'], nama_akun,
+               row.get('deskripsi') or '', row['debit'], row['kredit'], row.get('referensi') or '']
+
+def export_rows_buku_besar(start_date, end_date):
+    """Baris export buku besar (semua akun, atau ?kode_akun=... untuk satu akun)"""
+    catalogue = get_account_catalogue()
+    kode_filter = request.args.get('kode_akun')
+    saldo_awal_periode = get_saldo_awal_periode(["jurnal_umum"], start_date)
+    yield ['Kode Akun', 'Nama Akun', 'Tanggal', 'Keterangan', 'Ref', 'Debit', 'Kredit', 'Saldo']
+
+    def make_query():
+        query = supabase.table("jurnal_umum")\
+            .select(JURNAL_BUKU_BESAR_COLUMNS)\
+            .gte("tanggal", start_date.isoformat())\
+            .lte("tanggal", end_date.isoformat())
+        if kode_filter:
+            query = query.eq("kode_akun", kode_filter)
+        return query
+
+    # Baris jurnal urut per akun, digabung dengan katalog akun (juga urut kode) dalam satu lintasan
+    lines = iter_query_rows(make_query, keys=("kode_akun", "tanggal", "id"))
+    line = next(lines, None)
+    for kode, akun in sorted(catalogue.items()):
+        if kode_filter and kode != kode_filter:
+            continue
+        while line is not None and line['kode_akun'] < kode:
+            line = next(lines, None)  # akun tidak ada di katalog
+
+        saldo = saldo_awal_periode[kode]
+        yield [kode, akun['nama_akun'], start_date.isoformat(), 'Saldo Awal', '', '', '', saldo]
+        while line is not None and line['kode_akun'] == kode:
+            if akun['tipe_akun'] == 'debit':
+                saldo += line['debit'] - line['kredit']
+            else:  # kredit
+                saldo += line['kredit'] - line['debit']
+            yield [kode, akun['nama_akun'], line['tanggal'], line['jenis_transaksi'], line.get('referensi') or '-',
+                   line['debit'], line['kredit'], saldo]
+            line = next(lines, None)
+
+def export_rows_neraca_saldo(start_date, end_date):
+    """Baris export neraca saldo per akhir periode"""
+    yield ['Kode Akun', 'Nama Akun', 'Debit', 'Kredit']
+    for item in get_neraca_saldo_data(end_date):
+        yield [item['kode_akun'], item['nama_akun'], item['debit'], item['kredit']]
+
+def export_rows_neraca_saldo_penyesuaian(start_date, end_date):
+    """Baris export neraca saldo setelah penyesuaian per akhir periode"""
+    yield ['Kode Akun', 'Nama Akun', 'Debit', 'Kredit']
+    for item in get_neraca_saldo_setelah_penyesuaian(end_date):
+        yield [item['kode_akun'], item['nama_akun'], item['debit'], item['kredit']]
+
+def export_rows_neraca_lajur(start_date, end_date):
+    """Baris export neraca lajur per akhir periode"""
+    kolom = ['neraca_saldo_debit', 'neraca_saldo_kredit', 'penyesuaian_debit', 'penyesuaian_kredit',
+             'neraca_saldo_setelah_penyesuaian_debit', 'neraca_saldo_setelah_penyesuaian_kredit',
+             'laba_rugi_debit', 'laba_rugi_kredit', 'neraca_debit', 'neraca_kredit']
+    yield ['Kode Akun', 'Nama Akun', 'NS Debit', 'NS Kredit', 'Penyesuaian Debit', 'Penyesuaian Kredit',
+           'NSSP Debit', 'NSSP Kredit', 'Laba Rugi Debit', 'Laba Rugi Kredit', 'Neraca Debit', 'Neraca Kredit']
+    for item in get_neraca_lajur(end_date):
+        yield [item['kode_akun'], item['nama_akun']] + [item[k] for k in kolom]
+
+def export_rows_buku_pembantu_piutang(start_date, end_date):
+    """Baris export buku pembantu piutang dalam periode"""
+    yield ['Customer', 'Tanggal', 'Keterangan', 'Debit', 'Kredit', 'Saldo']
+
+    def make_query():
+        return supabase.table("buku_pembantu_piutang")\
+            .select(PIUTANG_COLUMNS)\
+            .gte("tanggal", start_date.isoformat())\
+            .lte("tanggal", end_date.isoformat())
+
+    for row in iter_query_rows(make_query, keys=("customer", "tanggal", "id")):
+        yield [row['customer'], row['tanggal'], row['keterangan'], row['debit'], row['kredit'], row['saldo']]
+
+EXPORT_REPORTS = {
+    'jurnal_umum': ('Jurnal Umum', export_rows_jurnal_umum),
+    'buku_besar': ('Buku Besar', export_rows_buku_besar),
+    'neraca_saldo': ('Neraca Saldo', export_rows_neraca_saldo),
+    'neraca_saldo_penyesuaian': ('NSSP', export_rows_neraca_saldo_penyesuaian),
+    'neraca_lajur': ('Neraca Lajur', export_rows_neraca_lajur),
+    'buku_pembantu_piutang': ('Buku Pembantu Piutang', export_rows_buku_pembantu_piutang),
+}
 
-            # Apply Jurnal Penyesuaian
-            for adj in jurnal_penyesuaian_data:
-                kode = adj['kode_akun']
-                if kode in saldo_setelah_penyesuaian_dict:
-                    acc = saldo_setelah_penyesuaian_dict[kode]
-                    if acc['tipe'] == 'debit':
-                        acc['val'] += (adj['debit'] - adj['kredit'])
-                    else:
-                        acc['val'] += (adj['kredit'] - adj['debit'])
-
-            # Convert dict ke list untuk template NSSP
-            neraca_saldo_setelah_penyesuaian = []
-            for kode, data in saldo_setelah_penyesuaian_dict.items():
-                neraca_saldo_setelah_penyesuaian.append({
-                    'kode_akun': kode,
-                    'nama_akun': data['nama'],
-                    'debit': data['val'] if data['tipe'] == 'debit' and data['val'] > 0 else 0,
-                    'kredit': data['val'] if data['tipe'] == 'kredit' and data['val'] > 0 else 0,
-                    # Field tambahan untuk helpers lain jika perlu
-                    'saldo_akhir': data['val'],
-                    'tipe_akun': data['tipe']
-                })
+def stream_csv(rows):
+    """Tulis baris CSV satu per satu (memori konstan)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    yield '\ufeff'  # BOM agar Excel membaca UTF-8
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+def write_xlsx(sheet_name, rows):
+    """Tulis XLSX dengan mode constant_memory (baris langsung di-flush ke disk)"""
+    import xlsxwriter
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'tmpdir': tempfile.gettempdir()})
+    try:
+        worksheet = workbook.add_worksheet(sheet_name[:31])
+        header_format = workbook.add_format({'bold': True})
+        for row_index, row in enumerate(rows):
+            worksheet.write_row(row_index, 0, row, header_format if row_index == 0 else None)
+    finally:
+        workbook.close()
+
+    # File dibuka lalu langsung dihapus; isinya tetap bisa dibaca sampai response selesai
+    xlsx_file = open(path, 'rb')
+    os.remove(path)
+    return xlsx_file
+
+@app.route("/export/<report>.<fmt>")
+def export_laporan(report, fmt):
+    """Export laporan periode berjalan (?start=&end=) sebagai CSV (streaming) atau XLSX"""
+    if "user" not in session:
+        return redirect("/signin")
 
-            # D. Hitung Laba Rugi (Disatukan disini agar tidak fetch ulang)
-            # Hitung komponen HPP manual dari data yang sudah ada
-            persediaan_awal = sum(acc['saldo_awal'] for acc in accounts if acc['kode_akun'] in ['1-1200', '1-1300'])
-            
-            pembelian = 0
-            for j in jurnal_data:
-                if 'Pembelian' in j['jenis_transaksi'] and j['kode_akun'] in ['1-1200', '1-1300']:
-                    pembelian += j['debit']
-            
-            # Ambil saldo akhir persediaan dari NSSP
-            persediaan_akhir = 0
-            beban_angkut_pembelian = 0
-            
-            # Loop NSSP untuk memisahkan akun Nominal (Laba Rugi) dan Real (Neraca)
-            total_pendapatan = 0
-            total_beban = 0
-            
-            for item in neraca_saldo_setelah_penyesuaian:
-                kode = item['kode_akun']
-                saldo = item['debit'] if item['debit'] > 0 else item['kredit']
-                
-                # Cek komponen HPP di NSSP
-                if kode in ['1-1200', '1-1300']:
-                    persediaan_akhir += saldo
-                elif kode == '5-1300':
-                    beban_angkut_pembelian = item['debit'] # Saldo normal debit
-
-                # Klasifikasi Laba Rugi
-                if kode.startswith('4-'): # Pendapatan
-                    total_pendapatan += item['kredit']
-                elif kode.startswith('5-') and kode != '5-1300': # Beban Ops (kecuali angkut pembelian)
-                    total_beban += item['debit']
-                elif kode.startswith('6-'): # Beban Penyesuaian
-                    total_beban += item['debit']
-
-            # Hitung HPP Final
-            # Rumus: (Awal + Pembelian + Angkut) - Akhir
-            hpp = (persediaan_awal + pembelian + beban_angkut_pembelian) - persediaan_akhir
-            laba_kotor = total_pendapatan - hpp
-            laba_bersih = laba_kotor - total_beban
-
-            laba_rugi_data = {
-                'total_pendapatan': total_pendapatan,
-                'total_hpp': hpp,
-                'laba_kotor': laba_kotor,
-                'total_beban': total_beban,
-                'laba_bersih': laba_bersih,
-                'detail_hpp': {
-                    'persediaan_awal': persediaan_awal,
-                    'pembelian': pembelian,
-                    'beban_angkut_pembelian': beban_angkut_pembelian,
-                    'persediaan_akhir': persediaan_akhir,
-                    # Detail per item disederhanakan 0 jika tidak kritikal untuk tampilan ringkas
-                    'persediaan_awal_8cm': 0, 'persediaan_awal_10cm': 0,
-                    'pembelian_8cm': 0, 'pembelian_10cm': 0,
-                    'persediaan_akhir_8cm': 0, 'persediaan_akhir_10cm': 0
-                }
-            }
+    if report not in EXPORT_REPORTS or fmt not in ('csv', 'xlsx'):
+        return "<script>alert('Jenis export tidak dikenal!'); window.history.back();</script>"
 
-            # E. Hitung Neraca (Balance Sheet)
-            total_aset_lancar = 0
-            total_aset_tetap = 0
-            total_liabilitas = 0
-            total_ekuitas = 0 # Ekuitas awal + Laba Bersih - Prive
-
-            prive = 0
-            modal_awal = 0
-
-            for item in neraca_saldo_setelah_penyesuaian:
-                kode = item['kode_akun']
-                # Cari kategori akun dari data accounts awal
-                kategori = next((a['kategori'] for a in accounts if a['kode_akun'] == kode), '')
-                saldo = item['debit'] if item['debit'] > 0 else item['kredit']
-                tipe = item.get('tipe_akun', 'debit')
-
-                # Logika Penjumlahan Neraca (Asset, Liabilitas, Equity)
-                if kategori == 'Current Asset':
-                    total_aset_lancar += item['debit'] # Aset saldo normal debit
-                elif kategori == 'Fixed Asset':
-                    total_aset_tetap += item['debit']
-                elif kategori == 'Contra Asset':
-                    total_aset_tetap -= item['kredit'] # Akumulasi penyusutan mengurangi aset
-                elif kategori == 'Liabilities':
-                    total_liabilitas += item['kredit']
-                elif kategori == 'Equity':
-                    if kode == '3-1000': modal_awal = item['kredit']
-                    total_ekuitas += item['kredit']
-                elif kategori == 'Contra Equity' or kode == '3-1200': # PERBAIKAN: Tambahkan 'or'
-                    prive = item['debit']
-                    total_ekuitas -= item['debit'] # Prive mengurangi modal
-
-            # Masukkan Laba Bersih ke Ekuitas di Neraca Akhir
-            total_ekuitas_akhir = total_ekuitas + laba_bersih # Total ekuitas di neraca sudah net (Modal Awal - Prive + Laba)
-            
-            # Koreksi perhitungan manual untuk variabel terpisah
-            # Total Ekuitas yang ditampilkan di ringkasan biasanya Modal Akhir
-            # Modal Akhir = Modal Awal + Laba - Prive
-            modal_akhir_calc = modal_awal + laba_bersih - prive
-
-            neraca_data = {
-                'total_aset_lancar': total_aset_lancar,
-                'total_aset_tetap': total_aset_tetap,
-                'total_aset': total_aset_lancar + total_aset_tetap,
-                'total_liabilitas': total_liabilitas,
-                'total_ekuitas': modal_akhir_calc 
-            }
+    start_date, end_date = get_report_period()
+    title, build_rows = EXPORT_REPORTS[report]
+    filename = f"{report}_{start_date.isoformat()}_{end_date.isoformat()}.{fmt}"
 
-            # F. Data Pendukung Lainnya
-            # Buku Pembantu Piutang (Grouping manual)
-            buku_piutang_data = {}
-            for entry in buku_piutang_raw:
-                cust = entry['customer']
-                if cust not in buku_piutang_data:
-                    buku_piutang_data[cust] = []
-                buku_piutang_data[cust].append(entry)
-
-            # Laporan Perubahan Modal
-            perubahan_modal_data = {
-                'modal_awal': modal_awal,
-                'laba_bersih': laba_bersih,
-                'prive': prive,
-                'perubahan_modal': laba_bersih - prive,
-                'modal_akhir': modal_awal + (laba_bersih - prive)
-            }
+    try:
+        if fmt == 'csv':
+            return Response(
+                stream_with_context(stream_csv(build_rows(start_date, end_date))),
+                mimetype="text/csv",
+                headers={"Content-Disposition": f"attachment; filename={filename}"}
+            )
 
-            # Neraca Lajur (Generate data kosong untuk struktur visual saja agar tidak error)
-            # Implementasi penuh neraca lajur di satu fungsi akan sangat panjang, 
-            # kita gunakan data yang sudah dihitung sebelumnya
-            neraca_lajur_data = get_neraca_lajur()
-            print(f"🔍 LAPORAN: Neraca Lajur data entries: {len(neraca_lajur_data)}")
-            
-            
-            # Jurnal Penutup (Logic sederhana)
-            jurnal_penutup_data = [] 
-            # (Logic generate jurnal penutup bisa ditambahkan jika fitur ini krusial ditampilkan realtime)
+        xlsx_file = write_xlsx(title, build_rows(start_date, end_date))
+        return send_file(
+            xlsx_file,
+            as_attachment=True,
+            download_name=filename,
+            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+    except ImportError:
+        return "<script>alert('Export XLSX membutuhkan paket XlsxWriter (pip install XlsxWriter)'); window.history.back();</script>"
+    except Exception as e:
+        print(f"❌ Error export {report}.{fmt}: {e}")
+        return f"<script>alert('Gagal export laporan: {str(e)}'); window.history.back();</script>"
 
-            # Neraca Saldo Penutupan
-            neraca_saldo_penutupan = [] # (Logic neraca penutupan)
 
-        except Exception as e:
-            print(f"Error fetching data: {e}")
-            import traceback
-            traceback.print_exc()
-            # Fallback data kosong agar tidak error 500 template
-            accounts = []
-            formatted_jurnal = []
-            buku_besar_data = {}
-            neraca_saldo_data = []
-            neraca_saldo_setelah_penyesuaian = []
-            jurnal_penyesuaian_data = []
-            neraca_lajur_data = []
-            laba_rugi_data = {'total_pendapatan': 0, 'total_hpp': 0, 'laba_kotor': 0, 'total_beban': 0, 'laba_bersih': 0, 'detail_hpp': {}}
-            neraca_data = {'total_aset_lancar': 0, 'total_aset_tetap': 0, 'total_aset': 0, 'total_liabilitas': 0, 'total_ekuitas': 0}
-            buku_piutang_data = {}
-            perubahan_modal_data = {'modal_awal': 0, 'laba_bersih': 0, 'prive': 0, 'perubahan_modal': 0, 'modal_akhir': 0}
-            arus_kas_data = {}
-            jurnal_penutup_data = get_jurnal_penutup_data()
-            neraca_saldo_penutupan = get_neraca_saldo_setelah_penutupan()
-        
-        laporan_content = """
+# === LAPORAN KEUANGAN CONTENT ===
+# Kerangka halaman laporan (tab, modal, script); isi tab dirender terpisah dari template laporan/tab_*
+TEMPLATES["laporan.html"] = """{% extends "base.html" %}
+{% block content %}
         <style>
             .laporan-container {
                 max-width: 1400px;
@@ -4173,11 +6521,45 @@ def laporan():
         </style>
 
         <div class="laporan-container">
+            <div class="card" style="margin-bottom: 1rem;">
+                <form id="periode-form" onsubmit="applyPeriode(event)" style="display: flex; gap: 1rem; align-items: flex-end; flex-wrap: wrap;">
+                    <div class="form-group" style="margin: 0;">
+                        <label class="form-label">Periode Dari</label>
+                        <input type="date" id="periode_start" class="form-control" required value='{{ start_date.isoformat() }}'>
+                    </div>
+                    <div class="form-group" style="margin: 0;">
+                        <label class="form-label">Sampai</label>
+                        <input type="date" id="periode_end" class="form-control" required value='{{ end_date.isoformat() }}'>
+                    </div>
+                    <button type="submit" class="btn-primary">
+                        <i class="ri-calendar-check-line"></i> Terapkan Periode
+                    </button>
+                    <div class="form-group" style="margin: 0 0 0 auto;">
+                        <label class="form-label">Export</label>
+                        <select id="export_report" class="form-control">
+                            <option value="jurnal_umum">Jurnal Umum</option>
+                            <option value="buku_besar">Buku Besar</option>
+                            <option value="neraca_saldo">Neraca Saldo</option>
+                            <option value="neraca_saldo_penyesuaian">Neraca Saldo Setelah Penyesuaian</option>
+                            <option value="neraca_lajur">Neraca Lajur</option>
+                            <option value="buku_pembantu_piutang">Buku Pembantu Piutang</option>
+                        </select>
+                    </div>
+                    <button type="button" class="btn-primary btn-success" onclick="exportLaporan('csv')">
+                        <i class="ri-file-text-line"></i> CSV
+                    </button>
+                    <button type="button" class="btn-primary btn-success" onclick="exportLaporan('xlsx')">
+                        <i class="ri-file-excel-2-line"></i> XLSX
+                    </button>
+                </form>
+            </div>
+
             <div class="tab-navigation">
                 <button class="tab-btn active" onclick="openTab('daftar-akun')">Daftar Akun</button>
                 <button class="tab-btn" onclick="openTab('jurnal-umum')">Jurnal Umum</button>
                 <button class="tab-btn" onclick="openTab('buku-besar')">Buku Besar</button>
                 <button class="tab-btn" onclick="openTab('buku-pembantu-piutang')">Buku Pembantu Piutang</button>
+                <button class="tab-btn" onclick="openTab('rekap-penjualan')">Rekap Penjualan</button>
                 <button class="tab-btn" onclick="openTab('neraca-saldo')">Neraca Saldo</button>
                 <button class="tab-btn" onclick="openTab('jurnal-penyesuaian')">Jurnal Penyesuaian</button>
                 <button class="tab-btn" onclick="openTab('neraca-saldo-penyesuaian')">Neraca Saldo Penyesuaian</button>
@@ -4189,998 +6571,68 @@ def laporan():
             </div>
             
             <!-- TAB 1: DAFTAR AKUN -->
-            <div id="daftar-akun" class="tab-content active">
-                <div class="card">
-                    <div class="card-header">
-                        <h2 class="card-title">Chart of Accounts (COA) - Toko Ikan Patin</h2>
-                        <button class="btn-primary" onclick="openModal('tambah-akun')">
-                            <i class="ri-add-line"></i>Tambah Akun
-                        </button>
-                    </div>
-                    
-                    <div class="table-container">
-                        <div style="display: grid; grid-template-columns: 100px 1fr 150px 120px 150px 120px; gap: 1rem; padding: 1rem; background: #f8fafc; font-weight: 600; color: #374151; border-bottom: 2px solid #e2e8f0;">
-                            <div>Kode</div>
-                            <div>Nama Akun</div>
-                            <div>Kategori</div>
-                            <div>Tipe</div>
-                            <div>Saldo Awal</div>
-                            <div style="text-align: center;">Aksi</div>
-                        </div>
-        """
-        
-        # Tampilkan daftar akun dengan tombol edit/hapus
-        if accounts:
-            # Kelompokkan akun berdasarkan kategori untuk tampilan yang lebih terstruktur
-            kategori_groups = {
-                'Current Asset': [],
-                'Fixed Asset': [],
-                'Contra Asset': [],
-                'Liabilities': [],
-                'Equity': [],
-                'Contra Equity': [],
-                'Revenue': [],
-                'Cost of Goods Sold': [],
-                'Expense': []
-            }
-            
-            for akun in accounts:
-                kategori = akun['kategori']
-                if kategori in kategori_groups:
-                    kategori_groups[kategori].append(akun)
-                else:
-                    kategori_groups['Expense'].append(akun)  # Default fallback
-            
-            # Tampilkan akun per kategori
-            for kategori, akun_list in kategori_groups.items():
-                if akun_list:
-                    laporan_content += f"""
-                        <div style="background: #f1f5f9; padding: 0.75rem 1rem; font-weight: 700; color: #374151; border-bottom: 1px solid #e2e8f0;">
-                            {kategori.upper()}
-                        </div>
-                    """
-                    
-                    for akun in akun_list:
-                        # Tentukan class CSS untuk badge kategori
-                        badge_class = ""
-                        if kategori == 'Current Asset': badge_class = "current-asset"
-                        elif kategori == 'Fixed Asset': badge_class = "fixed-asset"
-                        elif kategori == 'Contra Asset': badge_class = "contra-asset"
-                        elif kategori == 'Liabilities': badge_class = "liabilities"
-                        elif kategori == 'Equity': badge_class = "equity"
-                        elif kategori == 'Contra Equity': badge_class = "contra-equity"
-                        elif kategori == 'Revenue': badge_class = "revenue"
-                        elif kategori == 'Cost of Goods Sold': badge_class = "cogs"
-                        elif kategori == 'Expense': badge_class = "expense"
-                        
-                        laporan_content += f"""
-                        <div style="display: grid; grid-template-columns: 100px 1fr 150px 120px 150px 120px; gap: 1rem; padding: 1rem; border-bottom: 1px solid #f1f5f9; align-items: center;">
-                            <div><strong>{akun['kode_akun']}</strong></div>
-                            <div>{akun['nama_akun']}</div>
-                            <div><span class="kategori-badge {badge_class}">{akun['kategori']}</span></div>
-                            <div>{akun['tipe_akun']}</div>
-                            <div style="color: {'#059669' if akun['tipe_akun'] == 'debit' else '#dc2626'}; font-weight: 600;">
-                                Rp {akun['saldo_awal']:,.0f}
-                            </div>
-                            <div class="action-buttons">
-                                <button class="btn-primary btn-warning btn-sm" onclick="openEditModal('{akun['kode_akun']}', '{akun['nama_akun']}', '{akun['kategori']}', '{akun['tipe_akun']}', {akun['saldo_awal']})">
-                                    <i class="ri-edit-line"></i>
-                                </button>
-                                <button class="btn-primary btn-danger btn-sm" onclick="confirmDelete('{akun['kode_akun']}', '{akun['nama_akun']}')">
-                                    <i class="ri-delete-bin-line"></i>
-                                </button>
-                            </div>
-                        </div>
-                        """
-        else:
-            laporan_content += """
-                        <div class="empty-state">
-                            <i class="ri-file-list-3-line"></i>
-                            <h3>Belum Ada Akun</h3>
-                            <p>Akun default sedang dimuat...</p>
-                        </div>
-            """
-        
-        laporan_content += """
-                    </div>
-                </div>
+            <div id="daftar-akun" class="tab-content active" data-loaded="false">
+                <div class="card"><div class="empty-state"><i class="ri-loader-4-line"></i><p>Memuat data...</p></div></div>
             </div>
             
             <!-- TAB 2: JURNAL UMUM -->
-            <div id="jurnal-umum" class="tab-content">
-                <div class="card">
-                    <div class="card-header">
-                        <h2 class="card-title">Jurnal Umum - Toko Ikan Patin</h2>
-                        <div>
-                            <button class="btn-primary btn-success" onclick="openModal('tambah-jurnal-penjualan-baru')">
-                                <i class="ri-money-dollar-circle-line"></i> Jurnal Penjualan
-                            </button>
-                            <button class="btn-primary btn-warning" onclick="openModal('tambah-jurnal-pembelian')">
-                                <i class="ri-shopping-cart-line"></i> Jurnal Pembelian
-                            </button>
-                            <button class="btn-primary btn-danger" onclick="openModal('tambah-jurnal-biaya')">
-                                <i class="ri-money-dollar-circle-line"></i> Jurnal Biaya
-                            </button>
-                            <button class="btn-primary btn-info" onclick="openModal('tambah-jurnal-manual')">
-                                <i class="ri-upload-line"></i> Jurnal Manual
-                            </button>
-                        </div>
-                    </div>
-                    
-                    <div class="jurnal-container">
-        """
-        
-        # Tampilkan jurnal umum
-        if formatted_jurnal:
-            laporan_content += """
-                        <table class="jurnal-table">
-                            <thead>
-                                <tr>
-                                    <th width="100">Tanggal</th>
-                                    <th>Keterangan</th>
-                                    <th width="120">Ref</th>
-                                    <th width="150">Debit</th>
-                                    <th width="150">Kredit</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-            """
-            
-            for entry in formatted_jurnal:
-                tanggal = entry['tanggal'] if entry['show_date'] else ''
-                
-                laporan_content += f"""
-                                <tr>
-                                    <td>{tanggal}</td>
-                                    <td>{entry['keterangan']}</td>
-                                    <td>{entry['ref']}</td>
-                                    <td class="debit-amount">{f"Rp {entry['debit']:,.0f}" if entry['debit'] > 0 else ""}</td>
-                                    <td class="kredit-amount">{f"Rp {entry['kredit']:,.0f}" if entry['kredit'] > 0 else ""}</td>
-                                </tr>
-                """
-            
-            laporan_content += """
-                            </tbody>
-                        </table>
-            """
-        else:
-            laporan_content += """
-                        <div class="empty-state">
-                            <i class="ri-file-list-3-line"></i>
-                            <h3>Belum Ada Transaksi Jurnal</h3>
-                            <p>Mulai dengan menambahkan jurnal penjualan, pembelian, atau biaya operasional</p>
-                        </div>
-            """
-        
-        laporan_content += """
-                    </div>
-                </div>
+            <div id="jurnal-umum" class="tab-content" data-loaded="false">
+                <div class="card"><div class="empty-state"><i class="ri-loader-4-line"></i><p>Memuat data...</p></div></div>
             </div>
             
             <!-- TAB 3: BUKU BESAR -->
-            <div id="buku-besar" class="tab-content">
-                <div class="card">
-                    <div class="card-header">
-                        <h2 class="card-title">Buku Besar - Toko Ikan Patin</h2>
-                        <p style="color: #64748b; margin: 0;">Ringkasan transaksi per akun</p>
-                    </div>
-                    
-                    <div class="buku-besar-container">
-        """
-        
-        # Tampilkan buku besar per akun
-        if buku_besar_data:
-            for kode_akun, data in buku_besar_data.items():
-                if data['entries'] or data['saldo_awal'] != 0:
-                    laporan_content += f"""
-                        <div class="akun-card">
-                            <div class="akun-header">
-                                <div class="akun-info">
-                                    <h3>{kode_akun} - {data['nama_akun']}</h3>
-                                    <p>{data['kategori']} • Tipe: {data['tipe_akun'].title()}</p>
-                                </div>
-                                <div class="akun-saldo">
-                                    <div class="saldo-awal">Saldo Awal: Rp {data['saldo_awal']:,.0f}</div>
-                                    <div class="saldo-akhir">Saldo Akhir: Rp {data['saldo_akhir']:,.0f}</div>
-                                </div>
-                            </div>
-                            
-                            <div class="jurnal-container">
-                                <table class="jurnal-table">
-                                    <thead>
-                                        <tr>
-                                            <th width="100">Tanggal</th>
-                                            <th>Keterangan</th>
-                                            <th width="120">Ref</th>
-                                            <th width="150">Debit</th>
-                                            <th width="150">Kredit</th>
-                                            <th width="150">Saldo</th>
-                                        </tr>
-                                    </thead>
-                                    <tbody>
-                    """
-                    
-                    laporan_content += f"""
-                                        <tr>
-                                            <td></td>
-                                            <td><em>Saldo Awal</em></td>
-                                            <td></td>
-                                            <td></td>
-                                            <td></td>
-                                            <td class="saldo-amount">Rp {data['saldo_awal']:,.0f}</td>
-                                        </tr>
-                    """
-                    
-                    for entry in data['entries']:
-                        laporan_content += f"""
-                                        <tr>
-                                            <td>{entry['tanggal']}</td>
-                                            <td>{entry['keterangan']}</td>
-                                            <td>{entry['ref']}</td>
-                                            <td class="debit-amount">{f"Rp {entry['debit']:,.0f}" if entry['debit'] > 0 else ""}</td>
-                                            <td class="kredit-amount">{f"Rp {entry['kredit']:,.0f}" if entry['kredit'] > 0 else ""}</td>
-                                            <td class="saldo-amount">Rp {entry['saldo']:,.0f}</td>
-                                        </tr>
-                        """
-                    
-                    laporan_content += """
-                                    </tbody>
-                                </table>
-                            </div>
-                        </div>
-                    """
-        else:
-            laporan_content += """
-                        <div class="empty-state">
-                            <i class="ri-file-list-3-line"></i>
-                            <h3>Belum Ada Transaksi</h3>
-                            <p>Belum ada transaksi yang tercatat dalam buku besar</p>
-                        </div>
-            """
-        
-        laporan_content += """
-                    </div>
-                </div>
+            <div id="buku-besar" class="tab-content" data-loaded="false">
+                <div class="card"><div class="empty-state"><i class="ri-loader-4-line"></i><p>Memuat data...</p></div></div>
             </div>
             
             <!-- TAB 4: BUKU PEMBANTU PIUTANG -->
-            <div id="buku-pembantu-piutang" class="tab-content">
-                <div class="card">
-                    <div class="card-header">
-                        <h2 class="card-title">Buku Pembantu Piutang - Toko Ikan Patin</h2>
-                        <p style="color: #64748b; margin: 0;">Detail piutang per customer (hanya transaksi DP)</p>
-                    </div>
-                    
-                    <div class="buku-piutang-container">
-        """
-        
-        # Tampilkan buku pembantu piutang
-        if buku_piutang_data:
-            for customer, entries in buku_piutang_data.items():
-                # Hitung saldo akhir
-                saldo_akhir = entries[-1]['saldo'] if entries else 0
-                
-                laporan_content += f"""
-                        <div class="piutang-customer-card">
-                            <div class="piutang-header">
-                                <div class="piutang-info">
-                                    <h3>{customer}</h3>
-                                    <p>Customer Piutang</p>
-                                </div>
-                                <div class="piutang-saldo">
-                                    <div class="saldo-piutang">Saldo Akhir: Rp {saldo_akhir:,.0f}</div>
-                                </div>
-                            </div>
-                            
-                            <div class="jurnal-container">
-                                <table class="piutang-table">
-                                    <thead>
-                                        <tr>
-                                            <th width="100">Tanggal</th>
-                                            <th>Keterangan</th>
-                                            <th width="150">Debit</th>
-                                            <th width="150">Kredit</th>
-                                            <th width="150">Saldo</th>
-                                        </tr>
-                                    </thead>
-                                    <tbody>
-                """
-                
-                for entry in entries:
-                    laporan_content += f"""
-                                        <tr>
-                                            <td>{entry['tanggal']}</td>
-                                            <td>{entry['keterangan']}</td>
-                                            <td class="debit-amount">{f"Rp {entry['debit']:,.0f}" if entry['debit'] > 0 else ""}</td>
-                                            <td class="kredit-amount">{f"Rp {entry['kredit']:,.0f}" if entry['kredit'] > 0 else ""}</td>
-                                            <td class="saldo-amount">Rp {entry['saldo']:,.0f}</td>
-                                        </tr>
-                    """
-                
-                laporan_content += """
-                                    </tbody>
-                                </table>
-                            </div>
-                        </div>
-                """
-        else:
-            laporan_content += """
-                        <div class="empty-state">
-                            <i class="ri-file-list-3-line"></i>
-                            <h3>Belum Ada Piutang</h3>
-                            <p>Belum ada transaksi DP yang menghasilkan piutang</p>
-                        </div>
-            """
-        
-        laporan_content += """
-                    </div>
-                </div>
-            </div>
-            
-            <!-- TAB 5: NERACA SALDO -->
-            <div id="neraca-saldo" class="tab-content">
-                <div class="card">
-                    <div class="card-header">
-                        <h2 class="card-title">Neraca Saldo - Toko Ikan Patin</h2>
-                        <p style="color: #64748b; margin: 0;">Saldo akhir semua akun sebelum penyesuaian</p>
-                    </div>
-                    
-                    <div class="jurnal-container">
-        """
-        
-        # Tampilkan neraca saldo
-        if neraca_saldo_data:
-            total_debit = sum(item['debit'] for item in neraca_saldo_data)
-            total_kredit = sum(item['kredit'] for item in neraca_saldo_data)
-            
-            laporan_content += """
-                        <table class="neraca-table">
-                            <thead>
-                                <tr>
-                                    <th width="100">Kode Akun</th>
-                                    <th>Nama Akun</th>
-                                    <th width="200">Debit</th>
-                                    <th width="200">Kredit</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-            """
-            
-            for item in neraca_saldo_data:
-                laporan_content += f"""
-                                <tr>
-                                    <td><strong>{item['kode_akun']}</strong></td>
-                                    <td>{item['nama_akun']}</td>
-                                    <td class="debit-amount">{f"Rp {item['debit']:,.0f}" if item['debit'] > 0 else ""}</td>
-                                    <td class="kredit-amount">{f"Rp {item['kredit']:,.0f}" if item['kredit'] > 0 else ""}</td>
-                                </tr>
-                """
-            
-            laporan_content += f"""
-                                <tr class="total-row">
-                                    <td colspan="2"><strong>TOTAL</strong></td>
-                                    <td class="debit-amount"><strong>Rp {total_debit:,.0f}</strong></td>
-                                    <td class="kredit-amount"><strong>Rp {total_kredit:,.0f}</strong></td>
-                                </tr>
-            """
-            
-            laporan_content += """
-                            </tbody>
-                        </table>
-            """
-            
-            # Tampilkan status balance
-            if abs(total_debit - total_kredit) < 0.01:
-                laporan_content += f"""
-                        <div style="background: #f0fdf4; padding: 1rem; border-radius: 8px; margin-top: 1rem; border-left: 4px solid #10b981;">
-                            <h4 style="color: #065f46; margin: 0;">✅ Neraca Saldo Balance</h4>
-                            <p style="color: #065f46; margin: 0.5rem 0 0 0;">Total Debit (Rp {total_debit:,.0f}) = Total Kredit (Rp {total_kredit:,.0f})</p>
-                        </div>
-                """
-            else:
-                laporan_content += f"""
-                        <div style="background: #fef2f2; padding: 1rem; border-radius: 8px; margin-top: 1rem; border-left: 4px solid #ef4444;">
-                            <h4 style="color: #dc2626; margin: 0;">❌ Neraca Saldo Tidak Balance</h4>
-                            <p style="color: #dc2626; margin: 0.5rem 0 0 0;">Total Debit (Rp {total_debit:,.0f}) ≠ Total Kredit (Rp {total_kredit:,.0f})</p>
-                            <p style="color: #dc2626; margin: 0.5rem 0 0 0;">Selisih: Rp {abs(total_debit - total_kredit):,.0f}</p>
-                        </div>
-                """
-        else:
-            laporan_content += """
-                        <div class="empty-state">
-                            <i class="ri-file-list-3-line"></i>
-                            <h3>Belum Ada Data Neraca Saldo</h3>
-                            <p>Data neraca saldo akan muncul setelah ada transaksi</p>
-                        </div>
-            """
-        
-        laporan_content += """
-                    </div>
-                </div>
-            </div>
-            
-            <!-- TAB 6: JURNAL PENYESUAIAN -->
-            <div id="jurnal-penyesuaian" class="tab-content">
-                <div class="card">
-                    <div class="card-header">
-                        <h2 class="card-title">Jurnal Penyesuaian - Toko Ikan Patin</h2>
-                        <button class="btn-primary btn-warning" onclick="openModal('tambah-jurnal-penyesuaian')">
-                            <i class="ri-add-line"></i> Tambah Jurnal Penyesuaian
-                        </button>
-                    </div>
-                    
-                    <div class="jurnal-container">
-        """
-        
-        # Tampilkan jurnal penyesuaian
-        if jurnal_penyesuaian_data:
-            # Format jurnal penyesuaian untuk tampilan
-            formatted_penyesuaian = format_journal_for_display(jurnal_penyesuaian_data, accounts)
-            
-            laporan_content += """
-                        <table class="jurnal-table">
-                            <thead>
-                                <tr>
-                                    <th width="100">Tanggal</th>
-                                    <th>Keterangan</th>
-                                    <th width="120">Ref</th>
-                                    <th width="150">Debit</th>
-                                    <th width="150">Kredit</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-            """
-            
-            for entry in formatted_penyesuaian:
-                tanggal = entry['tanggal'] if entry['show_date'] else ''
-                
-                laporan_content += f"""
-                                <tr>
-                                    <td>{tanggal}</td>
-                                    <td>{entry['keterangan']}</td>
-                                    <td>{entry['ref']}</td>
-                                    <td class="debit-amount">{f"Rp {entry['debit']:,.0f}" if entry['debit'] > 0 else ""}</td>
-                                    <td class="kredit-amount">{f"Rp {entry['kredit']:,.0f}" if entry['kredit'] > 0 else ""}</td>
-                                </tr>
-                """
-            
-            laporan_content += """
-                            </tbody>
-                        </table>
-            """
-        else:
-            laporan_content += """
-                        <div class="empty-state">
-                            <i class="ri-file-list-3-line"></i>
-                            <h3>Belum Ada Jurnal Penyesuaian</h3>
-                            <p>Tambahkan jurnal penyesuaian untuk mencatat transaksi penyesuaian akhir periode</p>
-                        </div>
-            """
-        
-        laporan_content += """
-                    </div>
-                </div>
-            </div>
-            
-            <!-- TAB 7: NERACA SALDO SETELAH PENYESUAIAN -->
-            <div id="neraca-saldo-penyesuaian" class="tab-content">
-                <div class="card">
-                    <div class="card-header">
-                        <h2 class="card-title">Neraca Saldo Setelah Penyesuaian - Toko Ikan Patin</h2>
-                        <p style="color: #64748b; margin: 0;">Saldo akhir semua akun setelah penyesuaian</p>
-                    </div>
-                    
-                    <div class="jurnal-container">
-        """
-        
-        # Tampilkan neraca saldo setelah penyesuaian
-        if neraca_saldo_setelah_penyesuaian:
-            total_debit = sum(item['debit'] for item in neraca_saldo_setelah_penyesuaian)
-            total_kredit = sum(item['kredit'] for item in neraca_saldo_setelah_penyesuaian)
-            
-            laporan_content += """
-                        <table class="neraca-table">
-                            <thead>
-                                <tr>
-                                    <th width="100">Kode Akun</th>
-                                    <th>Nama Akun</th>
-                                    <th width="200">Debit</th>
-                                    <th width="200">Kredit</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-            """
-            
-            for item in neraca_saldo_setelah_penyesuaian:
-                laporan_content += f"""
-                                <tr>
-                                    <td><strong>{item['kode_akun']}</strong></td>
-                                    <td>{item['nama_akun']}</td>
-                                    <td class="debit-amount">{f"Rp {item['debit']:,.0f}" if item['debit'] > 0 else ""}</td>
-                                    <td class="kredit-amount">{f"Rp {item['kredit']:,.0f}" if item['kredit'] > 0 else ""}</td>
-                                </tr>
-                """
-            
-            laporan_content += f"""
-                                <tr class="total-row">
-                                    <td colspan="2"><strong>TOTAL</strong></td>
-                                    <td class="debit-amount"><strong>Rp {total_debit:,.0f}</strong></td>
-                                    <td class="kredit-amount"><strong>Rp {total_kredit:,.0f}</strong></td>
-                                </tr>
-            """
-            
-            laporan_content += """
-                            </tbody>
-                        </table>
-            """
-            
-            # Tampilkan status balance
-            if abs(total_debit - total_kredit) < 0.01:
-                laporan_content += f"""
-                        <div style="background: #f0fdf4; padding: 1rem; border-radius: 8px; margin-top: 1rem; border-left: 4px solid #10b981;">
-                            <h4 style="color: #065f46; margin: 0;">✅ Neraca Saldo Setelah Penyesuaian Balance</h4>
-                            <p style="color: #065f46; margin: 0.5rem 0 0 0;">Total Debit (Rp {total_debit:,.0f}) = Total Kredit (Rp {total_kredit:,.0f})</p>
-                        </div>
-                """
-            else:
-                laporan_content += f"""
-                        <div style="background: #fef2f2; padding: 1rem; border-radius: 8px; margin-top: 1rem; border-left: 4px solid #ef4444;">
-                            <h4 style="color: #dc2626; margin: 0;">❌ Neraca Saldo Setelah Penyesuaian Tidak Balance</h4>
-                            <p style="color: #dc2626; margin: 0.5rem 0 0 0;">Total Debit (Rp {total_debit:,.0f}) ≠ Total Kredit (Rp {total_kredit:,.0f})</p>
-                            <p style="color: #dc2626; margin: 0.5rem 0 0 0;">Selisih: Rp {abs(total_debit - total_kredit):,.0f}</p>
-                        </div>
-                """
-        else:
-            laporan_content += """
-                        <div class="empty-state">
-                            <i class="ri-file-list-3-line"></i>
-                            <h3>Belum Ada Data Neraca Saldo Setelah Penyesuaian</h3>
-                            <p>Data akan muncul setelah ada jurnal penyesuaian</p>
-                        </div>
-            """
-        
-        laporan_content += """
-                    </div>
-                </div>
-            </div>
-            
-            <!-- TAB 8: NERACA LAJUR -->
-            <div id="neraca-lajur" class="tab-content">
-                <div class="card">
-                    <div class="card-header">
-                        <h2 class="card-title">Neraca Lajur (Worksheet) - Toko Ikan Patin</h2>
-                        <p style="color: #64748b; margin: 0;">Worksheet untuk mempersiapkan laporan keuangan</p>
-                    </div>
-                    
-                    <div class="jurnal-container">
-        """
-        
-        # Tampilkan neraca lajur
-        if neraca_lajur_data:
-            # Hitung total untuk setiap kolom
-            total_neraca_saldo_debit = sum(item['neraca_saldo_debit'] for item in neraca_lajur_data)
-            total_neraca_saldo_kredit = sum(item['neraca_saldo_kredit'] for item in neraca_lajur_data)
-            total_penyesuaian_debit = sum(item['penyesuaian_debit'] for item in neraca_lajur_data)
-            total_penyesuaian_kredit = sum(item['penyesuaian_kredit'] for item in neraca_lajur_data)
-            total_setelah_penyesuaian_debit = sum(item['neraca_saldo_setelah_penyesuaian_debit'] for item in neraca_lajur_data)
-            total_setelah_penyesuaian_kredit = sum(item['neraca_saldo_setelah_penyesuaian_kredit'] for item in neraca_lajur_data)
-            total_laba_rugi_debit = sum(item['laba_rugi_debit'] for item in neraca_lajur_data)
-            total_laba_rugi_kredit = sum(item['laba_rugi_kredit'] for item in neraca_lajur_data)
-            total_neraca_debit = sum(item['neraca_debit'] for item in neraca_lajur_data)
-            total_neraca_kredit = sum(item['neraca_kredit'] for item in neraca_lajur_data)
-            
-            laporan_content += """
-                        <table class="neraca-lajur-table">
-                            <thead>
-                                <tr>
-                                    <th rowspan="2">Kode Akun</th>
-                                    <th rowspan="2">Nama Akun</th>
-                                    <th colspan="2">Neraca Saldo</th>
-                                    <th colspan="2">Penyesuaian</th>
-                                    <th colspan="2">Neraca Saldo Setelah Penyesuaian</th>
-                                    <th colspan="2">Laba Rugi</th>
-                                    <th colspan="2">Neraca</th>
-                                </tr>
-                                <tr>
-                                    <th>Debit</th>
-                                    <th>Kredit</th>
-                                    <th>Debit</th>
-                                    <th>Kredit</th>
-                                    <th>Debit</th>
-                                    <th>Kredit</th>
-                                    <th>Debit</th>
-                                    <th>Kredit</th>
-                                    <th>Debit</th>
-                                    <th>Kredit</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-            """
-            
-            for item in neraca_lajur_data:
-                # Hanya tampilkan akun yang memiliki saldo
-                if (item['neraca_saldo_debit'] > 0 or item['neraca_saldo_kredit'] > 0 or 
-                    item['penyesuaian_debit'] > 0 or item['penyesuaian_kredit'] > 0):
-                    
-                    laporan_content += f"""
-                                <tr>
-                                    <td class="akun-info">{item['kode_akun']}</td>
-                                    <td class="akun-info">{item['nama_akun']}</td>
-                                    <td>{f"Rp {item['neraca_saldo_debit']:,.0f}" if item['neraca_saldo_debit'] > 0 else ""}</td>
-                                    <td>{f"Rp {item['neraca_saldo_kredit']:,.0f}" if item['neraca_saldo_kredit'] > 0 else ""}</td>
-                                    <td>{f"Rp {item['penyesuaian_debit']:,.0f}" if item['penyesuaian_debit'] > 0 else ""}</td>
-                                    <td>{f"Rp {item['penyesuaian_kredit']:,.0f}" if item['penyesuaian_kredit'] > 0 else ""}</td>
-                                    <td>{f"Rp {item['neraca_saldo_setelah_penyesuaian_debit']:,.0f}" if item['neraca_saldo_setelah_penyesuaian_debit'] > 0 else ""}</td>
-                                    <td>{f"Rp {item['neraca_saldo_setelah_penyesuaian_kredit']:,.0f}" if item['neraca_saldo_setelah_penyesuaian_kredit'] > 0 else ""}</td>
-                                    <td>{f"Rp {item['laba_rugi_debit']:,.0f}" if item['laba_rugi_debit'] > 0 else ""}</td>
-                                    <td>{f"Rp {item['laba_rugi_kredit']:,.0f}" if item['laba_rugi_kredit'] > 0 else ""}</td>
-                                    <td>{f"Rp {item['neraca_debit']:,.0f}" if item['neraca_debit'] > 0 else ""}</td>
-                                    <td>{f"Rp {item['neraca_kredit']:,.0f}" if item['neraca_kredit'] > 0 else ""}</td>
-                                </tr>
-                    """
-            
-            # Baris total
-            laporan_content += f"""
-                                <tr class="neraca-lajur-section">
-                                    <td colspan="2"><strong>TOTAL</strong></td>
-                                    <td><strong>Rp {total_neraca_saldo_debit:,.0f}</strong></td>
-                                    <td><strong>Rp {total_neraca_saldo_kredit:,.0f}</strong></td>
-                                    <td><strong>Rp {total_penyesuaian_debit:,.0f}</strong></td>
-                                    <td><strong>Rp {total_penyesuaian_kredit:,.0f}</strong></td>
-                                    <td><strong>Rp {total_setelah_penyesuaian_debit:,.0f}</strong></td>
-                                    <td><strong>Rp {total_setelah_penyesuaian_kredit:,.0f}</strong></td>
-                                    <td><strong>Rp {total_laba_rugi_debit:,.0f}</strong></td>
-                                    <td><strong>Rp {total_laba_rugi_kredit:,.0f}</strong></td>
-                                    <td><strong>Rp {total_neraca_debit:,.0f}</strong></td>
-                                    <td><strong>Rp {total_neraca_kredit:,.0f}</strong></td>
-                                </tr>
-            """
-            
-            laporan_content += """
-                            </tbody>
-                        </table>
-            """
-            
-            # Tampilkan status balance
-            balance_neraca_saldo = abs(total_neraca_saldo_debit - total_neraca_saldo_kredit) < 0.01
-            balance_penyesuaian = abs(total_penyesuaian_debit - total_penyesuaian_kredit) < 0.01
-            balance_setelah_penyesuaian = abs(total_setelah_penyesuaian_debit - total_setelah_penyesuaian_kredit) < 0.01
-            balance_laba_rugi = abs(total_laba_rugi_debit - total_laba_rugi_kredit) < 0.01
-            balance_neraca = abs(total_neraca_debit - total_neraca_kredit) < 0.01
-            
-            laporan_content += """
-                        <div style="margin-top: 2rem;">
-                            <h4>Status Balance Neraca Lajur:</h4>
-                            <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 1rem; margin-top: 1rem;">
-            """
-            
-            status_items = [
-                ("Neraca Saldo", balance_neraca_saldo, total_neraca_saldo_debit, total_neraca_saldo_kredit),
-                ("Penyesuaian", balance_penyesuaian, total_penyesuaian_debit, total_penyesuaian_kredit),
-                ("Setelah Penyesuaian", balance_setelah_penyesuaian, total_setelah_penyesuaian_debit, total_setelah_penyesuaian_kredit),
-                ("Laba Rugi", balance_laba_rugi, total_laba_rugi_debit, total_laba_rugi_kredit),
-                ("Neraca", balance_neraca, total_neraca_debit, total_neraca_kredit)
-            ]
-            
-            for name, balanced, debit, kredit in status_items:
-                color = "#065f46" if balanced else "#dc2626"
-                bg_color = "#f0fdf4" if balanced else "#fef2f2"
-                icon = "✅" if balanced else "❌"
-                
-                laporan_content += f"""
-                                <div style="background: {bg_color}; padding: 1rem; border-radius: 8px; border-left: 4px solid {color};">
-                                    <h5 style="margin: 0; color: {color};">{icon} {name}</h5>
-                                    <p style="margin: 0.5rem 0 0 0; color: {color};">
-                                        Debit: Rp {debit:,.0f}<br>
-                                        Kredit: Rp {kredit:,.0f}
-                                    </p>
-                                </div>
-                """
-            
-            laporan_content += """
-                            </div>
-                        </div>
-            """
-        else:
-            laporan_content += """
-                        <div class="empty-state">
-                            <i class="ri-file-list-3-line"></i>
-                            <h3>Belum Ada Data Neraca Lajur</h3>
-                            <p>Data neraca lajur akan muncul setelah ada transaksi dan penyesuaian</p>
-                        </div>
-            """
-        
-        laporan_content += """
-                    </div>
-                </div>
-            </div>
-            
-            <!-- TAB 9: LAPORAN KEUANGAN -->
-            <div id="laporan-keuangan" class="tab-content">
-                <div class="card">
-                    <div class="card-header">
-                        <h2 class="card-title">Laporan Keuangan - Toko Ikan Patin</h2>
-                        <p style="color: #64748b; margin: 0;">Periode: """ + date.today().strftime("%d %B %Y") + """</p>
-                    </div>
-                    
-                    <div class="laporan-keuangan-container">
-                        <!-- Laporan Laba Rugi -->
-                        <div class="laporan-section">
-                            <div class="laporan-header">
-                                <h3 style="margin: 0; color: white;">LAPORAN LABA RUGI</h3>
-                                <p style="margin: 0.5rem 0 0 0; color: #e0e7ff;">Periode Berjalan</p>
-                            </div>
-                            <div class="laporan-body">
-                                <div class="laporan-row">
-                                    <span>Pendapatan:</span>
-                                    <span>Rp """ + f"{laba_rugi_data['total_pendapatan']:,.0f}" + """</span>
-                                </div>
-                                <div class="laporan-row">
-                                    <span>Harga Pokok Penjualan:</span>
-                                    <span>(Rp """ + f"{laba_rugi_data['total_hpp']:,.0f}" + """)</span>
-                                </div>
-                                <div class="laporan-row laporan-total">
-                                    <span>Laba Kotor:</span>
-                                    <span class="laporan-positive">Rp """ + f"{laba_rugi_data['laba_kotor']:,.0f}" + """</span>
-                                </div>
-                                <div class="laporan-row">
-                                    <span>Beban Operasional:</span>
-                                    <span>(Rp """ + f"{laba_rugi_data['total_beban']:,.0f}" + """)</span>
-                                </div>
-                                <div class="laporan-row laporan-total """ + ("laporan-positive" if laba_rugi_data['laba_bersih'] >= 0 else "laporan-negative") + """">
-                                    <span>""" + ("LABA BERSIH" if laba_rugi_data['laba_bersih'] >= 0 else "RUGI BERSIH") + """:</span>
-                                    <span>Rp """ + f"{abs(laba_rugi_data['laba_bersih']):,.0f}" + """</span>
-                                </div>
-                            </div>
-                        </div>
-                        
-                        <!-- Neraca -->
-                        <div class="laporan-section">
-                            <div class="laporan-header">
-                                <h3 style="margin: 0; color: white;">NERACA</h3>
-                                <p style="margin: 0.5rem 0 0 0; color: #e0e7ff;">Posisi Keuangan per """ + date.today().strftime("%d %B %Y") + """</p>
-                            </div>
-                            <div class="laporan-body">
-                                <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 2rem;">
-                                    <!-- Aset -->
-                                    <div>
-                                        <h4 style="color: #374151; margin-bottom: 1rem;">ASET</h4>
-                                        <div class="laporan-row">
-                                            <span>Aset Lancar:</span>
-                                            <span>Rp """ + f"{neraca_data['total_aset_lancar']:,.0f}" + """</span>
-                                        </div>
-                                        <div class="laporan-row">
-                                            <span>Aset Tetap:</span>
-                                            <span>Rp """ + f"{neraca_data['total_aset_tetap']:,.0f}" + """</span>
-                                        </div>
-                                        <div class="laporan-row laporan-total">
-                                            <span>Total Aset:</span>
-                                            <span>Rp """ + f"{neraca_data['total_aset']:,.0f}" + """</span>
-                                        </div>
-                                    </div>
-                                    
-                                    <!-- Liabilitas & Ekuitas -->
-                                    <div>
-                                        <h4 style="color: #374151; margin-bottom: 1rem;">LIABILITAS & EKUITAS</h4>
-                                        <div class="laporan-row">
-                                            <span>Liabilitas:</span>
-                                            <span>Rp """ + f"{neraca_data['total_liabilitas']:,.0f}" + """</span>
-                                        </div>
-                                        <div class="laporan-row">
-                                            <span>Ekuitas:</span>
-                                            <span>Rp """ + f"{neraca_data['total_ekuitas']:,.0f}" + """</span>
-                                        </div>
-                                        <div class="laporan-row laporan-total">
-                                            <span>Total:</span>
-                                            <span>Rp """ + f"{(neraca_data['total_liabilitas'] + neraca_data['total_ekuitas']):,.0f}" + """</span>
-                                        </div>
-                                    </div>
-                                </div>
-                                
-                                <!-- Status Balance -->
-                                <div style="margin-top: 2rem; padding: 1rem; border-radius: 8px; """ + ("background: #f0fdf4; border-left: 4px solid #10b981;" if abs(neraca_data['total_aset'] - (neraca_data['total_liabilitas'] + neraca_data['total_ekuitas'])) < 0.01 else "background: #fef2f2; border-left: 4px solid #ef4444;") + """">
-                                    <h4 style="margin: 0; """ + ("color: #065f46;" if abs(neraca_data['total_aset'] - (neraca_data['total_liabilitas'] + neraca_data['total_ekuitas'])) < 0.01 else "color: #dc2626;") + """>
-                                        """ + ("✅ Neraca Balance" if abs(neraca_data['total_aset'] - (neraca_data['total_liabilitas'] + neraca_data['total_ekuitas'])) < 0.01 else "❌ Neraca Tidak Balance") + """
-                                    </h4>
-                                    <p style="margin: 0.5rem 0 0 0; """ + ("color: #065f46;" if abs(neraca_data['total_aset'] - (neraca_data['total_liabilitas'] + neraca_data['total_ekuitas'])) < 0.01 else "color: #dc2626;") + """>
-                                        Aset (Rp """ + f"{neraca_data['total_aset']:,.0f}" + """) """ + ("=" if abs(neraca_data['total_aset'] - (neraca_data['total_liabilitas'] + neraca_data['total_ekuitas'])) < 0.01 else "≠") + """ Liabilitas + Ekuitas (Rp """ + f"{(neraca_data['total_liabilitas'] + neraca_data['total_ekuitas']):,.0f}" + """)
-                                    </p>
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-                </div>
+            <div id="buku-pembantu-piutang" class="tab-content" data-loaded="false">
+                <div class="card"><div class="empty-state"><i class="ri-loader-4-line"></i><p>Memuat data...</p></div></div>
             </div>
             
-            <!-- TAB 10: LAPORAN PERUBAHAN MODAL -->
-            <div id="laporan-perubahan-modal" class="tab-content">
-                <div class="perubahan-modal-section">
-                    <div class="perubahan-modal-header">
-                        <h2 style="margin: 0; color: white;">LAPORAN PERUBAHAN MODAL</h2>
-                        <p style="margin: 0.5rem 0 0 0; color: #e0e7ff;">Periode: """ + date.today().strftime("%d %B %Y") + """</p>
-                    </div>
-                    <div class="perubahan-modal-body">
-                        <div class="modal-row">
-                            <span>Modal Awal</span>
-                            <span>Rp """ + f"{perubahan_modal_data['modal_awal']:,.0f}" + """</span>
-                        </div>
-                        <div class="modal-row">
-                            <span>Laba Bersih</span>
-                            <span class="laporan-positive">+ Rp """ + f"{perubahan_modal_data['laba_bersih']:,.0f}" + """</span>
-                        </div>
-                        <div class="modal-row">
-                            <span>Prive/Penarikan Pemilik</span>
-                            <span class="laporan-negative">- Rp """ + f"{perubahan_modal_data['prive']:,.0f}" + """</span>
-                        </div>
-                        <div class="modal-row modal-total">
-                            <span>Penambahan Modal</span>
-                            <span>Rp """ + f"{perubahan_modal_data['perubahan_modal']:,.0f}" + """</span>
-                        </div>
-                        <div class="modal-row modal-total" style="border-top: 2px solid #1e40af; font-size: 1.2rem;">
-                            <span><strong>Modal Akhir</strong></span>
-                            <span><strong>Rp """ + f"{perubahan_modal_data['modal_akhir']:,.0f}" + """</strong></span>
-                        </div>
-                    </div>
-                </div>
-                
-                <div class="card">
-                    <div class="card-header">
-                        <h2 class="card-title">Keterangan Laporan Perubahan Modal</h2>
-                    </div>
-                    <div class="account-info">
-                        <h4>📊 Sumber Data:</h4>
-                        <p>
-                            • <strong>Modal Awal</strong>: Diambil dari Neraca Saldo Setelah Penyesuaian (Akun 3-1000 - Modal Usaha)<br>
-                            • <strong>Laba Bersih</strong>: Diambil dari Laporan Laba Rugi<br>
-                            • <strong>Prive</strong>: Diambil dari transaksi pengambilan pribadi pemilik (Akun 3-1200 - Prive)<br>
-                            • <strong>Modal Akhir</strong>: Modal Awal + Laba Bersih - Prive
-                        </p>
-                    </div>
-                </div>
+            <!-- TAB BARU: REKAP PENJUALAN -->
+            <div id="rekap-penjualan" class="tab-content" data-loaded="false">
+                <div class="card"><div class="empty-state"><i class="ri-loader-4-line"></i><p>Memuat data...</p></div></div>
             </div>
-
-             <!-- TAB BARU: JURNAL PENUTUP -->
-            <div id="jurnal-penutup" class="tab-content">
-                <div class="card">
-                    <div class="card-header">
-                        <h2 class="card-title">Jurnal Penutup - Toko Ikan Patin</h2>
-                        <div>
-                            <button class="btn-primary btn-warning" onclick="generateJurnalPenutup()">
-                                <i class="ri-refresh-line"></i> Generate Jurnal Penutup
-                            </button>
-                            <button class="btn-primary btn-danger" onclick="prosesPenutupanPeriode()">
-                                <i class="ri-shut-down-line"></i> Proses Penutupan Periode
-                            </button>
-                        </div>
-                    </div>
-                    <div class="jurnal-container">
-        """
-        
-        # Tampilkan data jurnal penutup
-        if jurnal_penutup_data:
-            laporan_content += """
-                        <table class="jurnal-table">
-                            <thead>
-                                <tr>
-                                    <th width="100">Kode Akun</th>
-                                    <th>Nama Akun</th>
-                                    <th width="200">Debit</th>
-                                    <th width="200">Kredit</th>
-                                    <th>Keterangan</th>
-                                </tr>
-                            </thead>
-                            <tbody>
-            """
             
-            for entry in jurnal_penutup_data:
-                laporan_content += f"""
-                            <tr>
-                                <td><strong>{entry['kode_akun']}</strong></td>
-                                <td>{entry['nama_akun']}</td>
-                                <td class="debit-amount">{f"Rp {entry['debit']:,.0f}" if entry['debit'] > 0 else ""}</td>
-                                <td class="kredit-amount">{f"Rp {entry['kredit']:,.0f}" if entry['kredit'] > 0 else ""}</td>
-                                <td>{entry['keterangan']}</td>
-                            </tr>
-                """
+            <!-- TAB 5: NERACA SALDO -->
+            <div id="neraca-saldo" class="tab-content" data-loaded="false">
+                <div class="card"><div class="empty-state"><i class="ri-loader-4-line"></i><p>Memuat data...</p></div></div>
+            </div>
             
-            laporan_content += """
-                        </tbody>
-                    </table>
-            """
-        else:
-            laporan_content += """
-                    <div class="empty-state">
-                        <i class="ri-file-list-3-line"></i>
-                        <h3>Belum Ada Jurnal Penutup</h3>
-                        <p>Jurnal penutup akan di-generate otomatis berdasarkan data laba rugi</p>
-                    </div>
-            """
-        
-        laporan_content += """
-                    </div>
-                </div>
+            <!-- TAB 6: JURNAL PENYESUAIAN -->
+            <div id="jurnal-penyesuaian" class="tab-content" data-loaded="false">
+                <div class="card"><div class="empty-state"><i class="ri-loader-4-line"></i><p>Memuat data...</p></div></div>
             </div>
             
-            <!-- TAB BARU: NERACA SALDO SETELAH PENUTUPAN -->
-            <div id="neraca-saldo-penutupan" class="tab-content">
-                <div class="card">
-                    <div class="card-header">
-                        <h2 class="card-title">Neraca Saldo Setelah Penutupan - Toko Ikan Patin</h2>
-                        <p style="color: #64748b; margin: 0;">Saldo akhir akun real setelah penutupan</p>
-                    </div>
-                    
-                    <div class="jurnal-container">
-        """
-        
-        # Tampilkan data neraca saldo setelah penutupan
-        if neraca_saldo_penutupan:
-            total_debit = sum(item['debit'] for item in neraca_saldo_penutupan)
-            total_kredit = sum(item['kredit'] for item in neraca_saldo_penutupan)
+            <!-- TAB 7: NERACA SALDO SETELAH PENYESUAIAN -->
+            <div id="neraca-saldo-penyesuaian" class="tab-content" data-loaded="false">
+                <div class="card"><div class="empty-state"><i class="ri-loader-4-line"></i><p>Memuat data...</p></div></div>
+            </div>
             
-            laporan_content += """
-                    <table class="neraca-table">
-                        <thead>
-                            <tr>
-                                <th width="100">Kode Akun</th>
-                                <th>Nama Akun</th>
-                                <th width="200">Debit</th>
-                                <th width="200">Kredit</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-            """
+            <!-- TAB 8: NERACA LAJUR -->
+            <div id="neraca-lajur" class="tab-content" data-loaded="false">
+                <div class="card"><div class="empty-state"><i class="ri-loader-4-line"></i><p>Memuat data...</p></div></div>
+            </div>
             
-            for item in neraca_saldo_penutupan:
-                laporan_content += f"""
-                            <tr>
-                                <td><strong>{item['kode_akun']}</strong></td>
-                                <td>{item['nama_akun']}</td>
-                                <td class="debit-amount">{f"Rp {item['debit']:,.0f}" if item['debit'] > 0 else ""}</td>
-                                <td class="kredit-amount">{f"Rp {item['kredit']:,.0f}" if item['kredit'] > 0 else ""}</td>
-                            </tr>
-                """
+            <!-- TAB 9: LAPORAN KEUANGAN -->
+            <div id="laporan-keuangan" class="tab-content" data-loaded="false">
+                <div class="card"><div class="empty-state"><i class="ri-loader-4-line"></i><p>Memuat data...</p></div></div>
+            </div>
             
-            laporan_content += f"""
-                            <tr class="total-row">
-                                <td colspan="2"><strong>TOTAL</strong></td>
-                                <td class="debit-amount"><strong>Rp {total_debit:,.0f}</strong></td>
-                                <td class="kredit-amount"><strong>Rp {total_kredit:,.0f}</strong></td>
-                            </tr>
-            """
+            <!-- TAB 10: LAPORAN PERUBAHAN MODAL -->
+            <div id="laporan-perubahan-modal" class="tab-content" data-loaded="false">
+                <div class="card"><div class="empty-state"><i class="ri-loader-4-line"></i><p>Memuat data...</p></div></div>
+            </div>
             
-            laporan_content += """
-                        </tbody>
-                    </table>
-            """
+             <!-- TAB BARU: JURNAL PENUTUP -->
+            <div id="jurnal-penutup" class="tab-content" data-loaded="false">
+                <div class="card"><div class="empty-state"><i class="ri-loader-4-line"></i><p>Memuat data...</p></div></div>
+            </div>
             
-            # Tampilkan status balance
-            if abs(total_debit - total_kredit) < 0.01:
-                laporan_content += f"""
-                    <div style="background: #f0fdf4; padding: 1rem; border-radius: 8px; margin-top: 1rem; border-left: 4px solid #10b981;">
-                        <h4 style="color: #065f46; margin: 0;">✅ Neraca Saldo Setelah Penutupan Balance</h4>
-                        <p style="color: #065f46; margin: 0.5rem 0 0 0;">Total Debit (Rp {total_debit:,.0f}) = Total Kredit (Rp {total_kredit:,.0f})</p>
-                    </div>
-                """
-            else:
-                laporan_content += f"""
-                    <div style="background: #fef2f2; padding: 1rem; border-radius: 8px; margin-top: 1rem; border-left: 4px solid #ef4444;">
-                        <h4 style="color: #dc2626; margin: 0;">❌ Neraca Saldo Setelah Penutupan Tidak Balance</h4>
-                        <p style="color: #dc2626; margin: 0.5rem 0 0 0;">Total Debit (Rp {total_debit:,.0f}) ≠ Total Kredit (Rp {total_kredit:,.0f})</p>
-                        <p style="color: #dc2626; margin: 0.5rem 0 0 0;">Selisih: Rp {abs(total_debit - total_kredit):,.0f}</p>
-                    </div>
-                """
-        else:
-            laporan_content += """
-                    <div class="empty-state">
-                        <i class="ri-file-list-3-line"></i>
-                        <h3>Belum Ada Data Neraca Saldo Setelah Penutupan</h3>
-                        <p>Data akan muncul setelah proses penutupan akun nominal</p>
-                    </div>
-            """
-        
-        laporan_content += """
-                    </div>
-                </div>
+            <!-- TAB BARU: NERACA SALDO SETELAH PENUTUPAN -->
+            <div id="neraca-saldo-penutupan" class="tab-content" data-loaded="false">
+                <div class="card"><div class="empty-state"><i class="ri-loader-4-line"></i><p>Memuat data...</p></div></div>
             </div>
         </div>
         
@@ -5313,6 +6765,7 @@ def laporan():
                     <button class="close-modal" onclick="closeModal('tambah-jurnal-penyesuaian')">&times;</button>
                 </div>
                 <form method="POST" action="/tambah_jurnal_penyesuaian">
+                    <input type="hidden" name="idempotency_key" value="{{ new_idempotency_key() }}">
                     <div class="account-info">
                         <h4>📋 Jurnal Penyesuaian Penyusutan Aset Tetap</h4>
                         <p>Jurnal untuk mencatat penyusutan aset tetap (kendaraan, peralatan, bangunan)</p>
@@ -5321,7 +6774,7 @@ def laporan():
                     <div class="form-group">
                         <label class="form-label">Tanggal *</label>
                         <input type="date" name="tanggal" class="form-control" required 
-                               value=" """ + date.today().isoformat() + """ ">
+                               value="{{ today }}">
                     </div>
                     
                     <!-- Informasi Saldo Aset -->
@@ -5472,6 +6925,7 @@ def laporan():
             <button class="close-modal" onclick="closeModal('tambah-jurnal-penjualan-baru')">&times;</button>
         </div>
         <form method="POST" action="/tambah_jurnal_penjualan_baru" id="form-penjualan-baru">
+            <input type="hidden" name="idempotency_key" value="{{ new_idempotency_key() }}">
             <div class="account-info">
                 <h4>📋 Sistem Penjualan Periodik</h4>
                 <p>Jurnal penjualan dengan metode periodik (tanpa HPP real-time)</p>
@@ -5480,7 +6934,7 @@ def laporan():
             <div class="form-group">
                 <label class="form-label">Tanggal *</label>
                 <input type="date" name="tanggal" class="form-control" required 
-                       value="{{ date.today().isoformat() }}">
+                       value="{{ today }}">
             </div>
             
             <div class="form-group">
@@ -5598,6 +7052,7 @@ def laporan():
                     <button class="close-modal" onclick="closeModal('tambah-jurnal-pembelian')">&times;</button>
                 </div>
                 <form method="POST" action="/tambah_jurnal_pembelian" id="form-pembelian">
+                    <input type="hidden" name="idempotency_key" value="{{ new_idempotency_key() }}">
                     <div class="account-info">
                         <h4>📋 Informasi Pembelian</h4>
                         <p>Jurnal untuk pembelian barang dan persediaan</p>
@@ -5606,7 +7061,7 @@ def laporan():
                     <div class="form-group">
                         <label class="form-label">Tanggal *</label>
                         <input type="date" name="tanggal" class="form-control" required 
-                               value=" """ + date.today().isoformat() + """ ">
+                               value="{{ today }}">
                     </div>
                     
                     <div class="form-group">
@@ -5705,6 +7160,7 @@ def laporan():
                     <button class="close-modal" onclick="closeModal('tambah-jurnal-biaya')">&times;</button>
                 </div>
                 <form method="POST" action="/tambah_jurnal_biaya">
+                    <input type="hidden" name="idempotency_key" value="{{ new_idempotency_key() }}">
                     <div class="account-info">
                         <h4>📋 Informasi Transaksi</h4>
                         <p>Jurnal untuk beban operasional toko ikan patin</p>
@@ -5713,7 +7169,7 @@ def laporan():
                     <div class="form-group">
                         <label class="form-label">Tanggal *</label>
                         <input type="date" name="tanggal" class="form-control" required 
-                               value=" """ + date.today().isoformat() + """ ">
+                               value="{{ today }}">
                     </div>
                     
                     <div class="form-group">
@@ -5764,6 +7220,7 @@ def laporan():
                     <button class="close-modal" onclick="closeModal('tambah-jurnal-manual')">&times;</button>
                 </div>
                 <form method="POST" action="/tambah_jurnal_manual" id="form-jurnal-manual">
+                    <input type="hidden" name="idempotency_key" value="{{ new_idempotency_key() }}">
                     <div class="account-info">
                         <h4>📋 Jurnal Manual Multiple Akun</h4>
                         <p>Input jurnal manual dengan multiple debit dan kredit entries</p>
@@ -5772,7 +7229,7 @@ def laporan():
                     <div class="form-group">
                         <label class="form-label">Tanggal *</label>
                         <input type="date" name="tanggal" class="form-control" required 
-                               value=" """ + date.today().isoformat() + """ ">
+                               value="{{ today }}">
                     </div>
                     
                     <div class="form-group">
@@ -5793,16 +7250,9 @@ def laporan():
                                     <label class="form-label">Akun *</label>
                                     <select name="akun[]" class="form-control" required>
                                         <option value="">Pilih Akun</option>
-            """
-        
-        # Tampilkan pilihan akun
-        if accounts:
-            for akun in accounts:
-                laporan_content += f"""
-                                        <option value="{akun['kode_akun']}">{akun['kode_akun']} - {akun['nama_akun']}</option>
-                """
-        
-        laporan_content += """
+                                        {% for akun in accounts %}
+                                        <option value="{{ akun.kode_akun }}">{{ akun.kode_akun }} - {{ akun.nama_akun }}</option>
+                                        {% endfor %}
                                     </select>
                                 </div>
                                 <div class="form-group">
@@ -5876,7 +7326,59 @@ def laporan():
             
             document.getElementById(tabName).classList.add('active');
             event.currentTarget.classList.add('active');
+            loadTab(tabName);
+        }
+
+        // Isi tab diambil dari server saat pertama kali dibuka
+        function loadTab(tabName) {
+            const tab = document.getElementById(tabName);
+            if (!tab || tab.dataset.loaded === 'true') {
+                return;
+            }
+            tab.dataset.loaded = 'true';
+
+            fetch('/laporan/tab/' + tabName + periodeQuery())
+                .then(response => response.json())
+                .then(data => {
+                    if (data.success) {
+                        tab.innerHTML = data.html;
+                    } else {
+                        tab.dataset.loaded = 'false';
+                        tab.innerHTML = '<div class="card"><div class="empty-state"><i class="ri-error-warning-line"></i><h3>Gagal memuat data</h3><p>' + data.message + '</p></div></div>';
+                    }
+                })
+                .catch(error => {
+                    console.error('Error loading tab:', error);
+                    tab.dataset.loaded = 'false';
+                    tab.innerHTML = '<div class="card"><div class="empty-state"><i class="ri-error-warning-line"></i><h3>Koneksi bermasalah</h3><p>Silakan buka tab ini lagi</p></div></div>';
+                });
+        }
+
+        // Periode laporan dikirim ke setiap permintaan tab
+        function periodeQuery() {
+            const start = document.getElementById('periode_start').value;
+            const end = document.getElementById('periode_end').value;
+            return '?start=' + encodeURIComponent(start) + '&end=' + encodeURIComponent(end);
+        }
+
+        function exportLaporan(fmt) {
+            const report = document.getElementById('export_report').value;
+            window.location.href = '/export/' + report + '.' + fmt + periodeQuery();
+        }
+
+        function applyPeriode(e) {
+            e.preventDefault();
+            const tabContents = document.getElementsByClassName('tab-content');
+            for (let i = 0; i < tabContents.length; i++) {
+                tabContents[i].dataset.loaded = 'false';
+            }
+            history.replaceState(null, '', '/laporan' + periodeQuery());
+            loadTab(document.querySelector('.tab-content.active').id);
         }
+
+        document.addEventListener('DOMContentLoaded', function() {
+            loadTab('daftar-akun');
+        });
         
         // Modal Functions
         function openModal(modalId) {
@@ -6333,7 +7835,7 @@ function hitungTotal() {
                         <label class="form-label">Akun *</label>
                         <select name="akun[]" class="form-control" required>
                             <option value="">Pilih Akun</option>
-                            """ + "".join([f'<option value="{akun["kode_akun"]}">{akun["kode_akun"]} - {akun["nama_akun"]}</option>' for akun in accounts]) + """
+                            {% for akun in accounts %}<option value="{{ akun.kode_akun }}">{{ akun.kode_akun }} - {{ akun.nama_akun }}</option>{% endfor %}
                         </select>
                     </div>
                     <div class="form-group">
@@ -6497,9 +7999,35 @@ function hitungTotal() {
             }
         }
         </script>
-        """
+{% endblock %}
+"""
+
+@app.route("/laporan")
+def laporan():
+    if "user" not in session:
+        return redirect("/signin")
+
+    # Matikan setup otomatis agar loading cepat
+    # setup_default_accounts()
+    # setup_default_inventory_items()
 
-        return render_template_string(base_template, title="Laporan Keuangan", content=laporan_content)
+    # Halaman hanya berisi kerangka tab; isi tiap tab diambil lewat /laporan/tab/<nama>
+    try:
+        # Daftar akun tetap dibutuhkan untuk pilihan akun di modal jurnal manual
+        accounts = list(get_account_catalogue().values())
+    except Exception as e:
+        print(f"Error fetching data: {e}")
+        accounts = []
+    start_date, end_date = get_report_period()
+
+    return render_template(
+        "laporan.html",
+        title="Laporan Keuangan",
+        accounts=accounts,
+        start_date=start_date,
+        end_date=end_date,
+        today=date.today().isoformat(),
+    )
 
 # === ROUTES UNTUK JURNAL ===
 
@@ -6513,7 +8041,7 @@ def get_saldo_aset():
         print("🔍 get_saldo_aset() - Ambil dari saldo_awal accounts")
         
         # Ambil langsung dari tabel accounts (saldo_awal)
-        accounts_res = supabase.table("accounts").select("*").in_("kode_akun", ['1-2000', '1-2200', '1-2100']).execute()
+        accounts_res = supabase.table("accounts").select("kode_akun, nama_akun, saldo_awal").in_("kode_akun", ['1-2000', '1-2200', '1-2100']).execute()
         
         if not accounts_res.data:
             print("❌ Tidak ada data akun aset")
@@ -6556,6 +8084,7 @@ def get_saldo_aset():
         })
     
 @app.route("/tambah_jurnal_penyesuaian", methods=["POST"])
+@idempotent
 def tambah_jurnal_penyesuaian():
     if "user" not in session:
         return redirect("/signin")
@@ -6571,7 +8100,7 @@ def tambah_jurnal_penyesuaian():
         total_kredit = 0
         
         # 1. Ambil saldo aset langsung dari accounts (saldo_awal)
-        accounts_res = supabase.table("accounts").select("*").in_("kode_akun", ['1-2000', '1-2200', '1-2100']).execute()
+        accounts_res = supabase.table("accounts").select("kode_akun, nama_akun, saldo_awal").in_("kode_akun", ['1-2000', '1-2200', '1-2100']).execute()
         accounts_data = accounts_res.data if accounts_res.data else []
         
         print(f"🔧 Data akun aset ditemukan: {len(accounts_data)} akun")
@@ -6693,6 +8222,7 @@ def tambah_jurnal_penyesuaian():
         return f"<script>alert('Error: {str(e)}'); window.history.back();</script>"
     
 @app.route("/tambah_jurnal_penjualan_baru", methods=["POST"])
+@idempotent
 def tambah_jurnal_penjualan_baru():
     if "user" not in session:
         return redirect("/signin")
@@ -6741,6 +8271,7 @@ def tambah_jurnal_penjualan_baru():
         
         if success:
             # Update inventory untuk setiap item yang dijual
+            reference = next_document_number("SO")
             for item in items:
                 item_code = "PATIN-8CM" if item['jenis_ikan'] == '8cm' else "PATIN-10CM"
                 
@@ -6750,7 +8281,7 @@ def tambah_jurnal_penjualan_baru():
                     'SALE', 
                     item['quantity'], 
                     0,
-                    f"SO-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+                    reference,
                     f"Penjualan {item['jenis_ikan']} - {customer}",
                     tanggal
                 )
@@ -6760,11 +8291,14 @@ def tambah_jurnal_penjualan_baru():
         else:
             return "<script>alert('Error menyimpan jurnal penjualan!'); window.history.back();</script>"
         
+    except PostingStatusUnknown:
+        return posting_response(interrupted_posting_response())
     except Exception as e:
         print(f"Error adding new sales journal: {e}")
         return "<script>alert('Error menyimpan jurnal penjualan!'); window.history.back();</script>"
     
 @app.route("/tambah_jurnal_pembelian", methods=["POST"])
+@idempotent
 def tambah_jurnal_pembelian():
     if "user" not in session:
         return redirect("/signin")
@@ -6873,7 +8407,7 @@ def tambah_jurnal_pembelian():
                     'PURCHASE', 
                     kuantitas, 
                     0,
-                    f"PO-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+                    next_document_number("PO"),
                     f"Pembelian {jenis_ikan} - {supplier}",
                     tanggal
                 )
@@ -6888,6 +8422,7 @@ def tambah_jurnal_pembelian():
         return "<script>alert('Error menyimpan jurnal!'); window.history.back();</script>"
     
 @app.route("/tambah_jurnal_biaya", methods=["POST"])
+@idempotent
 def tambah_jurnal_biaya():
     if "user" not in session:
         return redirect("/signin")
@@ -6933,26 +8468,30 @@ def generate_jurnal_penutup():
         
         # Simpan ke database
         tanggal = datetime.now().date().isoformat()
+        nomor_jurnal = next_document_number("JP")
+        created_at = datetime.now().isoformat()
         
+        jurnal_rows = []
         for entry in jurnal_penutup_data:
             # Cek apakah entry memiliki kode_akun
             if 'kode_akun' not in entry:
                 continue
                 
-            jurnal_data = {
+            jurnal_rows.append({
                 "tanggal": tanggal,
-                "nomor_jurnal": f"JP-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+                "nomor_jurnal": nomor_jurnal,
                 "jenis_transaksi": "Jurnal Penutup",
                 "kode_akun": entry['kode_akun'],
                 "deskripsi": entry.get('keterangan', 'Jurnal Penutup'),
                 "debit": float(entry.get('debit', 0)),
                 "kredit": float(entry.get('kredit', 0)),
                 "referensi": "Penutupan Periode",
-                "created_at": datetime.now().isoformat()
-            }
-            
-            # Simpan ke tabel jurnal_penutup (buat tabel di Supabase dulu)
-            supabase.table("jurnal_penutup").insert(jurnal_data).execute()
+                "created_at": created_at
+            })
+        
+        # Simpan ke tabel jurnal_penutup (buat tabel di Supabase dulu) dalam satu bulk insert
+        if not insert_journal_rows("jurnal_penutup", jurnal_rows):
+            return jsonify({"success": False, "message": "Gagal menyimpan jurnal penutup"})
         
         return jsonify({
             "success": True, 
@@ -6967,6 +8506,7 @@ def generate_jurnal_penutup():
         return jsonify({"success": False, "message": f"Error: {str(e)}"})
 
 @app.route("/tambah_jurnal_manual", methods=["POST"])
+@idempotent
 def tambah_jurnal_manual():
     if "user" not in session:
         return redirect("/signin")
@@ -7055,6 +8595,7 @@ def tambah_akun():
         
         # Insert ke database
         result = supabase.table("accounts").insert(akun_data).execute()
+        invalidate_account_catalogue()
         print(f"Insert result: {result}")
         
         if hasattr(result, 'data') and result.data:
@@ -7117,6 +8658,7 @@ def edit_akun():
         
         # Lakukan update dengan WHERE yang benar
         result = supabase.table("accounts").update(akun_data).eq("kode_akun", kode_akun_lama).execute()
+        invalidate_account_catalogue()
         
         print(f"🔧 Update result: {result}")
         
@@ -7182,7 +8724,8 @@ def hapus_akun(kode_akun):
             """
         
         # Hapus akun jika tidak digunakan
-        result = supabase.table("accounts").delete().eq("kode_akun", kode_akun).execute()        
+        result = supabase.table("accounts").delete().eq("kode_akun", kode_akun).execute()
+        invalidate_account_catalogue()
         if result.data:
             return f"""
             <script>
@@ -7217,9 +8760,15 @@ def hapus_akun_cascade(kode_akun):
         # Hapus dulu semua transaksi yang menggunakan akun ini
         supabase.table("jurnal_umum").delete().eq("kode_akun", kode_akun).execute()
         supabase.table("jurnal_penyesuaian").delete().eq("kode_akun", kode_akun).execute()
+        bump_ledger_version("jurnal_umum", "jurnal_penyesuaian")
+        try:
+            supabase.table("saldo_akun").delete().eq("kode_akun", kode_akun).in_("sumber", ["jurnal_umum", "jurnal_penyesuaian"]).execute()
+        except Exception as saldo_error:
+            print(f"⚠ Gagal menghapus saldo_akun {kode_akun}: {saldo_error}")
         
         # Kemudian hapus akunnya
         result = supabase.table("accounts").delete().eq("kode_akun", kode_akun).execute()
+        invalidate_account_catalogue()
         
         if result.data:
             return f"""
@@ -7248,6 +8797,7 @@ def hapus_akun_cascade(kode_akun):
 
 # === ROUTES UNTUK PROSES PENJUALAN ===
 @app.route("/proses_penjualan", methods=["POST"])
+@idempotent
 def proses_penjualan():
     if "user" not in session:
         return jsonify({"success": False, "message": "Unauthorized"})
@@ -7277,6 +8827,8 @@ def proses_penjualan():
                 "message": "Gagal memproses transaksi"
             })
             
+    except PostingStatusUnknown:
+        return posting_response(interrupted_posting_response())
     except Exception as e:
         print(f"Error processing sale: {e}")
         return jsonify({
@@ -7284,6 +8836,47 @@ def proses_penjualan():
             "message": "Terjadi kesalahan sistem"
         })
 
+@app.route("/proses_penjualan_batch", methods=["POST"])
+@idempotent
+def proses_penjualan_batch():
+    """Banyak penjualan sekaligus: {"sales": [ {payload /proses_penjualan}, ... ]}"""
+    if "user" not in session:
+        return jsonify({"success": False, "message": "Unauthorized"})
+
+    try:
+        data = request.get_json(silent=True) or {}
+        sales_data = data.get('sales')
+
+        if not isinstance(sales_data, list) or not sales_data:
+            return jsonify({"success": False, "message": "Daftar penjualan kosong"})
+        if len(sales_data) > SALES_BATCH_MAX:
+            return jsonify({"success": False, "message": f"Maksimal {SALES_BATCH_MAX} penjualan per batch"})
+
+        results = process_sales_batch(sales_data)
+        processed = sum(1 for result in results if result['success'])
+        unknown = sum(1 for result in results if result.get('unknown'))
+        message = f"{processed} dari {len(results)} transaksi berhasil diproses"
+        if unknown:
+            message += f", {unknown} status tidak diketahui (cek laporan sebelum mengulang)"
+
+        return jsonify({
+            "success": processed == len(results),
+            "processed": processed,
+            "failed": len(results) - processed - unknown,
+            "unknown": unknown,
+            "results": results,
+            "message": message
+        })
+
+    except Exception as e:
+        print(f"Error processing sales batch: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            "success": False,
+            "message": "Terjadi kesalahan sistem"
+        })
+
 @app.route("/proses_pelunasan", methods=["POST"])
 def proses_pelunasan():
     if "user" not in session:
@@ -7307,7 +8900,7 @@ def tambah_stok():
         keterangan = request.form.get('keterangan', f'Pembelian {jenis_ikan} - {supplier}')
         
         # Update inventory
-        doc_no = f"PO-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        doc_no = next_document_number("PO")
         success = update_inventory_stock(jenis_ikan, 'IN', jumlah, harga_beli, tanggal, doc_no, "PURCHASE", keterangan)
         
         if success:
@@ -7333,6 +8926,7 @@ def tambah_stok():
         return "<script>alert('Error menambah stok!'); window.history.back();</script>"
     
 @app.route("/tambah_stok_simple", methods=["POST"])
+@idempotent
 def tambah_stok_simple():
     if "user" not in session:
         return redirect("/signin")
@@ -7357,7 +8951,7 @@ def tambah_stok_simple():
         keterangan = f'Pembelian {jenis_ikan} - {supplier}'
         
         # Update inventory - HANYA quantity yang penting
-        doc_no = f"PO-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        doc_no = next_document_number("PO")
         inventory_success = record_inventory_transaction(
             item_code, 
             'PURCHASE', 
@@ -7422,16 +9016,13 @@ def adjust_stok():
         difference = new_stock - current_stock
         
         if difference != 0:
-            # Update inventory
-            update_inventory_stock(item_code, 'ADJUSTMENT', difference)
-            
-            # Catat transaksi adjustment
+            # Set stok ke nilai baru + catat transaksi adjustment (atomik)
             record_inventory_transaction(
                 item_code,
                 'ADJUSTMENT',
-                abs(difference),
+                new_stock,
                 0,  # harga 0 untuk adjustment
-                f"ADJ-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+                next_document_number("ADJ"),
                 f"Stock adjustment: {reason} - {keterangan}",
                 date.today().isoformat()
             )
@@ -7451,6 +9042,7 @@ def reset_inventory():
     try:
         # Hapus semua data inventory yang ada
         supabase.table("inventory").delete().neq("item_code", "none").execute()
+        bump_ledger_version("inventory")
         print("✅ Inventory data cleared")
         
         # Setup ulang inventory
@@ -7479,7 +9071,7 @@ def check_inventory():
     
     try:
         # Cek data inventory
-        inventory_res = supabase.table("inventory").select("*").execute()
+        inventory_res = supabase.table("inventory").select("item_code, item_name, current_stock").execute()
         
         html = f"""
         <h2>📊 Inventory Status</h2>
@@ -7502,21 +9094,63 @@ def check_inventory():
     except Exception as e:
         return f"Error: {str(e)}"
     
-# === ROUTES LAINNYA ===
-@app.route("/riwayat")
-def riwayat():
-    if "user" not in session:
-        return redirect("/signin")
-    
-    # Ambil data penjualan dari database
-    try:
-        sales_res = supabase.table("sales").select("*").order("tanggal", desc=True).execute()
-        sales_data = sales_res.data if sales_res.data else []
-    except Exception as e:
-        print(f"Error getting sales data: {e}")
-        sales_data = []
-    
-    riwayat_content = """
+# === Helper: Riwayat penjualan (keyset pagination) ===
+RIWAYAT_PAGE_SIZE = int(os.getenv("RIWAYAT_PAGE_SIZE", "20"))
+RIWAYAT_MAX_PAGE_SIZE = 100
+RIWAYAT_COLUMNS = "id, tanggal, customer, items, total_amount, payment_method, shipping_cost, dp_amount, status"
+RIWAYAT_CURSOR_RE = re.compile(r"^([0-9][0-9T:.+ -]*)~([0-9A-Za-z-]+)$")
+
+def get_riwayat_filters():
+    """Filter riwayat dari query string (?start=&end=&customer=&payment=); nilai tidak valid diabaikan"""
+    filters = {}
+    for key in ("start", "end"):
+        value = request.args.get(key, "").strip()
+        try:
+            filters[key] = date.fromisoformat(value).isoformat()
+        except ValueError:
+            pass
+    customer = request.args.get("customer", "").strip()
+    if customer:
+        filters["customer"] = customer
+    payment = request.args.get("payment", "").strip().lower()
+    if payment in ("lunas", "dp"):
+        filters["payment"] = payment
+    return filters
+
+def get_sales_page(filters, cursor=None, page_size=RIWAYAT_PAGE_SIZE):
+    """Satu halaman penjualan terbaru (urut tanggal, id menurun) setelah cursor "tanggal~id".
+
+    Mengembalikan (sales, next_cursor); next_cursor None bila sudah halaman terakhir."""
+    query = supabase.table("sales").select(RIWAYAT_COLUMNS)
+    if "start" in filters:
+        query = query.gte("tanggal", filters["start"])
+    if "end" in filters:
+        query = query.lte("tanggal", filters["end"])
+    if "customer" in filters:
+        query = query.ilike("customer", f"%{filters['customer']}%")
+    if "payment" in filters:
+        query = query.eq("payment_method", filters["payment"])
+
+    # Keyset: lanjut dari baris terakhir halaman sebelumnya, tanpa offset
+    match = RIWAYAT_CURSOR_RE.match(cursor or "")
+    if match:
+        tanggal, sale_id = match.groups()
+        query = query.or_(f'tanggal.lt."{tanggal}",and(tanggal.eq."{tanggal}",id.lt.{sale_id})')
+
+    # Ambil satu baris lebih untuk tahu apakah masih ada halaman berikutnya
+    rows = query.order("tanggal", desc=True).order("id", desc=True).limit(page_size + 1).execute().data or []
+    sales = rows[:page_size]
+    next_cursor = None
+    if len(rows) > page_size:
+        next_cursor = f"{sales[-1]['tanggal']}~{sales[-1]['id']}"
+
+    for sale in sales:
+        items = sale.get('items')
+        sale['items'] = json.loads(items) if isinstance(items, str) else (items or [])
+    return sales, next_cursor
+
+TEMPLATES["riwayat.html"] = """{% extends "base.html" %}
+{% block content %}
     <style>
         .riwayat-container {
             max-width: 1200px;
@@ -7617,63 +9251,153 @@ def riwayat():
             color: #cbd5e1;
         }
     </style>
+    <style>
+        .riwayat-filter {
+            display: flex;
+            flex-wrap: wrap;
+            gap: 0.75rem;
+            align-items: flex-end;
+            background: white;
+            padding: 1rem;
+            border-radius: 12px;
+            margin-bottom: 1.5rem;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.08);
+        }
+
+        .riwayat-filter label {
+            display: block;
+            font-size: 0.8rem;
+            color: #64748b;
+            margin-bottom: 0.25rem;
+        }
+
+        .riwayat-filter input, .riwayat-filter select {
+            padding: 0.5rem;
+            border: 1px solid #e2e8f0;
+            border-radius: 6px;
+        }
+
+        .riwayat-filter button, .riwayat-pagination a {
+            padding: 0.5rem 1rem;
+            border-radius: 6px;
+            border: none;
+            background: #667eea;
+            color: white;
+            text-decoration: none;
+            cursor: pointer;
+        }
+
+        .riwayat-filter .reset-link {
+            color: #64748b;
+            padding: 0.5rem;
+        }
+
+        .riwayat-pagination {
+            display: flex;
+            justify-content: space-between;
+            margin-top: 1.5rem;
+        }
+    </style>
 
     <div class="riwayat-container">
         <div class="riwayat-header">
             <h1 class="riwayat-title">Riwayat Transaksi Penjualan</h1>
             <p class="riwayat-subtitle">Daftar semua transaksi penjualan yang telah dilakukan</p>
         </div>
-    """
-    
-    if sales_data:
-        for sale in sales_data:
-            items = json.loads(sale['items'])
-            status_class = "status-completed" if sale['status'] == 'completed' else "status-pending"
-            status_text = "Lunas" if sale['status'] == 'completed' else "Pending"
-            
-            riwayat_content += f"""
-            <div class="transaction-card">
-                <div class="transaction-header">
-                    <div class="transaction-info">
-                        <h3>{sale['customer'] or 'Customer'}</h3>
-                        <p>{sale['tanggal']} • {sale['payment_method'].upper()} • <span class="status {status_class}">{status_text}</span></p>
-                    </div>
-                    <div class="transaction-amount">
-                        <div class="amount">Rp {sale['total_amount']:,.0f}</div>
-                    </div>
+
+        <form class="riwayat-filter" method="GET" action="/riwayat">
+            <div>
+                <label>Dari</label>
+                <input type="date" name="start" value="{{ filters.start or '' }}">
+            </div>
+            <div>
+                <label>Sampai</label>
+                <input type="date" name="end" value="{{ filters.end or '' }}">
+            </div>
+            <div>
+                <label>Customer</label>
+                <input type="text" name="customer" placeholder="Nama customer" value="{{ filters.customer or '' }}">
+            </div>
+            <div>
+                <label>Pembayaran</label>
+                <select name="payment">
+                    <option value="">Semua</option>
+                    <option value="lunas" {{ 'selected' if filters.payment == 'lunas' }}>Lunas</option>
+                    <option value="dp" {{ 'selected' if filters.payment == 'dp' }}>DP</option>
+                </select>
+            </div>
+            <input type="hidden" name="limit" value="{{ page_size }}">
+            <button type="submit"><i class="ri-filter-3-line"></i> Filter</button>
+            {% if filters %}<a class="reset-link" href="/riwayat">Reset</a>{% endif %}
+        </form>
+
+    {% for sale in sales %}
+        {% set completed = sale.status == 'completed' %}
+        <div class="transaction-card">
+            <div class="transaction-header">
+                <div class="transaction-info">
+                    <h3>{{ sale.customer or 'Customer' }}</h3>
+                    <p>{{ sale.tanggal }} • {{ sale.payment_method|upper }} • <span class="status {{ 'status-completed' if completed else 'status-pending' }}">{{ 'Lunas' if completed else 'Pending' }}</span></p>
                 </div>
-                
-                <div class="transaction-details">
-                    <div class="detail-row">
-                        <span><strong>Items:</strong></span>
-                        <span>
-            """
-            
-            for item in items:
-                riwayat_content += f"{item['quantity']} {item['jenis_ikan']} × Rp {item['selling_price']:,.0f}<br>"
-            
-            riwayat_content += f"""
-                        </span>
-                    </div>
-                    {f"<div class='detail-row'><span><strong>Ongkos Kirim:</strong></span><span>Rp {sale['shipping_cost']:,.0f}</span></div>" if sale['shipping_cost'] > 0 else ""}
-                    {f"<div class='detail-row'><span><strong>DP Dibayar:</strong></span><span>Rp {sale['dp_amount']:,.0f}</span></div>" if sale['dp_amount'] > 0 else ""}
+                <div class="transaction-amount">
+                    <div class="amount">{{ sale.total_amount|rupiah }}</div>
                 </div>
             </div>
-            """
-    else:
-        riwayat_content += """
-            <div class="empty-state">
-                <i class="ri-history-line"></i>
-                <h3>Belum Ada Transaksi</h3>
-                <p>Belum ada transaksi penjualan yang tercatat</p>
+
+            <div class="transaction-details">
+                <div class="detail-row">
+                    <span><strong>Items:</strong></span>
+                    <span>
+                    {% for item in sale['items'] %}{{ item.quantity }} {{ item.jenis_ikan }} × {{ item.selling_price|rupiah }}<br>{% endfor %}
+                    </span>
+                </div>
+                {% if sale.shipping_cost > 0 %}<div class='detail-row'><span><strong>Ongkos Kirim:</strong></span><span>{{ sale.shipping_cost|rupiah }}</span></div>{% endif %}
+                {% if sale.dp_amount > 0 %}<div class='detail-row'><span><strong>DP Dibayar:</strong></span><span>{{ sale.dp_amount|rupiah }}</span></div>{% endif %}
             </div>
-        """
-    
-    riwayat_content += """
+        </div>
+    {% else %}
+        <div class="empty-state">
+            <i class="ri-history-line"></i>
+            <h3>Belum Ada Transaksi</h3>
+            <p>{{ 'Tidak ada transaksi yang cocok dengan filter' if filters else 'Belum ada transaksi penjualan yang tercatat' }}</p>
+        </div>
+    {% endfor %}
+
+        <div class="riwayat-pagination">
+            <span>{% if first_url %}<a href="{{ first_url }}"><i class="ri-arrow-left-double-line"></i> Terbaru</a>{% endif %}</span>
+            <span>{% if next_url %}<a href="{{ next_url }}">Berikutnya <i class="ri-arrow-right-line"></i></a>{% endif %}</span>
+        </div>
     </div>
-    """
-    
-    return render_template_string(base_template, title="Riwayat Transaksi", content=riwayat_content)
+{% endblock %}
+"""
+
+# === ROUTES LAINNYA ===
+@app.route("/riwayat")
+def riwayat():
+    if "user" not in session:
+        return redirect("/signin")
+
+    filters = get_riwayat_filters()
+    page_size = request.args.get("limit", RIWAYAT_PAGE_SIZE, type=int)
+    page_size = min(max(page_size, 1), RIWAYAT_MAX_PAGE_SIZE)
+    cursor = request.args.get("cursor")
+
+    # Ambil satu halaman penjualan dari database
+    try:
+        sales_data, next_cursor = get_sales_page(filters, cursor, page_size)
+    except Exception as e:
+        print(f"Error getting sales data: {e}")
+        sales_data, next_cursor = [], None
+
+    return render_template(
+        "riwayat.html",
+        title="Riwayat Transaksi",
+        sales=sales_data,
+        filters=filters,
+        page_size=page_size,
+        next_url=url_for("riwayat", cursor=next_cursor, limit=page_size, **filters) if next_cursor else None,
+        first_url=url_for("riwayat", limit=page_size, **filters) if cursor else None,
+    )
 
 @app.route("/hubungi")
 def hubungi():
@@ -7816,13 +9540,109 @@ def hubungi():
         </div>
     """
     
-    return render_template_string(base_template, title="Hubungi Kami", content=hubungi_content)
+    return render_template("base.html", title="Hubungi Kami", content=hubungi_content)
 
 @app.route("/logout")
 def logout():
     session.pop("user", None)
     return redirect("/signin")
 
+@app.route("/admin/rebuild_saldo_akun")
+def admin_rebuild_saldo_akun():
+    """Hitung ulang tabel saldo_akun dan piutang_saldo dari baris jurnal / buku pembantu (inisialisasi / perbaikan)"""
+    if "user" not in session:
+        return redirect("/signin")
+    
+    rebuild_saldo_akun()
+    rebuild_piutang_saldo()
+    return """
+    <script>
+        alert('✅ Saldo akun dan saldo piutang berhasil dihitung ulang!');
+        window.location.href = '/laporan';
+    </script>
+    """
+
+@app.route("/admin/backend_calls")
+def admin_backend_calls():
+    """Ringkasan panggilan backend per route dan request terakhir"""
+    if "user" not in session:
+        return redirect("/signin")
+    
+    if request.args.get("reset"):
+        with BACKEND_STATS_LOCK:
+            BACKEND_ROUTE_STATS.clear()
+            BACKEND_RECENT_REQUESTS.clear()
+        return redirect("/admin/backend_calls")
+    
+    with BACKEND_STATS_LOCK:
+        route_stats = sorted(BACKEND_ROUTE_STATS.items(), key=lambda item: item[1]["ms"], reverse=True)
+        recent_requests = list(BACKEND_RECENT_REQUESTS)[::-1]
+    
+    route_rows = ""
+    for route, stats in route_stats:
+        n = stats["requests"]
+        route_rows += f"""
+        <tr>
+            <td>{html.escape(route)}</td>
+            <td>{n}</td>
+            <td>{stats['calls'] / n:.1f}</td>
+            <td>{stats['max_calls']}</td>
+            <td>{stats['ms'] / n:.1f}</td>
+            <td>{stats['rows'] / n:,.0f}</td>
+            <td>{stats['bytes'] / n / 1024:,.1f}</td>
+            <td>{stats['errors']}</td>
+        </tr>
+        """
+    
+    recent_rows = ""
+    for item in recent_requests:
+        summary = item["summary"]
+        top_tables = sorted(item["per_table"].items(), key=lambda entry: entry[1]["ms"], reverse=True)[:5]
+        detail = "<br>".join(
+            f"{html.escape(key)}: {entry['calls']}x, {entry['rows']:,} baris, {entry['ms']:.1f} ms" for key, entry in top_tables
+        )
+        recent_rows += f"""
+        <tr>
+            <td>{item['time']}</td>
+            <td>{item['method']} {html.escape(item['path'])}</td>
+            <td>{item['status']}</td>
+            <td>{summary['calls']}</td>
+            <td>{summary['ms']:.1f}</td>
+            <td>{summary['rows']:,}</td>
+            <td>{detail or '-'}</td>
+        </tr>
+        """
+    
+    status = "aktif" if BACKEND_INSTRUMENTATION else "nonaktif (BACKEND_INSTRUMENTATION=0)"
+    if BACKEND_INSTRUMENTATION and not BACKEND_PAYLOAD_BYTES:
+        status += ", ukuran payload tidak diukur (BACKEND_PAYLOAD_BYTES=1)"
+    return f"""
+    <html>
+    <body style="padding: 20px; font-family: monospace;">
+        <h2>📊 Panggilan Backend per Route</h2>
+        <p>Instrumentasi: {status} | <a href="/admin/backend_calls?reset=1">Reset</a></p>
+        <table border="1" cellpadding="6" style="border-collapse: collapse;">
+            <tr>
+                <th>Route</th><th>Request</th><th>Rata2 Calls</th><th>Max Calls</th>
+                <th>Rata2 ms</th><th>Rata2 Baris</th><th>Rata2 KB</th><th>Error</th>
+            </tr>
+            {route_rows or '<tr><td colspan="8">Belum ada data</td></tr>'}
+        </table>
+        
+        <h2>🕑 {len(recent_requests)} Request Terakhir</h2>
+        <table border="1" cellpadding="6" style="border-collapse: collapse;">
+            <tr>
+                <th>Waktu</th><th>Request</th><th>Status</th><th>Calls</th>
+                <th>ms</th><th>Baris</th><th>Tabel teratas</th>
+            </tr>
+            {recent_rows or '<tr><td colspan="7">Belum ada data</td></tr>'}
+        </table>
+        <br>
+        <a href="/">← Kembali</a>
+    </body>
+    </html>
+    """
+
 # === ROUTE UNTUK GENERATE JURNAL PENUTUP ===
 @app.route("/api/generate_jurnal_penutup", methods=["POST"])
 def api_generate_jurnal_penutup():
@@ -7871,6 +9691,8 @@ def api_save_jurnal_penutup():
         # 1. Hapus data jurnal penutup lama jika ada
         try:
             supabase.table("jurnal_penutup").delete().neq("id", "none").execute()
+            supabase.table("saldo_akun").delete().eq("sumber", "jurnal_penutup").execute()
+            bump_ledger_version("jurnal_penutup")
             print("✅ Data jurnal penutup lama dihapus")
         except Exception as delete_error:
             print(f"⚠ Tidak ada data lama atau error: {delete_error}")
@@ -7886,11 +9708,12 @@ def api_save_jurnal_penutup():
         
         # 3. Simpan ke database
         tanggal = datetime.now().date().isoformat()
-        nomor_jurnal_base = f"JP-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        nomor_jurnal_base = next_document_number("JP")
         
-        saved_count = 0
+        created_at = datetime.now().isoformat()
+        jurnal_rows = []
         for i, entry in enumerate(jurnal_penutup_data):
-            jurnal_data = {
+            jurnal_rows.append({
                 "tanggal": tanggal,
                 "nomor_jurnal": f"{nomor_jurnal_base}-{i+1:03d}",
                 "jenis_transaksi": "Jurnal Penutup",
@@ -7899,13 +9722,17 @@ def api_save_jurnal_penutup():
                 "debit": float(entry.get('debit', 0)),
                 "kredit": float(entry.get('kredit', 0)),
                 "referensi": f"Penutupan Periode {tanggal}",
-                "created_at": datetime.now().isoformat()
-            }
-            
-            # Insert ke database
-            result = supabase.table("jurnal_penutup").insert(jurnal_data).execute()
-            if hasattr(result, 'data') and result.data:
-                saved_count += 1
+                "created_at": created_at
+            })
+        
+        # Insert ke database dalam satu bulk insert (semua atau tidak sama sekali)
+        saved_rows = insert_journal_rows("jurnal_penutup", jurnal_rows)
+        if not saved_rows:
+            return jsonify({
+                "success": False, 
+                "message": "Gagal menyimpan jurnal penutup"
+            })
+        saved_count = len(saved_rows)
         
         print(f"✅ Saved {saved_count} entries to database")
         
@@ -7923,6 +9750,8 @@ def api_save_jurnal_penutup():
         return jsonify({"success": False, "message": f"Error: {str(e)}"})
 
 # === MAIN ===
+precompile_templates()
+
 if __name__ == "__main__":
     # Setup database dan akun default saat aplikasi pertama kali dijalankan
     setup_database_tables()
@@ -0,0 +1,343 @@
+"""Benchmark pipeline laporan dengan backend lokal (lihat supabase_client.py).
+
+Mengisi ledger sintetis toko ikan patin (penjualan 8cm/10cm, DP + pelunasan,
+pembelian, penyusutan bulanan) lalu mengukur setiap builder laporan dan render
+/laporan penuh: waktu, jumlah panggilan backend, dan puncak memori.
+
+Contoh:
+    python bench_ledger.py                                  # 10k, 100k, 1M baris jurnal
+    python bench_ledger.py --sizes 10000 --backend sqlite
+    python bench_ledger.py --output bench_results.json --skip-memory
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+BATCH_LINES = 2_000
+
+# Saldo awal (seimbang): modal disetor = kas + aset tetap
+SALDO_AWAL = {
+    '1-1000': 250_000_000,
+    '1-2000': 150_000_000,
+    '1-2100': 40_000_000,
+    '1-2200': 300_000_000,
+    '1-1200': 5_000_000,
+    '1-1300': 8_000_000,
+    '3-1000': 753_000_000,
+}
+
+# (kode pendapatan, kode persediaan, harga jual, harga beli, jenis)
+PRODUK = [
+    ('4-1000', '1-1200', 1000, 500, '8cm'),
+    ('4-1100', '1-1300', 1500, 800, '10cm'),
+]
+
+PENYUSUTAN_BULANAN = [
+    ('6-1000', '1-2010', 1_250_000),
+    ('6-1100', '1-2110', 350_000),
+    ('6-1200', '1-2210', 1_000_000),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark laporan Airyn pada backend lokal")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="jumlah baris jurnal umum, dipisah koma (default: 10000,100000,1000000)")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--output", default="bench_results.json", help="file hasil (JSON)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-memory", action="store_true", help="lewati pengukuran puncak memori (tracemalloc)")
+    return parser.parse_args()
+
+
+# === Generator ledger sintetis ===
+def jurnal_line(tanggal, nomor, jenis, kode, debit, kredit, referensi=None):
+    return {
+        "tanggal": tanggal.isoformat(),
+        "nomor_jurnal": nomor,
+        "jenis_transaksi": jenis,
+        "kode_akun": kode,
+        "deskripsi": jenis,
+        "debit": debit,
+        "kredit": kredit,
+        "referensi": referensi,
+    }
+
+
+def generate_transactions(rng, start_date, end_date):
+    """Yield (tabel, baris jurnal seimbang) tanpa henti, tersebar merata dalam periode"""
+    days = (end_date - start_date).days + 1
+    counter = 0
+    bulan_disusutkan = set()
+
+    while True:
+        counter += 1
+        tanggal = start_date + timedelta(days=rng.randrange(days))
+        nomor = f"B{counter:09d}"
+        pendapatan, persediaan, harga_jual, harga_beli, jenis = rng.choice(PRODUK)
+        qty = rng.randint(50, 500)
+        roll = rng.random()
+
+        if roll < 0.45:
+            # Penjualan tunai + HPP
+            customer = f"Customer {rng.randint(1, 300)}"
+            total, hpp = qty * harga_jual, qty * harga_beli
+            yield "jurnal_umum", [
+                jurnal_line(tanggal, nomor, f"Penjualan - {customer}", '1-1000', total, 0),
+                jurnal_line(tanggal, nomor, f"Penjualan - {customer}", pendapatan, 0, total),
+                jurnal_line(tanggal, nomor, f"Penjualan - {customer}", '5-1000', hpp, 0),
+                jurnal_line(tanggal, nomor, f"Penjualan - {customer}", persediaan, 0, hpp),
+            ], None
+        elif roll < 0.65:
+            # Penjualan DP, pelunasan hari berikutnya
+            customer = f"Customer {rng.randint(1, 300)}"
+            total, hpp = qty * harga_jual, qty * harga_beli
+            dp = total // 2
+            pelunasan = min(tanggal + timedelta(days=1), end_date)
+            yield "jurnal_umum", [
+                jurnal_line(tanggal, nomor, f"Penjualan DP - {customer}", '1-1000', dp, 0),
+                jurnal_line(tanggal, nomor, f"Penjualan DP - {customer}", '1-1100', total - dp, 0),
+                jurnal_line(tanggal, nomor, f"Penjualan DP - {customer}", pendapatan, 0, total),
+                jurnal_line(tanggal, nomor, f"Penjualan DP - {customer}", '5-1000', hpp, 0),
+                jurnal_line(tanggal, nomor, f"Penjualan DP - {customer}", persediaan, 0, hpp),
+                jurnal_line(pelunasan, nomor + "-L", f"Pelunasan - {customer}", '1-1000', total - dp, 0),
+                jurnal_line(pelunasan, nomor + "-L", f"Pelunasan - {customer}", '1-1100', 0, total - dp),
+            ], [
+                {"customer": customer, "tanggal": tanggal.isoformat(), "keterangan": "Penjualan DP",
+                 "debit": total - dp, "kredit": 0},
+                {"customer": customer, "tanggal": pelunasan.isoformat(), "keterangan": "Pelunasan",
+                 "debit": 0, "kredit": total - dp},
+            ]
+        elif roll < 0.9:
+            # Pembelian bibit (kadang dengan ongkir)
+            total = qty * 2 * harga_beli
+            lines = [
+                jurnal_line(tanggal, nomor, f"Pembelian {jenis}", persediaan, total, 0),
+                jurnal_line(tanggal, nomor, f"Pembelian {jenis}", '1-1000', 0, total),
+            ]
+            if rng.random() < 0.3:
+                ongkir = rng.randint(10, 50) * 1000
+                lines += [
+                    jurnal_line(tanggal, nomor, f"Pembelian {jenis}", '5-1300', ongkir, 0),
+                    jurnal_line(tanggal, nomor, f"Pembelian {jenis}", '1-1000', 0, ongkir),
+                ]
+            yield "jurnal_umum", lines, None
+        else:
+            # Beban listrik & angkut penjualan
+            beban = rng.choice(['5-1100', '5-1200'])
+            nilai = rng.randint(50, 500) * 1000
+            yield "jurnal_umum", [
+                jurnal_line(tanggal, nomor, "Beban Operasional", beban, nilai, 0),
+                jurnal_line(tanggal, nomor, "Beban Operasional", '1-1000', 0, nilai),
+            ], None
+
+        # Penyusutan bulanan (jurnal penyesuaian), sekali per bulan yang sudah tersentuh
+        bulan = tanggal.replace(day=1)
+        if bulan not in bulan_disusutkan:
+            bulan_disusutkan.add(bulan)
+            nomor_adj = f"JP-{bulan.strftime('%Y%m')}"
+            akhir_bulan = min((bulan + timedelta(days=32)).replace(day=1) - timedelta(days=1), end_date)
+            lines = []
+            for beban, akumulasi, nilai in PENYUSUTAN_BULANAN:
+                lines.append(jurnal_line(akhir_bulan, nomor_adj, "Penyusutan", beban, nilai, 0))
+                lines.append(jurnal_line(akhir_bulan, nomor_adj, "Penyusutan", akumulasi, 0, nilai))
+            yield "jurnal_penyesuaian", lines, None
+
+
+def seed_ledger(SIA, target_lines, rng):
+    """Isi akun, inventory dan jurnal sampai jurnal_umum berisi >= target_lines baris"""
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        SIA.setup_default_accounts()
+        SIA.setup_default_inventory_items()
+    for kode, saldo in SALDO_AWAL.items():
+        SIA.supabase.table("accounts").update({"saldo_awal": saldo}).eq("kode_akun", kode).execute()
+
+    start_date, end_date = SIA.get_default_period()
+    buffers = {"jurnal_umum": [], "jurnal_penyesuaian": [], "buku_pembantu_piutang": []}
+    piutang_saldo = {}
+    written = 0
+
+    def flush(table_name):
+        if not buffers[table_name]:
+            return
+        if table_name == "buku_pembantu_piutang":
+            SIA.supabase.table(table_name).insert(buffers[table_name]).execute()
+        else:
+            SIA.insert_journal_rows(table_name, buffers[table_name])
+        buffers[table_name] = []
+
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        for table_name, lines, piutang in generate_transactions(rng, start_date, end_date):
+            buffers[table_name].extend(lines)
+            if table_name == "jurnal_umum":
+                written += len(lines)
+            for entry in piutang or []:
+                saldo = piutang_saldo.get(entry["customer"], 0) + entry["debit"] - entry["kredit"]
+                piutang_saldo[entry["customer"]] = saldo
+                buffers["buku_pembantu_piutang"].append(dict(entry, saldo=saldo))
+            for name in buffers:
+                if len(buffers[name]) >= BATCH_LINES:
+                    flush(name)
+            if written >= target_lines:
+                break
+        for name in buffers:
+            flush(name)
+        # Buku pembantu di-insert langsung (batch), jadi saldo piutang per customer dihitung ulang
+        SIA.rebuild_piutang_saldo()
+
+    return written, start_date, end_date
+
+
+# === Pengukuran ===
+class CallCounter:
+    """Hitung panggilan execute() ke backend lokal (query tabel + RPC)"""
+
+    def __init__(self, supabase_client):
+        self.calls = 0
+        for cls in (supabase_client.LocalQuery, supabase_client.LocalRpc):
+            cls.execute = self._wrap(cls.execute)
+
+    def _wrap(self, execute):
+        counter = self
+
+        def counted(query):
+            counter.calls += 1
+            return execute(query)
+        return counted
+
+
+def measure(name, func, counter, skip_memory, clear_cache):
+    """Waktu + jumlah panggilan dengan cache laporan kosong (cold) dan terisi (cached),
+    lalu (opsional) puncak memori run cold di pass terpisah"""
+    devnull = open(os.devnull, "w")
+    clear_cache()
+    calls_before = counter.calls
+    with contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - started
+    result = {"seconds": round(seconds, 4), "backend_calls": counter.calls - calls_before}
+
+    calls_before = counter.calls
+    with contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        func()
+        result["cached_seconds"] = round(time.perf_counter() - started, 4)
+    result["cached_backend_calls"] = counter.calls - calls_before
+
+    if not skip_memory:
+        clear_cache()
+        tracemalloc.start()
+        with contextlib.redirect_stdout(devnull):
+            func()
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    print(f"   {name:<40} {result['seconds']:>9.3f}s  {result['backend_calls']:>6} calls"
+          f"  (cached {result['cached_seconds']:.3f}s)"
+          + (f"  {result['peak_memory_bytes'] / 1_048_576:>8.1f} MiB" if not skip_memory else ""))
+    return result
+
+
+def benchmark_reports(SIA, start_date, end_date, counter, skip_memory):
+    query = f"?start={start_date.isoformat()}&end={end_date.isoformat()}"
+    results = {}
+
+    def clear_cache():
+        with SIA.REPORT_CACHE_LOCK:
+            SIA.REPORT_CACHE.clear()
+
+    def in_request(func):
+        def run():
+            with SIA.app.test_request_context("/laporan" + query):
+                func()
+        return run
+
+    builders = {
+        "get_buku_besar_data": lambda: SIA.get_buku_besar_data(start_date, end_date),
+        "get_neraca_lajur": lambda: SIA.get_neraca_lajur(end_date),
+        "get_jurnal_penutup_data": lambda: SIA.get_jurnal_penutup_data(end_date),
+        "get_neraca_saldo_setelah_penutupan": lambda: SIA.get_neraca_saldo_setelah_penutupan(end_date),
+    }
+    for name, builder in builders.items():
+        results[name] = measure(name, in_request(builder), counter, skip_memory, clear_cache)
+
+    for tab_name, render_tab in SIA.LAPORAN_TABS.items():
+        results[f"tab:{tab_name}"] = measure(f"tab:{tab_name}", in_request(render_tab), counter, skip_memory, clear_cache)
+
+    # Render /laporan penuh lewat test client: halaman kerangka + semua tab
+    client = SIA.app.test_client()
+    with client.session_transaction() as sess:
+        sess["user"] = "bench@airyn.local"
+
+    def full_laporan():
+        response = client.get("/laporan" + query)
+        assert response.status_code == 200, response.status_code
+        for tab_name in SIA.LAPORAN_TABS:
+            response = client.get(f"/laporan/tab/{tab_name}{query}")
+            assert response.get_json()["success"], response.get_json()
+
+    results["laporan_full"] = measure("/laporan + semua tab", full_laporan, counter, skip_memory, clear_cache)
+    return results
+
+
+def main():
+    args = parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    os.environ["SIA_BACKEND"] = args.backend
+    sqlite_dir = tempfile.mkdtemp(prefix="airyn-bench-") if args.backend == "sqlite" else None
+    if sqlite_dir:
+        os.environ["SIA_SQLITE_PATH"] = os.path.join(sqlite_dir, "init.db")
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        import supabase_client
+        import SIA
+
+    counter = CallCounter(supabase_client)
+    report = {
+        "generated_at": datetime.now().isoformat(),
+        "backend": args.backend,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": [],
+    }
+
+    for size in sizes:
+        # Backend baru untuk setiap ukuran
+        if sqlite_dir:
+            os.environ["SIA_SQLITE_PATH"] = os.path.join(sqlite_dir, f"ledger_{size}.db")
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            SIA.supabase = supabase_client.create_backend()
+
+        print(f"🔧 Seeding {size:,} baris jurnal ({args.backend})...")
+        started = time.perf_counter()
+        written, start_date, end_date = seed_ledger(SIA, size, random.Random(args.seed))
+        seed_seconds = time.perf_counter() - started
+        print(f"   {written:,} baris dalam {seed_seconds:.1f}s")
+
+        report["runs"].append({
+            "journal_lines": written,
+            "period": [start_date.isoformat(), end_date.isoformat()],
+            "seed_seconds": round(seed_seconds, 2),
+            "results": benchmark_reports(SIA, start_date, end_date, counter, args.skip_memory),
+        })
+
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+    print(f"✅ Hasil benchmark disimpan di {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Antrian pengiriman email OTP di background untuk SIA.py.
+
+send_otp() hanya memasukkan email ke antrian lalu langsung kembali; worker
+thread yang mengirim lewat SMTP atau SendGrid dengan koneksi yang dipakai
+ulang, retry dengan backoff, dan fallback ke console bila semua percobaan gagal.
+
+Konfigurasi (env):
+    OTP_DELIVERY        auto (default) | smtp | sendgrid | console
+                        auto: EMAIL_PASSWORD "SG..." -> sendgrid,
+                              EMAIL_SENDER + EMAIL_PASSWORD -> smtp, selain itu console
+    SMTP_HOST           default smtp.gmail.com
+    SMTP_PORT           default 587
+    SMTP_SECURITY       starttls (default) | ssl | none
+    OTP_WORKERS         jumlah worker thread (default 2)
+    OTP_MAX_ATTEMPTS    percobaan per email sebelum fallback (default 3)
+    OTP_RETRY_BACKOFF   jeda awal retry dalam detik, dilipatgandakan tiap percobaan (default 1)
+
+Tes lokal dengan SMTP sink (tanpa login/TLS):
+    python -m aiosmtpd -n -l localhost:1025
+    OTP_DELIVERY=smtp SMTP_HOST=localhost SMTP_PORT=1025 SMTP_SECURITY=none python SIA.py
+"""
+import os
+import queue
+import random
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+
+
+class OtpJob:
+    """Satu email OTP di antrian"""
+
+    def __init__(self, email, subject, html, otp):
+        self.email = email
+        self.subject = subject
+        self.html = html
+        self.otp = otp
+        self.attempts = 0
+
+
+# === Transport ===
+class SMTPTransport:
+    """Kirim lewat SMTP; satu koneksi per worker thread, dipakai ulang antar email"""
+
+    name = "smtp"
+
+    def __init__(self, host, port, sender, username=None, password=None, security="starttls", timeout=10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.security = security
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connect(self):
+        if self.security == "ssl":
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.security == "starttls":
+                server.starttls()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            # Gagal STARTTLS / login: socket yang sudah terbuka jangan dibiarkan bocor
+            server.close()
+            raise
+        return server
+
+    def close(self):
+        server = getattr(self.local, "server", None)
+        self.local.server = None
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+
+    def deliver(self, msg):
+        server = getattr(self.local, "server", None)
+        if server is None:
+            server = self.local.server = self.connect()
+            server.send_message(msg)
+            return
+        try:
+            server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # Server menutup koneksi idle: sambung ulang sekali, error lain diserahkan ke retry
+            self.close()
+            server = self.local.server = self.connect()
+            server.send_message(msg)
+
+    def send(self, job):
+        msg = MIMEText(job.html, "html")
+        msg["Subject"] = job.subject
+        msg["From"] = self.sender
+        msg["To"] = job.email
+
+        try:
+            self.deliver(msg)
+        except Exception:
+            # Koneksi yang gagal (connect maupun kirim) tidak dipakai lagi oleh email berikutnya
+            self.close()
+            raise
+
+
+class SendGridTransport:
+    """Kirim lewat SendGrid API; satu requests.Session (keep-alive) per worker thread"""
+
+    name = "sendgrid"
+    url = "https://api.sendgrid.com/v3/mail/send"
+
+    def __init__(self, api_key, sender, timeout=10):
+        self.api_key = api_key
+        self.sender = sender
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def session(self):
+        http = getattr(self.local, "session", None)
+        if http is None:
+            import requests
+            http = self.local.session = requests.Session()
+            http.headers.update({
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+            })
+        return http
+
+    def close(self):
+        http = getattr(self.local, "session", None)
+        self.local.session = None
+        if http is not None:
+            http.close()
+
+    def send(self, job):
+        response = self.session().post(self.url, json={
+            "personalizations": [{"to": [{"email": job.email}]}],
+            "from": {"email": self.sender, "name": "Airyn Team"},
+            "subject": job.subject,
+            "content": [{"type": "text/html", "value": job.html}],
+        }, timeout=self.timeout)
+        if response.status_code != 202:
+            raise RuntimeError(f"SendGrid error {response.status_code}: {response.text[:200]}")
+
+
+# === Antrian ===
+class OtpDeliveryQueue:
+    """Queue + worker thread; enqueue() tidak pernah menunggu mail server"""
+
+    def __init__(self, transport, fallback, workers=2, max_attempts=3, backoff=1.0):
+        self.transport = transport
+        self.fallback = fallback
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.pid = None
+        self.stats = {"queued": 0, "sent": 0, "retried": 0, "fallback": 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def start(self):
+        """Start worker (lazy, dan ulang setelah fork gunicorn karena thread tidak ikut ter-fork)"""
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            if self.pid is not None:
+                # Proses hasil fork: antrian/lock lama bisa dalam keadaan terkunci
+                self.jobs = queue.Queue()
+            self.pid = os.getpid()
+            for i in range(self.workers):
+                threading.Thread(target=self.run, name=f"otp-delivery-{i + 1}", daemon=True).start()
+
+    def enqueue(self, email, subject, html, otp):
+        if self.transport is None:
+            self.fallback(email, otp)
+            return
+        self.start()
+        self.count("queued")
+        self.jobs.put(OtpJob(email, subject, html, otp))
+
+    def wait_idle(self, timeout=None):
+        """Tunggu sampai antrian kosong (untuk tes); True bila selesai sebelum timeout"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self.jobs.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def run(self):
+        jobs = self.jobs
+        while True:
+            job = jobs.get()
+            try:
+                self.deliver(job)
+            except Exception as e:
+                print(f"❌ OTP worker error ({job.email}): {e!r}")
+            finally:
+                jobs.task_done()
+
+    def deliver(self, job):
+        while True:
+            job.attempts += 1
+            try:
+                self.transport.send(job)
+                self.count("sent")
+                print(f"✅ OTP terkirim ke {job.email} via {self.transport.name} (percobaan {job.attempts})")
+                return
+            except Exception as e:
+                print(f"⚠ Gagal kirim OTP ke {job.email} via {self.transport.name} "
+                      f"(percobaan {job.attempts}/{self.max_attempts}): {e!r}")
+                if job.attempts >= self.max_attempts:
+                    break
+                self.count("retried")
+                delay = self.backoff * (2 ** (job.attempts - 1))
+                time.sleep(delay + random.uniform(0, delay / 2))
+
+        self.count("fallback")
+        self.fallback(job.email, job.otp)
+
+
+def create_otp_queue(fallback):
+    """Buat antrian sesuai env (lihat docstring modul)"""
+    sender = os.getenv("EMAIL_SENDER", "noreply@airyn.com")
+    password = os.getenv("EMAIL_PASSWORD")
+    mode = os.getenv("OTP_DELIVERY", "auto").strip().lower()
+    if mode == "auto":
+        if password and password.startswith("SG."):
+            mode = "sendgrid"
+        elif os.getenv("EMAIL_SENDER") and password:
+            mode = "smtp"
+        else:
+            mode = "console"
+
+    if mode == "sendgrid":
+        transport = SendGridTransport(password, sender)
+    elif mode == "smtp":
+        transport = SMTPTransport(
+            os.getenv("SMTP_HOST", "smtp.gmail.com"),
+            int(os.getenv("SMTP_PORT", "587")),
+            sender,
+            username=os.getenv("EMAIL_SENDER"),
+            password=password,
+            security=os.getenv("SMTP_SECURITY", "starttls").strip().lower(),
+        )
+    else:
+        transport = None
+
+    print(f"🔧 Pengiriman OTP: {mode}")
+    return OtpDeliveryQueue(
+        transport,
+        fallback,
+        workers=int(os.getenv("OTP_WORKERS", "2")),
+        max_attempts=int(os.getenv("OTP_MAX_ATTEMPTS", "3")),
+        backoff=float(os.getenv("OTP_RETRY_BACKOFF", "1")),
+    )
@@ -0,0 +1,997 @@
+"""Backend data untuk SIA.py.
+
+Secara default memakai Supabase asli. Untuk benchmark / load test tanpa project
+Supabase, set SIA_BACKEND:
+
+    SIA_BACKEND=supabase   (default) client supabase-py biasa
+    SIA_BACKEND=memory     semua tabel disimpan di memori proses
+    SIA_BACKEND=sqlite     tabel disimpan di file SQLite (SIA_SQLITE_PATH, default airyn_local.db)
+
+Backend lokal meniru subset query builder yang dipakai SIA.py
+(table/select/insert/update/delete/eq/neq/gt/gte/lt/lte/like/ilike/in_/or_/order/limit/range,
+select(..., count="exact")) serta fungsi RPC di supabase_schema.sql.
+
+Client Supabase asli memakai transport httpx terkonfigurasi (create_supabase_client):
+pool koneksi keep-alive seukuran jumlah thread, timeout connect/read eksplisit dan
+retry ber-jitter untuk request baca yang idempoten. Client dibuat ulang per proses
+setelah fork (ForkSafeClient), aman untuk gunicorn --preload.
+
+instrument_backend() membungkus client apa pun (Supabase maupun lokal) dan
+melaporkan setiap execute(): tabel/RPC, operasi, jumlah baris dan latency
+(ukuran payload hanya bila measure_bytes=True, karena perlu json.dumps per respons).
+"""
+import os
+import random
+import re
+import json
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+
+def create_backend(supabase_url=None, supabase_key=None, pool_size=10):
+    """Buat client sesuai SIA_BACKEND (pool_size: jumlah koneksi HTTP per proses untuk Supabase)"""
+    backend = os.getenv("SIA_BACKEND", "supabase").strip().lower()
+
+    if backend == "memory":
+        print("🔧 Backend data: memory (lokal)")
+        return LocalClient(MemoryStore())
+    if backend == "sqlite":
+        path = os.getenv("SIA_SQLITE_PATH", "airyn_local.db")
+        print(f"🔧 Backend data: sqlite ({path})")
+        return LocalClient(SQLiteStore(path))
+
+    supabase_url = supabase_url or os.getenv("SUPABASE_URL")
+    supabase_key = supabase_key or os.getenv("SUPABASE_KEY")
+    return ForkSafeClient(lambda: create_supabase_client(supabase_url, supabase_key, pool_size))
+
+
+# === Transport HTTP Supabase ===
+# Hanya gangguan sementara yang diulang: 429 / 5xx dari gateway dan koneksi yang gagal
+# dibuka atau diputus server (mis. koneksi keep-alive yang sudah ditutup di sisi lain).
+# Read timeout tidak diulang agar satu query lambat tidak berlipat jadi beberapa kali timeout.
+RETRY_STATUS = {429, 502, 503, 504}
+# RPC yang hanya membaca (dipanggil lewat POST /rpc/<nama>) juga aman diulang
+READ_ONLY_RPCS = {"saldo_per_akun", "penjualan_per_ukuran"}
+
+
+def create_supabase_client(supabase_url, supabase_key, pool_size=10):
+    """Client supabase-py dengan transport httpx sendiri: pool keep-alive, timeout, retry baca"""
+    import httpx
+    from supabase import create_client, ClientOptions
+
+    connect_timeout = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+    read_timeout = float(os.getenv("SUPABASE_READ_TIMEOUT", "30"))
+    transport = RetryTransport(
+        httpx.HTTPTransport(limits=httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=float(os.getenv("SUPABASE_KEEPALIVE_SECONDS", "60")),
+        )),
+        retries=int(os.getenv("SUPABASE_RETRIES", "3")),
+        backoff=float(os.getenv("SUPABASE_RETRY_BACKOFF", "0.2")),
+        backoff_max=float(os.getenv("SUPABASE_RETRY_BACKOFF_MAX", "3")),
+    )
+    # Menunggu koneksi bebas dari pool dibatasi sama dengan connect timeout
+    timeout = httpx.Timeout(read_timeout, connect=connect_timeout, pool=connect_timeout)
+    http_client = httpx.Client(transport=transport, timeout=timeout)
+
+    try:
+        options = ClientOptions(httpx_client=http_client, postgrest_client_timeout=timeout)
+    except TypeError:
+        # supabase-py lama belum menerima httpx_client: hanya timeout yang bisa diatur
+        print("⚠ supabase-py belum mendukung httpx_client, pakai transport default (tanpa pool/retry)")
+        http_client.close()
+        options = ClientOptions(postgrest_client_timeout=timeout)
+    print(f"🔧 Backend data: supabase (pool {pool_size} koneksi, timeout {connect_timeout}s/{read_timeout}s)")
+    return create_client(supabase_url, supabase_key, options=options)
+
+
+class RetryTransport:
+    """Transport httpx pembungkus: request baca idempoten (GET/HEAD, RPC baca) diulang
+    dengan backoff eksponensial ber-jitter saat gangguan sementara"""
+
+    def __init__(self, transport, retries=3, backoff=0.2, backoff_max=3.0, read_only_rpcs=READ_ONLY_RPCS):
+        import httpx
+
+        self.transport = transport
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.read_only_rpcs = set(read_only_rpcs)
+        self.retry_errors = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadError,
+                             httpx.RemoteProtocolError)
+
+    def idempotent(self, request):
+        if request.method in ("GET", "HEAD"):
+            return True
+        path = request.url.path
+        return request.method == "POST" and "/rpc/" in path and path.rsplit("/", 1)[-1] in self.read_only_rpcs
+
+    def delay(self, attempt, response=None):
+        """Full jitter: acak 0..min(backoff_max, backoff * 2^attempt); Retry-After dihormati (dibatasi)"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+        if retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.backoff_max))
+        return delay
+
+    def handle_request(self, request):
+        attempts = self.retries + 1 if self.idempotent(request) else 1
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                response = self.transport.handle_request(request)
+            except self.retry_errors:
+                if last:
+                    raise
+                time.sleep(self.delay(attempt))
+                continue
+            if last or response.status_code not in RETRY_STATUS:
+                return response
+            response.close()
+            time.sleep(self.delay(attempt, response))
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        self.transport.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.transport.__exit__(*exc_info)
+
+
+class ForkSafeClient:
+    """Proxy client yang dibuat ulang di proses hasil fork (gunicorn --preload).
+
+    Pool koneksi keep-alive proses induk tidak boleh dipakai bersama oleh worker:
+    dua proses yang menulis ke socket yang sama saling merusak stream HTTP."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._client = factory()
+
+    def _current(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Client induk dibuang tanpa close(): socket-nya masih dipakai proses induk
+                    self._client = self._factory()
+                    self._pid = os.getpid()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._current(), name)
+
+
+# === Instrumentasi panggilan backend ===
+QUERY_OPERATIONS = ("select", "insert", "update", "upsert", "delete")
+
+
+def instrument_backend(client, on_call, measure_bytes=False):
+    """Bungkus client supaya setiap execute() dilaporkan ke on_call(call_dict)"""
+    return InstrumentedClient(client, on_call, measure_bytes)
+
+
+def payload_size(data):
+    """Perkiraan ukuran payload respons (byte JSON)"""
+    if data is None:
+        return 0
+    try:
+        return len(json.dumps(data, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class InstrumentedClient:
+    """Proxy client: table()/rpc() mengembalikan builder yang diukur"""
+
+    def __init__(self, client, on_call, measure_bytes=False):
+        self._client = client
+        self._on_call = on_call
+        self._measure_bytes = measure_bytes
+
+    def table(self, table_name):
+        return InstrumentedQuery(self._client.table(table_name), table_name, "select",
+                                 self._on_call, self._measure_bytes)
+
+    def rpc(self, fn, params=None):
+        return InstrumentedQuery(self._client.rpc(fn, params or {}), fn, "rpc",
+                                 self._on_call, self._measure_bytes)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class InstrumentedQuery:
+    """Proxy query builder; operasi diambil dari select/insert/update/upsert/delete terakhir"""
+
+    def __init__(self, builder, table_name, operation, on_call, measure_bytes=False):
+        self._builder = builder
+        self._table_name = table_name
+        self._operation = operation
+        self._on_call = on_call
+        self._measure_bytes = measure_bytes
+
+    def _wrap(self, result, operation):
+        if hasattr(result, "execute"):
+            return InstrumentedQuery(result, self._table_name, operation, self._on_call, self._measure_bytes)
+        return result
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        operation = name if name in QUERY_OPERATIONS else self._operation
+        if not callable(attr):
+            return self._wrap(attr, operation)
+
+        def call(*args, **kwargs):
+            return self._wrap(attr(*args, **kwargs), operation)
+        return call
+
+    def execute(self):
+        started = time.perf_counter()
+        response = None
+        error = None
+        try:
+            response = self._builder.execute()
+            return response
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            data = getattr(response, "data", None)
+            self._on_call({
+                "table": self._table_name,
+                "operation": self._operation,
+                "rows": len(data) if isinstance(data, list) else (1 if data else 0),
+                "bytes": payload_size(data) if self._measure_bytes else 0,
+                "ms": (time.perf_counter() - started) * 1000,
+                "error": error,
+            })
+
+
+# === Response & query builder ===
+class LocalAPIError(Exception):
+    """Pengganti postgrest APIError: .code mengikuti kode PostgREST (PGRST202 = fungsi tidak ada)"""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+class LocalResponse:
+    """Pengganti APIResponse supabase-py (cukup .data dan .count)"""
+
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class LocalQuery:
+    """Query builder satu tabel; filter dikumpulkan lalu dijalankan oleh store saat execute()"""
+
+    def __init__(self, store, table_name):
+        self.store = store
+        self.table_name = table_name
+        self.action = "select"
+        self.columns = "*"
+        self.count = None
+        self.payload = None
+        self.filters = []
+        self.orders = []
+        self.limit_value = None
+        self.offset_value = 0
+
+    # --- aksi ---
+    def select(self, columns="*", count=None):
+        self.action = "select"
+        self.columns = columns
+        self.count = count
+        return self
+
+    def insert(self, rows):
+        self.action = "insert"
+        self.payload = rows
+        return self
+
+    def update(self, values):
+        self.action = "update"
+        self.payload = values
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    # --- filter ---
+    def _filter(self, op, column, value):
+        self.filters.append((op, column, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter("eq", column, value)
+
+    def neq(self, column, value):
+        return self._filter("neq", column, value)
+
+    def gt(self, column, value):
+        return self._filter("gt", column, value)
+
+    def gte(self, column, value):
+        return self._filter("gte", column, value)
+
+    def lt(self, column, value):
+        return self._filter("lt", column, value)
+
+    def lte(self, column, value):
+        return self._filter("lte", column, value)
+
+    def like(self, column, pattern):
+        return self._filter("like", column, pattern)
+
+    def ilike(self, column, pattern):
+        return self._filter("ilike", column, pattern)
+
+    def in_(self, column, values):
+        return self._filter("in", column, list(values))
+
+    def or_(self, filters, reference_table=None):
+        """Filter OR format PostgREST, mis. tanggal.lt.2024-05-01,and(tanggal.eq.2024-05-01,id.lt.9)"""
+        return self._filter("or", None, parse_logic_tree(filters))
+
+    # --- urutan & halaman ---
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, size):
+        self.limit_value = size
+        return self
+
+    def range(self, start, end):
+        self.offset_value = start
+        self.limit_value = end - start + 1
+        return self
+
+    def execute(self):
+        with self.store.lock:
+            if self.action == "insert":
+                rows = self.payload if isinstance(self.payload, list) else [self.payload]
+                return LocalResponse(self.store.insert(self.table_name, rows))
+            if self.action == "update":
+                return LocalResponse(self.store.update(self.table_name, self.filters, self.payload))
+            if self.action == "delete":
+                return LocalResponse(self.store.delete(self.table_name, self.filters))
+
+            rows, total = self.store.select(self.table_name, self.filters, self.orders,
+                                            self.limit_value, self.offset_value)
+            return LocalResponse(project_columns(rows, self.columns),
+                                 total if self.count == "exact" else None)
+
+
+class LocalRpc:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params or {}
+
+    def execute(self):
+        handler = LOCAL_RPCS.get(self.name)
+        if handler is None:
+            raise LocalAPIError(f"Could not find the function {self.name} di backend lokal", code="PGRST202")
+        with self.client.store.lock:
+            return LocalResponse(handler(self.client, **self.params))
+
+
+class LocalClient:
+    """Pengganti supabase.Client untuk backend lokal"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def table(self, table_name):
+        return LocalQuery(self.store, table_name)
+
+    def rpc(self, name, params=None):
+        return LocalRpc(self, name, params)
+
+
+# === Parser filter logika PostgREST (or_) ===
+LOGIC_OPERATORS = {"eq", "neq", "gt", "gte", "lt", "lte", "like", "ilike"}
+
+def split_top_level(text):
+    """Pisah "a,and(b,c),d" di koma yang tidak berada di dalam kurung / tanda kutip"""
+    parts, depth, quoted, escaped, current = [], 0, False, False, []
+    for char in text:
+        if escaped:
+            escaped = False
+        elif quoted and char == "\\":
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    parts.append("".join(current))
+    return [part.strip() for part in parts if part.strip()]
+
+
+def parse_filter_value(text):
+    """Nilai literal di string filter: "..." tetap teks (\\" dan \\\\ di-unescape), angka jadi int/float"""
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', text[1:-1])
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_logic_tree(text):
+    """a.eq.1,and(b.lt.2,c.gt.3) -> daftar filter (op, kolom, nilai); grup jadi ("and"/"or", None, [...])"""
+    filters = []
+    for part in split_top_level(text):
+        group = re.match(r"^(and|or)\((.*)\)$", part, re.DOTALL)
+        if group:
+            filters.append((group.group(1), None, parse_logic_tree(group.group(2))))
+            continue
+        column, op, value = (part.split(".", 2) + ["", ""])[:3]
+        if op not in LOGIC_OPERATORS:
+            raise Exception(f"Filter or_ tidak didukung backend lokal: {part}")
+        filters.append((op, column, parse_filter_value(value)))
+    return filters
+
+
+# === Evaluasi filter untuk MemoryStore ===
+def like_to_regex(pattern, flags=0):
+    parts = []
+    for char in pattern:
+        if char == "%":
+            parts.append(".*")
+        elif char == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return re.compile("^" + "".join(parts) + "$", re.DOTALL | flags)
+
+
+def row_matches(row, filters):
+    for op, column, value in filters:
+        if op == "or":
+            if not any(row_matches(row, [condition]) for condition in value):
+                return False
+            continue
+        if op == "and":
+            if not row_matches(row, value):
+                return False
+            continue
+        current = row.get(column)
+        if op == "eq":
+            if current != value:
+                return False
+        elif op == "neq":
+            # Postgres: NULL != x bernilai NULL (baris tidak ikut)
+            if current is None or current == value:
+                return False
+        elif op == "in":
+            if current not in value:
+                return False
+        elif op == "like":
+            if current is None or not like_to_regex(value).match(str(current)):
+                return False
+        elif op == "ilike":
+            if current is None or not like_to_regex(value, re.IGNORECASE).match(str(current)):
+                return False
+        else:
+            if current is None or isinstance(current, str) != isinstance(value, str):
+                return False
+            if op == "gt" and not current > value:
+                return False
+            if op == "gte" and not current >= value:
+                return False
+            if op == "lt" and not current < value:
+                return False
+            if op == "lte" and not current <= value:
+                return False
+    return True
+
+
+def sort_rows(rows, orders):
+    # Urutkan dari kunci terakhir ke pertama (sort stabil); NULL di akhir seperti Postgres
+    for column, desc in reversed(orders):
+        present = [row for row in rows if row.get(column) is not None]
+        missing = [row for row in rows if row.get(column) is None]
+        present.sort(key=lambda row: row[column], reverse=desc)
+        rows = present + missing
+    return rows
+
+
+def project_columns(rows, columns):
+    if not columns or columns.strip() == "*":
+        return rows
+    names = [name.strip() for name in columns.split(",") if name.strip()]
+    return [{name: row.get(name) for name in names} for row in rows]
+
+
+# === Store: memori ===
+class MemoryStore:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.tables = {}
+        self.sequences = {}
+
+    def _next_id(self, table_name):
+        self.sequences[table_name] = self.sequences.get(table_name, 0) + 1
+        return self.sequences[table_name]
+
+    def insert(self, table_name, rows):
+        table = self.tables.setdefault(table_name, [])
+        inserted = []
+        for row in rows:
+            record = dict(row)
+            if record.get("id") is None:
+                record["id"] = self._next_id(table_name)
+            record.setdefault("created_at", datetime.now().isoformat())
+            table.append(record)
+            inserted.append(dict(record))
+        return inserted
+
+    def select(self, table_name, filters, orders, limit, offset):
+        rows = [row for row in self.tables.get(table_name, []) if row_matches(row, filters)]
+        total = len(rows)
+        rows = sort_rows(rows, orders)
+        end = None if limit is None else offset + limit
+        return [dict(row) for row in rows[offset:end]], total
+
+    def update(self, table_name, filters, values):
+        updated = []
+        for row in self.tables.get(table_name, []):
+            if row_matches(row, filters):
+                row.update(values)
+                updated.append(dict(row))
+        return updated
+
+    def delete(self, table_name, filters):
+        table = self.tables.get(table_name, [])
+        deleted = [dict(row) for row in table if row_matches(row, filters)]
+        self.tables[table_name] = [row for row in table if not row_matches(row, filters)]
+        return deleted
+
+
+# === Store: SQLite ===
+class SQLiteStore:
+    """Satu tabel SQLite per tabel Supabase; baris disimpan sebagai JSON (kolom doc).
+
+    Filter, urutan, limit dan offset diterjemahkan ke SQL dengan json_extract."""
+
+    SQL_OPERATORS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<=", "like": "LIKE"}
+
+    def __init__(self, path):
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA case_sensitive_like=ON")
+        self.known_tables = set()
+
+    def _table(self, table_name):
+        if table_name not in self.known_tables:
+            if not re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", table_name):
+                raise Exception(f"Nama tabel tidak valid: {table_name}")
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{table_name}" (id INTEGER PRIMARY KEY AUTOINCREMENT, doc TEXT NOT NULL)')
+            self.known_tables.add(table_name)
+        return f'"{table_name}"'
+
+    @staticmethod
+    def _path(column):
+        if column == "id":
+            # id bawaan memakai rowid kecuali baris disimpan dengan id sendiri
+            return "COALESCE(json_extract(doc, '$.id'), id)"
+        return f"json_extract(doc, '$.{column}')"
+
+    def _clause(self, op, column, value):
+        if op in ("and", "or"):
+            parts = [self._clause(*condition) for condition in value]
+            if not parts:
+                return ("1" if op == "and" else "0"), []
+            joiner = " AND " if op == "and" else " OR "
+            return "(" + joiner.join(sql for sql, _ in parts) + ")", [p for _, params in parts for p in params]
+        if op == "in":
+            if not value:
+                return "0", []
+            return f"{self._path(column)} IN ({', '.join('?' for _ in value)})", list(value)
+        if op == "eq" and value is None:
+            return f"{self._path(column)} IS NULL", []
+        if op == "neq":
+            # Postgres: NULL != x bernilai NULL (baris tidak ikut)
+            return f"({self._path(column)} IS NOT NULL AND {self._path(column)} != ?)", [value]
+        if op == "ilike":
+            return f"LOWER({self._path(column)}) LIKE LOWER(?)", [value]
+        return f"{self._path(column)} {self.SQL_OPERATORS[op]} ?", [value]
+
+    def _where(self, filters):
+        clauses, params = [], []
+        for op, column, value in filters:
+            sql, clause_params = self._clause(op, column, value)
+            clauses.append(sql)
+            params.extend(clause_params)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _rows(self, cursor):
+        rows = []
+        for row_id, doc in cursor.fetchall():
+            record = json.loads(doc)
+            if record.get("id") is None:
+                record["id"] = row_id
+            rows.append(record)
+        return rows
+
+    def insert(self, table_name, rows):
+        table = self._table(table_name)
+        inserted = []
+        with self.conn:
+            for row in rows:
+                record = {key: value for key, value in row.items() if not (key == "id" and value is None)}
+                record.setdefault("created_at", datetime.now().isoformat())
+                cursor = self.conn.execute(f"INSERT INTO {table} (doc) VALUES (?)", (json.dumps(record, default=str),))
+                record.setdefault("id", cursor.lastrowid)
+                inserted.append(record)
+        return inserted
+
+    def select(self, table_name, filters, orders, limit, offset):
+        table = self._table(table_name)
+        where, params = self._where(filters)
+        total = self.conn.execute(f"SELECT COUNT(*) FROM {table}{where}", params).fetchone()[0]
+
+        order_sql = ""
+        if orders:
+            order_sql = " ORDER BY " + ", ".join(
+                f"{self._path(column)} IS NULL, {self._path(column)} {'DESC' if desc else 'ASC'}"
+                for column, desc in orders
+            )
+        page_sql = ""
+        if limit is not None or offset:
+            page_sql = f" LIMIT {int(limit) if limit is not None else -1} OFFSET {int(offset)}"
+
+        cursor = self.conn.execute(f"SELECT id, doc FROM {table}{where}{order_sql}{page_sql}", params)
+        return self._rows(cursor), total
+
+    def update(self, table_name, filters, values):
+        table = self._table(table_name)
+        where, params = self._where(filters)
+        rows = self._rows(self.conn.execute(f"SELECT id, doc FROM {table}{where}", params))
+        with self.conn:
+            for row in rows:
+                row.update(values)
+                self.conn.execute(f"UPDATE {table} SET doc = ? WHERE id = ?", (json.dumps(row, default=str), row["id"]))
+        return rows
+
+    def delete(self, table_name, filters):
+        table = self._table(table_name)
+        where, params = self._where(filters)
+        rows = self._rows(self.conn.execute(f"SELECT id, doc FROM {table}{where}", params))
+        with self.conn:
+            self.conn.execute(f"DELETE FROM {table}{where}", params)
+        return rows
+
+
+# === Stand-in fungsi RPC (lihat supabase_schema.sql) ===
+LOCAL_RPCS = {}
+
+
+def local_rpc(name):
+    def register(handler):
+        LOCAL_RPCS[name] = handler
+        return handler
+    return register
+
+
+def periode_of(tanggal):
+    return str(tanggal)[:7]
+
+
+def add_to_saldo_akun(client, sumber, rows):
+    """Tambahkan total debit/kredit baris jurnal ke bucket saldo_akun (sumber, akun, bulan)"""
+    buckets = {}
+    for row in rows:
+        key = (row["kode_akun"], periode_of(row["tanggal"]))
+        total = buckets.setdefault(key, [0, 0])
+        total[0] += float(row.get("debit") or 0)
+        total[1] += float(row.get("kredit") or 0)
+
+    for (kode_akun, periode), (debit, kredit) in buckets.items():
+        existing = client.table("saldo_akun").select("*")\
+            .eq("sumber", sumber).eq("kode_akun", kode_akun).eq("periode", periode).execute().data
+        if existing:
+            client.table("saldo_akun").update({
+                "total_debit": float(existing[0]["total_debit"]) + debit,
+                "total_kredit": float(existing[0]["total_kredit"]) + kredit,
+                "updated_at": datetime.now().isoformat()
+            }).eq("sumber", sumber).eq("kode_akun", kode_akun).eq("periode", periode).execute()
+        else:
+            client.table("saldo_akun").insert({
+                "sumber": sumber, "kode_akun": kode_akun, "periode": periode,
+                "total_debit": debit, "total_kredit": kredit,
+                "updated_at": datetime.now().isoformat()
+            }).execute()
+
+
+JOURNAL_TABLES = ("jurnal_umum", "jurnal_penyesuaian", "jurnal_penutup")
+
+
+@local_rpc("post_journal")
+def rpc_post_journal(client, p_table, p_rows):
+    if p_table not in JOURNAL_TABLES:
+        raise Exception(f"Tabel jurnal tidak dikenal: {p_table}")
+    inserted = client.table(p_table).insert(p_rows).execute().data
+    add_to_saldo_akun(client, p_table, inserted)
+    return inserted
+
+
+@local_rpc("rebuild_saldo_akun")
+def rpc_rebuild_saldo_akun(client, p_sumber):
+    if p_sumber not in JOURNAL_TABLES:
+        raise Exception(f"Tabel jurnal tidak dikenal: {p_sumber}")
+    client.table("saldo_akun").delete().eq("sumber", p_sumber).execute()
+    add_to_saldo_akun(client, p_sumber, client.table(p_sumber).select("kode_akun, tanggal, debit, kredit").execute().data)
+    return None
+
+
+def as_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+@local_rpc("saldo_per_akun")
+def rpc_saldo_per_akun(client, p_sumber, p_start=None, p_end=None):
+    if p_sumber not in JOURNAL_TABLES:
+        raise Exception(f"Tabel jurnal tidak dikenal: {p_sumber}")
+    start, end = as_date(p_start), as_date(p_end)
+
+    # Jendela bulan penuh [bulan_awal, bulan_akhir): dari saldo_akun, sisanya dari baris jurnal
+    bulan_awal = None if start is None else (start if start.day == 1 else
+                                             date(start.year + start.month // 12, start.month % 12 + 1, 1))
+    bulan_akhir = None if end is None else (end + timedelta(days=1)).replace(day=1)
+    rows = []
+    if bulan_awal and bulan_akhir and bulan_awal >= bulan_akhir:
+        ranges = [(start, end)]
+    else:
+        query = client.table("saldo_akun").select("kode_akun, total_debit, total_kredit").eq("sumber", p_sumber)
+        if bulan_awal:
+            query = query.gte("periode", bulan_awal.strftime("%Y-%m"))
+        if bulan_akhir:
+            query = query.lt("periode", bulan_akhir.strftime("%Y-%m"))
+        rows += [(row["kode_akun"], row["total_debit"], row["total_kredit"]) for row in query.execute().data]
+        ranges = []
+        if start and start < bulan_awal:
+            ranges.append((start, bulan_awal - timedelta(days=1)))
+        if end and bulan_akhir <= end:
+            ranges.append((bulan_akhir, end))
+
+    for range_start, range_end in ranges:
+        query = client.table(p_sumber).select("kode_akun, debit, kredit")
+        if range_start:
+            query = query.gte("tanggal", range_start.isoformat())
+        if range_end:
+            query = query.lte("tanggal", range_end.isoformat())
+        rows += [(row["kode_akun"], row["debit"], row["kredit"]) for row in query.execute().data]
+
+    totals = {}
+    for kode_akun, debit, kredit in rows:
+        total = totals.setdefault(kode_akun, {"kode_akun": kode_akun, "debit": 0, "kredit": 0})
+        total["debit"] += float(debit or 0)
+        total["kredit"] += float(kredit or 0)
+    return list(totals.values())
+
+
+@local_rpc("penjualan_per_ukuran")
+def rpc_penjualan_per_ukuran(client, p_start=None, p_end=None):
+    query = client.table("sales").select("id, tanggal, items")
+    if p_start:
+        query = query.gte("tanggal", as_date(p_start).isoformat())
+    if p_end:
+        query = query.lte("tanggal", as_date(p_end).isoformat())
+
+    groups = {}
+    for sale in query.execute().data:
+        items = sale["items"]
+        if isinstance(items, str):
+            items = json.loads(items)
+        for item in items or []:
+            key = (str(sale["tanggal"])[:10], item.get("jenis_ikan"))
+            group = groups.setdefault(key, {"tanggal": key[0], "jenis_ikan": key[1], "quantity": 0,
+                                            "subtotal": 0, "sales": set()})
+            group["quantity"] += int(item.get("quantity") or 0)
+            group["subtotal"] += float(item.get("subtotal") or 0)
+            group["sales"].add(sale["id"])
+    rekap = []
+    for key in sorted(groups, key=lambda key: (key[0], str(key[1]))):
+        group = groups[key]
+        group["jumlah_transaksi"] = len(group.pop("sales"))
+        rekap.append(group)
+    return rekap
+
+
+@local_rpc("apply_stock_movement")
+def rpc_apply_stock_movement(client, p_item_code, p_transaction_type, p_quantity, p_unit_cost,
+                             p_reference, p_notes, p_transaction_date):
+    if p_quantity is None or p_quantity < 0:
+        return {"success": False, "message": "Kuantitas tidak valid"}
+
+    item = client.table("inventory_items").select("id").eq("item_code", p_item_code).execute().data
+    if not item:
+        return {"success": False, "message": "Item tidak ditemukan di inventory_items"}
+    stock = client.table("inventory").select("current_stock, total_sold").eq("item_code", p_item_code).execute().data
+    if not stock:
+        return {"success": False, "message": "Item tidak ditemukan di inventory"}
+
+    current_stock = int(stock[0]["current_stock"] or 0)
+    total_sold = int(stock[0].get("total_sold") or 0)
+    moved = p_quantity
+
+    if p_transaction_type == "PURCHASE":
+        new_stock = current_stock + p_quantity
+    elif p_transaction_type == "SALE":
+        if current_stock < p_quantity:
+            return {"success": False, "message": "Stok tidak cukup", "current_stock": current_stock}
+        new_stock = current_stock - p_quantity
+        total_sold += p_quantity
+    elif p_transaction_type == "RETURN":
+        new_stock = current_stock + p_quantity
+        total_sold = max(total_sold - p_quantity, 0)
+    elif p_transaction_type == "ADJUSTMENT":
+        new_stock = p_quantity
+        moved = abs(p_quantity - current_stock)
+    else:
+        return {"success": False, "message": "Jenis transaksi tidak dikenal"}
+
+    client.table("inventory").update({
+        "current_stock": new_stock,
+        "total_sold": total_sold,
+        "updated_at": datetime.now().isoformat()
+    }).eq("item_code", p_item_code).execute()
+
+    client.table("inventory_transactions").insert({
+        "item_id": item[0]["id"],
+        "transaction_type": p_transaction_type,
+        "quantity": moved,
+        "unit_cost": p_unit_cost,
+        "total_value": moved * (p_unit_cost or 0),
+        "reference_number": p_reference,
+        "notes": p_notes,
+        "transaction_date": p_transaction_date
+    }).execute()
+
+    return {"success": True, "current_stock": new_stock}
+
+
+@local_rpc("apply_stock_movements")
+def rpc_apply_stock_movements(client, p_movements):
+    # Backend lokal tidak punya rollback: simulasikan dulu semua pergerakan, baru tulis
+    stocks = {}
+    for movement in p_movements:
+        code = movement["p_item_code"]
+        if code not in stocks:
+            stock = client.table("inventory").select("current_stock").eq("item_code", code).execute().data
+            if not stock:
+                return {"success": False, "message": f"{code}: Item tidak ditemukan di inventory"}
+            stocks[code] = int(stock[0]["current_stock"] or 0)
+        quantity = movement["p_quantity"]
+        if movement["p_transaction_type"] == "SALE":
+            if stocks[code] < quantity:
+                return {"success": False, "message": f"{code}: Stok tidak cukup"}
+            stocks[code] -= quantity
+        elif movement["p_transaction_type"] in ("PURCHASE", "RETURN"):
+            stocks[code] += quantity
+        elif movement["p_transaction_type"] == "ADJUSTMENT":
+            stocks[code] = quantity
+
+    current_stock = {}
+    for movement in p_movements:
+        outcome = rpc_apply_stock_movement(client, **movement)
+        if not outcome["success"]:
+            return {"success": False, "message": f"{movement['p_item_code']}: {outcome['message']}"}
+        current_stock[movement["p_item_code"]] = outcome["current_stock"]
+    return {"success": True, "current_stock": current_stock}
+
+
+@local_rpc("post_piutang")
+def rpc_post_piutang(client, p_customer, p_tanggal, p_keterangan, p_debit, p_kredit):
+    delta = float(p_debit or 0) - float(p_kredit or 0)
+    head = client.table("piutang_saldo").select("saldo").eq("customer", p_customer).execute().data
+    if head:
+        saldo = float(head[0]["saldo"]) + delta
+        client.table("piutang_saldo").update({"saldo": saldo, "updated_at": datetime.now().isoformat()})\
+            .eq("customer", p_customer).execute()
+    else:
+        history = client.table("buku_pembantu_piutang").select("debit, kredit").eq("customer", p_customer).execute().data
+        saldo = sum(float(row["debit"] or 0) - float(row["kredit"] or 0) for row in history) + delta
+        client.table("piutang_saldo").insert({"customer": p_customer, "saldo": saldo,
+                                              "updated_at": datetime.now().isoformat()}).execute()
+
+    return client.table("buku_pembantu_piutang").insert({
+        "customer": p_customer,
+        "tanggal": p_tanggal,
+        "keterangan": p_keterangan,
+        "debit": p_debit,
+        "kredit": p_kredit,
+        "saldo": saldo,
+        "created_at": datetime.now().isoformat()
+    }).execute().data[0]
+
+
+@local_rpc("post_piutang_batch")
+def rpc_post_piutang_batch(client, p_rows):
+    return [rpc_post_piutang(client, **row) for row in p_rows]
+
+
+@local_rpc("rebuild_piutang_saldo")
+def rpc_rebuild_piutang_saldo(client):
+    client.table("piutang_saldo").delete().execute()
+    saldo = {}
+    for row in client.table("buku_pembantu_piutang").select("customer, debit, kredit").execute().data:
+        saldo[row["customer"]] = saldo.get(row["customer"], 0) + float(row["debit"] or 0) - float(row["kredit"] or 0)
+    if saldo:
+        now = datetime.now().isoformat()
+        client.table("piutang_saldo").insert([
+            {"customer": customer, "saldo": value, "updated_at": now} for customer, value in saldo.items()
+        ]).execute()
+    return None
+
+
+@local_rpc("next_document_number")
+def rpc_next_document_number(client, p_doc_type, p_hari, p_count=1):
+    existing = client.table("document_sequences").select("last_number")\
+        .eq("doc_type", p_doc_type).eq("hari", p_hari).execute().data
+    if existing:
+        last_number = int(existing[0]["last_number"]) + p_count
+        client.table("document_sequences").update({"last_number": last_number})\
+            .eq("doc_type", p_doc_type).eq("hari", p_hari).execute()
+    else:
+        last_number = p_count
+        client.table("document_sequences").insert({"doc_type": p_doc_type, "hari": p_hari,
+                                                   "last_number": last_number}).execute()
+    return last_number
+
+
+@local_rpc("claim_idempotency_key")
+def rpc_claim_idempotency_key(client, p_route, p_key, p_lease_seconds=120):
+    existing = client.table("idempotency_keys").select("status, response, created_at")\
+        .eq("route", p_route).eq("key", p_key).execute().data
+    if existing:
+        row = existing[0]
+        claimed_at = datetime.fromisoformat(str(row["created_at"]))
+        if row["status"] == "processing" and claimed_at < datetime.now() - timedelta(seconds=p_lease_seconds):
+            client.table("idempotency_keys").update({"created_at": datetime.now().isoformat()})\
+                .eq("route", p_route).eq("key", p_key).execute()
+            return {"claimed": True, "reclaimed": True}
+        return {"claimed": False, "status": row["status"], "response": row["response"]}
+    client.table("idempotency_keys").insert({"route": p_route, "key": p_key, "status": "processing",
+                                             "response": None, "created_at": datetime.now().isoformat()}).execute()
+    return {"claimed": True}
+
+
+@local_rpc("bump_ledger_version")
+def rpc_bump_ledger_version(client, p_domains):
+    bumped = []
+    for domain in p_domains:
+        existing = client.table("ledger_versions").select("*").eq("domain", domain).execute().data
+        if existing:
+            bumped += client.table("ledger_versions").update({"version": existing[0]["version"] + 1})\
+                .eq("domain", domain).execute().data
+        else:
+            bumped += client.table("ledger_versions").insert({"domain": domain, "version": 1}).execute().data
+    return bumped
@@ -0,0 +1,471 @@
+-- =====================================================================
+-- Airyn - objek database tambahan untuk Supabase
+-- Jalankan file ini di Supabase SQL Editor (aman dijalankan ulang).
+-- =====================================================================
+
+
+-- === Saldo akun per bulan (materialized running balance) ===
+-- Satu baris per (sumber jurnal, akun, bulan). Dipelihara oleh post_journal()
+-- sehingga laporan cukup membaca O(akun) baris, bukan seluruh baris jurnal.
+create table if not exists saldo_akun (
+    sumber       text        not null,  -- jurnal_umum / jurnal_penyesuaian / jurnal_penutup
+    kode_akun    text        not null,
+    periode      text        not null,  -- 'YYYY-MM'
+    total_debit  numeric     not null default 0,
+    total_kredit numeric     not null default 0,
+    updated_at   timestamptz not null default now(),
+    primary key (sumber, kode_akun, periode)
+);
+
+-- Posting jurnal: insert semua baris + update saldo_akun dalam satu transaksi
+create or replace function post_journal(p_table text, p_rows jsonb)
+returns setof jsonb
+language plpgsql
+as $$
+begin
+    if p_table not in ('jurnal_umum', 'jurnal_penyesuaian', 'jurnal_penutup') then
+        raise exception 'Tabel jurnal tidak dikenal: %', p_table;
+    end if;
+
+    return query execute format(
+        'insert into %I (tanggal, nomor_jurnal, jenis_transaksi, kode_akun, deskripsi, debit, kredit, referensi, created_at)
+         select r.tanggal, r.nomor_jurnal, r.jenis_transaksi, r.kode_akun, r.deskripsi,
+                r.debit, r.kredit, r.referensi, coalesce(r.created_at, now())
+           from jsonb_to_recordset($1) as r(tanggal date, nomor_jurnal text, jenis_transaksi text,
+                                            kode_akun text, deskripsi text, debit numeric,
+                                            kredit numeric, referensi text, created_at timestamptz)
+         returning to_jsonb(%I.*)',
+        p_table, p_table)
+    using p_rows;
+
+    insert into saldo_akun (sumber, kode_akun, periode, total_debit, total_kredit)
+    select p_table, r.kode_akun, to_char(r.tanggal, 'YYYY-MM'), sum(r.debit), sum(r.kredit)
+      from jsonb_to_recordset(p_rows) as r(tanggal date, kode_akun text, debit numeric, kredit numeric)
+     group by r.kode_akun, to_char(r.tanggal, 'YYYY-MM')
+    on conflict (sumber, kode_akun, periode) do update
+       set total_debit  = saldo_akun.total_debit  + excluded.total_debit,
+           total_kredit = saldo_akun.total_kredit + excluded.total_kredit,
+           updated_at   = now();
+end;
+$$;
+
+-- Hitung ulang saldo_akun satu sumber dari baris jurnalnya
+-- (dipakai setelah baris jurnal dihapus, atau untuk inisialisasi data lama)
+create or replace function rebuild_saldo_akun(p_sumber text)
+returns void
+language plpgsql
+as $$
+begin
+    if p_sumber not in ('jurnal_umum', 'jurnal_penyesuaian', 'jurnal_penutup') then
+        raise exception 'Tabel jurnal tidak dikenal: %', p_sumber;
+    end if;
+
+    delete from saldo_akun where sumber = p_sumber;
+
+    execute format(
+        'insert into saldo_akun (sumber, kode_akun, periode, total_debit, total_kredit)
+         select %L, kode_akun, to_char(tanggal::date, ''YYYY-MM''), sum(debit), sum(kredit)
+           from %I
+          group by kode_akun, to_char(tanggal::date, ''YYYY-MM'')',
+        p_sumber, p_sumber);
+end;
+$$;
+
+
+-- === Pergerakan stok atomik ===
+-- Ubah inventory.current_stock dan catat inventory_transactions dalam satu transaksi.
+-- SALE hanya berhasil bila stok cukup (dicek di dalam UPDATE yang sama), sehingga
+-- dua penjualan bersamaan tidak bisa sama-sama lolos dan membuat stok minus.
+--   PURCHASE   : stok + p_quantity
+--   SALE       : stok - p_quantity (ditolak bila stok < p_quantity)
+--   RETURN     : kebalikan SALE (stok + p_quantity, total_sold - p_quantity), untuk
+--                membatalkan penjualan yang posting jurnalnya gagal
+--   ADJUSTMENT : stok di-set menjadi p_quantity (baris dikunci dulu)
+create or replace function apply_stock_movement(
+    p_item_code        text,
+    p_transaction_type text,
+    p_quantity         integer,
+    p_unit_cost        numeric,
+    p_reference        text,
+    p_notes            text,
+    p_transaction_date date
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_item_id   uuid;
+    v_old_stock integer;
+    v_new_stock integer;
+    v_moved     integer := p_quantity;
+begin
+    if p_quantity is null or p_quantity < 0 then
+        return jsonb_build_object('success', false, 'message', 'Kuantitas tidak valid');
+    end if;
+
+    select id into v_item_id from inventory_items where item_code = p_item_code;
+    if v_item_id is null then
+        return jsonb_build_object('success', false, 'message', 'Item tidak ditemukan di inventory_items');
+    end if;
+
+    if p_transaction_type = 'PURCHASE' then
+        update inventory
+           set current_stock = current_stock + p_quantity,
+               updated_at    = now()
+         where item_code = p_item_code
+        returning current_stock into v_new_stock;
+
+    elsif p_transaction_type = 'SALE' then
+        update inventory
+           set current_stock = current_stock - p_quantity,
+               total_sold    = coalesce(total_sold, 0) + p_quantity,
+               updated_at    = now()
+         where item_code = p_item_code
+           and current_stock >= p_quantity
+        returning current_stock into v_new_stock;
+
+        if v_new_stock is null then
+            select current_stock into v_old_stock from inventory where item_code = p_item_code;
+            if v_old_stock is not null then
+                return jsonb_build_object('success', false, 'message', 'Stok tidak cukup',
+                                          'current_stock', v_old_stock);
+            end if;
+        end if;
+
+    elsif p_transaction_type = 'RETURN' then
+        update inventory
+           set current_stock = current_stock + p_quantity,
+               total_sold    = greatest(coalesce(total_sold, 0) - p_quantity, 0),
+               updated_at    = now()
+         where item_code = p_item_code
+        returning current_stock into v_new_stock;
+
+    elsif p_transaction_type = 'ADJUSTMENT' then
+        select current_stock into v_old_stock from inventory where item_code = p_item_code for update;
+        if v_old_stock is not null then
+            update inventory
+               set current_stock = p_quantity,
+                   updated_at    = now()
+             where item_code = p_item_code
+            returning current_stock into v_new_stock;
+            v_moved := abs(p_quantity - v_old_stock);
+        end if;
+
+    else
+        return jsonb_build_object('success', false, 'message', 'Jenis transaksi tidak dikenal');
+    end if;
+
+    if v_new_stock is null then
+        return jsonb_build_object('success', false, 'message', 'Item tidak ditemukan di inventory');
+    end if;
+
+    insert into inventory_transactions (item_id, transaction_type, quantity, unit_cost, total_value,
+                                        reference_number, notes, transaction_date)
+    values (v_item_id, p_transaction_type, v_moved, p_unit_cost, v_moved * p_unit_cost,
+            p_reference, p_notes, p_transaction_date);
+
+    return jsonb_build_object('success', true, 'current_stock', v_new_stock);
+end;
+$$;
+
+-- Banyak pergerakan stok sekaligus (batch penjualan): semua berhasil atau tidak ada yang
+-- diterapkan. Tiap elemen p_movements memakai nama parameter apply_stock_movement().
+create or replace function apply_stock_movements(p_movements jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_move   jsonb;
+    v_result jsonb;
+    v_stocks jsonb := '{}'::jsonb;
+begin
+    begin
+        for v_move in select * from jsonb_array_elements(p_movements) loop
+            v_result := apply_stock_movement(
+                v_move->>'p_item_code',
+                v_move->>'p_transaction_type',
+                (v_move->>'p_quantity')::integer,
+                (v_move->>'p_unit_cost')::numeric,
+                v_move->>'p_reference',
+                v_move->>'p_notes',
+                (v_move->>'p_transaction_date')::date);
+            if not (v_result->>'success')::boolean then
+                raise exception '%: %', v_move->>'p_item_code', v_result->>'message';
+            end if;
+            v_stocks := v_stocks || jsonb_build_object(v_move->>'p_item_code', v_result->'current_stock');
+        end loop;
+    exception when others then
+        -- Blok dengan EXCEPTION = savepoint: pergerakan yang sudah diterapkan ikut dibatalkan
+        return jsonb_build_object('success', false, 'message', sqlerrm);
+    end;
+
+    return jsonb_build_object('success', true, 'current_stock', v_stocks);
+end;
+$$;
+
+
+-- === Saldo piutang per customer (kepala running balance buku pembantu piutang) ===
+-- Satu baris per customer berisi saldo terkini. post_piutang() menaikkan saldo dan
+-- menyimpan baris buku_pembantu_piutang dalam satu transaksi; UPDATE mengunci baris
+-- customer sehingga posting bersamaan untuk customer yang sama antre, bukan saling timpa.
+create table if not exists piutang_saldo (
+    customer   text        primary key,
+    saldo      numeric     not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+create or replace function post_piutang(
+    p_customer   text,
+    p_tanggal    date,
+    p_keterangan text,
+    p_debit      numeric,
+    p_kredit     numeric
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_saldo numeric;
+    v_row   jsonb;
+begin
+    update piutang_saldo
+       set saldo      = saldo + p_debit - p_kredit,
+           updated_at = now()
+     where customer = p_customer
+    returning saldo into v_saldo;
+
+    if v_saldo is null then
+        -- Customer pertama kali diposting: saldo awal diambil dari history (sekali saja)
+        insert into piutang_saldo (customer, saldo)
+        select p_customer, coalesce(sum(debit - kredit), 0) + p_debit - p_kredit
+          from buku_pembantu_piutang
+         where customer = p_customer
+        on conflict (customer) do update
+           set saldo      = piutang_saldo.saldo + p_debit - p_kredit,
+               updated_at = now()
+        returning saldo into v_saldo;
+    end if;
+
+    insert into buku_pembantu_piutang (customer, tanggal, keterangan, debit, kredit, saldo, created_at)
+    values (p_customer, p_tanggal, p_keterangan, p_debit, p_kredit, v_saldo, now())
+    returning to_jsonb(buku_pembantu_piutang.*) into v_row;
+
+    return v_row;
+end;
+$$;
+
+-- Banyak posting piutang sekaligus (batch penjualan), urut sesuai p_rows, satu transaksi
+create or replace function post_piutang_batch(p_rows jsonb)
+returns setof jsonb
+language plpgsql
+as $$
+declare
+    v_row jsonb;
+begin
+    for v_row in select * from jsonb_array_elements(p_rows) loop
+        return next post_piutang(
+            v_row->>'p_customer',
+            (v_row->>'p_tanggal')::date,
+            v_row->>'p_keterangan',
+            (v_row->>'p_debit')::numeric,
+            (v_row->>'p_kredit')::numeric);
+    end loop;
+end;
+$$;
+
+-- Hitung ulang piutang_saldo dari seluruh baris buku pembantu (inisialisasi / perbaikan)
+create or replace function rebuild_piutang_saldo()
+returns void
+language sql
+as $$
+    delete from piutang_saldo where true;
+    insert into piutang_saldo (customer, saldo)
+    select customer, sum(debit - kredit)
+      from buku_pembantu_piutang
+     group by customer;
+$$;
+
+
+-- === Penomoran dokumen per jenis per hari ===
+-- J-20250301-0001, SO-20250301-0001, ... Counter dinaikkan dengan satu upsert yang
+-- mengunci baris (jenis, hari), jadi posting bersamaan selalu mendapat nomor berbeda.
+-- p_count > 1 mengalokasikan satu blok nomor (batch); yang dikembalikan nomor terakhir.
+create table if not exists document_sequences (
+    doc_type    text   not null,  -- J / JP / SO / PO / ADJ
+    hari        date   not null,
+    last_number bigint not null default 0,
+    primary key (doc_type, hari)
+);
+
+create or replace function next_document_number(p_doc_type text, p_hari date, p_count integer default 1)
+returns bigint
+language sql
+as $$
+    insert into document_sequences (doc_type, hari, last_number)
+    values (p_doc_type, p_hari, p_count)
+    on conflict (doc_type, hari) do update
+       set last_number = document_sequences.last_number + excluded.last_number
+    returning last_number;
+$$;
+
+
+-- === Idempotency key route posting ===
+-- Request pertama meng-klaim (route, key) dengan status 'processing'; SIA.py menyimpan
+-- responsnya (status 'completed') atau menghapus key bila posting gagal. Retry dengan key
+-- yang sama mendapat respons tersimpan, bukan posting ulang. Klaim 'processing' berlaku
+-- selama p_lease_seconds sejak created_at: bila worker mati / timeout sebelum selesai,
+-- retry setelah lease habis mengambil alih key (created_at diperbarui).
+create table if not exists idempotency_keys (
+    route      text        not null,
+    key        text        not null,
+    status     text        not null default 'processing',  -- processing / completed
+    response   jsonb,
+    created_at timestamptz not null default now(),
+    primary key (route, key)
+);
+
+drop function if exists claim_idempotency_key(text, text);
+
+create or replace function claim_idempotency_key(p_route text, p_key text, p_lease_seconds integer default 120)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_row idempotency_keys;
+begin
+    insert into idempotency_keys (route, key) values (p_route, p_key)
+    on conflict (route, key) do nothing;
+    if found then
+        return jsonb_build_object('claimed', true);
+    end if;
+
+    update idempotency_keys
+       set created_at = now()
+     where route = p_route
+       and key = p_key
+       and status = 'processing'
+       and created_at < now() - make_interval(secs => p_lease_seconds);
+    if found then
+        return jsonb_build_object('claimed', true, 'reclaimed', true);
+    end if;
+
+    select * into v_row from idempotency_keys where route = p_route and key = p_key;
+    return jsonb_build_object('claimed', false, 'status', v_row.status, 'response', v_row.response);
+end;
+$$;
+
+
+-- === Versi ledger untuk cache laporan ===
+-- SIA.py menaikkan versi domain (nama tabel) setiap kali menulis; laporan di-cache
+-- per kombinasi versi, jadi semua worker membatalkan cache yang sama.
+create table if not exists ledger_versions (
+    domain  text primary key,
+    version bigint not null default 0
+);
+
+create or replace function bump_ledger_version(p_domains text[])
+returns setof ledger_versions
+language sql
+as $$
+    insert into ledger_versions (domain, version)
+    select unnest(p_domains), 1
+    on conflict (domain) do update set version = ledger_versions.version + 1
+    returning *;
+$$;
+
+
+-- === Agregat laporan di server ===
+-- Laporan hanya butuh total per akun / per ukuran ikan, jadi penjumlahan dilakukan
+-- di database dan yang dikirim ke aplikasi O(akun) baris, bukan O(baris jurnal).
+
+-- Total debit/kredit per akun satu sumber jurnal untuk tanggal p_start s/d p_end
+-- (null = tanpa batas). Bulan penuh dibaca dari saldo_akun, sisa hari di bulan
+-- pinggir dijumlahkan dari baris jurnal.
+create or replace function saldo_per_akun(p_sumber text, p_start date default null, p_end date default null)
+returns table (kode_akun text, debit numeric, kredit numeric)
+language plpgsql
+stable
+as $$
+declare
+    v_bulan_awal  date;
+    v_bulan_akhir date;
+    v_bulan_penuh boolean;
+begin
+    if p_sumber not in ('jurnal_umum', 'jurnal_penyesuaian', 'jurnal_penutup') then
+        raise exception 'Tabel jurnal tidak dikenal: %', p_sumber;
+    end if;
+
+    -- Jendela bulan penuh [v_bulan_awal, v_bulan_akhir) dalam periode
+    v_bulan_awal := case
+        when p_start is null then null
+        when extract(day from p_start) = 1 then p_start
+        else (date_trunc('month', p_start) + interval '1 month')::date
+    end;
+    v_bulan_akhir := case
+        when p_end is null then null
+        else date_trunc('month', p_end + 1)::date
+    end;
+    v_bulan_penuh := v_bulan_awal is null or v_bulan_akhir is null or v_bulan_awal < v_bulan_akhir;
+
+    return query execute format(
+        'select t.kode_akun, sum(t.debit), sum(t.kredit)
+           from (
+                select s.kode_akun, s.total_debit as debit, s.total_kredit as kredit
+                  from saldo_akun s
+                 where $3
+                   and s.sumber = %L
+                   and ($4 is null or s.periode >= to_char($4, ''YYYY-MM''))
+                   and ($5 is null or s.periode <  to_char($5, ''YYYY-MM''))
+                union all
+                select j.kode_akun, j.debit, j.kredit
+                  from %I j
+                 where case when $3
+                            then ($1 is not null and j.tanggal::date >= $1 and j.tanggal::date < $4)
+                              or ($2 is not null and j.tanggal::date >= $5 and j.tanggal::date <= $2)
+                            else ($1 is null or j.tanggal::date >= $1) and ($2 is null or j.tanggal::date <= $2)
+                       end
+           ) t
+          group by t.kode_akun',
+        p_sumber, p_sumber)
+    using p_start, p_end, v_bulan_penuh, v_bulan_awal, v_bulan_akhir;
+end;
+$$;
+
+-- Total penjualan per hari per ukuran ikan (jenis_ikan) dari item JSON tabel sales
+create or replace function penjualan_per_ukuran(p_start date default null, p_end date default null)
+returns table (tanggal date, jenis_ikan text, quantity bigint, subtotal numeric, jumlah_transaksi bigint)
+language sql
+stable
+as $$
+    with item as (
+        select s.id, s.tanggal::date as tanggal,
+               case when jsonb_typeof(s.items::jsonb) = 'string'
+                    then (s.items::jsonb #>> '{}')::jsonb
+                    else s.items::jsonb
+               end as items
+          from sales s
+         where (p_start is null or s.tanggal::date >= p_start)
+           and (p_end is null or s.tanggal::date <= p_end)
+    )
+    select item.tanggal, e->>'jenis_ikan', sum((e->>'quantity')::integer), sum((e->>'subtotal')::numeric),
+           count(distinct item.id)
+      from item, jsonb_array_elements(item.items) as e
+     group by item.tanggal, e->>'jenis_ikan'
+     order by item.tanggal, e->>'jenis_ikan';
+$$;
+
+
+-- === Index untuk laporan per periode ===
+-- Laporan memfilter baris jurnal dengan tanggal (start s/d end) dan mengurutkan per (tanggal, id)
+create index if not exists jurnal_umum_tanggal_idx        on jurnal_umum (tanggal, id);
+create index if not exists jurnal_penyesuaian_tanggal_idx on jurnal_penyesuaian (tanggal, id);
+create index if not exists jurnal_penutup_tanggal_idx     on jurnal_penutup (tanggal);
+create index if not exists buku_pembantu_piutang_tanggal_idx on buku_pembantu_piutang (customer, tanggal);
+-- Export buku besar membaca jurnal urut per (kode_akun, tanggal, id)
+create index if not exists jurnal_umum_akun_tanggal_idx on jurnal_umum (kode_akun, tanggal, id);
+-- Riwayat penjualan: keyset pagination urut (tanggal, id) menurun + filter pembayaran
+create index if not exists sales_tanggal_id_idx         on sales (tanggal desc, id desc);
+create index if not exists sales_payment_tanggal_id_idx on sales (payment_method, tanggal desc, id desc);
+-- Filter customer memakai ilike '%nama%' -> butuh index trigram
+create extension if not exists pg_trgm;
+create index if not exists sales_customer_trgm_idx on sales using gin (customer gin_trgm_ops);